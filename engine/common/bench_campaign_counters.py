@@ -0,0 +1,249 @@
+# FILE: engine/common/bench_campaign_counters.py  (новое — 2026-10-16)
+# PURPOSE: Бенч rollup-а campaign_counters против прежних COUNT-запросов дашборда.
+#          Всё в отдельной схеме (--schema, по умолчанию bench_cc; public не трогается):
+#          синтетический sending_log на --rows строк (+ mailbox_stats / replay_log), установка триггеров,
+#          бэкфилл (= пересчёт каждой кампании), сверка, чтения дашборда (old COUNT vs rollup)
+#          и цена записи: flush-пачки по --batch-rows строк с триггерами и без.
+
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from typing import Callable, List
+
+from engine.common import campaign_counters as cc
+from engine.common.db import get_connection
+
+_STATUSES = ["SEND"] * 16 + ["FAIL_TMP", "OTHER", "BAD_ADDRESS", "SEND_UNCONFIRMED"]
+
+
+def _base_sql(s: str) -> str:
+    return f"""
+    DROP SCHEMA IF EXISTS {s} CASCADE;
+    CREATE SCHEMA {s};
+    CREATE TABLE {s}.sending_log (
+        id bigserial PRIMARY KEY,
+        campaign_id bigint NOT NULL,
+        aggr_contact_cb_id bigint NOT NULL,
+        processed boolean NOT NULL DEFAULT false,
+        status text,
+        data jsonb,
+        processed_at timestamptz,
+        created_at timestamptz NOT NULL DEFAULT now()
+    );
+    CREATE TABLE {s}.mailbox_stats (id bigserial PRIMARY KEY, letter_id bigint NOT NULL, time timestamptz NOT NULL);
+    CREATE TABLE {s}.replay_log (
+        id bigserial PRIMARY KEY,
+        sending_log_id bigint NOT NULL,
+        status text,
+        replay_json jsonb,
+        replay_time timestamptz
+    );
+    """
+
+
+def _load_sql(s: str) -> List[str]:
+    st = "ARRAY[" + ", ".join(f"'{x}'" for x in _STATUSES) + "]"
+    return [
+        f"""
+        INSERT INTO {s}.sending_log (campaign_id, aggr_contact_cb_id, processed, status, data, processed_at, created_at)
+        SELECT
+            1 + (g %% %(campaigns)s),
+            g,
+            true,
+            ({st})[1 + (hashint8(g) & 2147483647) %% {len(_STATUSES)}],
+            '{{}}'::jsonb,
+            ts,
+            ts
+        FROM generate_series(1, %(rows)s) g,
+             LATERAL (SELECT now() - (g %% %(days)s) * interval '1 day' AS ts) t
+        """,
+        f"""
+        INSERT INTO {s}.mailbox_stats (letter_id, time)
+        SELECT lg.id, lg.created_at + interval '1 hour'
+        FROM {s}.sending_log lg, generate_series(1, 1 + (lg.id %% 3)::int)
+        WHERE (hashint8(lg.id) & 1023) < %(click_per_1024)s
+        """,
+        f"""
+        INSERT INTO {s}.replay_log (sending_log_id, status, replay_json, replay_time)
+        SELECT lg.id, CASE WHEN lg.id %% 4 = 0 THEN 'AUTO_RESPONSE' ELSE 'ANSWER' END, '{{}}'::jsonb,
+               lg.created_at + interval '2 hour'
+        FROM {s}.sending_log lg
+        WHERE (hashint8(lg.id + 7) & 1023) < %(reply_per_1024)s
+        """,
+        f"CREATE INDEX ON {s}.sending_log (campaign_id)",
+        f"CREATE INDEX ON {s}.mailbox_stats (letter_id)",
+        f"CREATE INDEX ON {s}.replay_log (sending_log_id)",
+        f"ANALYZE {s}.sending_log",
+        f"ANALYZE {s}.mailbox_stats",
+        f"ANALYZE {s}.replay_log",
+    ]
+
+
+def _old_reads(s: str) -> List[str]:
+    # Прежние запросы дашборда (web/panel/views.py, aap_campaigns/views/campaigns.py)
+    return [
+        f"""
+        SELECT campaign_id, COUNT(id) FROM {s}.sending_log
+        WHERE campaign_id = ANY(%s) AND status = 'SEND' GROUP BY campaign_id
+        """,
+        f"""
+        SELECT lg.campaign_id, COUNT(DISTINCT lg.aggr_contact_cb_id)
+        FROM {s}.mailbox_stats ms JOIN {s}.sending_log lg ON lg.id = ms.letter_id
+        WHERE lg.campaign_id = ANY(%s) GROUP BY lg.campaign_id
+        """,
+        f"""
+        SELECT campaign_id, COUNT(*), COUNT(*) FILTER (WHERE UPPER(COALESCE(status, '')) = 'SEND')
+        FROM {s}.sending_log WHERE campaign_id = ANY(%s) GROUP BY campaign_id
+        """,
+    ]
+
+
+def _new_reads(s: str) -> List[str]:
+    return [
+        f"SELECT campaign_id, sent FROM {s}.campaign_counters WHERE campaign_id = ANY(%s)",
+        f"SELECT campaign_id, viewed_unique FROM {s}.campaign_counters WHERE campaign_id = ANY(%s)",
+        f"SELECT campaign_id, total_logged, sent FROM {s}.campaign_counters WHERE campaign_id = ANY(%s)",
+    ]
+
+
+def _time_reads(cur, sqls: List[str], pick: Callable[[], List[int]], repeat: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        ids = pick()
+        for sql in sqls:
+            cur.execute(sql, [ids])
+            cur.fetchall()
+    return (time.perf_counter() - t0) / max(1, repeat)
+
+
+def _time_writes(conn, s: str, batches: int, batch_rows: int, campaigns: int) -> float:
+    rnd = random.Random(7)
+    base = 10**12
+    t0 = time.perf_counter()
+    with conn.cursor() as cur:
+        for b in range(batches):
+            cids = [rnd.randint(1, campaigns) for _ in range(batch_rows)]
+            cur.execute(
+                f"""
+                WITH ins AS (
+                    INSERT INTO {s}.sending_log (campaign_id, aggr_contact_cb_id, processed, status, processed_at)
+                    SELECT v.c, v.a, true, 'SEND', now()
+                    FROM unnest(%s::bigint[], %s::bigint[]) AS v(c, a)
+                    RETURNING id
+                )
+                INSERT INTO {s}.mailbox_stats (letter_id, time)
+                SELECT id, now() FROM ins WHERE id %% 10 = 0
+                """,
+                [cids, [base + b * batch_rows + i for i in range(batch_rows)]],
+            )
+            conn.commit()
+    return (time.perf_counter() - t0) / max(1, batches)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--schema", default="bench_cc")
+    ap.add_argument("--rows", type=int, default=10_000_000, help="sending_log rows")
+    ap.add_argument("--campaigns", type=int, default=400)
+    ap.add_argument("--days", type=int, default=90)
+    ap.add_argument("--click-rate", type=float, default=0.05)
+    ap.add_argument("--reply-rate", type=float, default=0.01)
+    ap.add_argument("--ids-per-read", type=int, default=20, help="campaigns per dashboard read (overview page)")
+    ap.add_argument("--reads", type=int, default=20)
+    ap.add_argument("--batches", type=int, default=200)
+    ap.add_argument("--batch-rows", type=int, default=50, help="rows per write statement (SendingLogWriter flush)")
+    ap.add_argument("--keep", action="store_true", help="do not drop the schema at the end")
+    args = ap.parse_args()
+
+    s = str(args.schema)
+    if s == cc.SCHEMA:
+        raise SystemExit("refusing to run in the live schema")
+    params = {
+        "rows": int(args.rows),
+        "campaigns": int(args.campaigns),
+        "days": max(1, int(args.days)),
+        "click_per_1024": int(round(float(args.click_rate) * 1024)),
+        "reply_per_1024": int(round(float(args.reply_rate) * 1024)),
+    }
+    rnd = random.Random(1)
+
+    def pick() -> List[int]:
+        return rnd.sample(range(1, int(args.campaigns) + 1), min(int(args.ids_per_read), int(args.campaigns)))
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            t0 = time.perf_counter()
+            cur.execute(_base_sql(s))
+            for sql in _load_sql(s):
+                cur.execute(sql, params)
+            conn.commit()
+            cur.execute(
+                f"SELECT (SELECT COUNT(*) FROM {s}.sending_log), (SELECT COUNT(*) FROM {s}.mailbox_stats), "
+                f"(SELECT COUNT(*) FROM {s}.replay_log)"
+            )
+            n_log, n_ms, n_rp = cur.fetchone()
+            print(f"load: sending_log={n_log:,} mailbox_stats={n_ms:,} replay_log={n_rp:,} {time.perf_counter() - t0:.1f}s")
+
+            t0 = time.perf_counter()
+            cc.install_schema(cur, s)
+            conn.commit()
+            print(f"install (tables + triggers): {(time.perf_counter() - t0) * 1000:.0f}ms")
+
+        t0 = time.perf_counter()
+        for cid in range(1, int(args.campaigns) + 1):
+            cc._repair_one(conn, cid, schema=s)
+        dt_backfill = time.perf_counter() - t0
+        print(f"backfill ({args.campaigns} campaigns): {dt_backfill:.1f}s")
+
+        with conn.cursor() as cur:
+            t0 = time.perf_counter()
+            drift = cc._check(cur, None, schema=s)
+            conn.commit()
+            print(f"verify (full scan): {time.perf_counter() - t0:.1f}s drift={len(drift)}")
+
+            for sql in _old_reads(s) + _new_reads(s):  # warm-up: кэш страниц / планы
+                cur.execute(sql, [pick()])
+                cur.fetchall()
+            dt_old = _time_reads(cur, _old_reads(s), pick, int(args.reads))
+            dt_new = _time_reads(cur, _new_reads(s), pick, int(args.reads))
+            conn.commit()
+        speedup = (dt_old / dt_new) if dt_new > 0 else 0.0
+        print(
+            f"dashboard read ({args.ids_per_read} campaigns, 3 queries): "
+            f"COUNT={dt_old * 1000:9.2f}ms  rollup={dt_new * 1000:7.3f}ms  x{speedup:,.0f}"
+        )
+
+        dt_trg = _time_writes(conn, s, int(args.batches), int(args.batch_rows), int(args.campaigns))
+        with conn.cursor() as cur:
+            cur.execute(f"ALTER TABLE {s}.sending_log DISABLE TRIGGER USER")
+            cur.execute(f"ALTER TABLE {s}.mailbox_stats DISABLE TRIGGER USER")
+        conn.commit()
+        dt_raw = _time_writes(conn, s, int(args.batches), int(args.batch_rows), int(args.campaigns))
+        print(
+            f"write ({args.batch_rows} rows/statement): triggers={dt_trg * 1000:.2f}ms  "
+            f"no triggers={dt_raw * 1000:.2f}ms  overhead={(dt_trg - dt_raw) * 1000:+.2f}ms/statement"
+        )
+        with conn.cursor() as cur:
+            cur.execute(f"ALTER TABLE {s}.sending_log ENABLE TRIGGER USER")
+            cur.execute(f"ALTER TABLE {s}.mailbox_stats ENABLE TRIGGER USER")
+            # строки, записанные без триггеров, -> расхождение, которое должна найти сверка
+            drift = cc._check(cur, None, schema=s)
+            conn.commit()
+        t0 = time.perf_counter()
+        for cid in drift:
+            cc._repair_one(conn, cid, schema=s)
+        with conn.cursor() as cur:
+            left = cc._check(cur, None, schema=s)
+            conn.commit()
+        print(f"repair after untracked writes: drift={len(drift)} -> {len(left)} in {time.perf_counter() - t0:.1f}s")
+
+        if not args.keep:
+            with conn.cursor() as cur:
+                cur.execute(f"DROP SCHEMA {s} CASCADE")
+            conn.commit()
+
+
+if __name__ == "__main__":
+    main()
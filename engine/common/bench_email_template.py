@@ -0,0 +1,91 @@
+# FILE: engine/common/bench_email_template.py  (новое — 2026-10-16)
+# PURPOSE: Микро-бенч рендера письма на получателя: build_send_bodies() (regex-проходы) против
+#          SendTemplate.render() (прекомпилированный шаблон). Проверяет идентичность результата.
+
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+from engine.common.email_template import (
+    PLACEHOLDER,
+    build_send_bodies,
+    build_send_vars,
+    compile_send_template,
+)
+
+_PROJECT_ROOT = Path(__file__).resolve().parents[2]
+_DEFAULT_TEMPLATE = _PROJECT_ROOT / "config" / "html-letters" / "letter-1-content.html"
+
+_CITIES = ["Düsseldorf", "Köln", "Bergen", "Hamburg", "München", "Siegen"]
+_LANDS = ["Nordrhein-Westfalen", "Bayern", "Hamburg", ""]
+_NAMES = ["Müller & Söhne GmbH", "Bau Schmidt", "Raumdesign Bart", "Kaan Immobilien KG", ""]
+
+
+def _load_template(path: Path, repeat: int) -> str:
+    raw = path.read_text(encoding="utf-8")
+    body = raw.replace(PLACEHOLDER, "")
+    return body * max(1, int(repeat))
+
+
+def _recipients(n: int) -> List[Tuple[Dict[str, str], str]]:
+    out: List[Tuple[Dict[str, str], str]] = []
+    for i in range(n):
+        utm = f"smrel={1_000_000 + i}"
+        vars_map = build_send_vars(
+            company_name=random.choice(_NAMES),
+            company_email=f"info{i}@example.de",
+            city=random.choice(_CITIES),
+            land=random.choice(_LANDS),
+            company_address=f"Hauptstraße {i % 200}, {random.choice(_CITIES)}",
+            utm=utm,
+        )
+        out.append((vars_map, utm))
+    return out
+
+
+def _bench(fn: Callable[[Dict[str, str], str], tuple[str, str]], recipients) -> Tuple[float, List[tuple[str, str]]]:
+    t0 = time.perf_counter()
+    out = [fn(vars_map, utm) for vars_map, utm in recipients]
+    return time.perf_counter() - t0, out
+
+
+def _print_line(title: str, n: int, dt: float) -> None:
+    rps = (n / dt) if dt > 0 else 0.0
+    print(f"{title:<18} n={n:<6} dt={dt:.4f}s  rps={rps:,.0f}/s  per_mail={dt / max(1, n) * 1e6:.1f}us")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--template", type=str, default=str(_DEFAULT_TEMPLATE), help="html letter file")
+    ap.add_argument("--repeat", type=int, default=1, help="repeat template body N times (bigger letters)")
+    ap.add_argument("--n", type=int, default=5000, help="count of recipients")
+    ap.add_argument("--rounds", type=int, default=3, help="repeat rounds")
+    args = ap.parse_args()
+
+    random.seed(42)
+    html_tpl = _load_template(Path(args.template), int(args.repeat))
+    recipients = _recipients(int(args.n))
+
+    t0 = time.perf_counter()
+    compiled = compile_send_template(html_tpl)
+    dt_compile = time.perf_counter() - t0
+    print(f"TEMPLATE bytes={len(html_tpl.encode('utf-8'))} fast={compiled.fast} compile={dt_compile * 1e3:.2f}ms")
+
+    for r in range(1, int(args.rounds) + 1):
+        dt_old, out_old = _bench(lambda v, u: build_send_bodies(html_tpl, v, u), recipients)
+        _print_line(f"REGEX r{r}", len(recipients), dt_old)
+
+        dt_new, out_new = _bench(compiled.render, recipients)
+        _print_line(f"COMPILED r{r}", len(recipients), dt_new)
+
+        same = sum(1 for a, b in zip(out_old, out_new) if a == b)
+        speedup = (dt_old / dt_new) if dt_new > 0 else 0.0
+        print(f"{'':<18} identical={same}/{len(recipients)} speedup={speedup:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
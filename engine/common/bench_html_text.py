@@ -0,0 +1,157 @@
+# FILE: engine/common/bench_html_text.py  (новое — 2026-10-16)
+# PURPOSE: Бенч HTML -> text для страниц сайтов: прежняя regex-цепочка rate_sending_lists против engine.common.html_text.
+#          Ответы (imap_message) и текст письма (email_template) остаются на regex-цепочках: на письмах в 3-13KB
+#          однопроходный вариант был медленнее (x0.6 / x0.4), выигрыш есть только на больших страницах с cap.
+#          Корпус: --corpus DIR (сохранённые страницы *.html / *.htm), по умолчанию config/html-letters
+#          + синтетическая "тяжёлая" страница (большой nav/footer, много мелких блоков) размером --synthetic-kb.
+
+from __future__ import annotations
+
+import argparse
+import re
+import time
+from html import unescape
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+from engine.common.html_text import html_to_text
+from engine.core_rate.rate_sending_lists import (
+    MAX_MEANINGFUL_BLOCKS,
+    MAX_PAGE_TEXT_LEN,
+    WEBSITE_BLOCK_TAGS,
+    _is_meaningful_line,
+)
+
+_PROJECT_ROOT = Path(__file__).resolve().parents[2]
+_DEFAULT_CORPUS = _PROJECT_ROOT / "config" / "html-letters"
+
+# ---- legacy: rate_sending_lists._fetch_text_from_url (до 2026-10-16) ----
+
+_NOISY = ("cookie", "datenschutz", "agb", "impressum", "login", "newsletter", "kontakt")
+
+
+def _legacy_website(html: str) -> str:
+    body_match = re.search(r"(?is)<body[^>]*>(.*?)</body>", html)
+    if not body_match:
+        return ""
+    html = body_match.group(1)
+    html = re.sub(r"(?is)<(header|footer|nav|aside|form|noscript|svg)[^>]*>.*?</\1>", " ", html)
+    html = re.sub(r"(?is)<script[^>]*>.*?</script>", " ", html)
+    html = re.sub(r"(?is)<style[^>]*>.*?</style>", " ", html)
+    html = re.sub(r"(?is)<!--.*?-->", " ", html)
+    html = re.sub(r"(?is)</?(main|article|section|p|li|h1|h2|h3|h4)[^>]*>", "\n", html)
+    html = re.sub(r"(?is)<[^>]+>", " ", html)
+    html = unescape(html)
+    html = re.sub(r"\r", "\n", html)
+    html = re.sub(r"[ \t]+", " ", html)
+    html = re.sub(r"\n\s*\n+", "\n\n", html)
+    lines: List[str] = []
+    seen: set[str] = set()
+    for raw_line in html.splitlines():
+        line = re.sub(r"\s+", " ", raw_line).strip()
+        if not line:
+            continue
+        line_l = line.lower()
+        if any(m in line_l for m in _NOISY) and len(line) <= 160:
+            continue
+        if sum(1 for ch in line if ch in "|>•") >= 3:
+            continue
+        if len(line.split()) <= 2 and len(line) <= 24:
+            continue
+        if line in seen:
+            continue
+        seen.add(line)
+        lines.append(line)
+        if len(lines) >= 30:
+            break
+    return "\n\n".join(lines).strip()[:8000]
+
+
+def _new_website(html: str) -> str:
+    return html_to_text(
+        html,
+        block_tags=WEBSITE_BLOCK_TAGS,
+        body_only=True,
+        dedup=True,
+        max_lines=MAX_MEANINGFUL_BLOCKS,
+        max_chars=MAX_PAGE_TEXT_LEN,
+        line_filter=_is_meaningful_line,
+        line_sep="\n\n",
+    ).strip()[:MAX_PAGE_TEXT_LEN]
+
+
+# ---- corpus ----
+
+
+def _synthetic_page(kb: int) -> str:
+    nav = "<nav>" + "".join(f'<a href="/p{i}">Menu {i}</a> | ' for i in range(400)) + "</nav>"
+    footer = "<footer>" + "".join(f"<p>Impressum Datenschutz AGB {i}</p>" for i in range(300)) + "</footer>"
+    block = (
+        "<section><h2>Unsere Leistungen im Bereich Sanitär &amp; Heizung</h2>"
+        "<p>Wir planen, liefern und montieren Heizungsanlagen für Wohn- und Gewerbeobjekte in der Region.</p>"
+        "<div class='card'><span>Tel</span> <b>0211 123456</b></div>"
+        "<script>var x = '<p>not text</p>';</script><style>.a{color:red}</style><!-- tracking -->"
+        "<ul><li>Wartung und Service rund um die Uhr</li><li>Badsanierung aus einer Hand</li></ul></section>"
+    )
+    parts = ["<html><head><title>t</title><style>body{}</style></head><body>", nav]
+    size = 0
+    i = 0
+    while size < kb * 1024:
+        b = block.replace("Region", f"Region {i}")
+        parts.append(b)
+        size += len(b)
+        i += 1
+    parts.append(footer)
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def _load_corpus(path: Path, synthetic_kb: int) -> List[Tuple[str, str]]:
+    docs: List[Tuple[str, str]] = []
+    if path.is_dir():
+        for f in sorted(path.iterdir()):
+            if f.suffix.lower() in (".html", ".htm"):
+                docs.append((f.name, f.read_text(encoding="utf-8", errors="ignore")))
+    if synthetic_kb > 0:
+        docs.append((f"synthetic_{synthetic_kb}kb", _synthetic_page(synthetic_kb)))
+    return docs
+
+
+def _time(fn: Callable[[str], str], docs: List[Tuple[str, str]], repeat: int) -> Tuple[float, List[str]]:
+    out: List[str] = []
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        out = [fn(html) for _, html in docs]
+    return (time.perf_counter() - t0) / max(1, repeat), out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--corpus", default=str(_DEFAULT_CORPUS), help="dir with saved pages (*.html)")
+    ap.add_argument("--synthetic-kb", type=int, default=1024, help="add a synthetic page of this size (0 = off)")
+    ap.add_argument("--repeat", type=int, default=5)
+    args = ap.parse_args()
+
+    docs = _load_corpus(Path(args.corpus), int(args.synthetic_kb))
+    total_kb = sum(len(h) for _, h in docs) / 1024
+    print(f"docs={len(docs)} total={total_kb:,.0f}KB repeat={args.repeat}")
+
+    modes = [
+        ("website", docs, _legacy_website, _new_website, lambda a, b: a == b),
+    ]
+    for name, subset, legacy, new, same in modes:
+        if not subset:
+            continue
+        new(subset[0][1])  # warm-up: компиляция master-regex
+        dt_old, out_old = _time(legacy, subset, int(args.repeat))
+        dt_new, out_new = _time(new, subset, int(args.repeat))
+        equal = sum(1 for a, b in zip(out_old, out_new) if same(a, b))
+        speedup = (dt_old / dt_new) if dt_new > 0 else 0.0
+        print(
+            f"{name:<8} docs={len(subset):<4} regex={dt_old * 1000:9.2f}ms  single-pass={dt_new * 1000:9.2f}ms  "
+            f"x{speedup:5.1f}  same_output={equal}/{len(subset)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+# FILE: engine/common/bench_send_window.py  (новое — 2026-10-16)
+# PURPOSE: Бенч окон отправки: прежняя оценка JSON-окна (core_status до 2026-10-16) против send_window.calendar_for.
+#          --campaigns кампаний (по умолчанию 5000), окна: --shared общих (workspace / global) + доля уникальных.
+#          Один "тик" = то, что run_campaign_status_once считает на кампанию: open now, минуты сегодня,
+#          день интервала, остаток сегодня, следующий день, минуты по 15 дням; sender — open now + next opening.
+#          Перед замером — сверка ответов на --checks случайных моментах (вкл. переходы DST).
+
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from engine.common import send_window as sw
+
+# ---- legacy: core_status/status.py (до 2026-10-16), оценка на каждый тик ----
+
+
+def _legacy_minutes(window_obj: object, day_value: date) -> int:
+    if not isinstance(window_obj, dict):
+        return 0
+    total = 0
+    for a_str, b_str in sw.iter_slots(window_obj.get(sw.day_key_for_date(day_value), [])):
+        a = sw.parse_hhmm_to_minutes(a_str)
+        b = sw.parse_hhmm_to_minutes(b_str)
+        if a is None or b is None or b <= a:
+            continue
+        total += int(b - a)
+    return int(total)
+
+
+def _legacy_is_open(now_de: datetime, window_obj: object) -> bool:
+    if not isinstance(window_obj, dict):
+        return False
+    cur = int(now_de.hour * 60 + now_de.minute)
+    for a_str, b_str in sw.iter_slots(window_obj.get(sw.day_key_for_date(now_de.date()), [])):
+        a = sw.parse_hhmm_to_minutes(a_str)
+        b = sw.parse_hhmm_to_minutes(b_str)
+        if a is None or b is None or b <= a:
+            continue
+        if a <= cur < b:
+            return True
+    return False
+
+
+def _legacy_remaining(now_de: datetime, window_obj: object) -> int:
+    if not isinstance(window_obj, dict):
+        return 0
+    cur = int(now_de.hour * 60 + now_de.minute)
+    total = 0
+    for a_str, b_str in sw.iter_slots(window_obj.get(sw.day_key_for_date(now_de.date()), [])):
+        a = sw.parse_hhmm_to_minutes(a_str)
+        b = sw.parse_hhmm_to_minutes(b_str)
+        if a is None or b is None or b <= a or cur >= b:
+            continue
+        total += int(b - max(int(a), cur))
+    return int(total)
+
+
+def _legacy_first_day(now_de: datetime, window_obj: object, first: int) -> Tuple[Optional[date], int]:
+    for offset in range(first, 15):
+        day_value = now_de.date() + timedelta(days=offset)
+        m = _legacy_minutes(window_obj, day_value)
+        if m > 0:
+            return (day_value, m)
+    return (None, 0)
+
+
+def _legacy_next_open(now_de: datetime, window_obj: object) -> Optional[datetime]:
+    # так пришлось бы искать открытие без календаря: шаг в минуту по горизонту
+    t = now_de.replace(second=0, microsecond=0)
+    for _ in range(15 * 24 * 60):
+        if _legacy_is_open(t, window_obj):
+            return t
+        t = (t + timedelta(minutes=1)).astimezone(sw.TZ_BERLIN)
+    return None
+
+
+def _legacy_tick(now_de: datetime, window_obj: object) -> tuple:
+    days = []
+    for offset in range(15):
+        d = now_de.date() + timedelta(days=offset)
+        m = _legacy_minutes(window_obj, d)
+        if m > 0:
+            days.append((d, m))
+    return (
+        _legacy_is_open(now_de, window_obj),
+        _legacy_minutes(window_obj, now_de.date()),
+        _legacy_first_day(now_de, window_obj, 0),
+        _legacy_remaining(now_de, window_obj),
+        _legacy_first_day(now_de, window_obj, 1),
+        days,
+    )
+
+
+def _calendar_tick(now_de: datetime, window_obj: object) -> tuple:
+    today = now_de.date()
+    last = today + timedelta(days=14)
+    cal = sw.calendar_for(window_obj, today=today)
+    return (
+        cal.is_open(now_de.timestamp()),
+        cal.minutes_on(today),
+        cal.first_open_day(today, last),
+        cal.remaining_minutes(now_de),
+        cal.first_open_day(today + timedelta(days=1), last),
+        cal.open_days_between(today, last),
+    )
+
+
+# ---- synthetic windows ----
+
+
+def _rand_window(rnd: random.Random) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for key in ("mon", "tue", "wed", "thu", "fri", "sat", "sun", "hol"):
+        if key in ("sat", "sun", "hol") and rnd.random() < 0.6:
+            continue
+        slots = []
+        start = rnd.randint(6, 10) * 60 + rnd.choice((0, 15, 30, 45))
+        for _ in range(rnd.randint(1, 3)):
+            end = min(23 * 60 + 59, start + rnd.randint(45, 240))
+            slots.append({"from": f"{start // 60:02d}:{start % 60:02d}", "to": f"{end // 60:02d}:{end % 60:02d}"})
+            start = min(23 * 60, end + rnd.randint(-30, 120))  # иногда слоты перекрываются
+        out[key] = slots
+    return out
+
+
+def _windows(n: int, shared: int, unique_share: float, seed: int) -> List[Dict[str, Any]]:
+    rnd = random.Random(seed)
+    pool = [_rand_window(rnd) for _ in range(max(1, shared))]
+    return [_rand_window(rnd) if rnd.random() < unique_share else rnd.choice(pool) for _ in range(n)]
+
+
+def _check(windows: List[Dict[str, Any]], checks: int, seed: int) -> int:
+    rnd = random.Random(seed)
+    moments = [
+        datetime(2026, 3, 29, 1, 59, tzinfo=sw.TZ_BERLIN),   # весна: 02:00 -> 03:00
+        datetime(2026, 10, 25, 2, 30, tzinfo=sw.TZ_BERLIN),  # осень: 02:00-03:00 дважды
+        datetime(2026, 12, 24, 23, 59, tzinfo=sw.TZ_BERLIN),
+    ]
+    base = datetime(2026, 1, 1, tzinfo=sw.TZ_BERLIN).timestamp()
+    moments += [
+        datetime.fromtimestamp(base + rnd.randint(0, 365 * 86400), tz=sw.TZ_BERLIN) for _ in range(checks)
+    ]
+    bad = 0
+    for now_de in moments:
+        for w in rnd.sample(windows, min(20, len(windows))):
+            if _legacy_tick(now_de, w) != _calendar_tick(now_de, w):
+                bad += 1
+    # next opening: минутный перебор против bisect (на малой выборке — перебор дорогой)
+    for now_de in moments[:10]:
+        w = rnd.choice(windows)
+        legacy = _legacy_next_open(now_de, w)
+        got = sw.calendar_for(w, today=now_de.date()).next_open(now_de.timestamp())
+        want = None if legacy is None else max(legacy.timestamp(), now_de.timestamp())
+        if (got is None) != (want is None) or (got is not None and abs(got - want) > 60):
+            bad += 1
+    return bad
+
+
+def _time_ticks(fn, windows: List[Dict[str, Any]], moments: List[datetime]) -> float:
+    t0 = time.perf_counter()
+    for now_de in moments:
+        for w in windows:
+            fn(now_de, w)
+    return (time.perf_counter() - t0) / len(moments)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--campaigns", type=int, default=5000)
+    ap.add_argument("--shared", type=int, default=200, help="общих окон (workspace / global)")
+    ap.add_argument("--unique-share", type=float, default=0.3, help="доля кампаний со своим окном")
+    ap.add_argument("--ticks", type=int, default=20)
+    ap.add_argument("--checks", type=int, default=200)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    windows = _windows(int(args.campaigns), int(args.shared), float(args.unique_share), int(args.seed))
+    distinct = len({sw.window_hash(w) for w in windows})
+    print(f"campaigns={len(windows)} distinct_windows={distinct}")
+
+    bad = _check(windows, int(args.checks), int(args.seed))
+    print(f"parity: mismatches={bad}")
+
+    start = datetime(2026, 10, 16, 9, 0, tzinfo=sw.TZ_BERLIN)
+    moments = [start + timedelta(seconds=10 * i) for i in range(int(args.ticks))]  # тики status-процессора
+
+    dt_old = _time_ticks(_legacy_tick, windows, moments)
+    sw._CACHE.clear()
+    sw._BY_OBJ.clear()
+    t0 = time.perf_counter()
+    for w in windows:
+        sw.calendar_for(w, today=start.date())
+    dt_build = time.perf_counter() - t0
+    dt_new = _time_ticks(_calendar_tick, windows, moments)
+    print(
+        f"status tick: legacy={dt_old * 1000:.1f}ms  calendar={dt_new * 1000:.1f}ms  "
+        f"x{dt_old / max(dt_new, 1e-9):.1f}  (compile all, once per day: {dt_build * 1000:.1f}ms)"
+    )
+
+    now_ts = start.timestamp()
+    cals = [sw.calendar_for(w, today=start.date()) for w in windows]
+    t0 = time.perf_counter()
+    for _ in range(int(args.ticks)):
+        for w in windows:
+            _legacy_is_open(start, w)
+    dt_old_open = (time.perf_counter() - t0) / int(args.ticks)
+    t0 = time.perf_counter()
+    for _ in range(int(args.ticks)):
+        for cal in cals:
+            if not cal.is_open(now_ts):
+                cal.next_open(now_ts)
+    dt_new_open = (time.perf_counter() - t0) / int(args.ticks)
+    print(
+        f"sender open-now (+next opening): legacy={dt_old_open * 1000:.2f}ms  "
+        f"calendar={dt_new_open * 1000:.2f}ms  x{dt_old_open / max(dt_new_open, 1e-9):.1f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+# FILE: engine/common/bench_worker.py  (новое — 2026-10-16)
+# PURPOSE: Бенч планировщика Worker: 50+ задач, лаг старта (старт - due) и джиттер, CPU родителя.
+#          EVENT = текущий run_forever (heap + wait на sentinel-ах), TICK = старый цикл (опрос раз в tick_sec).
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import threading
+import time
+from typing import Any, Dict, List
+
+from engine.common.worker import Worker, _pct
+
+
+def _noop() -> None:
+    return None
+
+
+def _short() -> None:
+    time.sleep(0.02)
+
+
+class _TickWorker(Worker):
+    """Старое поведение для сравнения: опрос всего раз в tick_sec."""
+
+    def run_forever(self) -> None:
+        while not self._stop:
+            self._collect_finished()
+            self._kill_timeouts()
+            self._schedule_starts()
+            time.sleep(self.tick_sec)
+        self._stop_residents()
+
+
+def _run(label: str, cls: type, args: argparse.Namespace) -> Dict[str, Any]:
+    w = cls(
+        name=f"bench_{label.lower()}",
+        tick_sec=float(args.tick),
+        max_parallel=int(args.max_parallel),
+        log_path=None,
+        resident=bool(args.resident),
+    )
+    w._log = lambda *_a, **_k: None  # бенч меряет планировщик, не stdout
+
+    for i in range(int(args.tasks)):
+        w.register(
+            f"t{i:03d}",
+            _short if i % 5 == 0 else _noop,
+            every_sec=1 + (i % int(args.spread)),
+            timeout_sec=30,
+            priority=i % 10,
+        )
+
+    cpu0 = time.process_time()
+    t0 = time.perf_counter()
+    threading.Timer(float(args.seconds), w.stop).start()
+    w.run_forever()
+    wall = time.perf_counter() - t0
+    cpu = time.process_time() - cpu0
+
+    lags: List[float] = []
+    runs = 0
+    for st in w._stats.values():
+        lags.extend(st.lags_ms)
+        runs += st.runs
+    return {
+        "label": label,
+        "runs": runs,
+        "wall": wall,
+        "cpu": cpu,
+        "lag_p50": _pct(lags, 0.50),
+        "lag_p95": _pct(lags, 0.95),
+        "lag_max": max(lags) if lags else 0.0,
+        "jitter": statistics.pstdev(lags) if len(lags) > 1 else 0.0,
+    }
+
+
+def _print_line(r: Dict[str, Any]) -> None:
+    print(
+        f"{r['label']:<6} runs={r['runs']:<6} wall={r['wall']:.1f}s cpu={r['cpu']:.2f}s  "
+        f"lag p50={r['lag_p50']:.1f}ms p95={r['lag_p95']:.1f}ms max={r['lag_max']:.1f}ms  "
+        f"jitter(sd)={r['jitter']:.1f}ms"
+    )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tasks", type=int, default=60, help="registered tasks")
+    ap.add_argument("--seconds", type=float, default=15.0, help="run time per mode")
+    ap.add_argument("--spread", type=int, default=5, help="every_sec = 1..spread")
+    ap.add_argument("--tick", type=float, default=0.5, help="tick_sec")
+    ap.add_argument("--max-parallel", type=int, default=50)
+    ap.add_argument("--resident", action="store_true", help="resident children instead of fork-per-run")
+    ap.add_argument("--mode", choices=["both", "event", "tick"], default="both")
+    args = ap.parse_args()
+
+    print(
+        f"tasks={args.tasks} seconds={args.seconds} tick={args.tick} "
+        f"max_parallel={args.max_parallel} resident={bool(args.resident)}"
+    )
+    if args.mode in ("both", "tick"):
+        _print_line(_run("TICK", _TickWorker, args))
+    if args.mode in ("both", "event"):
+        _print_line(_run("EVENT", Worker, args))
+
+
+if __name__ == "__main__":
+    main()
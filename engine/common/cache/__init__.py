@@ -1,4 +1,6 @@
-# FILE: engine/common/cache/__init__.py  (новое — 2025-12-20)
+# FILE: engine/common/cache/__init__.py  (обновлено — 2026-10-16)
 # Смысл: публичный API дев-кеша (IPC через UNIX-socket): memo(query, fn, ttl, version, update).
+#        AsyncCacheClient / ACLIENT — тот же API для asyncio (engine.common.cache.aio).
 
-from .client import memo, CacheClient, DEFAULT_TTL_SEC, DEFAULT_VERSION
\ No newline at end of file
+from .client import memo, CacheClient, DEFAULT_TTL_SEC, DEFAULT_VERSION
+from .aio import AsyncCacheClient, ACLIENT
@@ -0,0 +1,785 @@
+# FILE: engine/common/cache/aio.py  (новое — 2026-10-16)
+# PURPOSE: asyncio-клиент того же Redis: тот же UNIX-сокет (asyncio.open_unix_connection), тот же RESP-парсер
+#          (client._RespReader), тот же кодек / L1 / лимиты. Семантика методов — как у CLIENT:
+#          None / False / 0 при недоступном Redis, общий с sync-клиентом backoff (_RPC_DOWN_UNTIL).
+#          Авто-pipelining: все команды, выданные за один проход event loop-а (тысячи одновременных await),
+#          уходят одной записью в сокет; ответы разбирает одна reader-задача и раздаёт future-ам по порядку.
+#          Одно соединение на event loop, без потоков на операцию.
+#          ACLIENT.get/set/get_obj/set_obj/get_many/set_many/delete_many/stats/lock_*/eval/incr/... ,
+#          memo() / memo_many_iter() — те же ключи и формат, что у sync memo (значения общие).
+#          fn у memo может быть обычной функцией или async (корутина await-ится).
+
+from __future__ import annotations
+
+import asyncio
+import inspect
+import os
+import socket
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Sequence, Tuple, Union
+
+from engine.common.cache import codec
+from engine.common.cache.client import (
+    DEFAULT_TTL_SEC,
+    DEFAULT_VERSION,
+    MAX_VALUE_BYTES,
+    RPC_TIMEOUT_SEC,
+    SF_LOCK_SEC,
+    SF_WAIT_SEC,
+    _BIG_BULK_BYTES,
+    _L1,
+    _LUA_INCR,
+    _LUA_PACE,
+    _LUA_RELEASE,
+    _LUA_RENEW,
+    _LUA_SEM_ACQUIRE,
+    _LUA_SEM_RENEW,
+    _LUA_SLIDING_WINDOW,
+    _LUA_TOKEN_BUCKET,
+    _RBUF_BYTES,
+    _SF_POLL_MAX_SEC,
+    _SF_POLL_MIN_SEC,
+    _KEY_SIZES,
+    _MemoOpts,
+    _RedisIOError,
+    _RedisReplyError,
+    _Resp,
+    _RespReader,
+    _chunked_pairs,
+    _encode_cmds,
+    _eval_cmd,
+    _get_result,
+    _is_ok,
+    _key_namespace,
+    _l1_ttl,
+    _lock_ttl_ms,
+    _make_key,
+    _mget_result,
+    _ms,
+    _redis_sock_path,
+    _rpc_is_down,
+    _rpc_mark_down,
+    _set_many_plan,
+    _set_many_result,
+    _sf_lock_name,
+    _stats_result,
+    _ttl_or_default,
+    _xf_key,
+    _xf_should_refresh,
+)
+
+_WRITE_HIGH_BYTES = 4 * 1024 * 1024  # неотправленного в transport больше -> ждём drain перед новой командой
+
+
+class _NeedMore(Exception):
+    # в буфере не хватает данных; args[0] — абсолютная позиция в _rbuf, до которой нужно дочитать
+    pass
+
+
+class _AsyncConn(_RespReader):
+    """
+    Одно соединение event loop-а. submit() ставит команды в очередь записи (flush — call_soon, одним writelines
+    на все команды прохода) и future-ы в FIFO; _read_loop() дочитывает в буфер _RespReader и разбирает ответы.
+    Неполный ответ: _fill бросает _NeedMore, позиция откатывается к _mark, разбор повторяется после дочитки.
+    Массив верхнего уровня (MGET) разбирается с продолжением по элементам — без повторного разбора начала.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        super().__init__()
+        self._reader = reader
+        self._writer = writer
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._wcmds: List[Sequence[Union[str, bytes, int]]] = []
+        self._flush_scheduled = False
+        self._mark = 0
+        self._want = 1
+        self._partial: Optional[List[Any]] = None
+        self._partial_n = 0
+        self.closed = False
+        self._busy_since = 0.0  # когда очередь ожидания стала непустой
+        self._last_rx = 0.0
+        self._watchdog_h: Optional[asyncio.TimerHandle] = None
+        self._task = asyncio.get_running_loop().create_task(self._read_loop())
+
+    # ---- _RespReader ----
+
+    def _fill(self, need: int) -> None:
+        if self._rend - self._rpos < need:
+            raise _NeedMore(self._rpos + need)
+
+    def _consumed(self, n: int) -> None:
+        # без сброса в 0: до конца ответа позиция может откатиться к _mark
+        self._rpos += n
+
+    def _read_big(self, ln: int) -> Union[bytes, bytearray]:
+        self._fill(ln + 2)  # _NeedMore несёт полный размер -> буфер растёт под bulk за одну дочитку
+        p = self._rpos
+        out = bytes(self._rview[p : p + ln])
+        self._consumed(ln + 2)
+        return out
+
+    # ---- запись ----
+
+    def submit(self, cmds: Sequence[Sequence[Union[str, bytes, int]]]) -> List[asyncio.Future]:
+        loop = asyncio.get_running_loop()
+        futs = [loop.create_future() for _ in cmds]
+        if not self._waiters:
+            self._busy_since = time.monotonic()
+        self._waiters.extend(futs)
+        self._wcmds.extend(cmds)
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            loop.call_soon(self._flush)
+        if self._watchdog_h is None:
+            self._watchdog_h = loop.call_later(RPC_TIMEOUT_SEC, self._watchdog)
+        return futs
+
+    def _watchdog(self) -> None:
+        # как socket timeout у sync: ответы ждут, а из сокета ничего не пришло RPC_TIMEOUT_SEC -> соединение мёртво
+        self._watchdog_h = None
+        if self.closed or not self._waiters:
+            return
+        quiet = time.monotonic() - max(self._last_rx, self._busy_since)
+        if quiet >= RPC_TIMEOUT_SEC:
+            self._fail(socket.timeout("rpc_timeout"))
+            return
+        self._watchdog_h = asyncio.get_running_loop().call_later(RPC_TIMEOUT_SEC - quiet, self._watchdog)
+
+    def _flush(self) -> None:
+        self._flush_scheduled = False
+        cmds, self._wcmds = self._wcmds, []
+        if self.closed or not cmds:
+            return
+        try:
+            self._writer.writelines(_encode_cmds(cmds))
+        except Exception as e:
+            self._fail(e)
+
+    def write_backlog(self) -> int:
+        try:
+            return int(self._writer.transport.get_write_buffer_size())
+        except Exception:
+            return 0
+
+    async def drain(self) -> None:
+        await self._writer.drain()
+
+    # ---- чтение ----
+
+    async def _read_loop(self) -> None:
+        try:
+            while True:
+                await self._feed()
+                self._parse_replies()
+        except Exception as e:
+            self._fail(e)
+
+    async def _feed(self) -> None:
+        if self._rpos == self._rend:
+            self._rpos = self._rend = self._mark = 0
+        avail = self._rend - self._rpos
+        self._compact(max(self._want, avail + _BIG_BULK_BYTES))
+        self._mark = self._rpos
+        data = await self._reader.read(len(self._rbuf) - self._rend)
+        if not data:
+            raise _RedisIOError("closed")
+        self._rview[self._rend : self._rend + len(data)] = data
+        self._rend += len(data)
+        self._last_rx = time.monotonic()
+
+    def _parse_replies(self) -> None:
+        while self._rpos < self._rend:
+            self._mark = self._rpos
+            try:
+                if self._partial is not None:
+                    resp = self._read_partial()
+                elif self._rbuf[self._rpos] == 0x2A:  # *
+                    self._rpos += 1
+                    n = self._read_int("bad_array_len")
+                    if n == -1:
+                        resp = None
+                    else:
+                        self._partial = []
+                        self._partial_n = n
+                        resp = self._read_partial()
+                else:
+                    resp = self._read_reply()
+            except _NeedMore as e:
+                self._want = int(e.args[0]) - self._mark
+                self._rpos = self._mark
+                return
+            except _RedisReplyError as e:
+                if self._partial is not None:
+                    raise _RedisIOError(f"error_inside_array: {e}")
+                resp = e  # ошибка одной команды; поток ответов цел
+            self._want = 1
+            self._resolve(resp)
+
+    def _read_partial(self) -> List[Any]:
+        arr = self._partial
+        assert arr is not None
+        while len(arr) < self._partial_n:
+            self._mark = self._rpos
+            arr.append(self._read_reply())
+        self._partial = None
+        return arr
+
+    def _resolve(self, resp: Any) -> None:
+        if not self._waiters:
+            raise _RedisIOError("unexpected_reply")
+        fut = self._waiters.popleft()
+        if not fut.done():  # cancelled (таймаут вызывающего) -> ответ просто выбрасывается
+            fut.set_result(resp)
+
+    def _fail(self, e: BaseException, *, mark_down: bool = True) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        err = e if isinstance(e, _RedisIOError) else _RedisIOError(f"{type(e).__name__}: {e}")
+        while self._waiters:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                fut.set_result(err)
+        self._wcmds = []
+        if self._watchdog_h is not None:
+            self._watchdog_h.cancel()
+            self._watchdog_h = None
+        try:
+            self._writer.close()
+        except Exception:
+            pass
+        if mark_down:
+            _rpc_mark_down(e)
+
+    def close(self) -> None:
+        self._fail(_RedisIOError("closed"), mark_down=False)
+        self._task.cancel()
+
+
+async def _call_fn(fn: Callable[[Any], Any], query: Any) -> Any:
+    value = fn(query)
+    if inspect.isawaitable(value):
+        value = await value
+    return value
+
+
+class AsyncCacheClient:
+    def __init__(self) -> None:
+        self._conn: Optional[_AsyncConn] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+
+    async def _get_conn(self) -> _AsyncConn:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # новый event loop (asyncio.run повторно / другой поток): соединение прежнего loop-а не годится
+            self._loop = loop
+            self._conn = None
+            self._connect_lock = asyncio.Lock()
+        c = self._conn
+        if c is not None and not c.closed:
+            return c
+        assert self._connect_lock is not None
+        async with self._connect_lock:
+            c = self._conn
+            if c is None or c.closed:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_unix_connection(_redis_sock_path(), limit=_RBUF_BYTES), RPC_TIMEOUT_SEC
+                )
+                c = self._conn = _AsyncConn(reader, writer)
+            return c
+
+    async def _call_many(self, cmds: Sequence[Tuple[Union[str, bytes, int], ...]]) -> Optional[List[_Resp]]:
+        if not cmds:
+            return []
+        if _rpc_is_down():
+            return None
+        try:
+            conn = await self._get_conn()
+            if conn.write_backlog() > _WRITE_HIGH_BYTES:
+                await conn.drain()
+            futs = conn.submit(cmds)
+            # ответы приходят по порядку: последовательный await дешевле gather; таймаут — watchdog соединения
+            rr = [await f for f in futs]
+        except asyncio.TimeoutError:
+            _rpc_mark_down(socket.timeout())
+            return None
+        except Exception as e:
+            _rpc_mark_down(e)
+            return None
+        for r in rr:
+            if isinstance(r, _RedisIOError):
+                if isinstance(r, _RedisReplyError):
+                    _rpc_mark_down(r)  # как sync: ошибка Redis = backoff (соединение при этом живо)
+                return None
+        return rr
+
+    async def _call(self, *parts: Union[str, bytes, int]) -> Optional[_Resp]:
+        if _rpc_is_down():
+            return None
+        try:
+            conn = await self._get_conn()
+            if conn.write_backlog() > _WRITE_HIGH_BYTES:
+                await conn.drain()
+            r = await conn.submit([parts])[0]
+        except asyncio.TimeoutError:
+            _rpc_mark_down(socket.timeout())
+            return None
+        except Exception as e:
+            _rpc_mark_down(e)
+            return None
+        if isinstance(r, _RedisIOError):
+            if isinstance(r, _RedisReplyError):
+                _rpc_mark_down(r)
+            return None
+        return r
+
+    async def close(self) -> None:
+        c = self._conn
+        self._conn = None
+        if c is not None:
+            c.close()
+
+    # ---------------- get / set ----------------
+
+    async def get(self, key: str, ttl_sec: int, *, l1: bool = False, l1_ttl: Optional[int] = None) -> Optional[bytes]:
+        ns = _key_namespace(key)
+        cache = _L1.ensure() if l1 else None
+        seq = 0
+        if cache is not None:
+            hit, value = cache.get(key, ns)
+            if hit:
+                return value
+            seq = cache.seq()
+
+        wire = await self._get_wire(key)
+        if wire is None:
+            return None
+        try:
+            _ser, payload = codec.decode(wire, ns=ns)
+        except codec.CodecError:
+            return None
+
+        if cache is not None:
+            cache.put(key, payload, size=len(payload), ttl_sec=_l1_ttl(l1_ttl, ttl_sec), seq=seq)
+        return payload
+
+    async def set(self, key: str, payload: bytes, ttl_sec: int) -> bool:
+        if not isinstance(payload, (bytes, bytearray)):
+            return False
+        return await self._set_wire(key, codec.encode(bytes(payload), ns=_key_namespace(key)), ttl_sec)
+
+    async def get_obj(self, key: str, ttl_sec: int, *, ns: Optional[str] = None) -> Tuple[bool, Any, int]:
+        wire = await self._get_wire(key)
+        if wire is None:
+            return False, None, 0
+        try:
+            return True, codec.loads(wire, ns=ns or _key_namespace(key)), len(wire)
+        except Exception:
+            return False, None, 0
+
+    async def set_obj(
+        self, key: str, value: Any, ttl_sec: int, *, serializer: str = "pickle", ns: Optional[str] = None
+    ) -> int:
+        try:
+            wire = codec.dumps(value, serializer=serializer, ns=ns or _key_namespace(key))
+        except Exception:
+            return 0
+        return len(wire) if await self._set_wire(key, wire, ttl_sec) else 0
+
+    async def _get_wire(self, key: str) -> Optional[bytes]:
+        return _get_result(key, await self._call("GET", key))
+
+    async def _set_wire(self, key: str, wire: bytes, ttl_sec: int) -> bool:
+        if len(wire) > MAX_VALUE_BYTES:
+            return False
+
+        ttl_i = _ttl_or_default(ttl_sec)
+        pub = _L1.publish_cmd([key])
+        if pub is None:
+            r = await self._call("SET", key, wire, "EX", ttl_i)
+        else:
+            rr = await self._call_many([("SET", key, wire, "EX", ttl_i), pub])
+            r = rr[0] if rr else None
+            _L1.written([key])
+        ok = _is_ok(r)
+        if ok:
+            _KEY_SIZES.set(key, len(wire))
+        return ok
+
+    async def get_many(self, keys: Sequence[str], ttl_sec: int) -> List[Optional[bytes]]:
+        out: List[Optional[bytes]] = []
+        for k, wire in zip(keys, await self._get_many_wire(keys)):
+            if wire is None:
+                out.append(None)
+                continue
+            try:
+                out.append(codec.decode(wire, ns=_key_namespace(str(k)))[1])
+            except codec.CodecError:
+                out.append(None)
+        return out
+
+    async def _get_many_wire(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        if not keys:
+            return []
+        return _mget_result(keys, await self._call("MGET", *list(keys)))
+
+    async def set_many(self, items: Sequence[Tuple[str, bytes]], ttl_sec: int) -> int:
+        return await self._set_many_wire(
+            [
+                (str(k), codec.encode(bytes(payload), ns=_key_namespace(str(k))))
+                for k, payload in items
+                if isinstance(payload, (bytes, bytearray))
+            ],
+            ttl_sec,
+        )
+
+    async def _set_many_wire(self, items: Sequence[Tuple[str, bytes]], ttl_sec: int) -> int:
+        kept, cmds = _set_many_plan(items, ttl_sec)
+        if not cmds:
+            return 0
+
+        pub = _L1.publish_cmd([k for k, _pb in kept])
+        rr = await self._call_many(cmds + [pub] if pub is not None else cmds)
+        if pub is not None:
+            _L1.written([k for k, _pb in kept])
+        return _set_many_result(kept, rr)
+
+    async def delete_many(self, keys: Sequence[str]) -> int:
+        if not keys:
+            return 0
+        pub = _L1.publish_cmd([str(k) for k in keys])
+        if pub is None:
+            r = await self._call("DEL", *list(keys))
+        else:
+            rr = await self._call_many([("DEL", *list(keys)), pub])
+            r = rr[0] if rr else None
+            _L1.written([str(k) for k in keys])
+        return int(r) if isinstance(r, int) else 0
+
+    async def stats(self) -> Optional[dict[str, Any]]:
+        rr = await self._call_many([("DBSIZE",), ("INFO", "memory")])
+        if rr is None:
+            return None
+        return _stats_result(rr[0], rr[1], _L1.cache.stats(), codec.codec_stats())
+
+    # ---------------- locks ----------------
+
+    async def lock_try(self, key: str, *, ttl_sec: float, owner: str) -> Optional[dict[str, Any]]:
+        ttl_ms = _lock_ttl_ms(ttl_sec)
+        token = os.urandom(16).hex()
+        r = await self._call("SET", f"lock:{key}", token, "NX", "PX", ttl_ms)
+        if r is None:
+            return None
+        if _is_ok(r):
+            return {"ok": True, "acquired": True, "owner": str(owner), "token": token, "expire_ms": ttl_ms}
+        return {"ok": True, "acquired": False}
+
+    async def lock_renew(self, key: str, *, ttl_sec: float, token: str) -> bool:
+        r = await self._call("EVAL", _LUA_RENEW, 1, f"lock:{key}", str(token), _lock_ttl_ms(ttl_sec))
+        return bool(isinstance(r, int) and r == 1)
+
+    async def lock_release(self, key: str, *, token: str) -> bool:
+        r = await self._call("EVAL", _LUA_RELEASE, 1, f"lock:{key}", str(token))
+        return bool(isinstance(r, int) and r == 1)
+
+    async def lock_status(self, key: str) -> Optional[dict[str, Any]]:
+        r = await self._call("GET", f"lock:{key}")
+        if r is None:
+            return None
+        return {"ok": True, "held": isinstance(r, (bytes, bytearray))}
+
+    # ---------------- eval / атомарные примитивы ----------------
+
+    async def eval(
+        self, script: bytes, keys: Sequence[str], args: Sequence[Union[str, bytes, int, float]]
+    ) -> Optional[_Resp]:
+        return await self._call(*_eval_cmd(script, keys, args))
+
+    async def incr(self, key: str, by: int = 1, *, ttl_sec: int = 0, refresh_ttl: bool = True) -> Optional[int]:
+        r = await self.eval(_LUA_INCR, [key], [int(by), int(ttl_sec or 0), "1" if refresh_ttl else "0"])
+        return int(r) if isinstance(r, int) else None
+
+    async def incr_many(
+        self, items: Sequence[Tuple[str, int]], *, ttl_sec: int = 0, refresh_ttl: bool = True
+    ) -> List[Optional[int]]:
+        if not items:
+            return []
+        flag = "1" if refresh_ttl else "0"
+        rr = await self._call_many(
+            [(b"EVAL", _LUA_INCR, 1, str(k), int(by), int(ttl_sec or 0), flag) for k, by in items]
+        )
+        if rr is None:
+            return [None] * len(items)
+        return [int(r) if isinstance(r, int) else None for r in rr]
+
+    async def rate_limit(
+        self, key: str, *, limit: int, window_sec: float, cost: int = 1
+    ) -> Optional[Tuple[bool, int, float]]:
+        r = await self.eval(
+            _LUA_SLIDING_WINDOW, [key], [_ms(window_sec), int(limit), max(1, int(cost)), os.urandom(8).hex()]
+        )
+        if not isinstance(r, list) or len(r) < 3:
+            return None
+        return bool(r[0] == 1), int(r[1] or 0), max(0.0, float(r[2] or 0) / 1000.0)
+
+    async def token_bucket(
+        self, key: str, *, rate_per_sec: float, burst: float, cost: float = 1.0
+    ) -> Optional[Tuple[bool, float]]:
+        if float(rate_per_sec) <= 0:
+            raise ValueError("rate_per_sec must be > 0")
+        r = await self.eval(_LUA_TOKEN_BUCKET, [key], [float(rate_per_sec), float(burst), float(cost)])
+        if not isinstance(r, list) or len(r) < 2:
+            return None
+        return bool(r[0] == 1), max(0.0, float(r[1] or 0) / 1000.0)
+
+    async def sem_acquire(self, key: str, *, limit: int, lease_sec: float) -> Optional[str]:
+        token = os.urandom(16).hex()
+        r = await self.eval(_LUA_SEM_ACQUIRE, [key], [int(limit), _ms(lease_sec), token])
+        return token if isinstance(r, int) and r == 1 else None
+
+    async def sem_renew(self, key: str, *, token: str, lease_sec: float) -> bool:
+        r = await self.eval(_LUA_SEM_RENEW, [key], [_ms(lease_sec), str(token)])
+        return bool(isinstance(r, int) and r == 1)
+
+    async def sem_release(self, key: str, *, token: str) -> bool:
+        r = await self._call("ZREM", key, str(token))
+        return bool(isinstance(r, int) and r == 1)
+
+    async def pace(
+        self, key: str, *, interval_sec: float, max_wait_sec: float = -1.0, ttl_sec: float = 3600
+    ) -> Optional[float]:
+        max_wait_ms = _ms(max_wait_sec) if float(max_wait_sec) >= 0 else -1
+        r = await self.eval(_LUA_PACE, [key], [_ms(interval_sec), max_wait_ms, max(1000, _ms(ttl_sec))])
+        if not isinstance(r, int):
+            return None
+        return -1.0 if r < 0 else float(r) / 1000.0
+
+
+ACLIENT = AsyncCacheClient()
+
+
+# -------------------- memo (async): та же логика, что client.memo --------------------
+
+
+async def _memo_compute(query: Any, fn: Callable[[Any], Any], key: str, o: _MemoOpts) -> Tuple[Any, int]:
+    t0 = time.monotonic()
+    value = await _call_fn(fn, query)
+    delta = time.monotonic() - t0
+
+    if o.early_refresh <= 0:
+        return value, await ACLIENT.set_obj(key, value, o.ttl_sec, serializer=o.serializer, ns=o.ns)
+
+    try:
+        wire = codec.dumps(value, serializer=o.serializer, ns=o.ns)
+    except Exception:
+        return value, 0
+    meta = f"{delta:.3f} {time.time() + o.ttl_sec:.3f}".encode("utf-8")
+    ok = await ACLIENT._set_many_wire([(key, wire), (_xf_key(key), meta)], ttl_sec=o.ttl_sec) > 0
+    return value, (len(wire) if ok else 0)
+
+
+async def _memo_single_flight(
+    query: Any, fn: Callable[[Any], Any], key: str, o: _MemoOpts, wait_sec: float, lock_sec: float
+) -> Tuple[Any, int]:
+    lock_name = _sf_lock_name(key)
+    owner = str(os.getpid())
+    deadline = time.monotonic() + max(0.0, float(wait_sec))
+    delay = _SF_POLL_MIN_SEC
+
+    while True:
+        lk = await ACLIENT.lock_try(lock_name, ttl_sec=lock_sec, owner=owner)
+        if lk is not None and lk.get("acquired"):
+            try:
+                found, value, size = await ACLIENT.get_obj(key, o.ttl_sec, ns=o.ns)
+                if found:
+                    return value, size
+                return await _memo_compute(query, fn, key, o)
+            finally:
+                await ACLIENT.lock_release(lock_name, token=str(lk.get("token") or ""))
+
+        while True:
+            if time.monotonic() >= deadline:
+                return await _memo_compute(query, fn, key, o)
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, _SF_POLL_MAX_SEC)
+
+            rr = await ACLIENT._call_many([("GET", key), ("EXISTS", f"lock:{lock_name}")])
+            if rr is None or len(rr) < 2:
+                return await _memo_compute(query, fn, key, o)
+            if isinstance(rr[0], (bytes, bytearray)):
+                wire = bytes(rr[0])
+                try:
+                    return codec.loads(wire, ns=o.ns), len(wire)
+                except Exception:
+                    pass
+            if not rr[1]:
+                break
+
+
+async def _memo_refresh_early(
+    query: Any, fn: Callable[[Any], Any], key: str, o: _MemoOpts, lock_sec: float, cached: Any
+) -> Tuple[bool, Any, int]:
+    lk = await ACLIENT.lock_try(_sf_lock_name(key), ttl_sec=lock_sec, owner=str(os.getpid()))
+    if not lk or not lk.get("acquired"):
+        return False, cached, 0
+    try:
+        value, size = await _memo_compute(query, fn, key, o)
+    except Exception:
+        return False, cached, 0
+    finally:
+        await ACLIENT.lock_release(_sf_lock_name(key), token=str(lk.get("token") or ""))
+    return True, value, size
+
+
+async def memo(
+    query: Any,
+    fn: Callable[[Any], Any],
+    *,
+    ttl: int = DEFAULT_TTL_SEC,
+    version: str = DEFAULT_VERSION,
+    update: bool = False,
+    l1: bool = False,
+    l1_ttl: Optional[int] = None,
+    single_flight: bool = False,
+    sf_wait_sec: float = SF_WAIT_SEC,
+    sf_lock_sec: float = SF_LOCK_SEC,
+    early_refresh: float = 0.0,
+    serializer: str = "pickle",
+) -> Any:
+    """Async-версия client.memo: те же параметры, ключи и формат значения."""
+    ttl_sec = int(ttl) if ttl is not None else DEFAULT_TTL_SEC
+    if ttl_sec <= 0:
+        ttl_sec = DEFAULT_TTL_SEC
+    beta = float(early_refresh or 0.0)
+    o = _MemoOpts(ttl_sec, beta, serializer, str(version))
+
+    try:
+        key = _make_key(query, fn, version)
+    except Exception:
+        return await _call_fn(fn, query)
+
+    cache = _L1.ensure() if l1 else None
+    seq = cache.seq() if cache is not None else 0
+
+    if not update:
+        if cache is not None:
+            hit, value = cache.get(key, str(version))
+            if hit:
+                return value
+
+        meta: Optional[bytes] = None
+        if beta > 0:
+            wire, meta = await ACLIENT._get_many_wire([key, _xf_key(key)])
+        else:
+            wire = await ACLIENT._get_wire(key)
+
+        if wire is not None:
+            try:
+                value = codec.loads(wire, ns=o.ns)
+            except Exception:
+                pass
+            else:
+                size = len(wire)
+                if beta > 0 and _xf_should_refresh(meta, beta):
+                    refreshed, value, fresh_size = await _memo_refresh_early(query, fn, key, o, sf_lock_sec, value)
+                    if refreshed:
+                        size = fresh_size
+                        if cache is not None:
+                            seq = cache.seq()
+                if cache is not None and size:
+                    cache.put(key, value, size=size, ttl_sec=_l1_ttl(l1_ttl, ttl_sec), seq=seq)
+                return value
+
+        if single_flight:
+            value, size = await _memo_single_flight(query, fn, key, o, sf_wait_sec, sf_lock_sec)
+            if size and cache is not None:
+                cache.put(key, value, size=size, ttl_sec=_l1_ttl(l1_ttl, ttl_sec), seq=cache.seq())
+            return value
+
+    value, size = await _memo_compute(query, fn, key, o)
+    if size and cache is not None:
+        cache.put(key, value, size=size, ttl_sec=_l1_ttl(l1_ttl, ttl_sec), seq=cache.seq())
+    return value
+
+
+async def memo_many_iter(
+    queries: Sequence[Any],
+    fn: Callable[[Any], Any],
+    *,
+    ttl: int = DEFAULT_TTL_SEC,
+    version: str = DEFAULT_VERSION,
+    update: bool = False,
+    chunk: int = 200,
+    serializer: str = "pickle",
+    concurrency: int = 1,
+) -> AsyncIterator[Tuple[Any, Any]]:
+    """
+    Async-версия client.memo_many_iter: yield (query, value), порядок не гарантируется.
+    concurrency > 1: промахи чанка считаются одновременно (для async fn), иначе по одному.
+    """
+    if not queries:
+        return
+
+    ttl_sec = int(ttl) if ttl is not None else DEFAULT_TTL_SEC
+    ns = str(version)
+    chunk_i = int(chunk) if chunk is not None else 200
+    if chunk_i <= 0:
+        chunk_i = 200
+
+    good: List[Tuple[Any, str]] = []
+    for q in queries:
+        try:
+            good.append((q, _make_key(q, fn, version)))
+        except Exception:
+            yield (q, await _call_fn(fn, q))
+
+    _MISS = object()
+    sem = asyncio.Semaphore(max(1, int(concurrency)))
+
+    async def compute(q: Any) -> Any:
+        async with sem:
+            return await _call_fn(fn, q)
+
+    for part in _chunked_pairs(good, chunk_i):
+        part_qk = list(part)
+        hits: Dict[str, Any] = {}
+        misses: List[Tuple[Any, str]] = []
+
+        if update:
+            misses = part_qk
+        else:
+            wires = await ACLIENT._get_many_wire([k for (_q, k) in part_qk])
+            for (q, k), wire in zip(part_qk, wires):
+                if wire is None:
+                    misses.append((q, k))
+                    continue
+                try:
+                    hits[k] = codec.loads(wire, ns=ns)
+                except Exception:
+                    misses.append((q, k))
+
+        for q, k in part_qk:
+            v = hits.get(k, _MISS)
+            if v is not _MISS:
+                yield (q, v)
+
+        if int(concurrency) > 1 and len(misses) > 1:
+            values = await asyncio.gather(*(compute(q) for q, _k in misses))
+        else:
+            values = None
+
+        to_set: List[Tuple[str, bytes]] = []
+        for i, (q, k) in enumerate(misses):
+            v = values[i] if values is not None else await _call_fn(fn, q)
+            try:
+                pb = codec.dumps(v, serializer=serializer, ns=ns)
+                if len(pb) <= MAX_VALUE_BYTES:
+                    to_set.append((k, pb))
+            except Exception:
+                pass
+            yield (q, v)
+
+        if to_set:
+            await ACLIENT._set_many_wire(to_set, ttl_sec=ttl_sec)
@@ -1,17 +1,26 @@
-# FILE: engine/common/cache/bench_cache.py  (новое — 2026-01-05)
+# FILE: engine/common/cache/bench_cache.py  (обновлено — 2026-10-16)
 # PURPOSE: Бенч кеш-демона по локальному UNIX-socket: SET/GET/GET-miss пачками (по 5000 ключей),
 #          замер времени и пропускной способности. Тестирует small и big payload.
+# CHANGE: + MGET по --mget-batch ключей и huge payload (MB/s) на живом Redis;
+#         + --offline: разбор канонического ответа (MGET-5000 / huge bulk) через socketpair без Redis —
+#           прежний _RedisConn (bytearray + del buf[:n]) против текущего (offset + recv_into).
+#         + --aio N: N одновременных GET — CLIENT из пула потоков против ACLIENT (asyncio, авто-pipelining).
 
 from __future__ import annotations
 
 import argparse
+import asyncio
 import os
 import random
+import socket
 import string
+import threading
 import time
-from typing import List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Tuple
 
-from engine.common.cache.client import CLIENT
+from engine.common.cache.aio import ACLIENT
+from engine.common.cache.client import CLIENT, _RedisConn
 
 
 def _rand_key(prefix: str, i: int) -> str:
@@ -58,11 +67,162 @@ def _bench_get_miss(keys: List[str], ttl_sec: int) -> Tuple[float, int]:
     return dt, miss
 
 
+def _bench_mget(keys: List[str], batch: int, ttl_sec: int) -> Tuple[float, int]:
+    t0 = time.perf_counter()
+    hit = 0
+    for part in _chunked(keys, batch):
+        hit += sum(1 for v in CLIENT.get_many(part, ttl_sec=ttl_sec) if v is not None)
+    dt = time.perf_counter() - t0
+    return dt, hit
+
+
 def _print_line(title: str, n: int, dt: float, cnt: int) -> None:
     rps = (n / dt) if dt > 0 else 0.0
     print(f"{title:<18} n={n:<6} dt={dt:.4f}s  rps={rps:,.0f}/s  cnt={cnt}")
 
 
+def _print_mb(title: str, n: int, size: int, dt: float, cnt: int) -> None:
+    mbs = (n * size / dt / (1024 * 1024)) if dt > 0 else 0.0
+    print(f"{title:<18} n={n:<6} dt={dt:.4f}s  {mbs:,.0f} MB/s  cnt={cnt}")
+
+
+# ---- offline: разбор ответа без Redis (socketpair) ----
+
+
+class _LegacyConn:
+    # _RedisConn до 2026-10-16: recv-чанки в bytearray, slice + del buf[:n] на каждый элемент ответа
+    def __init__(self, sock: socket.socket) -> None:
+        self._sock = sock
+        self._buf = bytearray()
+
+    def _fill(self, s: socket.socket, need: int = 1) -> None:
+        while len(self._buf) < need:
+            chunk = s.recv(64 * 1024)
+            if not chunk:
+                raise RuntimeError("closed")
+            self._buf += chunk
+
+    def _read_exact(self, s: socket.socket, n: int) -> bytes:
+        if n <= 0:
+            return b""
+        self._fill(s, n)
+        out = bytes(self._buf[:n])
+        del self._buf[:n]
+        return out
+
+    def _read_until_crlf(self, s: socket.socket) -> bytes:
+        while True:
+            idx = self._buf.find(b"\r\n")
+            if idx != -1:
+                out = bytes(self._buf[:idx])
+                del self._buf[: idx + 2]
+                return out
+            self._fill(s, len(self._buf) + 1)
+
+    def _read_reply(self, s: socket.socket) -> Any:
+        t = self._read_exact(s, 1)
+        if t == b"+":
+            return self._read_until_crlf(s).decode("utf-8", errors="replace")
+        if t == b":":
+            return int(self._read_until_crlf(s))
+        if t == b"$":
+            ln = int(self._read_until_crlf(s))
+            if ln == -1:
+                return None
+            data = self._read_exact(s, ln)
+            self._read_exact(s, 2)
+            return data
+        if t == b"*":
+            n = int(self._read_until_crlf(s))
+            return [self._read_reply(s) for _ in range(n)]
+        raise RuntimeError("bad_prefix")
+
+
+def _resp_mget(values: List[bytes]) -> bytes:
+    return b"*%d\r\n" % len(values) + b"".join(b"$%d\r\n%s\r\n" % (len(v), v) for v in values)
+
+
+def _resp_bulk(value: bytes) -> bytes:
+    return b"$%d\r\n" % len(value) + value + b"\r\n"
+
+
+def _offline_parse(make_read: Callable[[socket.socket], Callable[[], Any]], wire: bytes, repeat: int) -> Tuple[float, Any]:
+    a, b = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        writer = threading.Thread(target=lambda: [b.sendall(wire) for _ in range(repeat)], daemon=True)
+        read = make_read(a)
+        out: Any = None
+        t0 = time.perf_counter()
+        writer.start()
+        for _ in range(repeat):
+            out = read()
+        dt = time.perf_counter() - t0
+        writer.join()
+        return dt, out
+    finally:
+        a.close()
+        b.close()
+
+
+def _legacy_read(sock: socket.socket) -> Callable[[], Any]:
+    c = _LegacyConn(sock)
+    return lambda: c._read_reply(sock)
+
+
+def _new_read(sock: socket.socket) -> Callable[[], Any]:
+    c = _RedisConn()
+    c._sock = sock
+    return c._read_reply
+
+
+def run_offline(n: int, value_bytes: int, huge_bytes: int, repeat: int) -> None:
+    cases = [
+        (f"MGET-{n} x {value_bytes}B", _resp_mget([os.urandom(value_bytes) for _ in range(n)])),
+        (f"MGET-{n} mixed 0..16KB", _resp_mget([os.urandom(random.randint(0, 16384)) for _ in range(n)])),
+        (f"GET {huge_bytes // 1024}KB", _resp_bulk(os.urandom(huge_bytes))),
+    ]
+    for label, wire in cases:
+        dt_old, out_old = _offline_parse(_legacy_read, wire, repeat)
+        dt_new, out_new = _offline_parse(_new_read, wire, repeat)
+        same = out_old == (list(map(bytes, out_new)) if isinstance(out_new, list) else bytes(out_new))
+        mb = len(wire) * repeat / (1024 * 1024)
+        print(
+            f"{label:<26} legacy={dt_old * 1000 / repeat:8.2f}ms ({mb / dt_old:7,.0f} MB/s)  "
+            f"new={dt_new * 1000 / repeat:8.2f}ms ({mb / dt_new:7,.0f} MB/s)  x{dt_old / dt_new:5.1f}  same={same}"
+        )
+
+
+def run_aio(keys: List[str], concurrency: int, ttl: int, rounds: int) -> None:
+    # одинаковые n GET: пул потоков (как сейчас в broker / fetch_cb) против одного event loop-а
+    n = len(keys)
+    print(f"\n=== CONCURRENT GET n={n} concurrency={concurrency} ===")
+
+    async def aio_round() -> Tuple[float, int]:
+        sem = asyncio.Semaphore(concurrency)
+
+        async def one(k: str) -> bool:
+            async with sem:
+                return await ACLIENT.get(k, ttl) is not None
+
+        t0 = time.perf_counter()
+        hits = await asyncio.gather(*(one(k) for k in keys))
+        return time.perf_counter() - t0, sum(hits)
+
+    async def aio_all() -> None:
+        await ACLIENT.get(keys[0], ttl)  # connect
+        for r in range(1, rounds + 1):
+            dt, hit = await aio_round()
+            _print_line(f"aio r{r}", n, dt, hit)
+        await ACLIENT.close()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        for r in range(1, rounds + 1):
+            t0 = time.perf_counter()
+            hit = sum(1 for v in ex.map(lambda k: CLIENT.get(k, ttl), keys) if v is not None)
+            _print_line(f"threads r{r}", n, time.perf_counter() - t0, hit)
+    asyncio.run(aio_all())
+
+
 def main() -> None:
     ap = argparse.ArgumentParser()
     ap.add_argument("--n", type=int, default=5000, help="count of keys")
@@ -72,12 +232,21 @@ def main() -> None:
     ap.add_argument("--big-bytes", type=int, default=16384, help="payload size for big test (e.g. 16KB)")
     ap.add_argument("--prefix", type=str, default="bench", help="key prefix")
     ap.add_argument("--shuffle", action="store_true", help="shuffle keys each round")
+    ap.add_argument("--mget-batch", type=int, default=5000, help="keys per MGET")
+    ap.add_argument("--huge-bytes", type=int, default=4 * 1024 * 1024, help="payload size for huge test (<= 5MB)")
+    ap.add_argument("--huge-n", type=int, default=50, help="count of keys for huge test")
+    ap.add_argument("--offline", action="store_true", help="parser-only benchmark over socketpair (no Redis)")
+    ap.add_argument("--aio", type=int, default=0, help="concurrent GETs: thread pool vs AsyncCacheClient (0 = off)")
     args = ap.parse_args()
 
     n = int(args.n)
     ttl = int(args.ttl)
     rounds = int(args.rounds)
 
+    if args.offline:
+        run_offline(int(args.mget_batch), int(args.small_bytes), int(args.huge_bytes), rounds * 5)
+        return
+
     # quick daemon sanity
     st = CLIENT.stats()
     print("STATS:", st)
@@ -104,8 +273,26 @@ def main() -> None:
             dt_miss, miss = _bench_get_miss(keys_miss, ttl_sec=ttl)
             _print_line(f"GET-miss r{r}", n, dt_miss, miss)
 
+            dt_mget, hit = _bench_mget(keys, int(args.mget_batch), ttl_sec=ttl)
+            _print_line(f"MGET-{args.mget_batch} r{r}", n, dt_mget, hit)
+
+    def run_huge() -> None:
+        huge_n = int(args.huge_n)
+        payload = _rand_bytes(int(args.huge_bytes))
+        huge_keys = [_rand_key(args.prefix + "_huge", i) for i in range(huge_n)]
+        print(f"\n=== HUGE payload_bytes={len(payload)} ===")
+        for r in range(1, rounds + 1):
+            dt_set, ok = _bench_set(huge_keys, payload, ttl_sec=ttl)
+            _print_mb(f"SET r{r}", huge_n, len(payload), dt_set, ok)
+            dt_get, hit = _bench_get(huge_keys, ttl_sec=ttl)
+            _print_mb(f"GET r{r}", huge_n, len(payload), dt_get, hit)
+        CLIENT.delete_many(huge_keys)
+
     run_suite("SMALL", small_payload)
     run_suite("BIG", big_payload)
+    run_huge()
+    if int(args.aio) > 0:
+        run_aio(keys, int(args.aio), ttl, rounds)
 
 
 if __name__ == "__main__":
@@ -1,15 +1,30 @@
-# FILE: engine/common/cache/client.py  (обновлено — 2026-01-05)
+# FILE: engine/common/cache/client.py  (обновлено — 2026-10-16)
 # PURPOSE: Redis-cache client via UNIX-socket (старый интерфейс НЕ ЛОМАЕМ) + быстрые bulk/stream-хелперы.
 #          Старое (без изменений по API): CLIENT.get/set/stats/lock_* и memo()
 #          Новое (опционально): get_many/set_many/delete_many + memo_many_iter (yield всегда (query, value))
+#          eval(script, keys, args): raw EVAL для атомарных Lua-примитивов (gpt_limiter и т.п.);
+#          raise_errors=True: ошибка скрипта (-ERR / WRONGTYPE ...) -> CacheScriptError, а не None ("redis недоступен")
+#          L1 (opt-in): get(..., l1=True) / memo(..., l1=True) — in-process LRU (TTL на запись + бюджет байт),
+#          инвалидация между процессами через Redis pub/sub; hit ratio по namespace: CLIENT.l1_stats()
+#          memo(..., single_flight=True, early_refresh=beta): один вычислитель на miss (lock + ожидание результата),
+#          XFetch-обновление горячих ключей до истечения TTL
+#          Соединение: чтение по смещению (recv_into в преаллоцированный буфер, без del buf[:n]),
+#          отправка scatter-буферами (sendmsg) — большие значения не склеиваются в одну команду
+#          Кодек (engine.common.cache.codec): значения >= 1KB сжимаются (zstd / zlib), serializer в заголовке;
+#          старые ключи без заголовка читаются как раньше. MAX_VALUE_BYTES — лимит на сжатое значение.
+#          Атомарные примитивы (один round trip): incr / incr_many, rate_limit (sliding window),
+#          token_bucket, sem_acquire/renew/release (N держателей с lease), pace (резерв следующего старта)
+#          RESP-парсер (_RespReader) общий с asyncio-клиентом engine.common.cache.aio (AsyncCacheClient)
 #          ВАЖНО: sliding TTL убран (GET вместо GETEX) ради скорости и меньшей нагрузки.
 
 from __future__ import annotations
 
 import errno
 import hashlib
+import math
 import os
 import pickle
+import random
 import socket
 import threading
 import time
@@ -17,6 +32,8 @@ from collections import OrderedDict
 from pathlib import Path
 from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
 
+from engine.common.cache import codec
+
 DEFAULT_TTL_SEC = 7 * 24 * 60 * 60
 DEFAULT_VERSION = "dev"
 
@@ -35,7 +52,11 @@ POOL_SIZE = 10
 KEY_SIZE_CAP = 50_000
 
 # socket IO
-_RECV_CHUNK = 64 * 1024
+_RBUF_BYTES = 256 * 1024            # буфер чтения соединения (растёт только под строку длиннее буфера)
+_BIG_BULK_BYTES = 64 * 1024         # bulk больше -> recv_into сразу в свой bytearray
+_SCATTER_MIN_BYTES = 16 * 1024      # часть команды больше -> отдельный iovec в sendmsg (без склейки)
+_IOV_MAX = 512
+_HAS_SENDMSG = hasattr(socket.socket, "sendmsg")
 _CRLF = b"\r\n"
 
 _Resp = Union[None, int, bytes, str, list[Any]]
@@ -108,26 +129,203 @@ def _b(x: Union[str, bytes, int]) -> bytes:
     return x.encode("utf-8")
 
 
-def _encode_cmd(*parts: Union[str, bytes, int]) -> bytes:
-    # RESP Array of Bulk Strings
-    out = bytearray()
-    out += b"*" + str(len(parts)).encode("utf-8") + _CRLF
+def _encode_into(bufs: List[Any], head: bytearray, parts: Sequence[Union[str, bytes, int]]) -> bytearray:
+    # RESP Array of Bulk Strings. Мелкие части копятся в head; части >= _SCATTER_MIN_BYTES идут в bufs
+    # отдельным элементом (sendmsg отдаст их ядру без копии). -> текущий (незакрытый) head.
+    head += b"*%d\r\n" % len(parts)
     for p in parts:
-        pb = _b(p)
-        out += b"$" + str(len(pb)).encode("utf-8") + _CRLF
-        out += pb + _CRLF
-    return bytes(out)
+        pb = p if isinstance(p, (bytes, bytearray, memoryview)) else _b(p)
+        n = len(pb) if not isinstance(pb, memoryview) else pb.nbytes
+        head += b"$%d\r\n" % n
+        if n >= _SCATTER_MIN_BYTES:
+            bufs.append(head)
+            bufs.append(pb)
+            head = bytearray(_CRLF)
+        else:
+            head += pb
+            head += _CRLF
+    return head
+
+
+def _encode_cmds(cmds: Sequence[Sequence[Union[str, bytes, int]]]) -> List[Any]:
+    bufs: List[Any] = []
+    head = bytearray()
+    for c in cmds:
+        head = _encode_into(bufs, head, c)
+    if head:
+        bufs.append(head)
+    return bufs
+
+
+def _encode_cmd(*parts: Union[str, bytes, int]) -> bytes:
+    # RESP Array of Bulk Strings (одним куском; для pipeline/больших значений — _encode_cmds)
+    return b"".join(_encode_cmds([parts]))
+
+
+def _send_buffers(s: socket.socket, bufs: List[Any]) -> None:
+    if len(bufs) == 1 or not _HAS_SENDMSG:
+        s.sendall(bufs[0] if len(bufs) == 1 else b"".join(bufs))
+        return
+    views = [memoryview(b).cast("B") for b in bufs]
+    i = 0
+    while i < len(views):
+        sent = s.sendmsg(views[i : i + _IOV_MAX])
+        while sent > 0:
+            n = views[i].nbytes
+            if sent >= n:
+                sent -= n
+                i += 1
+            else:
+                views[i] = views[i][sent:]
+                sent = 0
 
 
 class _RedisIOError(RuntimeError):
     pass
 
 
-class _RedisConn:
+class _RedisReplyError(_RedisIOError):
+    # "-ERR ..." от Redis: поток ответов цел (sync всё равно рвёт соединение — как раньше)
+    pass
+
+
+class CacheScriptError(RuntimeError):
+    # eval(..., raise_errors=True): Redis ответил ошибкой на скрипт (Redis при этом жив)
+    pass
+
+
+class _RespReader:
+    """
+    RESP-парсер поверх буфера, общий для sync (_RedisConn) и asyncio (aio._AsyncConn) соединений.
+    Чтение: один преаллоцированный bytearray + memoryview, данные дописываются в хвост, разбор по смещению _rpos
+    (без del buf[:n]). Подкласс определяет _fill(need) — гарантировать need непрочитанных байт — и _read_big.
+    Результаты — свои объекты (bytes / bytearray), НЕ view на буфер: буфер переиспользуется.
+    """
+
+    def __init__(self) -> None:
+        self._rbuf = bytearray(_RBUF_BYTES)
+        self._rview = memoryview(self._rbuf)
+        self._rpos = 0
+        self._rend = 0
+
+    def _fill(self, need: int) -> None:
+        raise NotImplementedError
+
+    def _read_big(self, ln: int) -> Union[bytes, bytearray]:
+        self._fill(ln + 2)
+        p = self._rpos
+        out = bytes(self._rview[p : p + ln])
+        self._consumed(ln + 2)
+        return out
+
+    def _compact(self, need: int) -> None:
+        # сдвиг непрочитанного в начало (и рост буфера под need) — только когда хвоста не хватает
+        avail = self._rend - self._rpos
+        if self._rpos + need <= len(self._rbuf):
+            return
+        if need > len(self._rbuf):
+            grown = bytearray(max(need, 2 * len(self._rbuf)))
+            grown[:avail] = self._rview[self._rpos : self._rend]
+            self._rbuf = grown
+            self._rview = memoryview(grown)
+        elif avail:
+            self._rview[:avail] = self._rview[self._rpos : self._rend]
+        self._rpos = 0
+        self._rend = avail
+
+    def _consumed(self, n: int) -> None:
+        self._rpos += n
+        if self._rpos == self._rend:
+            self._rpos = self._rend = 0
+
+    def _read_line(self) -> Tuple[int, int]:
+        # -> (start, end) строки в _rbuf без CRLF; действительно до следующего _fill
+        while True:
+            idx = self._rbuf.find(_CRLF, self._rpos, self._rend)
+            if idx != -1:
+                start = self._rpos
+                self._rpos = idx + 2
+                return start, idx
+            self._fill(self._rend - self._rpos + 1)
+
+    def _read_int(self, err: str) -> int:
+        a, b = self._read_line()
+        try:
+            return int(self._rbuf[a:b])
+        except Exception:
+            raise _RedisIOError(err)
+
+    def _read_bulk(self, ln: int) -> Union[bytes, bytearray]:
+        if ln <= _BIG_BULK_BYTES or ln + 2 <= self._rend - self._rpos:
+            self._fill(ln + 2)
+            p = self._rpos
+            out = bytes(self._rview[p : p + ln])
+            self._consumed(ln + 2)
+            return out
+        return self._read_big(ln)
+
+    def _read_reply(self) -> _Resp:
+        self._fill(1)
+        t = self._rbuf[self._rpos]
+        self._consumed(1)
+        if t == 0x2B:  # +
+            a, b = self._read_line()
+            return self._rbuf[a:b].decode("utf-8", errors="replace")
+        if t == 0x2D:  # -
+            a, b = self._read_line()
+            raise _RedisReplyError(self._rbuf[a:b].decode("utf-8", errors="replace"))
+        if t == 0x3A:  # :
+            return self._read_int("bad_int")
+        if t == 0x24:  # $
+            ln = self._read_int("bad_bulk_len")
+            if ln == -1:
+                return None
+            return self._read_bulk(ln)
+        if t == 0x2A:  # *
+            n = self._read_int("bad_array_len")
+            if n == -1:
+                return None
+            return self._read_array(n)
+        raise _RedisIOError("bad_prefix")
+
+    def _read_array(self, n: int) -> list[Any]:
+        # MGET / SCAN: fast path для bulk-элементов, целиком лежащих в буфере (без вызова _read_reply на элемент)
+        arr: list[Any] = []
+        append = arr.append
+        for _ in range(n):
+            buf = self._rbuf
+            p = self._rpos
+            end = self._rend
+            if p < end and buf[p] == 0x24:
+                idx = buf.find(_CRLF, p + 1, end)
+                if idx != -1:
+                    try:
+                        ln = int(buf[p + 1 : idx])
+                    except Exception:
+                        raise _RedisIOError("bad_bulk_len")
+                    if ln == -1:
+                        append(None)
+                        self._consumed(idx + 2 - p)
+                        continue
+                    stop = idx + 2 + ln
+                    if stop + 2 <= end:
+                        append(bytes(self._rview[idx + 2 : stop]))
+                        self._consumed(stop + 2 - p)
+                        continue
+            append(self._read_reply())
+        return arr
+
+
+class _RedisConn(_RespReader):
+    """
+    Блокирующее соединение пула: recv_into в хвост буфера _RespReader.
+    Bulk > _BIG_BULK_BYTES читается recv_into сразу в собственный bytearray ответа (без прохода через буфер).
+    """
+
     def __init__(self) -> None:
+        super().__init__()
         self._sock: Optional[socket.socket] = None
         self._mu = threading.Lock()
-        self._buf = bytearray()
 
     def _connect(self) -> socket.socket:
         s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
@@ -138,7 +336,7 @@ class _RedisConn:
     def _ensure(self) -> socket.socket:
         if self._sock is None:
             self._sock = self._connect()
-            self._buf.clear()
+            self._rpos = self._rend = 0
         return self._sock
 
     def close(self) -> None:
@@ -148,84 +346,46 @@ class _RedisConn:
         except Exception:
             pass
         self._sock = None
-        self._buf.clear()
+        self._rpos = self._rend = 0
 
-    def _fill(self, s: socket.socket, need: int = 1) -> None:
-        while len(self._buf) < need:
-            chunk = s.recv(_RECV_CHUNK)
-            if not chunk:
+    def _fill(self, need: int) -> None:
+        # гарантирует need непрочитанных байт начиная с _rpos
+        if self._rend - self._rpos >= need:
+            return
+        self._compact(need)
+        s = self._sock
+        while self._rend - self._rpos < need:
+            n = s.recv_into(self._rview[self._rend :])
+            if not n:
                 raise _RedisIOError("closed")
-            self._buf += chunk
-
-    def _read_exact(self, s: socket.socket, n: int) -> bytes:
-        if n <= 0:
-            return b""
-        self._fill(s, n)
-        out = bytes(self._buf[:n])
-        del self._buf[:n]
-        return out
-
-    def _read_until_crlf(self, s: socket.socket) -> bytes:
-        while True:
-            idx = self._buf.find(_CRLF)
-            if idx != -1:
-                out = bytes(self._buf[:idx])
-                del self._buf[: idx + 2]
-                return out
-            self._fill(s, len(self._buf) + 1)
-
-    def _read_reply(self, s: socket.socket) -> _Resp:
-        t = self._read_exact(s, 1)
-        if t == b"+":
-            return self._read_until_crlf(s).decode("utf-8", errors="replace")
-        if t == b"-":
-            raise _RedisIOError(self._read_until_crlf(s).decode("utf-8", errors="replace"))
-        if t == b":":
-            line = self._read_until_crlf(s)
-            try:
-                return int(line)
-            except Exception:
-                raise _RedisIOError("bad_int")
-        if t == b"$":
-            line = self._read_until_crlf(s)
-            try:
-                ln = int(line)
-            except Exception:
-                raise _RedisIOError("bad_bulk_len")
-            if ln == -1:
-                return None
-            data = self._read_exact(s, ln)
-            _ = self._read_exact(s, 2)  # CRLF
-            return data
-        if t == b"*":
-            line = self._read_until_crlf(s)
-            try:
-                n = int(line)
-            except Exception:
-                raise _RedisIOError("bad_array_len")
-            if n == -1:
-                return None
-            arr: list[Any] = []
-            for _ in range(n):
-                arr.append(self._read_reply(s))
-            return arr
-        raise _RedisIOError("bad_prefix")
+            self._rend += n
+
+    def _read_big(self, ln: int) -> Union[bytes, bytearray]:
+        big = bytearray(ln)
+        view = memoryview(big)
+        have = min(self._rend - self._rpos, ln)
+        view[:have] = self._rview[self._rpos : self._rpos + have]
+        self._consumed(have)
+        while have < ln:
+            n = self._sock.recv_into(view[have:])
+            if not n:
+                raise _RedisIOError("closed")
+            have += n
+        self._fill(2)  # CRLF
+        self._consumed(2)
+        return big
 
     def call(self, *parts: Union[str, bytes, int]) -> _Resp:
         with self._mu:
             s = self._ensure()
-            s.sendall(_encode_cmd(*parts))
-            return self._read_reply(s)
+            _send_buffers(s, _encode_cmds([parts]))
+            return self._read_reply()
 
     def call_many(self, cmds: Sequence[Tuple[Union[str, bytes, int], ...]]) -> List[_Resp]:
         with self._mu:
             s = self._ensure()
-            blob = b"".join(_encode_cmd(*c) for c in cmds)
-            s.sendall(blob)
-            out: List[_Resp] = []
-            for _ in range(len(cmds)):
-                out.append(self._read_reply(s))
-            return out
+            _send_buffers(s, _encode_cmds(cmds))
+            return [self._read_reply() for _ in range(len(cmds))]
 
 
 class _ConnPool:
@@ -262,11 +422,28 @@ def _is_down_oserror(e: OSError) -> bool:
     return e.errno in (errno.ENOENT, errno.ECONNREFUSED, errno.ECONNRESET, errno.ENOTCONN, errno.EPIPE)
 
 
-def _redis_call(*parts: Union[str, bytes, int]) -> Optional[_Resp]:
+def _rpc_backoff_sec(e: BaseException) -> float:
+    # сколько не ходить в Redis после ошибки (общая для sync и aio)
+    if isinstance(e, socket.timeout):
+        return _RPC_TIMEOUT_BACKOFF_SEC
+    if isinstance(e, (FileNotFoundError, BrokenPipeError, ConnectionError, _RedisIOError)):
+        return _RPC_FAIL_BACKOFF_SEC
+    if isinstance(e, OSError):
+        return _RPC_FAIL_BACKOFF_SEC if _is_down_oserror(e) else _RPC_SOFT_BACKOFF_SEC
+    return _RPC_SOFT_BACKOFF_SEC
+
+
+def _rpc_is_down() -> bool:
+    return time.monotonic() < _RPC_DOWN_UNTIL
+
+
+def _rpc_mark_down(e: BaseException) -> None:
     global _RPC_DOWN_UNTIL
+    _RPC_DOWN_UNTIL = time.monotonic() + _rpc_backoff_sec(e)
 
-    now = time.monotonic()
-    if now < _RPC_DOWN_UNTIL:
+
+def _redis_call(*parts: Union[str, bytes, int], raise_reply: bool = False) -> Optional[_Resp]:
+    if _rpc_is_down():
         return None
 
     c = _POOL.acquire()
@@ -274,36 +451,22 @@ def _redis_call(*parts: Union[str, bytes, int]) -> Optional[_Resp]:
         r = c.call(*parts)
         _POOL.release(c)
         return r
-    except socket.timeout:
-        _RPC_DOWN_UNTIL = time.monotonic() + _RPC_TIMEOUT_BACKOFF_SEC
-        _POOL.drop(c)
-        return None
-    except FileNotFoundError:
-        _RPC_DOWN_UNTIL = time.monotonic() + _RPC_FAIL_BACKOFF_SEC
-        _POOL.drop(c)
-        return None
-    except (BrokenPipeError, ConnectionError, _RedisIOError):
-        _RPC_DOWN_UNTIL = time.monotonic() + _RPC_FAIL_BACKOFF_SEC
-        _POOL.drop(c)
-        return None
-    except OSError as e:
-        _RPC_DOWN_UNTIL = time.monotonic() + (_RPC_FAIL_BACKOFF_SEC if _is_down_oserror(e) else _RPC_SOFT_BACKOFF_SEC)
+    except _RedisReplyError as e:
         _POOL.drop(c)
+        if raise_reply:
+            raise CacheScriptError(str(e)) from e
+        _rpc_mark_down(e)
         return None
-    except Exception:
-        _RPC_DOWN_UNTIL = time.monotonic() + _RPC_SOFT_BACKOFF_SEC
+    except Exception as e:
+        _rpc_mark_down(e)
         _POOL.drop(c)
         return None
 
 
 def _redis_call_many(cmds: Sequence[Tuple[Union[str, bytes, int], ...]]) -> Optional[List[_Resp]]:
-    global _RPC_DOWN_UNTIL
-
     if not cmds:
         return []
-
-    now = time.monotonic()
-    if now < _RPC_DOWN_UNTIL:
+    if _rpc_is_down():
         return None
 
     c = _POOL.acquire()
@@ -311,32 +474,411 @@ def _redis_call_many(cmds: Sequence[Tuple[Union[str, bytes, int], ...]]) -> Opti
         r = c.call_many(cmds)
         _POOL.release(c)
         return r
-    except socket.timeout:
-        _RPC_DOWN_UNTIL = time.monotonic() + _RPC_TIMEOUT_BACKOFF_SEC
-        _POOL.drop(c)
-        return None
-    except FileNotFoundError:
-        _RPC_DOWN_UNTIL = time.monotonic() + _RPC_FAIL_BACKOFF_SEC
-        _POOL.drop(c)
-        return None
-    except (BrokenPipeError, ConnectionError, _RedisIOError):
-        _RPC_DOWN_UNTIL = time.monotonic() + _RPC_FAIL_BACKOFF_SEC
-        _POOL.drop(c)
-        return None
-    except OSError as e:
-        _RPC_DOWN_UNTIL = time.monotonic() + (_RPC_FAIL_BACKOFF_SEC if _is_down_oserror(e) else _RPC_SOFT_BACKOFF_SEC)
+    except Exception as e:
+        _rpc_mark_down(e)
         _POOL.drop(c)
         return None
+
+
+# -------------------- L1: in-process LRU перед Redis --------------------
+# Opt-in на уровне вызова (get(..., l1=True) / memo(..., l1=True)); хранит уже готовое значение
+# (bytes для get, распакованный объект для memo) -> горячие ключи не ходят в сокет и не unpickle-ятся.
+# Инвалидация между процессами: любой set/set_many/delete_many этого клиента публикует ключи
+# в L1_CHANNEL (тем же pipeline, без лишнего RTT); фоновый SUBSCRIBE-поток каждого процесса
+# выкидывает их из своего L1. Нет подписки (ещё не подключились / Redis упал) -> L1 пуст и не используется.
+# CACHE_L1=0 выключает и L1, и публикацию — значение должно быть одинаковым у всех процессов.
+
+
+def _env_int(name: str, default: int) -> int:
+    raw = (os.environ.get(name) or "").strip()
+    return int(raw) if raw.isdigit() else int(default)
+
+
+L1_ENABLED = (os.environ.get("CACHE_L1") or "").strip() != "0"
+L1_MAX_BYTES = _env_int("CACHE_L1_MAX_BYTES", 64 * 1024 * 1024)
+L1_MAX_ITEMS = _env_int("CACHE_L1_MAX_ITEMS", 50_000)
+L1_DEFAULT_TTL_SEC = 30
+L1_CHANNEL = "cache:l1:inv"
+L1_RESUBSCRIBE_SEC = 1.0
+
+_L1_FLUSH_ALL = b"*"
+
+
+def _key_namespace(key: str) -> str:
+    # "core_status:campaign:window:ws:12" -> "core_status:campaign:window:ws"
+    return key.rsplit(":", 1)[0] if ":" in key else "-"
+
+
+class _L1Cache:
+    def __init__(self, max_bytes: int, max_items: int) -> None:
+        self._max_bytes = int(max_bytes)
+        self._max_items = int(max_items)
+        self._mu = threading.Lock()
+        # key -> (value, size, expires_at_monotonic)
+        self._od: "OrderedDict[str, Tuple[Any, int, float]]" = OrderedDict()
+        self._bytes = 0
+        self._seq = 0  # растёт на каждой внешней инвалидации (защита от гонки read-from-redis / invalidate)
+        self._live = False
+        self._ns: Dict[str, List[int]] = {}  # ns -> [hits, misses]
+        self._evictions = 0
+        self._invalidations = 0
+
+    def _drop(self, key: str) -> None:
+        item = self._od.pop(key, None)
+        if item is not None:
+            self._bytes -= item[1]
+
+    def live(self) -> bool:
+        return self._live
+
+    def seq(self) -> int:
+        return self._seq
+
+    def get(self, key: str, ns: str) -> Tuple[bool, Any]:
+        with self._mu:
+            counters = self._ns.setdefault(ns, [0, 0])
+            item = self._od.get(key)
+            if item is None:
+                counters[1] += 1
+                return False, None
+            if item[2] <= time.monotonic():
+                self._drop(key)
+                counters[1] += 1
+                return False, None
+            self._od.move_to_end(key, last=True)
+            counters[0] += 1
+            return True, item[0]
+
+    def put(self, key: str, value: Any, *, size: int, ttl_sec: float, seq: int) -> None:
+        size_i = max(1, int(size))
+        if ttl_sec <= 0 or size_i > self._max_bytes // 8:
+            return
+        with self._mu:
+            if not self._live or seq != self._seq:
+                return
+            self._drop(key)
+            self._od[key] = (value, size_i, time.monotonic() + float(ttl_sec))
+            self._bytes += size_i
+            while self._od and (self._bytes > self._max_bytes or len(self._od) > self._max_items):
+                _k, (_v, sz, _exp) = self._od.popitem(last=False)
+                self._bytes -= sz
+                self._evictions += 1
+
+    def invalidate(self, keys: Sequence[str]) -> None:
+        # запись в Redis (своя — после ответа, чужая — из pub/sub); seq++ отбрасывает put() читателей,
+        # успевших прочитать старое значение до записи
+        with self._mu:
+            self._seq += 1
+            self._invalidations += len(keys)
+            for k in keys:
+                self._drop(k)
+
+    def clear(self, *, live: Optional[bool] = None) -> None:
+        with self._mu:
+            self._seq += 1
+            self._od.clear()
+            self._bytes = 0
+            if live is not None:
+                self._live = bool(live)
+
+    def stats(self) -> dict[str, Any]:
+        with self._mu:
+            ns_out: Dict[str, dict[str, Any]] = {}
+            for ns, (hits, misses) in sorted(self._ns.items()):
+                total = hits + misses
+                ns_out[ns] = {"hits": hits, "misses": misses, "hit_ratio": round(hits / total, 4) if total else 0.0}
+            return {
+                "enabled": L1_ENABLED,
+                "live": self._live,
+                "items": len(self._od),
+                "bytes": self._bytes,
+                "max_bytes": self._max_bytes,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+                "namespaces": ns_out,
+            }
+
+
+class _L1Invalidator:
+    """SUBSCRIBE-поток процесса. Перезапускается после fork (pid-check), переподключается сам."""
+
+    def __init__(self) -> None:
+        self._mu = threading.Lock()
+        self._pid = 0
+        self.origin = b""
+        self.cache = _L1Cache(L1_MAX_BYTES, L1_MAX_ITEMS)
+
+    def ensure(self) -> Optional[_L1Cache]:
+        if not L1_ENABLED:
+            return None
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._mu:
+                if self._pid != pid:
+                    # после fork: унаследованный L1 мог пропустить инвалидации, поток родителя не существует
+                    self.cache = _L1Cache(L1_MAX_BYTES, L1_MAX_ITEMS)
+                    self.origin = f"{socket.gethostname()}:{pid}:{os.urandom(4).hex()}".encode("utf-8")
+                    self._pid = pid
+                    t = threading.Thread(target=self._run, args=(pid,), name="cache-l1-inv", daemon=True)
+                    t.start()
+        return self.cache if self.cache.live() else None
+
+    def _run(self, pid: int) -> None:
+        while self._pid == pid:
+            conn = _RedisConn()
+            try:
+                s = conn._ensure()
+                s.sendall(_encode_cmd("SUBSCRIBE", L1_CHANNEL))
+                conn._read_reply()  # ["subscribe", channel, 1]
+                s.settimeout(None)  # канал может молчать сколько угодно
+                self.cache.clear(live=True)
+                while self._pid == pid:
+                    msg = conn._read_reply()
+                    if isinstance(msg, list) and len(msg) >= 3 and msg[0] == b"message":
+                        self._on_message(msg[2])
+            except Exception:
+                pass
+            finally:
+                conn.close()
+                self.cache.clear(live=False)
+            time.sleep(L1_RESUBSCRIBE_SEC)
+
+    def _on_message(self, payload: Any) -> None:
+        if not isinstance(payload, (bytes, bytearray)):
+            return
+        origin, _, body = bytes(payload).partition(b"\n")
+        if origin == self.origin:
+            return  # своя запись: written() уже сделан
+        if body == _L1_FLUSH_ALL:
+            self.cache.clear()
+            return
+        self.cache.invalidate([k.decode("utf-8", errors="replace") for k in body.split(b"\n") if k])
+
+    def publish_cmd(self, keys: Sequence[str]) -> Optional[Tuple[Union[str, bytes, int], ...]]:
+        # PUBLISH для pipeline вместе с самой записью; None = L1 выключен
+        if not L1_ENABLED or not keys:
+            return None
+        body = b"\n".join(_b(k) for k in keys)
+        return ("PUBLISH", L1_CHANNEL, (self.origin or b"-") + b"\n" + body)
+
+    def written(self, keys: Sequence[str]) -> None:
+        if L1_ENABLED and keys and self._pid == os.getpid():
+            self.cache.invalidate(keys)
+
+
+_L1 = _L1Invalidator()
+
+
+def _l1_ttl(l1_ttl: Optional[int], ttl_sec: Any) -> int:
+    # L1 никогда не живёт дольше самой записи в Redis
+    try:
+        redis_ttl = int(ttl_sec)
     except Exception:
-        _RPC_DOWN_UNTIL = time.monotonic() + _RPC_SOFT_BACKOFF_SEC
-        _POOL.drop(c)
-        return None
+        redis_ttl = DEFAULT_TTL_SEC
+    ttl = int(l1_ttl) if l1_ttl is not None else L1_DEFAULT_TTL_SEC
+    return min(ttl, redis_ttl) if redis_ttl > 0 else ttl
 
 
 _LUA_RENEW = b"if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) else return 0 end"
 _LUA_RELEASE = b"if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
 
 
+# Атомарные примитивы: один round trip (Lua там, где нужно чтение+запись). Время — Redis TIME (один
+# источник для всех хостов). Ошибка в ответе Redis (напр. INCR по не-числу) = None, как и недоступный Redis.
+_LUA_INCR = b"""
+local v = redis.call('INCRBY', KEYS[1], ARGV[1])
+local ttl = tonumber(ARGV[2])
+if ttl > 0 and (ARGV[3] == '1' or redis.call('TTL', KEYS[1]) < 0) then
+  redis.call('EXPIRE', KEYS[1], ttl)
+end
+return v
+"""
+
+_LUA_SLIDING_WINDOW = b"""
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local window = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+local n = redis.call('ZCARD', KEYS[1])
+if n + cost <= limit then
+  for i = 1, cost do
+    redis.call('ZADD', KEYS[1], now, ARGV[4] .. ':' .. i)
+  end
+  redis.call('PEXPIRE', KEYS[1], window)
+  return {1, limit - n - cost, 0}
+end
+local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+local retry = 0
+if oldest[2] then
+  retry = tonumber(oldest[2]) + window - now
+end
+return {0, limit - n, retry}
+"""
+
+_LUA_TOKEN_BUCKET = b"""
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local s = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(s[1]) or burst
+local ts = tonumber(s[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate / 1000)
+local ok = 0
+local wait = 0
+if tokens >= cost then
+  tokens = tokens - cost
+  ok = 1
+else
+  wait = math.ceil((cost - tokens) * 1000 / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst * 1000 / rate) + 1000)
+return {ok, wait}
+"""
+
+_LUA_SEM_ACQUIRE = b"""
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local lease = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[1]) then
+  return 0
+end
+redis.call('ZADD', KEYS[1], now + lease, ARGV[3])
+if redis.call('PTTL', KEYS[1]) < lease + 1000 then
+  redis.call('PEXPIRE', KEYS[1], lease + 1000)
+end
+return 1
+"""
+
+_LUA_SEM_RENEW = b"""
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local lease = tonumber(ARGV[1])
+local exp = redis.call('ZSCORE', KEYS[1], ARGV[2])
+if not exp or tonumber(exp) <= now then
+  redis.call('ZREM', KEYS[1], ARGV[2])
+  return 0
+end
+redis.call('ZADD', KEYS[1], now + lease, ARGV[2])
+if redis.call('PTTL', KEYS[1]) < lease + 1000 then
+  redis.call('PEXPIRE', KEYS[1], lease + 1000)
+end
+return 1
+"""
+
+_LUA_PACE = b"""
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local nxt = tonumber(redis.call('GET', KEYS[1]) or '0') or 0
+local start = math.max(now, nxt)
+local max_wait = tonumber(ARGV[2])
+if max_wait >= 0 and start - now > max_wait then
+  return -1
+end
+redis.call('SET', KEYS[1], tostring(start + tonumber(ARGV[1])), 'PX', tonumber(ARGV[3]))
+return start - now
+"""
+
+
+def _ms(sec: float) -> int:
+    return max(0, int(round(float(sec) * 1000)))
+
+
+def _ttl_or_default(ttl_sec: Any) -> int:
+    try:
+        ttl_i = int(ttl_sec)
+    except Exception:
+        ttl_i = DEFAULT_TTL_SEC
+    return ttl_i if ttl_i > 0 else DEFAULT_TTL_SEC
+
+
+def _lock_ttl_ms(ttl_sec: Any) -> int:
+    try:
+        ttl_ms = int(float(ttl_sec) * 1000)
+    except Exception:
+        ttl_ms = 1000
+    return ttl_ms if ttl_ms > 0 else 1000
+
+
+def _is_ok(r: _Resp) -> bool:
+    return isinstance(r, str) and r.upper() == "OK"
+
+
+def _eval_cmd(script: bytes, keys: Sequence[str], args: Sequence[Union[str, bytes, int, float]]) -> Tuple[Any, ...]:
+    parts: List[Union[str, bytes, int]] = [b"EVAL", script, len(keys)]
+    parts.extend(str(k) for k in keys)
+    parts.extend(a if isinstance(a, (bytes, str, int)) else repr(float(a)) for a in args)
+    return tuple(parts)
+
+
+def _get_result(key: str, r: _Resp) -> Optional[bytes]:
+    # GET-ответ -> wire | None (нет / не bytes / больше MAX_VALUE_BYTES)
+    if not isinstance(r, (bytes, bytearray)):
+        return None
+    wire = bytes(r)
+    if len(wire) > MAX_VALUE_BYTES:
+        return None
+    _KEY_SIZES.set(key, len(wire))
+    return wire
+
+
+def _mget_result(keys: Sequence[str], r: _Resp) -> List[Optional[bytes]]:
+    if not isinstance(r, list):
+        return [None] * len(keys)
+    out = [_get_result(str(k), v) for k, v in zip(keys, r)]
+    if len(out) < len(keys):
+        out.extend([None] * (len(keys) - len(out)))
+    return out
+
+
+def _set_many_plan(items: Sequence[Tuple[str, bytes]], ttl_sec: int) -> Tuple[List[Tuple[str, bytes]], List[Tuple[Any, ...]]]:
+    ttl_i = _ttl_or_default(ttl_sec)
+    kept = [(k, pb) for k, pb in items if len(pb) <= MAX_VALUE_BYTES]
+    return kept, [("SET", k, pb, "EX", ttl_i) for k, pb in kept]
+
+
+def _set_many_result(kept: Sequence[Tuple[str, bytes]], rr: Optional[List[_Resp]]) -> int:
+    if rr is None:
+        return 0
+    ok = 0
+    for (k, pb), r in zip(kept, rr):
+        if _is_ok(r):
+            ok += 1
+            _KEY_SIZES.set(k, len(pb))
+    return ok
+
+
+def _stats_result(dbsize: _Resp, info: _Resp, l1: dict[str, Any], codec_info: dict[str, Any]) -> Optional[dict[str, Any]]:
+    if dbsize is None:
+        return None
+
+    items = int(dbsize) if isinstance(dbsize, int) else None
+    used = None
+    if isinstance(info, (bytes, bytearray)):
+        try:
+            txt = bytes(info).decode("utf-8", errors="replace")
+            for line in txt.splitlines():
+                if line.startswith("used_memory:"):
+                    used = int(line.split(":", 1)[1].strip())
+                    break
+        except Exception:
+            used = None
+
+    return {
+        "ok": True,
+        "items": items,
+        "used_memory": used,
+        "socket": _redis_sock_path(),
+        "l1": l1,
+        "codec": codec_info,
+    }
+
+
 def _chunked_pairs(items: Sequence[Tuple[Any, Any]], n: int) -> Iterator[Sequence[Tuple[Any, Any]]]:
     if n <= 0:
         n = 200
@@ -347,91 +889,100 @@ def _chunked_pairs(items: Sequence[Tuple[Any, Any]], n: int) -> Iterator[Sequenc
 class CacheClient:
     # ---------------- OLD API (DO NOT BREAK) ----------------
 
-    def get(self, key: str, ttl_sec: int) -> Optional[bytes]:
+    def get(self, key: str, ttl_sec: int, *, l1: bool = False, l1_ttl: Optional[int] = None) -> Optional[bytes]:
         # ttl_sec is kept for backward compatibility; not used for sliding TTL anymore.
-        r = _redis_call("GET", key)
-        if r is None:
+        # l1=True: сначала in-process L1 (l1_ttl, по умолчанию L1_DEFAULT_TTL_SEC); miss в Redis не кэшируется.
+        ns = _key_namespace(key)
+        cache = _L1.ensure() if l1 else None
+        seq = 0
+        if cache is not None:
+            hit, value = cache.get(key, ns)
+            if hit:
+                return value
+            seq = cache.seq()
+
+        wire = self._get_wire(key)
+        if wire is None:
             return None
-        if not isinstance(r, (bytes, bytearray)):
-            return None
-
-        payload = bytes(r)
-        if len(payload) > MAX_VALUE_BYTES:
+        try:
+            _ser, payload = codec.decode(wire, ns=ns)
+        except codec.CodecError:
             return None
 
-        _KEY_SIZES.set(key, len(payload))
+        if cache is not None:
+            cache.put(key, payload, size=len(payload), ttl_sec=_l1_ttl(l1_ttl, ttl_sec), seq=seq)
         return payload
 
     def set(self, key: str, payload: bytes, ttl_sec: int) -> bool:
+        # payload >= codec.COMPRESS_MIN_BYTES сжимается прозрачно; лимит MAX_VALUE_BYTES — на то, что уходит в Redis
         if not isinstance(payload, (bytes, bytearray)):
             return False
-        pb = bytes(payload)
-        if len(pb) > MAX_VALUE_BYTES:
-            return False
+        return self._set_wire(key, codec.encode(bytes(payload), ns=_key_namespace(key)), ttl_sec)
 
+    def get_obj(self, key: str, ttl_sec: int, *, ns: Optional[str] = None) -> Tuple[bool, Any, int]:
+        # -> (found, value, wire_size); serializer берётся из заголовка, значение без заголовка = pickle
+        wire = self._get_wire(key)
+        if wire is None:
+            return False, None, 0
         try:
-            ttl_i = int(ttl_sec)
+            return True, codec.loads(wire, ns=ns or _key_namespace(key)), len(wire)
         except Exception:
-            ttl_i = DEFAULT_TTL_SEC
-        if ttl_i <= 0:
-            ttl_i = DEFAULT_TTL_SEC
+            return False, None, 0
 
-        r = _redis_call("SET", key, pb, "EX", ttl_i)
-        if r is None:
+    def set_obj(self, key: str, value: Any, ttl_sec: int, *, serializer: str = "pickle", ns: Optional[str] = None) -> int:
+        # -> размер записанного значения (0 = не записано)
+        try:
+            wire = codec.dumps(value, serializer=serializer, ns=ns or _key_namespace(key))
+        except Exception:
+            return 0
+        return len(wire) if self._set_wire(key, wire, ttl_sec) else 0
+
+    def _get_wire(self, key: str) -> Optional[bytes]:
+        return _get_result(key, _redis_call("GET", key))
+
+    def _set_wire(self, key: str, wire: bytes, ttl_sec: int) -> bool:
+        if len(wire) > MAX_VALUE_BYTES:
             return False
-        ok = isinstance(r, str) and r.upper() == "OK"
+
+        ttl_i = _ttl_or_default(ttl_sec)
+        pub = _L1.publish_cmd([key])
+        if pub is None:
+            r = _redis_call("SET", key, wire, "EX", ttl_i)
+        else:
+            rr = _redis_call_many([("SET", key, wire, "EX", ttl_i), pub])
+            r = rr[0] if rr else None
+            _L1.written([key])
+        ok = _is_ok(r)
         if ok:
-            _KEY_SIZES.set(key, len(pb))
+            _KEY_SIZES.set(key, len(wire))
         return ok
 
     def stats(self) -> Optional[dict[str, Any]]:
-        dbsize = _redis_call("DBSIZE")
-        info = _redis_call("INFO", "memory")
-        if dbsize is None:
-            return None
+        return _stats_result(_redis_call("DBSIZE"), _redis_call("INFO", "memory"), self.l1_stats(), self.codec_stats())
 
-        items = int(dbsize) if isinstance(dbsize, int) else None
-        used = None
-        if isinstance(info, (bytes, bytearray)):
-            try:
-                txt = bytes(info).decode("utf-8", errors="replace")
-                for line in txt.splitlines():
-                    if line.startswith("used_memory:"):
-                        used = int(line.split(":", 1)[1].strip())
-                        break
-            except Exception:
-                used = None
+    def l1_stats(self) -> dict[str, Any]:
+        # L1 этого процесса: размер + hit ratio по namespace (префикс ключа до последнего ':' / version у memo)
+        return _L1.cache.stats()
 
-        return {"ok": True, "items": items, "used_memory": used, "socket": _redis_sock_path()}
+    def codec_stats(self) -> dict[str, Any]:
+        # кодек этого процесса: wire/raw ratio, доля сжатых, среднее время encode/decode по namespace
+        return codec.codec_stats()
 
     def lock_try(self, key: str, *, ttl_sec: float, owner: str) -> Optional[dict[str, Any]]:
-        try:
-            ttl_ms = int(float(ttl_sec) * 1000)
-        except Exception:
-            ttl_ms = 1000
-        if ttl_ms <= 0:
-            ttl_ms = 1000
-
+        ttl_ms = _lock_ttl_ms(ttl_sec)
         token = os.urandom(16).hex()
         lock_key = f"lock:{key}"
 
         r = _redis_call("SET", lock_key, token, "NX", "PX", ttl_ms)
         if r is None:
             return None
-        if isinstance(r, str) and r.upper() == "OK":
+        if _is_ok(r):
             return {"ok": True, "acquired": True, "owner": str(owner), "token": token, "expire_ms": ttl_ms}
         return {"ok": True, "acquired": False}
 
     def lock_renew(self, key: str, *, ttl_sec: float, token: str) -> bool:
-        try:
-            ttl_ms = int(float(ttl_sec) * 1000)
-        except Exception:
-            ttl_ms = 1000
-        if ttl_ms <= 0:
-            ttl_ms = 1000
-
         lock_key = f"lock:{key}"
-        r = _redis_call("EVAL", _LUA_RENEW, 1, lock_key, str(token), ttl_ms)
+        r = _redis_call("EVAL", _LUA_RENEW, 1, lock_key, str(token), _lock_ttl_ms(ttl_sec))
         return bool(isinstance(r, int) and r == 1)
 
     def lock_release(self, key: str, *, token: str) -> bool:
@@ -448,79 +999,257 @@ class CacheClient:
 
     # ---------------- NEW OPTIONAL FAST API ----------------
 
-    def get_many(self, keys: Sequence[str], ttl_sec: int) -> List[Optional[bytes]]:
-        # MGET, no TTL-touch. ttl_sec kept for symmetry/backward usage patterns.
-        if not keys:
+    def eval(
+        self,
+        script: bytes,
+        keys: Sequence[str],
+        args: Sequence[Union[str, bytes, int, float]],
+        *,
+        raise_errors: bool = False,
+    ) -> Optional[_Resp]:
+        # EVAL <script> <numkeys> keys... args... ; None = redis недоступен
+        # raise_errors=True: ошибка скрипта -> CacheScriptError (иначе тоже None, как недоступность)
+        return _redis_call(*_eval_cmd(script, keys, args), raise_reply=raise_errors)
+
+    # ---------------- ATOMIC PRIMITIVES (один round trip) ----------------
+    # Ключи примитивов читать только через них / get() без l1: запись идёт мимо L1-инвалидации.
+
+    def incr(self, key: str, by: int = 1, *, ttl_sec: int = 0, refresh_ttl: bool = True) -> Optional[int]:
+        # INCRBY + EXPIRE атомарно. refresh_ttl=False: TTL ставится только новому ключу. None = Redis недоступен.
+        r = self.eval(_LUA_INCR, [key], [int(by), int(ttl_sec or 0), "1" if refresh_ttl else "0"])
+        return int(r) if isinstance(r, int) else None
+
+    def incr_many(
+        self, items: Sequence[Tuple[str, int]], *, ttl_sec: int = 0, refresh_ttl: bool = True
+    ) -> List[Optional[int]]:
+        # pipeline incr() по всем ключам одним round trip
+        if not items:
             return []
+        flag = "1" if refresh_ttl else "0"
+        rr = _redis_call_many(
+            [(b"EVAL", _LUA_INCR, 1, str(k), int(by), int(ttl_sec or 0), flag) for k, by in items]
+        )
+        if rr is None:
+            return [None] * len(items)
+        return [int(r) if isinstance(r, int) else None for r in rr]
 
-        r = _redis_call("MGET", *list(keys))
-        if r is None or not isinstance(r, list):
-            return [None] * len(keys)
-
-        out: List[Optional[bytes]] = []
-        for i, v in enumerate(r[: len(keys)]):
-            if isinstance(v, (bytes, bytearray)):
-                b = bytes(v)
-                if len(b) <= MAX_VALUE_BYTES:
-                    _KEY_SIZES.set(str(keys[i]), len(b))
-                    out.append(b)
-                else:
-                    out.append(None)
-            else:
-                out.append(None)
+    def rate_limit(self, key: str, *, limit: int, window_sec: float, cost: int = 1) -> Optional[Tuple[bool, int, float]]:
+        # Sliding window (ZSET по времени событий): -> (allowed, remaining, retry_after_sec) | None
+        r = self.eval(_LUA_SLIDING_WINDOW, [key], [_ms(window_sec), int(limit), max(1, int(cost)), os.urandom(8).hex()])
+        if not isinstance(r, list) or len(r) < 3:
+            return None
+        return bool(r[0] == 1), int(r[1] or 0), max(0.0, float(r[2] or 0) / 1000.0)
+
+    def token_bucket(self, key: str, *, rate_per_sec: float, burst: float, cost: float = 1.0) -> Optional[Tuple[bool, float]]:
+        # Token bucket: -> (allowed, wait_sec до достаточного числа токенов) | None
+        if float(rate_per_sec) <= 0:
+            raise ValueError("rate_per_sec must be > 0")
+        r = self.eval(_LUA_TOKEN_BUCKET, [key], [float(rate_per_sec), float(burst), float(cost)])
+        if not isinstance(r, list) or len(r) < 2:
+            return None
+        return bool(r[0] == 1), max(0.0, float(r[1] or 0) / 1000.0)
 
-        if len(out) < len(keys):
-            out.extend([None] * (len(keys) - len(out)))
-        return out
+    def sem_acquire(self, key: str, *, limit: int, lease_sec: float) -> Optional[str]:
+        # Семафор на N держателей с lease: -> token | None (мест нет / Redis недоступен).
+        # Истёкшие lease (упавший держатель) освобождаются сами при следующем acquire.
+        token = os.urandom(16).hex()
+        r = self.eval(_LUA_SEM_ACQUIRE, [key], [int(limit), _ms(lease_sec), token])
+        return token if isinstance(r, int) and r == 1 else None
 
-    def set_many(self, items: Sequence[Tuple[str, bytes]], ttl_sec: int) -> int:
-        # Pipeline SET EX ... ; returns OK count
-        if not items:
-            return 0
+    def sem_renew(self, key: str, *, token: str, lease_sec: float) -> bool:
+        r = self.eval(_LUA_SEM_RENEW, [key], [_ms(lease_sec), str(token)])
+        return bool(isinstance(r, int) and r == 1)
 
-        try:
-            ttl_i = int(ttl_sec)
-        except Exception:
-            ttl_i = DEFAULT_TTL_SEC
-        if ttl_i <= 0:
-            ttl_i = DEFAULT_TTL_SEC
+    def sem_release(self, key: str, *, token: str) -> bool:
+        r = _redis_call("ZREM", key, str(token))
+        return bool(isinstance(r, int) and r == 1)
 
-        kept: List[Tuple[str, bytes]] = []
-        cmds: List[Tuple[Union[str, bytes, int], ...]] = []
+    def pace(self, key: str, *, interval_sec: float, max_wait_sec: float = -1.0, ttl_sec: float = 3600) -> Optional[float]:
+        """
+        Резерв следующего старта с интервалом: start = max(now, next); next = start + interval_sec.
+        -> сколько ждать до своего start (сек); -1.0 = ждать дольше max_wait_sec (ничего не зарезервировано);
+        None = Redis недоступен. Заменяет lock + GET next_ts + sleep + SET.
+        """
+        max_wait_ms = _ms(max_wait_sec) if float(max_wait_sec) >= 0 else -1
+        r = self.eval(_LUA_PACE, [key], [_ms(interval_sec), max_wait_ms, max(1000, _ms(ttl_sec))])
+        if not isinstance(r, int):
+            return None
+        return -1.0 if r < 0 else float(r) / 1000.0
 
-        for k, payload in items:
-            if not isinstance(payload, (bytes, bytearray)):
-                continue
-            pb = bytes(payload)
-            if len(pb) > MAX_VALUE_BYTES:
+    def get_many(self, keys: Sequence[str], ttl_sec: int) -> List[Optional[bytes]]:
+        # MGET, no TTL-touch. ttl_sec kept for symmetry/backward usage patterns.
+        out: List[Optional[bytes]] = []
+        for k, wire in zip(keys, self._get_many_wire(keys)):
+            if wire is None:
+                out.append(None)
                 continue
-            kept.append((str(k), pb))
-            cmds.append(("SET", str(k), pb, "EX", ttl_i))
+            try:
+                out.append(codec.decode(wire, ns=_key_namespace(str(k)))[1])
+            except codec.CodecError:
+                out.append(None)
+        return out
 
-        if not cmds:
-            return 0
+    def _get_many_wire(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        if not keys:
+            return []
+        return _mget_result(keys, _redis_call("MGET", *list(keys)))
 
-        rr = _redis_call_many(cmds)
-        if rr is None:
+    def set_many(self, items: Sequence[Tuple[str, bytes]], ttl_sec: int) -> int:
+        # Pipeline SET EX ... ; returns OK count
+        return self._set_many_wire(
+            [
+                (str(k), codec.encode(bytes(payload), ns=_key_namespace(str(k))))
+                for k, payload in items
+                if isinstance(payload, (bytes, bytearray))
+            ],
+            ttl_sec,
+        )
+
+    def _set_many_wire(self, items: Sequence[Tuple[str, bytes]], ttl_sec: int) -> int:
+        kept, cmds = _set_many_plan(items, ttl_sec)
+        if not cmds:
             return 0
 
-        ok = 0
-        for (k, pb), r in zip(kept, rr):
-            if isinstance(r, str) and r.upper() == "OK":
-                ok += 1
-                _KEY_SIZES.set(k, len(pb))
-        return ok
+        pub = _L1.publish_cmd([k for k, _pb in kept])
+        rr = _redis_call_many(cmds + [pub] if pub is not None else cmds)
+        if pub is not None:
+            _L1.written([k for k, _pb in kept])
+        return _set_many_result(kept, rr)
 
     def delete_many(self, keys: Sequence[str]) -> int:
         if not keys:
             return 0
-        r = _redis_call("DEL", *list(keys))
+        pub = _L1.publish_cmd([str(k) for k in keys])
+        if pub is None:
+            r = _redis_call("DEL", *list(keys))
+        else:
+            rr = _redis_call_many([("DEL", *list(keys)), pub])
+            r = rr[0] if rr else None
+            _L1.written([str(k) for k in keys])
         return int(r) if isinstance(r, int) else 0
 
 
 CLIENT = CacheClient()
 
 
+# -------------------- memo: single-flight + early refresh --------------------
+# single_flight=True: на miss вычисляет один процесс (lock memo:sf:<key>), остальные поллят результат
+# (GET key + EXISTS lock одним pipeline, backoff до _SF_POLL_MAX_SEC) не дольше sf_wait_sec, потом считают сами.
+# early_refresh=beta>0: XFetch — рядом с memo-ключом лежит memo:xf:<key> = "<delta_sec> <expiry_unix>";
+# hit обновляется заранее с вероятностью, растущей к expiry (now - delta*beta*ln(rand) >= expiry),
+# под тем же lock-ом и без ожидания: остальные отдают текущее значение.
+
+SF_WAIT_SEC = 10.0
+SF_LOCK_SEC = 30.0
+_SF_POLL_MIN_SEC = 0.02
+_SF_POLL_MAX_SEC = 0.5
+
+
+def _sf_lock_name(key: str) -> str:
+    return f"memo:sf:{key}"
+
+
+def _xf_key(key: str) -> str:
+    return f"memo:xf:{key}"
+
+
+def _xf_should_refresh(meta: Optional[bytes], beta: float) -> bool:
+    if not meta:
+        return False
+    try:
+        delta_s, expiry_s = meta.split(b" ", 1)
+        delta = float(delta_s)
+        expiry = float(expiry_s)
+    except Exception:
+        return False
+    return time.time() - delta * beta * math.log(1.0 - random.random()) >= expiry
+
+
+class _MemoOpts:
+    __slots__ = ("ttl_sec", "early_refresh", "serializer", "ns")
+
+    def __init__(self, ttl_sec: int, early_refresh: float, serializer: str, ns: str) -> None:
+        self.ttl_sec = ttl_sec
+        self.early_refresh = early_refresh
+        self.serializer = serializer
+        self.ns = ns
+
+
+def _memo_compute(query: Any, fn: Callable[[Any], Any], key: str, o: _MemoOpts) -> Tuple[Any, int]:
+    # -> (value, размер записанного значения | 0 если не сохранено)
+    t0 = time.monotonic()
+    value = fn(query)
+    delta = time.monotonic() - t0
+
+    if o.early_refresh <= 0:
+        return value, CLIENT.set_obj(key, value, o.ttl_sec, serializer=o.serializer, ns=o.ns)
+
+    try:
+        wire = codec.dumps(value, serializer=o.serializer, ns=o.ns)
+    except Exception:
+        return value, 0
+    meta = f"{delta:.3f} {time.time() + o.ttl_sec:.3f}".encode("utf-8")
+    ok = CLIENT._set_many_wire([(key, wire), (_xf_key(key), meta)], ttl_sec=o.ttl_sec) > 0
+    return value, (len(wire) if ok else 0)
+
+
+def _memo_single_flight(
+    query: Any, fn: Callable[[Any], Any], key: str, o: _MemoOpts, wait_sec: float, lock_sec: float
+) -> Tuple[Any, int]:
+    lock_name = _sf_lock_name(key)
+    owner = str(os.getpid())
+    deadline = time.monotonic() + max(0.0, float(wait_sec))
+    delay = _SF_POLL_MIN_SEC
+
+    while True:
+        # lock_try -> None и при занятом lock-е (SET NX отвечает nil), и при недоступном Redis;
+        # второе ловит pipeline ожидания ниже
+        lk = CLIENT.lock_try(lock_name, ttl_sec=lock_sec, owner=owner)
+        if lk is not None and lk.get("acquired"):
+            try:
+                # пока ждали, прежний лидер мог успеть записать результат
+                found, value, size = CLIENT.get_obj(key, o.ttl_sec, ns=o.ns)
+                if found:
+                    return value, size
+                return _memo_compute(query, fn, key, o)
+            finally:
+                CLIENT.lock_release(lock_name, token=str(lk.get("token") or ""))
+
+        while True:
+            if time.monotonic() >= deadline:
+                return _memo_compute(query, fn, key, o)
+            time.sleep(delay)
+            delay = min(delay * 2, _SF_POLL_MAX_SEC)
+
+            rr = _redis_call_many([("GET", key), ("EXISTS", f"lock:{lock_name}")])
+            if rr is None or len(rr) < 2:
+                return _memo_compute(query, fn, key, o)  # Redis недоступен: без координации
+            if isinstance(rr[0], (bytes, bytearray)):
+                wire = bytes(rr[0])
+                try:
+                    return codec.loads(wire, ns=o.ns), len(wire)
+                except Exception:
+                    pass
+            if not rr[1]:
+                break  # лидер ушёл без результата (fn упала) -> пробуем стать лидером сами
+
+
+def _memo_refresh_early(
+    query: Any, fn: Callable[[Any], Any], key: str, o: _MemoOpts, lock_sec: float, cached: Any
+) -> Tuple[bool, Any, int]:
+    # -> (refreshed, value, size)
+    lk = CLIENT.lock_try(_sf_lock_name(key), ttl_sec=lock_sec, owner=str(os.getpid()))
+    if not lk or not lk.get("acquired"):
+        return False, cached, 0  # обновляет кто-то другой / Redis недоступен
+    try:
+        value, size = _memo_compute(query, fn, key, o)
+    except Exception:
+        return False, cached, 0  # текущее значение ещё валидно
+    finally:
+        CLIENT.lock_release(_sf_lock_name(key), token=str(lk.get("token") or ""))
+    return True, value, size
+
+
 def memo(
     query: Any,
     fn: Callable[[Any], Any],
@@ -528,30 +1257,75 @@ def memo(
     ttl: int = DEFAULT_TTL_SEC,
     version: str = DEFAULT_VERSION,
     update: bool = False,
+    l1: bool = False,
+    l1_ttl: Optional[int] = None,
+    single_flight: bool = False,
+    sf_wait_sec: float = SF_WAIT_SEC,
+    sf_lock_sec: float = SF_LOCK_SEC,
+    early_refresh: float = 0.0,
+    serializer: str = "pickle",
 ) -> Any:
+    """
+    l1=True: распакованное значение держится в L1 процесса (namespace = version).
+    Значение отдаётся ОДНИМ объектом всем вызывающим этого процесса — не мутировать его на месте
+    (или мутировать и сразу писать обратно через update=True).
+    single_flight=True: miss считает один процесс, остальные ждут его результат (до sf_wait_sec).
+    sf_lock_sec должен покрывать время fn(query).
+    early_refresh=beta (обычно 1.0): XFetch-обновление до истечения ttl; 0 = выключено.
+    serializer="msgpack": компактнее pickle, только для JSON-подобных значений (см. codec.dumps).
+    """
     ttl_sec = int(ttl) if ttl is not None else DEFAULT_TTL_SEC
+    if ttl_sec <= 0:
+        ttl_sec = DEFAULT_TTL_SEC
+    beta = float(early_refresh or 0.0)
+    o = _MemoOpts(ttl_sec, beta, serializer, str(version))
 
     try:
         key = _make_key(query, fn, version)
     except Exception:
         return fn(query)
 
+    cache = _L1.ensure() if l1 else None
+    seq = cache.seq() if cache is not None else 0
+
     if not update:
-        payload = CLIENT.get(key, ttl_sec=ttl_sec)
-        if payload is not None:
+        if cache is not None:
+            hit, value = cache.get(key, str(version))
+            if hit:
+                return value
+
+        meta: Optional[bytes] = None
+        if beta > 0:
+            wire, meta = CLIENT._get_many_wire([key, _xf_key(key)])
+        else:
+            wire = CLIENT._get_wire(key)
+
+        if wire is not None:
             try:
-                return pickle.loads(payload)
+                value = codec.loads(wire, ns=o.ns)
             except Exception:
                 pass
-
-    value = fn(query)
-
-    try:
-        out = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
-    except Exception:
-        return value
-
-    CLIENT.set(key, out, ttl_sec=ttl_sec)
+            else:
+                size = len(wire)
+                if beta > 0 and _xf_should_refresh(meta, beta):
+                    refreshed, value, fresh_size = _memo_refresh_early(query, fn, key, o, sf_lock_sec, value)
+                    if refreshed:
+                        size = fresh_size
+                        if cache is not None:
+                            seq = cache.seq()  # своя запись уже сбросила L1
+                if cache is not None and size:
+                    cache.put(key, value, size=size, ttl_sec=_l1_ttl(l1_ttl, ttl_sec), seq=seq)
+                return value
+
+        if single_flight:
+            value, size = _memo_single_flight(query, fn, key, o, sf_wait_sec, sf_lock_sec)
+            if size and cache is not None:
+                cache.put(key, value, size=size, ttl_sec=_l1_ttl(l1_ttl, ttl_sec), seq=cache.seq())
+            return value
+
+    value, size = _memo_compute(query, fn, key, o)
+    if size and cache is not None:
+        cache.put(key, value, size=size, ttl_sec=_l1_ttl(l1_ttl, ttl_sec), seq=cache.seq())
     return value
 
 
@@ -563,18 +1337,20 @@ def memo_many_iter(
     version: str = DEFAULT_VERSION,
     update: bool = False,
     chunk: int = 200,
+    serializer: str = "pickle",
 ) -> Iterator[Tuple[Any, Any]]:
     """
     Быстрый stream-memo на батчах.
     Yield ВСЕГДА: (query, value).
     Порядок НЕ гарантируется.
-    Miss -> fn(query) -> set(key, pickle(value)).
+    Miss -> fn(query) -> set(key, codec.dumps(value)) (pickle по умолчанию, сжатие больших значений).
     """
     if not queries:
         return
         yield  # pragma: no cover
 
     ttl_sec = int(ttl) if ttl is not None else DEFAULT_TTL_SEC
+    ns = str(version)
     chunk_i = int(chunk) if chunk is not None else 200
     if chunk_i <= 0:
         chunk_i = 200
@@ -603,13 +1379,13 @@ def memo_many_iter(
         if update:
             misses = part_qk
         else:
-            payloads = CLIENT.get_many(keys, ttl_sec=ttl_sec)
-            for (q, k), payload in zip(part_qk, payloads):
-                if payload is None:
+            wires = CLIENT._get_many_wire(keys)
+            for (q, k), wire in zip(part_qk, wires):
+                if wire is None:
                     misses.append((q, k))
                     continue
                 try:
-                    hits[k] = pickle.loads(payload)  # may be None (valid value)
+                    hits[k] = codec.loads(wire, ns=ns)  # may be None (valid value)
                 except Exception:
                     misses.append((q, k))
 
@@ -624,7 +1400,7 @@ def memo_many_iter(
         for q, k in misses:
             v = fn(q)
             try:
-                pb = pickle.dumps(v, protocol=pickle.HIGHEST_PROTOCOL)
+                pb = codec.dumps(v, serializer=serializer, ns=ns)
                 if len(pb) <= MAX_VALUE_BYTES:
                     to_set.append((k, pb))
             except Exception:
@@ -632,4 +1408,4 @@ def memo_many_iter(
             yield (q, v)
 
         if to_set:
-            CLIENT.set_many(to_set, ttl_sec=ttl_sec)
+            CLIENT._set_many_wire(to_set, ttl_sec=ttl_sec)
@@ -0,0 +1,230 @@
+# FILE: engine/common/cache/codec.py  (новое — 2026-10-16)
+# PURPOSE: Кодек значений CacheClient: заголовок (serializer + сжатие) + zstd/zlib для больших значений.
+#          Формат: MAGIC(2) + flags(1) + body; flags & 0x0F — serializer (raw / pickle / msgpack), flags & 0xF0 — сжатие.
+#          Заголовок пишется только когда он нужен (сжато / msgpack / payload сам начинается с MAGIC):
+#          мелкие raw и pickle-значения лежат в Redis байт-в-байт как раньше.
+#          Значения без MAGIC (в т.ч. записанные до кодека) читаются как есть: raw bytes, у memo — pickle.
+#          zstandard / msgpack — опциональные: без них zlib / pickle; чтение zstd без модуля -> CodecError (= miss).
+#          Статистика по namespace: байты до/после, доля сжатых, время encode/decode (codec_stats()).
+
+from __future__ import annotations
+
+import os
+import pickle
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import zstandard as _zstd
+except ImportError:  # pragma: no cover - опциональная зависимость
+    _zstd = None
+
+try:
+    import msgpack as _msgpack
+except ImportError:  # pragma: no cover - опциональная зависимость
+    _msgpack = None
+
+MAGIC = b"\x00\xcc"
+
+SER_RAW = 0x00
+SER_PICKLE = 0x01
+SER_MSGPACK = 0x02
+
+COMP_NONE = 0x00
+COMP_ZLIB = 0x10
+COMP_ZSTD = 0x20
+
+_SER_MASK = 0x0F
+_COMP_MASK = 0xF0
+
+ZLIB_LEVEL = 3
+ZSTD_LEVEL = 3
+COMPRESS_MIN_SAVING = 0.9          # сжатое >= 90% исходного -> хранить без сжатия
+MAX_DECODED_BYTES = 64 * 1024 * 1024
+
+
+def _env_compress_min_bytes() -> int:
+    raw = (os.environ.get("CACHE_COMPRESS_MIN_BYTES") or "").strip()
+    return int(raw) if raw.isdigit() else 1024
+
+
+def _env_compress_mode() -> int:
+    # CACHE_COMPRESS: off | zlib | zstd | (пусто) = zstd если установлен, иначе zlib
+    raw = (os.environ.get("CACHE_COMPRESS") or "").strip().lower()
+    if raw == "off":
+        return COMP_NONE
+    if raw == "zlib":
+        return COMP_ZLIB
+    if raw == "zstd" and _zstd is not None:
+        return COMP_ZSTD
+    return COMP_ZSTD if _zstd is not None else COMP_ZLIB
+
+
+COMPRESS_MIN_BYTES = _env_compress_min_bytes()
+COMPRESS_MODE = _env_compress_mode()
+
+
+class CodecError(ValueError):
+    pass
+
+
+# -------------------- compression --------------------
+
+_TLS = threading.local()  # zstd (de)compressor-объекты не thread-safe
+
+
+def _zstd_c() -> Any:
+    c = getattr(_TLS, "zc", None)
+    if c is None:
+        c = _TLS.zc = _zstd.ZstdCompressor(level=ZSTD_LEVEL)
+    return c
+
+
+def _zstd_d() -> Any:
+    d = getattr(_TLS, "zd", None)
+    if d is None:
+        d = _TLS.zd = _zstd.ZstdDecompressor()
+    return d
+
+
+def _compress(mode: int, data: bytes) -> bytes:
+    if mode == COMP_ZSTD:
+        return _zstd_c().compress(data)
+    return zlib.compress(data, ZLIB_LEVEL)
+
+
+def _decompress(mode: int, body: memoryview) -> bytes:
+    if mode == COMP_ZLIB:
+        d = zlib.decompressobj()
+        out = d.decompress(body, MAX_DECODED_BYTES)
+        if d.unconsumed_tail:
+            raise CodecError("decoded_too_big")
+        return out
+    if mode == COMP_ZSTD:
+        if _zstd is None:
+            raise CodecError("zstd_not_installed")
+        return _zstd_d().decompress(body, max_output_size=MAX_DECODED_BYTES)
+    raise CodecError(f"bad_compression: {mode:#x}")
+
+
+# -------------------- stats --------------------
+
+
+class _CodecStats:
+    def __init__(self) -> None:
+        self._mu = threading.Lock()
+        # ns -> [enc_n, raw_bytes, wire_bytes, compressed_n, enc_sec, dec_n, dec_sec]
+        self._ns: Dict[str, List[float]] = {}
+
+    def encoded(self, ns: str, raw_len: int, wire_len: int, compressed: bool, dt: float) -> None:
+        with self._mu:
+            c = self._ns.setdefault(ns, [0, 0, 0, 0, 0.0, 0, 0.0])
+            c[0] += 1
+            c[1] += raw_len
+            c[2] += wire_len
+            c[3] += 1 if compressed else 0
+            c[4] += dt
+
+    def decoded(self, ns: str, dt: float) -> None:
+        with self._mu:
+            c = self._ns.setdefault(ns, [0, 0, 0, 0, 0.0, 0, 0.0])
+            c[5] += 1
+            c[6] += dt
+
+    def snapshot(self) -> dict[str, Any]:
+        out: dict[str, Any] = {}
+        with self._mu:
+            for ns, (enc_n, raw_b, wire_b, comp_n, enc_s, dec_n, dec_s) in sorted(self._ns.items()):
+                out[ns] = {
+                    "encoded": int(enc_n),
+                    "compressed": int(comp_n),
+                    "raw_bytes": int(raw_b),
+                    "wire_bytes": int(wire_b),
+                    "ratio": round(wire_b / raw_b, 4) if raw_b else 1.0,
+                    "encode_us_avg": round(enc_s / enc_n * 1e6, 1) if enc_n else 0.0,
+                    "decoded": int(dec_n),
+                    "decode_us_avg": round(dec_s / dec_n * 1e6, 1) if dec_n else 0.0,
+                }
+        return out
+
+
+_STATS = _CodecStats()
+
+
+def codec_stats() -> dict[str, Any]:
+    return {
+        "compression": {COMP_NONE: "off", COMP_ZLIB: "zlib", COMP_ZSTD: "zstd"}[COMPRESS_MODE],
+        "compress_min_bytes": COMPRESS_MIN_BYTES,
+        "msgpack": _msgpack is not None,
+        "namespaces": _STATS.snapshot(),
+    }
+
+
+# -------------------- wire format --------------------
+
+
+def encode(payload: bytes, *, ser: int = SER_RAW, ns: str = "-") -> bytes:
+    t0 = time.perf_counter()
+    flags = ser
+    body = payload
+    if COMPRESS_MODE != COMP_NONE and len(payload) >= COMPRESS_MIN_BYTES:
+        packed = _compress(COMPRESS_MODE, payload)
+        if len(packed) < len(payload) * COMPRESS_MIN_SAVING:
+            body = packed
+            flags |= COMPRESS_MODE
+
+    if (flags == SER_RAW or flags == SER_PICKLE) and not payload.startswith(MAGIC):
+        wire = payload  # без заголовка: формат до кодека
+    else:
+        wire = MAGIC + bytes((flags,)) + body
+    _STATS.encoded(ns, len(payload), len(wire), bool(flags & _COMP_MASK), time.perf_counter() - t0)
+    return wire
+
+
+def decode(wire: bytes, *, ns: str = "-") -> Tuple[Optional[int], bytes]:
+    # -> (serializer | None для значения без заголовка, payload)
+    if not wire.startswith(MAGIC) or len(wire) < 3:
+        return None, wire
+    t0 = time.perf_counter()
+    flags = wire[2]
+    comp = flags & _COMP_MASK
+    body = memoryview(wire)[3:]
+    try:
+        payload = _decompress(comp, body) if comp else bytes(body)
+    except CodecError:
+        raise
+    except Exception as e:
+        raise CodecError(f"decompress_failed: {type(e).__name__}: {e}") from e
+    _STATS.decoded(ns, time.perf_counter() - t0)
+    return flags & _SER_MASK, payload
+
+
+# -------------------- objects (memo и т.п.) --------------------
+
+
+def dumps(value: Any, *, serializer: str = "pickle", ns: str = "-") -> bytes:
+    """
+    value -> wire. serializer="msgpack" — только для JSON-подобных значений (tuple вернётся list-ом);
+    если msgpack не установлен или значение им не упаковывается — pickle.
+    """
+    if serializer == "msgpack" and _msgpack is not None:
+        try:
+            return encode(_msgpack.packb(value, use_bin_type=True), ser=SER_MSGPACK, ns=ns)
+        except Exception:
+            pass
+    return encode(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), ser=SER_PICKLE, ns=ns)
+
+
+def loads(wire: bytes, *, ns: str = "-") -> Any:
+    ser, payload = decode(wire, ns=ns)
+    if ser is None or ser == SER_PICKLE:
+        return pickle.loads(payload)
+    if ser == SER_MSGPACK:
+        if _msgpack is None:
+            raise CodecError("msgpack_not_installed")
+        return _msgpack.unpackb(payload, raw=False, strict_map_key=False)
+    if ser == SER_RAW:
+        return payload
+    raise CodecError(f"bad_serializer: {ser:#x}")
@@ -0,0 +1,621 @@
+# FILE: engine/common/campaign_counters.py  (новое — 2026-10-16)
+# PURPOSE: Rollup-счётчики кампаний вместо COUNT(...) по sending_log / mailbox_stats на каждый показ дашборда.
+#          public.campaign_counters (итого на кампанию) + public.campaign_counters_daily (корзины по дням, Europe/Berlin):
+#          total_logged / processed / sent / failed / bounced / replied / viewed_unique / clicked.
+#          Поддерживаются statement-level AFTER триггерами (transition tables) на sending_log (INSERT/UPDATE/DELETE),
+#          mailbox_stats (INSERT) и replay_log (INSERT): один upsert на кампанию/день на statement, а не на строку —
+#          писатели (SendingLogWriter flush, send.py, imap_message, stat_processor) не меняются.
+#          Уникальные просмотры: public.campaign_viewers (campaign_id, aggr_contact_cb_id) — новый зритель = +1.
+#          verify_and_repair(): дешёвая сверка итогов с сырыми таблицами одним проходом + точный пересчёт
+#          расходящихся кампаний. Пересчёт кампании идёт под pg_advisory_xact_lock (эксклюзивно), триггеры берут
+#          тот же ключ shared — пересчёт не теряет и не удваивает параллельные записи.
+#          Установка — шаг деплоя (миграция web/panel/aap_campaigns 0006) до старта панели: install_schema()
+#          короткой транзакцией, затем backfill_one() по кампании в своей транзакции — писатели не ждут весь бэкфилл;
+#          verify_and_repair() в core_status.maintenance_processor — страховка: раз в час verify_recent() по кампаниям, тронутым
+#          за последние часы, полный проход по всем — раз в сутки. Воркеры DDL не выполняют (схема — только миграцией).
+#          Архив партиций (engine.common.partitions) замораживает кампанию по источнику в public.campaign_counters_frozen:
+#          только счётчики, которые питает архивированная таблица (FREEZE_SCOPE), берутся из rollup-а как есть;
+#          остальные счётчики кампании сверяются и пересчитываются как обычно.
+
+from __future__ import annotations
+
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from engine.common import db
+from engine.common.mail.sending_log import STATUS_RESERVED, STATUS_UNCONFIRMED
+
+COUNTERS: Tuple[str, ...] = (
+    "total_logged",   # все строки sending_log (в т.ч. резерв SENDING)
+    "processed",      # processed = true (то же, что campaigns_campaigns.sent_num)
+    "sent",           # status = SEND
+    "failed",         # прочие итоговые статусы (FAIL_TMP, REPUTATION, OTHER, BAD_CONTACT_..., ...)
+    "bounced",        # status = BAD_ADDRESS (SMTP 5xx или hard bounce из IMAP)
+    "replied",        # replay_log: ответ человека (ANSWER / ANGRY_CONTACT)
+    "viewed_unique",  # уникальные aggr-контакты с визитом на сайт (mailbox_stats)
+    "clicked",        # все визиты (строки mailbox_stats)
+)
+
+STATUS_SEND = "SEND"
+STATUS_BAD_ADDRESS = "BAD_ADDRESS"
+REPLY_STATUSES: Tuple[str, ...] = ("ANSWER", "ANGRY_CONTACT")
+_NOT_FAILED: Tuple[str, ...] = (STATUS_SEND, STATUS_RESERVED, STATUS_UNCONFIRMED, STATUS_BAD_ADDRESS)
+
+# источник архива -> счётчики, которые он питает (mailbox_stats / replay_log считаются через join к sending_log)
+FREEZE_SCOPE: Dict[str, Tuple[str, ...]] = {
+    "sending_log": COUNTERS,
+    "mailbox_stats": ("viewed_unique", "clicked"),
+}
+
+DAY_TZ = "Europe/Berlin"
+LOCK_CLASS = 0x43430001  # pg_advisory_xact_lock(LOCK_CLASS, campaign_id)
+SCHEMA = "public"
+
+
+# -------------------- SQL builders --------------------
+
+
+def _lit(values: Iterable[str]) -> str:
+    return ", ".join("'" + v.replace("'", "''") + "'" for v in values)
+
+
+def _day(expr: str) -> str:
+    return f"(({expr}) AT TIME ZONE '{DAY_TZ}')::date"
+
+
+def _row(campaign: str, day: str, **vals: str) -> str:
+    # SELECT-список в порядке (campaign_id, day, COUNTERS...); не названные счётчики = 0
+    cols = ", ".join(f"{vals.get(c, '0')}::bigint AS {c}" for c in COUNTERS)
+    return f"SELECT ({campaign})::bigint AS campaign_id, {day} AS day, {cols}"
+
+
+def _sl_src(table: str, sign: int) -> str:
+    # sending_log -> дельты; sign = -1 для old_rows (UPDATE / DELETE)
+    st = "COALESCE(r.status, '')"
+    s = "" if sign > 0 else "-"
+    return (
+        _row(
+            "r.campaign_id",
+            _day("COALESCE(r.created_at, now())"),
+            total_logged=f"{s}1",
+            processed=f"{s}(r.processed IS TRUE)::int",
+            sent=f"{s}({st} = '{STATUS_SEND}')::int",
+            failed=f"{s}(r.processed IS TRUE AND {st} NOT IN ({_lit(_NOT_FAILED)}))::int",
+            bounced=f"{s}({st} = '{STATUS_BAD_ADDRESS}')::int",
+        )
+        + f" FROM {table} r"
+    )
+
+
+def _apply_sql(schema: str, src: str, pre: str = "") -> str:
+    # src: строки (campaign_id, day, COUNTERS...) -> upsert в daily и в итоги, упорядоченно по ключу
+    cols = ", ".join(COUNTERS)
+    sums = ", ".join(f"SUM({c})::bigint AS {c}" for c in COUNTERS)
+    nonzero = " OR ".join(f"SUM({c}) <> 0" for c in COUNTERS)
+    upd = ", ".join(f"{c} = t.{c} + EXCLUDED.{c}" for c in COUNTERS)
+    return f"""
+    WITH {pre}
+    d AS (
+        SELECT campaign_id, day, {sums}
+        FROM ({src}) s
+        WHERE campaign_id IS NOT NULL
+        GROUP BY campaign_id, day
+        HAVING {nonzero}
+    ),
+    daily AS (
+        INSERT INTO {schema}.campaign_counters_daily AS t (campaign_id, day, {cols})
+        SELECT campaign_id, day, {cols} FROM d ORDER BY campaign_id, day
+        ON CONFLICT (campaign_id, day) DO UPDATE SET {upd}, updated_at = now()
+    )
+    INSERT INTO {schema}.campaign_counters AS t (campaign_id, {cols})
+    SELECT campaign_id, {sums} FROM d GROUP BY campaign_id ORDER BY campaign_id
+    ON CONFLICT (campaign_id) DO UPDATE SET {upd}, updated_at = now();
+    """
+
+
+def _trigger_fn(schema: str, name: str, lock_ids: str, src: str, pre: str = "") -> str:
+    return f"""
+CREATE OR REPLACE FUNCTION {schema}.{name}() RETURNS trigger LANGUAGE plpgsql AS $fn$
+BEGIN
+    PERFORM {schema}.campaign_counters_lock(ARRAY({lock_ids}));
+    {_apply_sql(schema, src, pre)}
+    RETURN NULL;
+END
+$fn$;
+"""
+
+
+def _trigger(schema: str, table: str, name: str, event: str, ref: str, fn: str) -> str:
+    # CREATE TRIGGER только если его ещё нет (без AccessExclusive на горячей таблице при каждом старте процесса)
+    return f"""
+DO $do$
+BEGIN
+    IF to_regclass('{schema}.{table}') IS NOT NULL AND NOT EXISTS (
+        SELECT 1 FROM pg_trigger WHERE tgname = '{name}' AND tgrelid = '{schema}.{table}'::regclass
+    ) THEN
+        CREATE TRIGGER {name} AFTER {event} ON {schema}.{table}
+            REFERENCING {ref}
+            FOR EACH STATEMENT EXECUTE FUNCTION {schema}.{fn}();
+    END IF;
+END
+$do$;
+"""
+
+
+def _schema_sql(schema: str = SCHEMA) -> str:
+    cols = ",\n    ".join(f"{c} bigint NOT NULL DEFAULT 0" for c in COUNTERS)
+    sl_lock = "SELECT DISTINCT campaign_id::bigint FROM {t}"
+    ms_join = f"FROM new_rows ms JOIN {schema}.sending_log lg ON lg.id = ms.letter_id"
+    rp_join = (
+        f"FROM new_rows r JOIN {schema}.sending_log lg ON lg.id = r.sending_log_id "
+        f"WHERE r.status IN ({_lit(REPLY_STATUSES)})"
+    )
+    ms_pre = f"""
+    v AS (
+        SELECT lg.campaign_id, lg.aggr_contact_cb_id, {_day("COALESCE(ms.time, now())")} AS day
+        {ms_join}
+    ),
+    fresh AS (
+        INSERT INTO {schema}.campaign_viewers (campaign_id, aggr_contact_cb_id, first_day)
+        SELECT campaign_id, aggr_contact_cb_id, MIN(day)
+        FROM v
+        WHERE campaign_id IS NOT NULL AND aggr_contact_cb_id IS NOT NULL
+        GROUP BY campaign_id, aggr_contact_cb_id
+        ORDER BY campaign_id, aggr_contact_cb_id
+        ON CONFLICT DO NOTHING
+        RETURNING campaign_id, first_day
+    ),"""
+    ms_src = (
+        _row("campaign_id", "day", clicked="1") + " FROM v UNION ALL "
+        + _row("campaign_id", "first_day", viewed_unique="1") + " FROM fresh"
+    )
+    rp_src = _row("lg.campaign_id", _day("COALESCE(r.replay_time, now())"), replied="1") + " " + rp_join
+
+    return f"""
+CREATE TABLE IF NOT EXISTS {schema}.campaign_counters (
+    campaign_id bigint PRIMARY KEY,
+    {cols},
+    updated_at timestamptz NOT NULL DEFAULT now()
+);
+CREATE TABLE IF NOT EXISTS {schema}.campaign_counters_daily (
+    campaign_id bigint NOT NULL,
+    day date NOT NULL,
+    {cols},
+    updated_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (campaign_id, day)
+);
+CREATE TABLE IF NOT EXISTS {schema}.campaign_counters_frozen (
+    campaign_id bigint NOT NULL,
+    source text NOT NULL,
+    frozen_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (campaign_id, source)
+);
+CREATE TABLE IF NOT EXISTS {schema}.campaign_viewers (
+    campaign_id bigint NOT NULL,
+    aggr_contact_cb_id bigint NOT NULL,
+    first_day date NOT NULL,
+    PRIMARY KEY (campaign_id, aggr_contact_cb_id)
+);
+
+CREATE OR REPLACE FUNCTION {schema}.campaign_counters_lock(ids bigint[]) RETURNS void LANGUAGE plpgsql AS $fn$
+BEGIN
+    -- shared: писатели друг другу не мешают; verify_and_repair берёт тот же ключ эксклюзивно
+    PERFORM pg_advisory_xact_lock_shared({LOCK_CLASS}, mod(x, 2147483647)::int)
+    FROM (SELECT DISTINCT x FROM unnest(ids) AS x WHERE x IS NOT NULL ORDER BY 1) s;
+END
+$fn$;
+{_trigger_fn(schema, "campaign_counters_sl_ins", sl_lock.format(t="new_rows"), _sl_src("new_rows", 1))}
+{_trigger_fn(
+    schema,
+    "campaign_counters_sl_upd",
+    sl_lock.format(t="old_rows") + " UNION " + sl_lock.format(t="new_rows"),
+    _sl_src("old_rows", -1) + " UNION ALL " + _sl_src("new_rows", 1),
+)}
+{_trigger_fn(schema, "campaign_counters_sl_del", sl_lock.format(t="old_rows"), _sl_src("old_rows", -1))}
+{_trigger_fn(schema, "campaign_counters_ms_ins", "SELECT DISTINCT lg.campaign_id::bigint " + ms_join, ms_src, ms_pre)}
+{_trigger_fn(schema, "campaign_counters_rp_ins", "SELECT DISTINCT lg.campaign_id::bigint " + rp_join, rp_src)}
+{_trigger(schema, "sending_log", "campaign_counters_sl_ins", "INSERT", "NEW TABLE AS new_rows", "campaign_counters_sl_ins")}
+{_trigger(schema, "sending_log", "campaign_counters_sl_upd", "UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows", "campaign_counters_sl_upd")}
+{_trigger(schema, "sending_log", "campaign_counters_sl_del", "DELETE", "OLD TABLE AS old_rows", "campaign_counters_sl_del")}
+{_trigger(schema, "mailbox_stats", "campaign_counters_ms_ins", "INSERT", "NEW TABLE AS new_rows", "campaign_counters_ms_ins")}
+{_trigger(schema, "replay_log", "campaign_counters_rp_ins", "INSERT", "NEW TABLE AS new_rows", "campaign_counters_rp_ins")}
+"""
+
+
+def _raw_daily_sql(schema: str = SCHEMA) -> str:
+    # Сырые корзины по дням для одной кампании (%s = campaign_id x3); viewed_unique — из пересобранного campaign_viewers
+    sums = ", ".join(f"SUM({c})::bigint" for c in COUNTERS)
+    return f"""
+    SELECT day, {sums}
+    FROM (
+        {_sl_src(f"{schema}.sending_log", 1)} WHERE r.campaign_id = %s
+        UNION ALL
+        {_row("lg.campaign_id", _day("COALESCE(ms.time, now())"), clicked="1")}
+        FROM {schema}.mailbox_stats ms JOIN {schema}.sending_log lg ON lg.id = ms.letter_id
+        WHERE lg.campaign_id = %s
+        UNION ALL
+        {_row("r.campaign_id", "r.first_day", viewed_unique="1")}
+        FROM {schema}.campaign_viewers r WHERE r.campaign_id = %s
+        UNION ALL
+        {_row("lg.campaign_id", _day("COALESCE(r.replay_time, now())"), replied="1")}
+        FROM {schema}.replay_log r JOIN {schema}.sending_log lg ON lg.id = r.sending_log_id
+        WHERE r.status IN ({_lit(REPLY_STATUSES)}) AND lg.campaign_id = %s
+    ) s
+    GROUP BY day
+    ORDER BY day
+    """
+
+
+def _rebuild_viewers_sql(schema: str = SCHEMA) -> str:
+    # %s = campaign_id; старый набор зрителей кампании удаляется отдельным DELETE перед этим INSERT
+    return f"""
+    INSERT INTO {schema}.campaign_viewers (campaign_id, aggr_contact_cb_id, first_day)
+    SELECT lg.campaign_id, lg.aggr_contact_cb_id, MIN({_day("COALESCE(ms.time, now())")})
+    FROM {schema}.mailbox_stats ms
+    JOIN {schema}.sending_log lg ON lg.id = ms.letter_id
+    WHERE lg.campaign_id = %s AND lg.aggr_contact_cb_id IS NOT NULL
+    GROUP BY lg.campaign_id, lg.aggr_contact_cb_id
+    """
+
+
+def _check_sql(schema: str = SCHEMA) -> str:
+    # Один проход по сырым таблицам: итоги по кампаниям, сравнение с campaign_counters -> (campaign_id, [счётчики]).
+    # %s x10 = campaign_ids (bigint[] | NULL = все)
+    cols = ", ".join(COUNTERS)
+    sums = ", ".join(f"SUM({c})::bigint AS {c}" for c in COUNTERS)
+    diff = " OR ".join(f"COALESCE(raw.{c}, 0) <> COALESCE(cc.{c}, 0)" for c in COUNTERS)
+    cols_diff = ", ".join(
+        f"CASE WHEN COALESCE(raw.{c}, 0) <> COALESCE(cc.{c}, 0) THEN '{c}' END" for c in COUNTERS
+    )
+    only = "(%s::bigint[] IS NULL OR {col} = ANY(%s::bigint[]))"
+    return f"""
+    WITH raw AS (
+        SELECT campaign_id, {sums}
+        FROM (
+            SELECT
+                r.campaign_id::bigint AS campaign_id,
+                COUNT(*)::bigint AS total_logged,
+                COUNT(*) FILTER (WHERE r.processed IS TRUE)::bigint AS processed,
+                COUNT(*) FILTER (WHERE COALESCE(r.status, '') = '{STATUS_SEND}')::bigint AS sent,
+                COUNT(*) FILTER (
+                    WHERE r.processed IS TRUE AND COALESCE(r.status, '') NOT IN ({_lit(_NOT_FAILED)})
+                )::bigint AS failed,
+                COUNT(*) FILTER (WHERE COALESCE(r.status, '') = '{STATUS_BAD_ADDRESS}')::bigint AS bounced,
+                0::bigint AS replied,
+                0::bigint AS viewed_unique,
+                0::bigint AS clicked
+            FROM {schema}.sending_log r
+            WHERE {only.format(col="r.campaign_id")}
+            GROUP BY r.campaign_id
+            UNION ALL
+            SELECT
+                lg.campaign_id::bigint,
+                0, 0, 0, 0, 0, 0,
+                COUNT(DISTINCT lg.aggr_contact_cb_id)::bigint,
+                COUNT(*)::bigint
+            FROM {schema}.mailbox_stats ms
+            JOIN {schema}.sending_log lg ON lg.id = ms.letter_id
+            WHERE {only.format(col="lg.campaign_id")}
+            GROUP BY lg.campaign_id
+            UNION ALL
+            SELECT lg.campaign_id::bigint, 0, 0, 0, 0, 0, COUNT(*)::bigint, 0, 0
+            FROM {schema}.replay_log r
+            JOIN {schema}.sending_log lg ON lg.id = r.sending_log_id
+            WHERE r.status IN ({_lit(REPLY_STATUSES)})
+              AND {only.format(col="lg.campaign_id")}
+            GROUP BY lg.campaign_id
+        ) s
+        WHERE campaign_id IS NOT NULL
+        GROUP BY campaign_id
+    ),
+    cc AS (
+        SELECT campaign_id, {cols}
+        FROM {schema}.campaign_counters
+        WHERE {only.format(col="campaign_id")}
+    )
+    SELECT
+        COALESCE(raw.campaign_id, cc.campaign_id),
+        array_remove(ARRAY[{cols_diff}], NULL)::text[]
+    FROM raw
+    FULL JOIN cc ON cc.campaign_id = raw.campaign_id
+    WHERE ({diff})
+      AND (%s::bigint[] IS NULL OR COALESCE(raw.campaign_id, cc.campaign_id) = ANY(%s::bigint[]))
+    ORDER BY 1
+    """
+
+
+# -------------------- verify / repair --------------------
+
+
+def _ids_param(campaign_ids: Optional[Sequence[int]]) -> Optional[List[int]]:
+    if campaign_ids is None:
+        return None
+    return sorted({int(x) for x in campaign_ids if int(x) > 0})
+
+
+def _daily_check_sql(schema: str = SCHEMA) -> str:
+    # Корзины по дням не сходятся с итогами кампании (%s x2 = campaign_ids | NULL)
+    sums = ", ".join(f"SUM({c})::bigint AS {c}" for c in COUNTERS)
+    diff = " OR ".join(f"COALESCE(d.{c}, 0) <> cc.{c}" for c in COUNTERS)
+    cols_diff = ", ".join(f"CASE WHEN COALESCE(d.{c}, 0) <> cc.{c} THEN '{c}' END" for c in COUNTERS)
+    return f"""
+    SELECT cc.campaign_id, array_remove(ARRAY[{cols_diff}], NULL)::text[]
+    FROM {schema}.campaign_counters cc
+    LEFT JOIN (
+        SELECT campaign_id, {sums}
+        FROM {schema}.campaign_counters_daily
+        GROUP BY campaign_id
+    ) d ON d.campaign_id = cc.campaign_id
+    WHERE (%s::bigint[] IS NULL OR cc.campaign_id = ANY(%s::bigint[]))
+      AND ({diff})
+    """
+
+
+def _check(cur: Any, campaign_ids: Optional[List[int]], schema: str = SCHEMA) -> Dict[int, set]:
+    """campaign_id -> расходящиеся счётчики (сырые vs итоги, итоги vs сумма дней)."""
+    out: Dict[int, set] = {}
+    cur.execute(_check_sql(schema), [campaign_ids] * 10)
+    for cid, cols in cur.fetchall() or []:
+        out.setdefault(int(cid), set()).update(cols or ())
+    cur.execute(_daily_check_sql(schema), [campaign_ids] * 2)
+    for cid, cols in cur.fetchall() or []:
+        out.setdefault(int(cid), set()).update(cols or ())
+    return out
+
+
+def _frozen(cur: Any, campaign_ids: Optional[List[int]], schema: str = SCHEMA) -> Dict[int, set]:
+    """campaign_id -> замороженные счётчики (объединение FREEZE_SCOPE по архивированным источникам)."""
+    cur.execute(
+        f"""
+        SELECT campaign_id, source
+        FROM {schema}.campaign_counters_frozen
+        WHERE (%s::bigint[] IS NULL OR campaign_id = ANY(%s::bigint[]))
+        """,
+        [campaign_ids, campaign_ids],
+    )
+    out: Dict[int, set] = {}
+    for cid, source in cur.fetchall() or []:
+        out.setdefault(int(cid), set()).update(FREEZE_SCOPE.get(str(source), COUNTERS))
+    return out
+
+
+def _rebuild(cur: Any, campaign_id: int, schema: str = SCHEMA, *, keep: Iterable[str] = ()) -> bool:
+    """
+    Пересборка viewers / daily / итогов одной кампании из сырых таблиц на cur (без блокировки и commit).
+    keep — замороженные счётчики: их дневные значения остаются из rollup-а (сырых строк уже нет).
+    """
+    cid = int(campaign_id)
+    cols = ", ".join(COUNTERS)
+    keep_idx = [i for i, c in enumerate(COUNTERS) if c in set(keep)]
+    cur.execute(f"SELECT {cols} FROM {schema}.campaign_counters WHERE campaign_id = %s", [cid])
+    before = tuple(int(x or 0) for x in (cur.fetchone() or (0,) * len(COUNTERS)))
+
+    if "viewed_unique" not in set(keep):
+        cur.execute(f"DELETE FROM {schema}.campaign_viewers WHERE campaign_id = %s", [cid])
+        cur.execute(_rebuild_viewers_sql(schema), [cid])
+    cur.execute(_raw_daily_sql(schema), [cid, cid, cid, cid])
+    raw_days = {r[0]: tuple(int(x or 0) for x in r[1:]) for r in cur.fetchall() or []}
+    if keep_idx:
+        cur.execute(f"SELECT day, {cols} FROM {schema}.campaign_counters_daily WHERE campaign_id = %s", [cid])
+        old_days = {r[0]: tuple(int(x or 0) for x in r[1:]) for r in cur.fetchall() or []}
+    else:
+        old_days = {}
+    zero = (0,) * len(COUNTERS)
+    days: List[Tuple[date, Tuple[int, ...]]] = []
+    for d in sorted(set(raw_days) | set(old_days)):
+        raw_v, old_v = raw_days.get(d, zero), old_days.get(d, zero)
+        v = tuple(old_v[i] if i in keep_idx else raw_v[i] for i in range(len(COUNTERS)))
+        if any(v):
+            days.append((d, v))
+    totals = tuple(sum(v[i] for _, v in days) for i in range(len(COUNTERS)))
+
+    cur.execute(f"DELETE FROM {schema}.campaign_counters_daily WHERE campaign_id = %s", [cid])
+    if days:
+        cur.execute(
+            f"""
+            INSERT INTO {schema}.campaign_counters_daily (campaign_id, day, {cols})
+            SELECT %s, v.*
+            FROM unnest(%s::date[], {", ".join(["%s::bigint[]"] * len(COUNTERS))})
+                AS v(day, {cols})
+            """,
+            [cid, [d for d, _ in days]] + [[v[i] for _, v in days] for i in range(len(COUNTERS))],
+        )
+    cur.execute(
+        f"""
+        INSERT INTO {schema}.campaign_counters (campaign_id, {cols})
+        VALUES (%s, {", ".join(["%s"] * len(COUNTERS))})
+        ON CONFLICT (campaign_id) DO UPDATE
+        SET {", ".join(f"{c} = EXCLUDED.{c}" for c in COUNTERS)}, updated_at = now()
+        """,
+        [cid, *totals],
+    )
+    return totals != before
+
+
+def _lock_campaign(cur: Any, campaign_id: int) -> None:
+    # эксклюзивно до конца транзакции: ждёт писателей, уже обновивших счётчики кампании (триггеры — shared)
+    cur.execute("SELECT pg_advisory_xact_lock(%s, mod(%s::bigint, 2147483647)::int)", [LOCK_CLASS, int(campaign_id)])
+
+
+def _repair_one(conn: Any, campaign_id: int, schema: str = SCHEMA, *, keep: Iterable[str] = ()) -> bool:
+    """
+    Точный пересчёт одной кампании (своя транзакция). Эксклюзивный advisory-lock ждёт писателей,
+    уже обновивших счётчики этой кампании; записи после снимка досчитают их собственные триггеры.
+    -> True, если итоги изменились.
+    """
+    cid = int(campaign_id)
+    with conn.cursor() as cur:
+        _lock_campaign(cur, cid)
+        changed = _rebuild(cur, cid, schema, keep=keep)
+    conn.commit()
+    return changed
+
+
+def install_schema(cur: Any, schema: str = SCHEMA) -> None:
+    """
+    Шаг деплоя 1 (web: aap_campaigns миграция 0006): таблицы + функции + триггеры, короткая транзакция вызывающего.
+    CREATE TRIGGER держит SHARE ROW EXCLUSIVE на sending_log / mailbox_stats / replay_log только до её commit.
+    """
+    cur.execute(_schema_sql(schema))
+
+
+def backfill_ids(cur: Any, schema: str = SCHEMA) -> List[int]:
+    """Кампании для бэкфилла (все, у которых есть строки в sending_log)."""
+    cur.execute(f"SELECT DISTINCT campaign_id FROM {schema}.sending_log WHERE campaign_id IS NOT NULL ORDER BY 1")
+    return [int(r[0]) for r in cur.fetchall() or []]
+
+
+def backfill_one(cur: Any, campaign_id: int, schema: str = SCHEMA) -> bool:
+    """
+    Шаг деплоя 2: точная пересборка одной кампании в транзакции вызывающего (одна транзакция = одна кампания).
+    Триггеры уже стоят: запись, пришедшая до пересборки, перекрывается ею; после — досчитывается триггером
+    (тот же advisory-lock, что и у verify_and_repair). Не дошедшее (прерванный деплой) добирает verify_and_repair().
+    """
+    cid = int(campaign_id)
+    _lock_campaign(cur, cid)
+    keep = _frozen(cur, [cid], schema).get(cid, ())
+    return _rebuild(cur, cid, schema, keep=keep)
+
+
+def verify_and_repair(campaign_ids: Optional[Sequence[int]] = None) -> Dict[str, Any]:
+    """
+    Сверка rollup-а с сырыми таблицами. campaign_ids=None — все кампании.
+    Расхождение (или гонка с текущей записью) -> точный пересчёт кампании под блокировкой.
+    """
+    ids = _ids_param(campaign_ids)
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            diff = _check(cur, ids)
+            frozen = _frozen(cur, ids) if diff else {}
+        conn.commit()
+        # расхождение только в замороженных счётчиках — ожидаемо (сырые строки в архиве), не чиним
+        skipped = [cid for cid, cols in diff.items() if cols and cols <= frozen.get(cid, set())]
+        drift = sorted(cid for cid in diff if cid not in set(skipped))
+        repaired: List[int] = []
+        for cid in drift:
+            if _repair_one(conn, cid, keep=frozen.get(cid, ())):
+                repaired.append(cid)
+    return {
+        "checked": "all" if ids is None else len(ids),
+        "drift_cnt": len(drift),
+        "frozen_skipped": len(skipped),
+        "repaired_cnt": len(repaired),
+        "repaired_ids": repaired[:50],
+    }
+
+
+def freeze(campaign_ids: Iterable[int], source: str, *, cur: Any = None) -> int:
+    """
+    Сырые строки кампаний из source (sending_log / mailbox_stats) уходят в архив:
+    счётчики FREEZE_SCOPE[source] дальше берутся из rollup-а, остальные сверяются как обычно. cur — транзакция архивации.
+    """
+    if source not in FREEZE_SCOPE:
+        raise ValueError(f"unknown freeze source: {source}")
+    ids = sorted({int(x) for x in campaign_ids if int(x) > 0})
+    if not ids:
+        return 0
+    sql = f"""
+    INSERT INTO {SCHEMA}.campaign_counters_frozen (campaign_id, source)
+    SELECT x, %s FROM unnest(%s::bigint[]) AS x
+    ON CONFLICT (campaign_id, source) DO NOTHING
+    """
+    if cur is None:
+        db.execute(sql, [source, ids])
+    else:
+        cur.execute(sql, [source, ids])
+    return len(ids)
+
+
+def recently_active_ids(within_sec: int) -> List[int]:
+    """Кампании, чей rollup трогали триггеры за within_sec (любая запись в sending_log / mailbox_stats / replay_log)."""
+    rows = db.fetch_all(
+        f"SELECT campaign_id FROM {SCHEMA}.campaign_counters WHERE updated_at >= now() - %s * interval '1 second'",
+        [int(within_sec)],
+    )
+    return sorted(int(r[0]) for r in rows or [])
+
+
+def verify_recent(within_sec: int) -> Dict[str, Any]:
+    """Часовая сверка: только недавно активные кампании (сырые выборки по campaign_id, без полного прохода)."""
+    ids = recently_active_ids(within_sec)
+    if not ids:
+        return {"checked": 0, "drift_cnt": 0, "frozen_skipped": 0, "repaired_cnt": 0, "repaired_ids": []}
+    return verify_and_repair(ids)
+
+
+# -------------------- read --------------------
+
+
+def _zero() -> Dict[str, int]:
+    return {c: 0 for c in COUNTERS}
+
+
+def _rows(sql: str, params: list, cur: Any = None) -> list:
+    if cur is None:
+        return db.fetch_all(sql, params) or []
+    cur.execute(sql, params)
+    return cur.fetchall() or []
+
+
+def counters_by_campaign_ids(campaign_ids: Iterable[int], *, cur: Any = None) -> Dict[int, Dict[str, int]]:
+    """{campaign_id: {counter: value}} для всех запрошенных id (нет строки -> нули). cur: DB-API курсор (Django / psycopg)."""
+    ids = sorted({int(x) for x in (campaign_ids or []) if int(x) > 0})
+    out = {cid: _zero() for cid in ids}
+    if not ids:
+        return out
+    rows = _rows(
+        f"SELECT campaign_id, {', '.join(COUNTERS)} FROM {SCHEMA}.campaign_counters WHERE campaign_id = ANY(%s)",
+        [ids],
+        cur,
+    )
+    for r in rows:
+        out[int(r[0])] = {c: int(v or 0) for c, v in zip(COUNTERS, r[1:])}
+    return out
+
+
+def workspace_counters(ws_id: Any, *, cur: Any = None) -> Dict[str, int]:
+    """Сумма счётчиков по всем кампаниям workspace."""
+    sums = ", ".join(f"COALESCE(SUM(cc.{c}), 0)::bigint" for c in COUNTERS)
+    rows = _rows(
+        f"""
+        SELECT {sums}
+        FROM {SCHEMA}.campaign_counters cc
+        JOIN public.campaigns_campaigns c
+          ON c.id = cc.campaign_id
+         AND c.workspace_id = %s::uuid
+        """,
+        [str(ws_id)],
+        cur,
+    )
+    if not rows:
+        return _zero()
+    return {c: int(v or 0) for c, v in zip(COUNTERS, rows[0])}
+
+
+def daily_by_campaign_ids(
+    campaign_ids: Iterable[int],
+    *,
+    day_from: Optional[date] = None,
+    day_to: Optional[date] = None,
+    cur: Any = None,
+) -> Dict[int, List[Tuple[date, Dict[str, int]]]]:
+    """{campaign_id: [(day, {counter: value}), ...]} по возрастанию дня; границы включительно."""
+    ids = sorted({int(x) for x in (campaign_ids or []) if int(x) > 0})
+    out: Dict[int, List[Tuple[date, Dict[str, int]]]] = {cid: [] for cid in ids}
+    if not ids:
+        return out
+    rows = _rows(
+        f"""
+        SELECT campaign_id, day, {', '.join(COUNTERS)}
+        FROM {SCHEMA}.campaign_counters_daily
+        WHERE campaign_id = ANY(%s)
+          AND (%s::date IS NULL OR day >= %s::date)
+          AND (%s::date IS NULL OR day <= %s::date)
+        ORDER BY campaign_id, day
+        """,
+        [ids, day_from, day_from, day_to, day_to],
+        cur,
+    )
+    for r in rows:
+        out[int(r[0])].append((r[1], {c: int(v or 0) for c, v in zip(COUNTERS, r[2:])}))
+    return out
@@ -1,12 +1,24 @@
-# FILE: engine/common/db.py  (обновлено — 2026-01-06)
+# FILE: engine/common/db.py  (обновлено — 2026-10-16)
 # PURPOSE: Универсальный PostgreSQL-коннектор.
 #          По умолчанию ведёт себя КАК СЕЙЧАС (localhost:5433 для хоста),
 #          но в Docker полностью управляется через env (mailer-db:5432).
+# CHANGE: fetch_all/fetch_one/execute идут через per-process ConnectionPool (psycopg_pool):
+#         пул пересоздаётся в дочернем процессе после fork, health-check при выдаче,
+#         prepared statements переиспользуются на долгоживущих соединениях.
+#         Opt-out: DB_POOL=0 (или configure_pool(enabled=False)) -> новое соединение на вызов, как раньше.
 
 from __future__ import annotations
 
+import atexit
 import os
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import util as mp_util
+from typing import Any, Dict, Iterator, Optional
+
 import psycopg
+from psycopg.conninfo import make_conninfo
 
 
 # -------------------------
@@ -19,6 +31,140 @@ DB_USER = os.environ["DB_USER"]
 DB_PASSWORD = os.environ["DB_PASSWORD"]
 
 
+def _env_int(name: str, default: int) -> int:
+    raw = (os.environ.get(name) or "").strip()
+    if raw.isdigit():
+        return int(raw)
+    return default
+
+
+def _env_float(name: str, default: float) -> float:
+    raw = (os.environ.get(name) or "").strip()
+    try:
+        return float(raw) if raw else default
+    except ValueError:
+        return default
+
+
+# -------------------------
+# POOL SETTINGS
+# -------------------------
+POOL_ENABLED = (os.environ.get("DB_POOL") or "1").strip().lower() not in ("0", "false", "no", "off")
+POOL_MIN_SIZE = _env_int("DB_POOL_MIN", 1)
+POOL_MAX_SIZE = _env_int("DB_POOL_MAX", 4)
+POOL_TIMEOUT_SEC = _env_float("DB_POOL_TIMEOUT_SEC", 30.0)
+POOL_MAX_IDLE_SEC = _env_float("DB_POOL_MAX_IDLE_SEC", 300.0)
+POOL_MAX_LIFETIME_SEC = _env_float("DB_POOL_MAX_LIFETIME_SEC", 1800.0)
+PREPARE_THRESHOLD = _env_int("DB_PREPARE_THRESHOLD", 5)
+
+_POOL: Any = None
+_POOL_PID: Optional[int] = None
+_POOL_LOCK = threading.Lock()
+# пулы, унаследованные через fork: держим ссылки, чтобы GC не закрыл (PQfinish) сокеты родителя
+_FORKED_POOLS: list[Any] = []
+# pid, для которого уже стоит mp_util.Finalize(close_pool): реестр финализаторов чистится в каждом дочернем процессе
+_FINALIZE_PID: Optional[int] = None
+
+_METRICS: Dict[str, float] = {
+    "checkouts": 0,
+    "wait_ms_total": 0.0,
+    "wait_ms_max": 0.0,
+    "direct_connects": 0,
+    "pool_builds": 0,
+}
+
+
+def _conninfo() -> str:
+    return make_conninfo(
+        host=DB_HOST,
+        port=DB_PORT,
+        dbname=DB_NAME,
+        user=DB_USER,
+        password=DB_PASSWORD,
+    )
+
+
+def _configure_conn(conn: psycopg.Connection) -> None:
+    conn.prepare_threshold = PREPARE_THRESHOLD
+
+
+def _drop_inherited_pool() -> None:
+    global _POOL, _POOL_PID, _POOL_LOCK
+    if _POOL is not None:
+        _FORKED_POOLS.append(_POOL)
+    _POOL = None
+    _POOL_PID = None
+    _POOL_LOCK = threading.Lock()
+    for k in _METRICS:
+        _METRICS[k] = 0
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_drop_inherited_pool)
+
+
+def _get_pool():
+    global _POOL, _POOL_PID, _FINALIZE_PID
+    pid = os.getpid()
+    if _POOL is not None and _POOL_PID == pid:
+        return _POOL
+    with _POOL_LOCK:
+        if _POOL is not None and _POOL_PID != pid:
+            _drop_inherited_pool()
+        if _POOL is None:
+            from psycopg_pool import ConnectionPool
+
+            _POOL = ConnectionPool(
+                _conninfo(),
+                min_size=max(0, POOL_MIN_SIZE),
+                max_size=max(1, POOL_MAX_SIZE, POOL_MIN_SIZE),
+                timeout=POOL_TIMEOUT_SEC,
+                max_idle=POOL_MAX_IDLE_SEC,
+                max_lifetime=POOL_MAX_LIFETIME_SEC,
+                configure=_configure_conn,
+                check=ConnectionPool.check_connection,
+                name=f"engine-db-{pid}",
+                open=True,
+            )
+            _POOL_PID = pid
+            _METRICS["pool_builds"] += 1
+            # штатное закрытие дочернего multiprocessing (там atexit не зовётся): один Finalize на процесс,
+            # не на каждую пересборку пула (configure_pool / fork)
+            if _FINALIZE_PID != pid:
+                mp_util.Finalize(None, close_pool, exitpriority=10)
+                _FINALIZE_PID = pid
+        return _POOL
+
+
+def configure_pool(
+    *,
+    enabled: Optional[bool] = None,
+    min_size: Optional[int] = None,
+    max_size: Optional[int] = None,
+) -> None:
+    """Настройка до первого запроса процесса (или с пересозданием пула текущего процесса)."""
+    global POOL_ENABLED, POOL_MIN_SIZE, POOL_MAX_SIZE
+    if enabled is not None:
+        POOL_ENABLED = bool(enabled)
+    if min_size is not None:
+        POOL_MIN_SIZE = int(min_size)
+    if max_size is not None:
+        POOL_MAX_SIZE = int(max_size)
+    close_pool()
+
+
+def close_pool() -> None:
+    global _POOL, _POOL_PID
+    with _POOL_LOCK:
+        pool, _POOL, pid, _POOL_PID = _POOL, None, _POOL_PID, None
+    if pool is not None and pid == os.getpid():
+        pool.close()
+
+
+# штатное закрытие обычного процесса; один раз на модуль
+atexit.register(close_pool)
+
+
 def get_connection(autocommit: bool = False) -> psycopg.Connection:
     """
     PostgreSQL connection.
@@ -35,22 +181,60 @@ def get_connection(autocommit: bool = False) -> psycopg.Connection:
     )
 
 
+@contextmanager
+def connection() -> Iterator[psycopg.Connection]:
+    """
+    Соединение на время блока: из пула процесса (или новое при DB_POOL=0).
+    На выходе: commit при успехе / rollback при исключении.
+    """
+    if not POOL_ENABLED:
+        _METRICS["direct_connects"] += 1
+        with get_connection() as conn:
+            yield conn
+        return
+
+    pool = _get_pool()
+    t0 = time.monotonic()
+    with pool.connection() as conn:
+        wait_ms = (time.monotonic() - t0) * 1000.0
+        _METRICS["checkouts"] += 1
+        _METRICS["wait_ms_total"] += wait_ms
+        if wait_ms > _METRICS["wait_ms_max"]:
+            _METRICS["wait_ms_max"] = wait_ms
+        yield conn
+
+
+def pool_stats() -> Dict[str, Any]:
+    """Метрики процесса: ожидание выдачи соединения + churn соединений (psycopg_pool.get_stats)."""
+    out: Dict[str, Any] = {"enabled": bool(POOL_ENABLED), "pid": os.getpid(), **_METRICS}
+    checkouts = int(_METRICS["checkouts"])
+    out["wait_ms_avg"] = (float(_METRICS["wait_ms_total"]) / checkouts) if checkouts else 0.0
+    pool = _POOL if _POOL_PID == os.getpid() else None
+    if pool is not None:
+        st = pool.get_stats()
+        out["pool"] = dict(st)
+        out["connections_opened"] = int(st.get("connections_num", 0))
+        out["connections_lost"] = int(st.get("connections_lost", 0))
+        out["returns_bad"] = int(st.get("returns_bad", 0))
+    return out
+
+
 def fetch_all(sql: str, params=None):
-    with get_connection() as conn:
+    with connection() as conn:
         with conn.cursor() as cur:
             cur.execute(sql, params or ())
             return cur.fetchall()
 
 
 def fetch_one(sql: str, params=None):
-    with get_connection() as conn:
+    with connection() as conn:
         with conn.cursor() as cur:
             cur.execute(sql, params or ())
             return cur.fetchone()
 
 
 def execute(sql: str, params=None):
-    with get_connection() as conn:
+    with connection() as conn:
         with conn.cursor() as cur:
             cur.execute(sql, params or ())
         conn.commit()
@@ -58,3 +242,4 @@ def execute(sql: str, params=None):
 
 if __name__ == "__main__":
     print(fetch_one("SELECT 1"))
+    print(pool_stats())
@@ -1,6 +1,7 @@
 # FILE: engine/common/email_template.py  (обновлено — 2026-01-30)
 # PURPOSE: Финальный рендер HTML-писем + (NEW) общий хелпер праздников DE для send-window.
 # CHANGE: Добавлен импорт holidays БЕЗ try/except (если пакета нет — падаем), кеш праздников и _is_de_public_holiday().
+# CHANGE: SendTemplate / compile_send_template(): рендер получателя без regex-проходов (build_send_bodies — эталон и fallback).
 
 from __future__ import annotations
 
@@ -8,9 +9,12 @@ import html as _html
 import json
 import re
 import textwrap
+from bisect import bisect_right
 from datetime import date
 from datetime import datetime
-from typing import Any, Dict, Optional, Union
+from functools import lru_cache
+from itertools import accumulate
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import holidays  # если пакета нет — пусть валится нах
 from dateutil.relativedelta import relativedelta
@@ -204,6 +208,264 @@ def add_smrel_to_links(html: str, utm: str) -> str:
 
 
 def html_to_text(s: str) -> str:
+    s1 = _html_to_text_unwrapped(s)
+    s1 = _RE_TEXT_WS.sub(" ", s1)
+    return textwrap.fill(s1.strip(), width=78)
+
+
+def build_send_bodies(html_template: str, vars_map: Dict[str, Any], utm: str) -> tuple[str, str]:
+    html1 = apply_vars(str(html_template or ""), vars_map=vars_map)
+    html2 = add_smrel_to_links(html1, str(utm or "").strip())
+    text = html_to_text(html2)
+    return html2, text
+
+
+# ---- compiled send template ----
+# Шаблон компилируется один раз: {{ var }} и smrel-вставки в ссылки превращаются в слоты,
+# текстовая версия — в скелет с теми же слотами (до textwrap.fill). Рендер получателя = join.
+# Если var стоит внутри тега / внутри <a>...</a> или значение может "склеиться" с разметкой
+# (<, >, хвостовой &entity) — рендер идёт через build_send_bodies(), результат всегда идентичен.
+
+_SLOT = "\x00"
+_SLOT_UTM = "\x00u\x00"
+_RE_SLOT = re.compile(r"\x00(u|\d+)\x00")
+_RE_SLOT_AFTER_AMP = re.compile(r"&[^\t\n\f <&;\x00]*\x00")
+_RE_TAIL_AMP = re.compile(r"&[^\t\n\f <&;]*$")
+_RE_FAST_UTM = re.compile(r"smrel=\d+")
+
+# part/slot-списки: parts[i] + value(slots[i]) + ... + parts[-1]; slot = индекс var или -1 для utm
+_Parts = Tuple[Tuple[str, ...], Tuple[int, ...]]
+
+
+def _split_slots(s: str) -> _Parts:
+    parts: List[str] = []
+    slots: List[int] = []
+    pos = 0
+    for m in _RE_SLOT.finditer(s):
+        parts.append(s[pos : m.start()])
+        slots.append(-1 if m.group(1) == "u" else int(m.group(1)))
+        pos = m.end()
+    parts.append(s[pos:])
+    return tuple(parts), tuple(slots)
+
+
+def _join_slots(compiled: _Parts, values: List[str], utm: str) -> str:
+    parts, slots = compiled
+    out = [parts[0]]
+    for i, slot in enumerate(slots):
+        out.append(utm if slot < 0 else values[slot])
+        out.append(parts[i + 1])
+    return "".join(out)
+
+
+class _SendTextWrapper(textwrap.TextWrapper):
+    """
+    textwrap.fill(width=78) с тем же результатом, но дешевле:
+    - _split(): после _munge_whitespace пробелы — единственные разделители, wordsep_re локален
+      внутри слова, поэтому регэксп нужен только словам с "-" (кешируется);
+    - wrap_chunks(): жадный перенос по префиксным суммам (bisect на строку, а не цикл по чанкам).
+    """
+
+    _RE_SPACES = re.compile(r"( +)")
+    _WORD_CHUNKS_MAX = 20000
+
+    def __init__(self) -> None:
+        super().__init__(width=78)
+        self._word_chunks: Dict[str, List[str]] = {}
+
+    def _split(self, text: str) -> List[str]:
+        chunks: List[str] = []
+        cache = self._word_chunks
+        for token in self._RE_SPACES.split(text):
+            if not token:
+                continue
+            if token[0] == " " or "-" not in token:
+                chunks.append(token)
+                continue
+            word_chunks = cache.get(token)
+            if word_chunks is None:
+                if len(cache) >= self._WORD_CHUNKS_MAX:
+                    cache.clear()
+                word_chunks = [c for c in self.wordsep_re.split(token) if c]
+                cache[token] = word_chunks
+            chunks.extend(word_chunks)
+        return chunks
+
+    def wrap_chunks(self, chunks: List[str]) -> str:
+        # повторяет TextWrapper._wrap_chunks() (без indent/max_lines) для чанков из _split()
+        width = int(self.width)
+        n = len(chunks)
+        pre = [0]
+        pre.extend(accumulate(map(len, chunks)))
+        lines: List[str] = []
+        i = 0
+        head: Optional[str] = None  # остаток разрезанного длинного слова вместо chunks[i]
+
+        while i < n:
+            if lines and not (chunks[i] if head is None else head).strip():
+                head = None
+                i += 1
+                if i >= n:
+                    break
+
+            cur: List[str] = []
+            cur_len = 0
+            if head is not None and len(head) <= width:
+                cur.append(head)
+                cur_len = len(head)
+                head = None
+                i += 1
+            if head is None:
+                j = bisect_right(pre, pre[i] + width - cur_len, i, n + 1) - 1
+                cur.extend(chunks[i:j])
+                cur_len += pre[j] - pre[i]
+                i = j
+
+            if i < n:
+                chunk = chunks[i] if head is None else head
+                if len(chunk) > width:
+                    end = space_left = width - cur_len
+                    hyphen = chunk.rfind("-", 0, space_left)
+                    if hyphen > 0 and any(c != "-" for c in chunk[:hyphen]):
+                        end = hyphen + 1
+                    cur.append(chunk[:end])
+                    head = chunk[end:]
+
+            if cur and not cur[-1].strip():
+                cur.pop()
+            if cur:
+                lines.append("".join(cur))
+
+        return "\n".join(lines)
+
+
+_SEND_TEXT_WRAPPER = _SendTextWrapper()
+_TEXTWRAP_WS = "\t\n\x0b\x0c\r "
+
+
+def _text_static_span(part: str) -> Tuple[int, int]:
+    # [s:t) — кусок, не зависящий от соседей: начинается/кончается не-пробелом на границе с ASCII-пробелом,
+    # значит ни WS-collapse, ни разбиение на чанки, ни strip() не "перетекают" через границы
+    n = len(part)
+    s = 1
+    while s < n and not (part[s - 1] in _TEXTWRAP_WS and not part[s].isspace()):
+        s += 1
+    t = n - 1
+    while t > s and not (part[t] in _TEXTWRAP_WS and not part[t - 1].isspace()):
+        t -= 1
+    return (s, t) if s < t else (n, n)
+
+
+def _compile_text(text_marked: str) -> Tuple[Tuple[Any, ...], ...]:
+    # сегменты: list[str] — готовые чанки; tuple — окно из строк и слотов (int), рендерится на получателя
+    parts, slots = _split_slots(text_marked)
+    segs: List[Any] = []
+    window: List[Any] = []
+    for i, part in enumerate(parts):
+        if i > 0:
+            window.append(slots[i - 1])
+        s, t = _text_static_span(part)
+        if s >= t:
+            window.append(part)
+            continue
+        window.append(part[:s])
+        segs.append(tuple(window))
+        static = _SEND_TEXT_WRAPPER._munge_whitespace(_RE_TEXT_WS.sub(" ", part[s:t]))
+        segs.append(_SEND_TEXT_WRAPPER._split(static))
+        window = [part[t:]]
+    segs.append(tuple(window))
+    return tuple(segs)
+
+
+class SendTemplate:
+    __slots__ = ("source", "fast", "var_keys", "var_tokens", "html", "text")
+
+    def __init__(self, html_template: str) -> None:
+        self.source = str(html_template or "")
+        self.fast = False
+        self.var_keys: Tuple[str, ...] = ()
+        self.var_tokens: Tuple[str, ...] = ()
+        self.html: _Parts = ((), ())
+        self.text: Tuple[Any, ...] = ()
+        self._compile()
+
+    def _compile(self) -> None:
+        src = self.source
+        if _SLOT in src:
+            return
+
+        keys: List[str] = []
+        tokens: List[str] = []
+
+        def rep(m: re.Match) -> str:
+            keys.append(m.group(1))
+            tokens.append(m.group(0))
+            return f"{_SLOT}{len(keys) - 1}{_SLOT}"
+
+        marked = _RE_VAR.sub(rep, src)
+        if keys:
+            for rx in (_RE_TEXT_TAG, _RE_A_HREF):
+                if any(_SLOT in m.group(0) for m in rx.finditer(marked)):
+                    return
+            if any(_SLOT in (m.group(3) or "") for m in _RE_TEXT_A.finditer(marked)):
+                return
+            if _RE_SLOT_AFTER_AMP.search(marked):
+                return
+
+        html_marked = add_smrel_to_links(marked, _SLOT_UTM)
+        text_marked = _html_to_text_unwrapped(html_marked)
+
+        self.var_keys = tuple(keys)
+        self.var_tokens = tuple(tokens)
+        self.html = _split_slots(html_marked)
+        self.text = _compile_text(text_marked)
+        self.fast = True
+
+    def render(self, vars_map: Dict[str, Any], utm: str) -> tuple[str, str]:
+        """Тот же результат, что build_send_bodies(source, vars_map, utm)."""
+        utm_s = str(utm or "").strip()
+        if not self.fast or not _RE_FAST_UTM.fullmatch(utm_s):
+            return build_send_bodies(self.source, vars_map, utm)
+
+        local_vars = {str(k): _safe_text(v) for k, v in (vars_map or {}).items() if str(k or "").strip()}
+        html_values: List[str] = []
+        text_values: List[str] = []
+        for key, token in zip(self.var_keys, self.var_tokens):
+            value = str(local_vars.get(key, token))
+            if "<" in value or ">" in value or _RE_TAIL_AMP.search(value):
+                return build_send_bodies(self.source, vars_map, utm)
+            html_values.append(value)
+            text_values.append(_html.unescape(value) if "&" in value else value)
+
+        body_html = _join_slots(self.html, html_values, utm_s)
+        return body_html, self._render_text(text_values, utm_s)
+
+    def _render_text(self, values: List[str], utm: str) -> str:
+        wrapper = _SEND_TEXT_WRAPPER
+        chunks: List[str] = []
+        last = len(self.text) - 1
+        for n, seg in enumerate(self.text):
+            if isinstance(seg, list):
+                chunks.extend(seg)
+                continue
+            window = "".join(piece if isinstance(piece, str) else (utm if piece < 0 else values[piece]) for piece in seg)
+            window = _RE_TEXT_WS.sub(" ", window)
+            if n == 0:
+                window = window.lstrip()
+            if n == last:
+                window = window.rstrip()
+            if window:
+                chunks.extend(wrapper._split(wrapper._munge_whitespace(window)))
+        return wrapper.wrap_chunks(chunks)
+
+
+@lru_cache(maxsize=64)
+def compile_send_template(html_template: str) -> SendTemplate:
+    return SendTemplate(html_template)
+
+
+def _html_to_text_unwrapped(s: str) -> str:
+    # html_to_text() без финальных WS-collapse/fill: их SendTemplate.render() делает после подстановки
     def a_rep(m: re.Match) -> str:
         inner = _RE_TEXT_TAG.sub("", m.group(3) or "")
         inner = _html.unescape(inner).strip()
@@ -214,16 +476,7 @@ def html_to_text(s: str) -> str:
     s1 = _RE_TEXT_BR.sub("\n", s1)
     s1 = _RE_TEXT_BLOCK_END.sub("\n\n", s1)
     s1 = _RE_TEXT_TAG.sub("", s1)
-    s1 = _html.unescape(s1)
-    s1 = _RE_TEXT_WS.sub(" ", s1)
-    return textwrap.fill(s1.strip(), width=78)
-
-
-def build_send_bodies(html_template: str, vars_map: Dict[str, Any], utm: str) -> tuple[str, str]:
-    html1 = apply_vars(str(html_template or ""), vars_map=vars_map)
-    html2 = add_smrel_to_links(html1, str(utm or "").strip())
-    text = html_to_text(html2)
-    return html2, text
+    return _html.unescape(s1)
 
 # ---- styles ----
 
@@ -1,6 +1,12 @@
-# FILE: engine/common/gpt.py  (обновлено — 2026-02-22)
+# FILE: engine/common/gpt.py  (обновлено — 2026-10-16)
 # PURPOSE: Единая точка общения с OpenAI (Responses API) + IPC-cache через common/cache (daemon).
 #          Логи: host stream (все вызовы, включая cache), host errors (все ошибки), system short (только реальные API-вызовы).
+# CHANGE: глобальный gate (один запрос на 0.5с на весь кластер) заменён на engine.common.gpt_limiter:
+#         token bucket rpm/tpm + max in-flight на (preset, service_tier), FIFO-очередь, fail-open без Redis.
+#         ask(limit_wait_sec=...): сколько ждать лимитер (по умолчанию короткий MAX_WAIT_SEC; офлайн-очередь — дольше).
+#         Ошибка лимитера (не недоступность Redis) -> STATUS_ERROR_INT (limiter_error) + errors.log.
+#         GPTClient.submit_many(): офлайн-очередь запросов (engine.common.gpt_jobs).
+#         local cache (gpt.content.v2): single-flight + XFetch early refresh — одинаковые запросы не множат API-вызовы.
 
 from __future__ import annotations
 
@@ -13,6 +19,7 @@ from dataclasses import dataclass
 from datetime import datetime
 from typing import Any, Dict, List, Optional, Tuple
 
+from engine.common import gpt_limiter
 from engine.common.cache.client import CLIENT, memo as cache_memo
 from engine.common.logs import log as host_log
 
@@ -21,6 +28,12 @@ from engine.common.logs import log as host_log
 MIN_LOCAL_CACHE_DAYS = 7
 MAX_LOCAL_CACHE_DAYS = 14
 
+# Local cache single-flight: один и тот же запрос из N процессов -> один вызов API, остальные ждут результат.
+# Lock покрывает ожидание лимитера + сам запрос; горячие ответы обновляются заранее (XFetch, beta=1).
+LOCAL_CACHE_SF_WAIT_SEC = float(gpt_limiter.MAX_WAIT_SEC) + 60.0
+LOCAL_CACHE_SF_LOCK_SEC = float(gpt_limiter.MAX_WAIT_SEC) + 120.0
+LOCAL_CACHE_EARLY_REFRESH = 1.0
+
 MODEL_PRESETS: dict[str, str] = {
     "standard": "gpt-5.4",
     "mini": "gpt-5.4-mini",
@@ -41,10 +54,7 @@ STATUS_ERROR_TMP = "ERROR_TMP"
 STATUS_ERROR_INT = "ERROR_INT"
 STATUS_ERROR = "ERROR"
 
-REQUEST_GATE_KEY = "gpt:request_gate"
-REQUEST_GATE_TTL_SEC = 0.5
 REQUEST_GATE_BACKOFF_SEC = 0.25
-REQUEST_GATE_ATTEMPTS = 20
 
 TMP_ERROR_BLOCK_KEY = "gpt:tmp_error_block"
 TMP_ERROR_BLOCK_TTL_SEC = 5 * 60
@@ -156,14 +166,18 @@ def _set_tmp_error_block() -> None:
         return
 
 
-def _acquire_request_gate() -> bool:
-    owner = f"gpt-gate:{os.getpid()}:{int(time.time() * 1000)}"
-    for _ in range(int(REQUEST_GATE_ATTEMPTS)):
-        info = CLIENT.lock_try(REQUEST_GATE_KEY, ttl_sec=float(REQUEST_GATE_TTL_SEC), owner=owner)
-        if info and bool(info.get("acquired")):
-            return True
-        time.sleep(float(REQUEST_GATE_BACKOFF_SEC))
-    return False
+def _limiter_scope(payload: Dict[str, Any], default_tier: str) -> Tuple[str, str]:
+    # scope лимитера = (preset, service_tier); модель вне MODEL_PRESETS считается "other"
+    model = _optional_str(payload.get("model"))
+    preset = next((k for k, v in MODEL_PRESETS.items() if v == model), "other")
+    tier = _optional_str(payload.get("service_tier")) or default_tier or "default"
+    return preset, tier
+
+
+def _limiter_wait_sec(override: Optional[float] = None) -> float:
+    if override is not None:
+        return max(0.0, float(override))
+    return float(gpt_limiter.MAX_WAIT_SEC)
 
 
 def _require_api_key() -> str:
@@ -473,6 +487,7 @@ class GPTClient:
         payload: Dict[str, Any],
         user_id_str: str,
         default_tier: str,
+        limit_wait_sec: Optional[float] = None,
     ) -> GptResponse:
         model_for_log = _optional_str(payload.get("model")) or "-"
         instructions_for_log = str(payload.get("instructions", ""))
@@ -497,12 +512,23 @@ class GPTClient:
             )
             return GptResponse(content=message, raw={"soft_error": True, "blocked": True}, usage=GptUsage(), status=STATUS_ERROR_TMP)
 
+        limit_preset, limit_tier = _limiter_scope(payload, default_tier)
+        est_tokens = gpt_limiter.estimate_tokens(instructions_for_log + input_for_log)
+
         for api_attempt in range(2):
-            if not _acquire_request_gate():
+            limiter_error = ""
+            try:
+                lease = gpt_limiter.acquire(
+                    limit_preset, limit_tier, est_tokens=est_tokens, max_wait_sec=_limiter_wait_sec(limit_wait_sec)
+                )
+            except gpt_limiter.LimiterError as exc:
+                lease, limiter_error = None, str(exc)
+            if lease is None:
+                reason = "limiter_error" if limiter_error else "gate_timeout"
                 message = _internal_error_message()
                 _log_host_stream(
                     now=datetime.now(),
-                    status=f"{STATUS_ERROR_INT} (gate_timeout)",
+                    status=f"{STATUS_ERROR_INT} ({reason})",
                     model_name=model_for_log,
                     request_tier=request_tier_for_log,
                     response_tier="-",
@@ -516,7 +542,7 @@ class GPTClient:
                 )
                 _log_host_error(
                     now=datetime.now(),
-                    status=f"{STATUS_ERROR_INT} (gate_timeout)",
+                    status=f"{STATUS_ERROR_INT} ({reason})",
                     model_name=model_for_log,
                     request_tier=request_tier_for_log,
                     response_tier="-",
@@ -527,11 +553,11 @@ class GPTClient:
                     usage=None,
                     cache_hit=False,
                     real_request=False,
-                    error_message="gpt request gate lock timeout",
+                    error_message=limiter_error or f"gpt limiter wait timeout ({limit_preset}:{limit_tier})",
                 )
                 return GptResponse(
                     content=message,
-                    raw={"soft_error": True, "gate_timeout": True},
+                    raw={"soft_error": True, reason: True},
                     usage=GptUsage(),
                     status=STATUS_ERROR_INT,
                 )
@@ -539,12 +565,18 @@ class GPTClient:
             try:
                 t0 = time.monotonic()
                 client = _get_openai_client()
-                resp = client.responses.create(**payload)
+                used_tokens: Optional[int] = None
+                try:
+                    resp = client.responses.create(**payload)
+                    raw = resp.model_dump()
+                    usage = self._extract_usage(raw)
+                    used_tokens = usage.total_tokens
+                finally:
+                    # слот in-flight освобождается сразу; оценка токенов доводится до фактических usage
+                    gpt_limiter.release(lease, actual_tokens=used_tokens)
                 elapsed_ms = int((time.monotonic() - t0) * 1000)
 
-                raw = resp.model_dump()
                 content = str(getattr(resp, "output_text", "") or "")
-                usage = self._extract_usage(raw)
                 status_for_log = f"{STATUS_OK} ({elapsed_ms} ms)"
 
                 _log_host_stream(
@@ -657,6 +689,7 @@ class GPTClient:
         user_id: Any = "SET USER URGENTLY",
         service_tier: Optional[str] = None,
         web_search: bool = False,
+        limit_wait_sec: Optional[float] = None,
     ) -> GptResponse:
         user_id_str = _optional_str(user_id) or "SET USER URGENTLY"
         effective_tier: str = service_tier or "flex"
@@ -681,6 +714,7 @@ class GPTClient:
                 payload=override_payload,
                 user_id_str=user_id_str,
                 default_tier=effective_tier,
+                limit_wait_sec=limit_wait_sec,
             )
 
         instr = _optional_str(instructions)
@@ -721,6 +755,7 @@ class GPTClient:
                 payload=payload,
                 user_id_str=user_id_str,
                 default_tier=effective_tier,
+                limit_wait_sec=limit_wait_sec,
             )
             if resp.status != STATUS_OK:
                 raise GptSoftError(resp.content, status=resp.status, error_message=resp.content)
@@ -738,6 +773,10 @@ class GPTClient:
                     ttl=local_cache_ttl_sec,
                     version="gpt.content.v2",
                     update=False,
+                    single_flight=True,
+                    sf_wait_sec=LOCAL_CACHE_SF_WAIT_SEC,
+                    sf_lock_sec=LOCAL_CACHE_SF_LOCK_SEC,
+                    early_refresh=LOCAL_CACHE_EARLY_REFRESH,
                 )
                 if last_raw is None:
                     _log_host_stream(
@@ -762,6 +801,15 @@ class GPTClient:
         except GptSoftError as exc:
             return GptResponse(content=exc.user_message, raw={"soft_error": True}, usage=GptUsage(), status=exc.status)
 
+    def submit_many(self, *, workload: str, jobs: List[Any], priority: int = 100) -> int:
+        """
+        Офлайн-ветка: job-ы (engine.common.gpt_jobs.GptJob) уходят в очередь public.gpt_jobs,
+        результаты получает handler workload-а в gpt_jobs.dispatch_once(). -> сколько job-ов добавлено.
+        """
+        from engine.common import gpt_jobs  # gpt_jobs импортирует gpt
+
+        return gpt_jobs.submit_many(workload, jobs, priority=priority)
+
     @staticmethod
     def _extract_usage(raw: Dict[str, Any]) -> GptUsage:
         usage = raw.get("usage") or {}
@@ -0,0 +1,417 @@
+# FILE: engine/common/gpt_jobs.py  (новое — 2026-10-16)
+# PURPOSE: Очередь офлайн GPT-запросов (Batch-style) для rating-нагрузок.
+#          submit_many(): payload-ы пишутся в public.gpt_jobs (idempotent по (workload, job_key) пока job не закрыт).
+#          dispatch_once(): забирает пачку (FOR UPDATE SKIP LOCKED), гонит через provider, результаты по мере
+#          готовности сохраняет и отдаёт handler-у workload-а (register_handler). Handler упал -> повторная доставка.
+#          Provider подключаемый: ConcurrentProvider (GPTClient.ask в пуле потоков, лимиты — gpt_limiter,
+#          ожидание бюджета — BACKGROUND_MAX_WAIT_SEC: очереди спешить некуда)
+#          или LocalProvider (локальная заглушка для тестов/dev).
+# STATUS:  QUEUED -> RUNNING -> DONE (результат сохранён) -> DELIVERED (handler отработал); FAILED — окончательно.
+
+from __future__ import annotations
+
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from engine.common import db, gpt_limiter
+from engine.common.gpt import STATUS_ERROR_TMP, STATUS_OK, GPTClient, GptResponse, GptUsage
+
+STATUS_QUEUED = "QUEUED"
+STATUS_RUNNING = "RUNNING"
+STATUS_DONE = "DONE"
+STATUS_DELIVERED = "DELIVERED"
+STATUS_FAILED = "FAILED"
+
+DISPATCH_LIMIT = 200
+DISPATCH_WORKERS = 8
+MAX_ATTEMPTS = 3
+MAX_DELIVER_ATTEMPTS = 3
+RETRY_BACKOFF_SEC = 60
+RUNNING_STALE_SEC = 15 * 60  # RUNNING дольше -> процесс-диспетчер умер, job забирается снова
+RETENTION_DAYS = 7
+
+# Схема ставится миграцией web/panel 0003_gpt_jobs (шаг деплоя), не из процессов воркеров
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS public.gpt_jobs (
+    id bigserial PRIMARY KEY,
+    workload text NOT NULL,
+    job_key text NOT NULL,
+    priority int NOT NULL DEFAULT 100,
+    status text NOT NULL DEFAULT 'QUEUED',
+    payload jsonb NOT NULL,
+    meta jsonb NOT NULL DEFAULT '{}'::jsonb,
+    attempts int NOT NULL DEFAULT 0,
+    deliver_attempts int NOT NULL DEFAULT 0,
+    not_before timestamptz NOT NULL DEFAULT now(),
+    result_status text,
+    result_content text,
+    usage jsonb,
+    error text,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    started_at timestamptz,
+    finished_at timestamptz,
+    updated_at timestamptz NOT NULL DEFAULT now()
+);
+CREATE UNIQUE INDEX IF NOT EXISTS gpt_jobs_open_key_uq
+    ON public.gpt_jobs (workload, job_key)
+    WHERE status IN ('QUEUED', 'RUNNING', 'DONE');
+CREATE INDEX IF NOT EXISTS gpt_jobs_claim_idx
+    ON public.gpt_jobs (workload, priority, id)
+    WHERE status IN ('QUEUED', 'RUNNING', 'DONE');
+"""
+
+_HANDLERS: Dict[str, Callable[["GptJobRow", GptResponse], None]] = {}
+
+
+@dataclass
+class GptJob:
+    key: str
+    instructions: str
+    input: str
+    model: str = "standard"
+    service_tier: str = "flex"
+    user_id: str = ""
+    use_gpt_cache: bool = True
+    meta: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class GptJobRow:
+    id: int
+    workload: str
+    key: str
+    payload: Dict[str, Any]
+    meta: Dict[str, Any]
+    attempts: int
+
+
+class GptProvider:
+    """Выполняет пачку job-ов; отдаёт (job, response) по мере готовности, в любом порядке."""
+
+    def run(self, jobs: Sequence[GptJobRow]) -> Iterator[Tuple[GptJobRow, GptResponse]]:
+        raise NotImplementedError
+
+
+class ConcurrentProvider(GptProvider):
+    def __init__(self, max_workers: int = DISPATCH_WORKERS) -> None:
+        self.max_workers = max(1, int(max_workers))
+
+    def run(self, jobs: Sequence[GptJobRow]) -> Iterator[Tuple[GptJobRow, GptResponse]]:
+        if not jobs:
+            return
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(jobs))) as ex:
+            futs = {ex.submit(self._ask, job): job for job in jobs}
+            for fut in as_completed(futs):
+                job = futs[fut]
+                try:
+                    yield job, fut.result()
+                except Exception as exc:
+                    yield job, GptResponse(
+                        content=str(exc),
+                        raw={"soft_error": True, "exception": type(exc).__name__},
+                        usage=GptUsage(),
+                        status=STATUS_ERROR_TMP,
+                    )
+
+    @staticmethod
+    def _ask(job: GptJobRow) -> GptResponse:
+        p = job.payload
+        return GPTClient().ask(
+            model=str(p.get("model") or "standard"),
+            service_tier=str(p.get("service_tier") or "flex"),
+            user_id=str(p.get("user_id") or ""),
+            instructions=str(p.get("instructions") or ""),
+            input=str(p.get("input") or ""),
+            use_local_cache=False,
+            use_gpt_cache=bool(p.get("use_gpt_cache", True)),
+            web_search=False,
+            limit_wait_sec=gpt_limiter.BACKGROUND_MAX_WAIT_SEC,
+        )
+
+
+class LocalProvider(GptProvider):
+    """Заглушка: fn(job) -> content (str). Исключение fn -> ERROR_TMP (как сетевой сбой)."""
+
+    def __init__(self, fn: Callable[[GptJobRow], str]) -> None:
+        self.fn = fn
+
+    def run(self, jobs: Sequence[GptJobRow]) -> Iterator[Tuple[GptJobRow, GptResponse]]:
+        for job in jobs:
+            try:
+                content = str(self.fn(job) or "")
+                yield job, GptResponse(content=content, raw={"local": True}, usage=GptUsage(), status=STATUS_OK)
+            except Exception as exc:
+                yield job, GptResponse(content=str(exc), raw={"soft_error": True}, usage=GptUsage(), status=STATUS_ERROR_TMP)
+
+
+def _default_provider() -> GptProvider:
+    raw = (os.environ.get("GPT_JOBS_WORKERS") or "").strip()
+    return ConcurrentProvider(int(raw) if raw.isdigit() and int(raw) > 0 else DISPATCH_WORKERS)
+
+
+def register_handler(workload: str, fn: Callable[[GptJobRow, GptResponse], None]) -> None:
+    _HANDLERS[str(workload)] = fn
+
+
+def submit_many(workload: str, jobs: Sequence[GptJob], *, priority: int = 100) -> int:
+    """Ставит job-ы в очередь. Job с тем же key, ещё не закрытый, пропускается. -> сколько реально добавлено."""
+    if not jobs:
+        return 0
+    keys: List[str] = []
+    payloads: List[str] = []
+    metas: List[str] = []
+    for job in jobs:
+        keys.append(str(job.key))
+        payloads.append(
+            json.dumps(
+                {
+                    "model": job.model,
+                    "service_tier": job.service_tier,
+                    "user_id": job.user_id,
+                    "instructions": job.instructions,
+                    "input": job.input,
+                    "use_gpt_cache": bool(job.use_gpt_cache),
+                },
+                ensure_ascii=False,
+            )
+        )
+        metas.append(json.dumps(job.meta or {}, ensure_ascii=False, default=str))
+
+    row = db.fetch_one(
+        """
+        WITH ins AS (
+            INSERT INTO public.gpt_jobs (workload, job_key, priority, payload, meta)
+            SELECT %s, v.job_key, %s, v.payload::jsonb, v.meta::jsonb
+            FROM unnest(%s::text[], %s::text[], %s::text[]) AS v(job_key, payload, meta)
+            ON CONFLICT (workload, job_key) WHERE status IN ('QUEUED', 'RUNNING', 'DONE') DO NOTHING
+            RETURNING 1
+        )
+        SELECT COUNT(*)::int FROM ins
+        """,
+        (str(workload), int(priority), keys, payloads, metas),
+    )
+    return int(row[0] or 0) if row else 0
+
+
+def _claim(workloads: List[str], limit: int) -> List[GptJobRow]:
+    rows = db.fetch_all(
+        """
+        WITH c AS (
+            SELECT id
+            FROM public.gpt_jobs
+            WHERE workload = ANY(%s)
+              AND (
+                  (status = 'QUEUED' AND not_before <= now())
+                  OR (status = 'RUNNING' AND started_at < now() - make_interval(secs => %s))
+              )
+              AND attempts < %s
+            ORDER BY priority, id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        UPDATE public.gpt_jobs j
+        SET status = 'RUNNING',
+            attempts = j.attempts + 1,
+            started_at = now(),
+            updated_at = now()
+        FROM c
+        WHERE j.id = c.id
+        RETURNING j.id, j.workload, j.job_key, j.payload, j.meta, j.attempts
+        """,
+        (workloads, int(RUNNING_STALE_SEC), int(MAX_ATTEMPTS), int(limit)),
+    )
+    out: List[GptJobRow] = []
+    for r in rows or []:
+        out.append(
+            GptJobRow(
+                id=int(r[0]),
+                workload=str(r[1]),
+                key=str(r[2]),
+                payload=r[3] if isinstance(r[3], dict) else json.loads(r[3] or "{}"),
+                meta=r[4] if isinstance(r[4], dict) else json.loads(r[4] or "{}"),
+                attempts=int(r[5] or 0),
+            )
+        )
+    return out
+
+
+def _store_result(job: GptJobRow, resp: GptResponse) -> str:
+    usage = {
+        "prompt_tokens": resp.usage.prompt_tokens,
+        "completion_tokens": resp.usage.completion_tokens,
+        "total_tokens": resp.usage.total_tokens,
+    }
+    if resp.status == STATUS_OK:
+        status = STATUS_DONE
+    elif resp.status == STATUS_ERROR_TMP and job.attempts < MAX_ATTEMPTS:
+        status = STATUS_QUEUED
+    else:
+        status = STATUS_FAILED
+    db.execute(
+        """
+        UPDATE public.gpt_jobs
+        SET status = %s,
+            result_status = %s,
+            result_content = %s,
+            usage = %s::jsonb,
+            error = CASE WHEN %s = 'DONE' THEN NULL ELSE %s END,
+            not_before = now() + make_interval(secs => %s),
+            finished_at = CASE WHEN %s = 'QUEUED' THEN NULL ELSE now() END,
+            updated_at = now()
+        WHERE id = %s
+          AND status = 'RUNNING'
+        """,
+        (
+            status,
+            str(resp.status),
+            str(resp.content or "") if status == STATUS_DONE else None,
+            json.dumps(usage),
+            status,
+            str(resp.content or "")[:2000],
+            int(RETRY_BACKOFF_SEC * job.attempts),
+            status,
+            int(job.id),
+        ),
+    )
+    return status
+
+
+def _deliver(job: GptJobRow, resp: GptResponse) -> bool:
+    handler = _HANDLERS.get(job.workload)
+    if handler is None:
+        return False
+    try:
+        handler(job, resp)
+    except Exception as exc:
+        db.execute(
+            """
+            UPDATE public.gpt_jobs
+            SET deliver_attempts = deliver_attempts + 1,
+                status = CASE WHEN deliver_attempts + 1 >= %s THEN 'FAILED' ELSE status END,
+                error = %s,
+                updated_at = now()
+            WHERE id = %s
+            """,
+            (int(MAX_DELIVER_ATTEMPTS), f"handler: {type(exc).__name__}: {exc}"[:2000], int(job.id)),
+        )
+        return False
+    db.execute(
+        "UPDATE public.gpt_jobs SET status = 'DELIVERED', updated_at = now() WHERE id = %s AND status = 'DONE'",
+        (int(job.id),),
+    )
+    return True
+
+
+def deliver_pending(workloads: List[str], limit: int = DISPATCH_LIMIT) -> int:
+    """Повторная доставка DONE-результатов, чей handler упал (или процесс умер до доставки)."""
+    rows = db.fetch_all(
+        """
+        SELECT id, workload, job_key, payload, meta, attempts, result_status, result_content
+        FROM public.gpt_jobs
+        WHERE workload = ANY(%s)
+          AND status = 'DONE'
+        ORDER BY priority, id
+        LIMIT %s
+        """,
+        (workloads, int(limit)),
+    )
+    delivered = 0
+    for r in rows or []:
+        job = GptJobRow(
+            id=int(r[0]),
+            workload=str(r[1]),
+            key=str(r[2]),
+            payload=r[3] if isinstance(r[3], dict) else json.loads(r[3] or "{}"),
+            meta=r[4] if isinstance(r[4], dict) else json.loads(r[4] or "{}"),
+            attempts=int(r[5] or 0),
+        )
+        resp = GptResponse(content=str(r[7] or ""), raw={"redelivered": True}, usage=GptUsage(), status=str(r[6] or STATUS_OK))
+        if _deliver(job, resp):
+            delivered += 1
+    return delivered
+
+
+def _sweep(workloads: List[str]) -> None:
+    # RUNNING без попыток в запасе -> FAILED; закрытые job-ы старше RETENTION_DAYS удаляются
+    db.execute(
+        """
+        UPDATE public.gpt_jobs
+        SET status = 'FAILED', error = COALESCE(error, 'attempts exhausted'), updated_at = now()
+        WHERE workload = ANY(%s)
+          AND status IN ('QUEUED', 'RUNNING')
+          AND attempts >= %s
+          AND (status = 'QUEUED' OR started_at < now() - make_interval(secs => %s))
+        """,
+        (workloads, int(MAX_ATTEMPTS), int(RUNNING_STALE_SEC)),
+    )
+    db.execute(
+        """
+        DELETE FROM public.gpt_jobs
+        WHERE workload = ANY(%s)
+          AND status IN ('DELIVERED', 'FAILED')
+          AND updated_at < now() - make_interval(days => %s)
+        """,
+        (workloads, int(RETENTION_DAYS)),
+    )
+
+
+def dispatch_once(
+    workloads: Optional[Sequence[str]] = None,
+    *,
+    limit: int = DISPATCH_LIMIT,
+    provider: Optional[GptProvider] = None,
+) -> Dict[str, Any]:
+    """Один проход диспетчера: redelivery -> claim -> provider -> store + handler по мере готовности."""
+    started = time.monotonic()
+    names = [str(w) for w in (workloads or list(_HANDLERS.keys()))]
+    result: Dict[str, Any] = {
+        "workloads": names,
+        "claimed": 0,
+        "done": 0,
+        "requeued": 0,
+        "failed": 0,
+        "delivered": 0,
+        "redelivered": 0,
+        "duration_ms": 0,
+    }
+    if not names:
+        return result
+
+    result["redelivered"] = deliver_pending(names, limit=limit)
+    jobs = _claim(names, int(limit))
+    result["claimed"] = len(jobs)
+
+    for job, resp in (provider or _default_provider()).run(jobs):
+        status = _store_result(job, resp)
+        if status == STATUS_DONE:
+            result["done"] += 1
+            if _deliver(job, resp):
+                result["delivered"] += 1
+        elif status == STATUS_QUEUED:
+            result["requeued"] += 1
+        else:
+            result["failed"] += 1
+
+    _sweep(names)
+    result["duration_ms"] = int((time.monotonic() - started) * 1000)
+    return result
+
+
+def queue_stats(workload: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+    rows = db.fetch_all(
+        """
+        SELECT workload, status, COUNT(*)::int
+        FROM public.gpt_jobs
+        WHERE %s::text IS NULL OR workload = %s
+        GROUP BY workload, status
+        """,
+        (workload, workload),
+    )
+    out: Dict[str, Dict[str, int]] = {}
+    for w, status, n in rows or []:
+        out.setdefault(str(w), {})[str(status)] = int(n or 0)
+    return out
@@ -0,0 +1,321 @@
+# FILE: engine/common/gpt_limiter.py  (новое — 2026-10-16)
+# PURPOSE: Распределённый лимитер OpenAI-вызовов поверх Redis (CLIENT.eval, атомарные Lua-скрипты).
+#          Бюджет на scope = (model preset, service_tier): requests/min + tokens/min (token bucket, burst) + max in-flight.
+#          Очередь FIFO на scope: выдаёт только голове очереди; ожидание = расчётное время до пополнения, не спин.
+#          Токены списываются оценкой при acquire и доводятся до фактических usage при release.
+#          Redis недоступен -> fail-open (вызов идёт без лимита), считается в stats.
+#          Ошибка скрипта / неожиданный ответ (Redis жив) -> LimiterError, без fail-open.
+#          Ожидание: MAX_WAIT_SEC для синхронных вызовов, BACKGROUND_MAX_WAIT_SEC — офлайн-очередь (gpt_jobs);
+#          оба от GPT_LIMIT_MAX_WAIT_SEC (env), его же видят single-flight тайминги локального кэша gpt.py.
+
+from __future__ import annotations
+
+import json
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from engine.common.cache.client import CLIENT, CacheScriptError
+
+# Дефолтные бюджеты на preset; per-tier переопределения — вложенным dict. GPT_LIMITS_JSON (env) перекрывает целиком.
+DEFAULT_LIMITS: Dict[str, Dict[str, Any]] = {
+    "standard": {"rpm": 500, "tpm": 800_000, "inflight": 16, "flex": {"rpm": 300, "inflight": 12}},
+    "mini": {"rpm": 1_000, "tpm": 2_000_000, "inflight": 32},
+    "nano": {"rpm": 2_000, "tpm": 4_000_000, "inflight": 32},
+    "other": {"rpm": 200, "tpm": 400_000, "inflight": 8},
+}
+
+BURST_SEC = 10.0  # ёмкость bucket-а = rate * BURST_SEC
+LEASE_SEC = 15 * 60  # in-flight слот протухает сам, если процесс умер не отпустив
+QUEUE_STALE_SEC = 5.0  # ожидающий, не подававший признаков жизни столько времени, выкидывается из очереди
+WAIT_POLL_MIN_SEC = 0.02
+WAIT_POLL_MAX_SEC = 0.5
+OUTPUT_TOKENS_EST = 800
+KEY_PREFIX = "gpt:lim:v1"
+
+
+def _env_wait_sec(default: float) -> float:
+    raw = (os.environ.get("GPT_LIMIT_MAX_WAIT_SEC") or "").strip()
+    try:
+        return max(0.0, float(raw)) if raw else default
+    except ValueError:
+        return default
+
+
+# GPT_LIMIT_MAX_WAIT_SEC (env) задаёт синхронное ожидание; фоновое не короче него
+MAX_WAIT_SEC = _env_wait_sec(10.0)  # синхронный вызывающий (ask из воркера / панели) дольше не ждёт -> gate_timeout
+BACKGROUND_MAX_WAIT_SEC = max(120.0, MAX_WAIT_SEC)  # офлайн-очередь: ждать бюджета дешевле, чем ронять job
+
+_ACQUIRE_LUA = b"""
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local me = ARGV[1]
+local rpm = tonumber(ARGV[2])
+local tpm = tonumber(ARGV[3])
+local maxin = tonumber(ARGV[4])
+local burst_ms = tonumber(ARGV[5])
+local cost = tonumber(ARGV[6])
+local lease_ms = tonumber(ARGV[7])
+local stale_ms = tonumber(ARGV[8])
+
+redis.call('ZADD', KEYS[5], now, me)
+if not redis.call('ZSCORE', KEYS[4], me) then
+  redis.call('ZADD', KEYS[4], now, me)
+end
+local stale = redis.call('ZRANGEBYSCORE', KEYS[5], '-inf', now - stale_ms)
+for _, m in ipairs(stale) do
+  redis.call('ZREM', KEYS[4], m)
+  redis.call('ZREM', KEYS[5], m)
+end
+redis.call('PEXPIRE', KEYS[4], stale_ms * 4)
+redis.call('PEXPIRE', KEYS[5], stale_ms * 4)
+redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', now)
+
+local head = redis.call('ZRANGE', KEYS[4], 0, 0)[1]
+if head ~= me then
+  return {-1, redis.call('ZRANK', KEYS[4], me) or 0}
+end
+if maxin > 0 and redis.call('ZCARD', KEYS[3]) >= maxin then
+  return {-2, 0}
+end
+
+local function level(key, per_min)
+  local cap = math.max(1, per_min * burst_ms / 60000)
+  local st = redis.call('HMGET', key, 'v', 't')
+  local v = tonumber(st[1])
+  local ts = tonumber(st[2])
+  if v == nil or ts == nil then
+    return cap, cap
+  end
+  return math.min(cap, v + (now - ts) * per_min / 60000), cap
+end
+
+local wait = 0
+local rv, tv
+if rpm > 0 then
+  rv = level(KEYS[1], rpm)
+  if rv < 1 then wait = math.max(wait, math.ceil((1 - rv) * 60000 / rpm)) end
+end
+if tpm > 0 then
+  local tcap
+  tv, tcap = level(KEYS[2], tpm)
+  cost = math.min(cost, tcap)
+  if tv < cost then wait = math.max(wait, math.ceil((cost - tv) * 60000 / tpm)) end
+end
+if wait > 0 then
+  return {-3, wait}
+end
+
+if rpm > 0 then
+  redis.call('HSET', KEYS[1], 'v', tostring(rv - 1), 't', now)
+  redis.call('PEXPIRE', KEYS[1], 120000)
+end
+if tpm > 0 then
+  redis.call('HSET', KEYS[2], 'v', tostring(tv - cost), 't', now)
+  redis.call('PEXPIRE', KEYS[2], 120000)
+end
+redis.call('ZADD', KEYS[3], now + lease_ms, me)
+redis.call('PEXPIRE', KEYS[3], lease_ms)
+redis.call('ZREM', KEYS[4], me)
+redis.call('ZREM', KEYS[5], me)
+return {1, cost}
+"""
+
+# KEYS: tok bucket, inflight, queue, seen ; ARGV: me, token delta (actual - charged)
+_RELEASE_LUA = b"""
+redis.call('ZREM', KEYS[2], ARGV[1])
+redis.call('ZREM', KEYS[3], ARGV[1])
+redis.call('ZREM', KEYS[4], ARGV[1])
+local d = tonumber(ARGV[2])
+if d ~= 0 and redis.call('EXISTS', KEYS[1]) == 1 then
+  redis.call('HINCRBYFLOAT', KEYS[1], 'v', -d)
+end
+return 1
+"""
+
+_STATS_LUA = b"""
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', now)
+local r = redis.call('HMGET', KEYS[1], 'v', 't')
+local k = redis.call('HMGET', KEYS[2], 'v', 't')
+return {now, r[1] or '', r[2] or '', k[1] or '', k[2] or '', redis.call('ZCARD', KEYS[3]), redis.call('ZCARD', KEYS[4])}
+"""
+
+
+class LimiterError(RuntimeError):
+    pass
+
+
+def _limits_table() -> Dict[str, Dict[str, Any]]:
+    raw = (os.environ.get("GPT_LIMITS_JSON") or "").strip()
+    if raw:
+        try:
+            obj = json.loads(raw)
+            if isinstance(obj, dict):
+                return obj
+        except Exception:
+            pass
+    return DEFAULT_LIMITS
+
+
+def limits_for(preset: str, tier: str) -> Dict[str, int]:
+    table = _limits_table()
+    base = table.get(preset) or table.get("other") or {}
+    out = {k: int(base.get(k) or 0) for k in ("rpm", "tpm", "inflight")}
+    over = base.get(tier)
+    if isinstance(over, dict):
+        for k in ("rpm", "tpm", "inflight"):
+            if k in over:
+                out[k] = int(over[k] or 0)
+    return out
+
+
+def estimate_tokens(text: str, output_tokens: int = OUTPUT_TOKENS_EST) -> int:
+    # ~4 символа на токен + ожидаемый ответ; точность не нужна — при release доводится до usage
+    return max(1, len(text or "") // 4) + int(output_tokens)
+
+
+def _keys(scope: str) -> list[str]:
+    base = f"{KEY_PREFIX}:{scope}"
+    return [f"{base}:rpm", f"{base}:tpm", f"{base}:inflight", f"{base}:queue", f"{base}:seen"]
+
+
+@dataclass
+class Lease:
+    scope: str
+    lease_id: str
+    charged_tokens: int
+    waited_ms: int
+    limited: bool = True  # False -> redis был недоступен, вызов без лимита
+
+
+# Счётчики процесса (fail-open, таймауты, ожидание) — utilisation берётся из Redis в limiter_stats()
+_LOCAL: Dict[str, Dict[str, float]] = {}
+
+
+def _local(scope: str) -> Dict[str, float]:
+    st = _LOCAL.get(scope)
+    if st is None:
+        st = {"granted": 0, "timeouts": 0, "fail_open": 0, "errors": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0}
+        _LOCAL[scope] = st
+    return st
+
+
+def _is_acquire_reply(r: Any) -> bool:
+    # {code, value}: code 1 = выдан, -1 = очередь, -2 = in-flight полон, -3 = ждать пополнения
+    return isinstance(r, list) and len(r) >= 2 and isinstance(r[1], int) and r[0] in (1, -1, -2, -3)
+
+
+def acquire(preset: str, tier: str, *, est_tokens: int, max_wait_sec: float = MAX_WAIT_SEC) -> Optional[Lease]:
+    """
+    Ждёт своей очереди и бюджета scope (preset:tier). None -> не дождались за max_wait_sec.
+    LimiterError -> Redis ответил ошибкой / не тем, что отдаёт скрипт (лимит не проверен, вызов не пускаем).
+    """
+    scope = f"{preset}:{tier}"
+    lim = limits_for(preset, tier)
+    keys = _keys(scope)
+    lease_id = f"{os.getpid()}:{time.monotonic_ns()}:{os.urandom(4).hex()}"
+    args = [
+        lease_id,
+        lim["rpm"],
+        lim["tpm"],
+        lim["inflight"],
+        int(BURST_SEC * 1000),
+        max(1, int(est_tokens)),
+        int(LEASE_SEC * 1000),
+        int(QUEUE_STALE_SEC * 1000),
+    ]
+    st = _local(scope)
+    t0 = time.monotonic()
+    deadline = t0 + float(max_wait_sec)
+
+    while True:
+        try:
+            r = CLIENT.eval(_ACQUIRE_LUA, keys, args, raise_errors=True)
+        except CacheScriptError as e:
+            st["errors"] += 1
+            raise LimiterError(f"gpt limiter script error ({scope}): {e}") from e
+        if r is None:
+            st["fail_open"] += 1
+            return Lease(scope=scope, lease_id=lease_id, charged_tokens=0, waited_ms=0, limited=False)
+        if not _is_acquire_reply(r):
+            st["errors"] += 1
+            raise LimiterError(f"gpt limiter unexpected reply ({scope}): {r!r}")
+
+        code, val = int(r[0]), int(r[1])
+        if code == 1:
+            waited_ms = int((time.monotonic() - t0) * 1000)
+            st["granted"] += 1
+            st["wait_ms_total"] += waited_ms
+            st["wait_ms_max"] = max(st["wait_ms_max"], waited_ms)
+            return Lease(scope=scope, lease_id=lease_id, charged_tokens=val, waited_ms=waited_ms)
+
+        if code == -3:
+            sleep_sec = val / 1000.0  # голова очереди: ровно до пополнения bucket-а
+        elif code == -1:
+            sleep_sec = WAIT_POLL_MIN_SEC * (1 + val)  # позиция в очереди
+        else:
+            sleep_sec = WAIT_POLL_MIN_SEC * 5  # in-flight полон
+        sleep_sec = min(max(sleep_sec, WAIT_POLL_MIN_SEC), WAIT_POLL_MAX_SEC)
+
+        if time.monotonic() + sleep_sec > deadline:
+            CLIENT.eval(_RELEASE_LUA, [keys[1], keys[2], keys[3], keys[4]], [lease_id, 0])
+            st["timeouts"] += 1
+            return None
+        time.sleep(sleep_sec)
+
+
+def release(lease: Optional[Lease], *, actual_tokens: Optional[int] = None) -> None:
+    if lease is None or not lease.limited:
+        return
+    delta = 0
+    if actual_tokens is not None and int(actual_tokens) > 0:
+        delta = int(actual_tokens) - int(lease.charged_tokens)
+    keys = _keys(lease.scope)
+    try:
+        CLIENT.eval(_RELEASE_LUA, [keys[1], keys[2], keys[3], keys[4]], [lease.lease_id, delta])
+    except Exception:
+        return  # слот сам протухнет через LEASE_SEC
+
+
+def limiter_stats(presets: Optional[list[str]] = None, tiers: Optional[list[str]] = None) -> Dict[str, Any]:
+    """Текущая загрузка scope-ов: заполненность bucket-ов, in-flight, очередь + локальные счётчики процесса."""
+    table = _limits_table()
+    out: Dict[str, Any] = {}
+    for preset in presets or list(table.keys()):
+        for tier in tiers or ["flex", "default", "auto", "priority"]:
+            scope = f"{preset}:{tier}"
+            lim = limits_for(preset, tier)
+            r = CLIENT.eval(_STATS_LUA, _keys(scope), [])
+            row: Dict[str, Any] = {"limits": lim, "local": dict(_local(scope)) if scope in _LOCAL else {}}
+            if isinstance(r, list) and len(r) >= 7:
+                now = int(r[0])
+                row["inflight"] = int(r[5])
+                row["queue"] = int(r[6])
+                row["rpm_available"] = _level(r[1], r[2], now, lim["rpm"])
+                row["tpm_available"] = _level(r[3], r[4], now, lim["tpm"])
+                row["inflight_util"] = (row["inflight"] / lim["inflight"]) if lim["inflight"] else 0.0
+            else:
+                row["redis"] = "unavailable"
+            out[scope] = row
+    return out
+
+
+def _level(v_raw: Any, t_raw: Any, now: int, per_min: int) -> Optional[float]:
+    if per_min <= 0:
+        return None
+    cap = max(1.0, per_min * BURST_SEC / 60.0)
+
+    def _f(x: Any) -> Optional[float]:
+        try:
+            s = x.decode() if isinstance(x, (bytes, bytearray)) else str(x)
+            return float(s) if s else None
+        except Exception:
+            return None
+
+    v, ts = _f(v_raw), _f(t_raw)
+    if v is None or ts is None:
+        return cap
+    return round(min(cap, v + (now - ts) * per_min / 60000.0), 2)
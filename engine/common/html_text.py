@@ -0,0 +1,154 @@
+# FILE: engine/common/html_text.py  (новое — 2026-10-16)
+# PURPOSE: Общий HTML -> text за один проход (один master-regex по тегам, без re.sub-цепочек).
+#          Python-цикл видит только структурные теги; прочие вырезаются внутри текстового сегмента (C-уровень).
+#          html_to_text(): страницы сайтов — выкидывает boilerplate-элементы, схлопывает пробелы,
+#          дедуп строк и cap (строки/символы) прямо по ходу — хвост большой страницы не читается.
+#          Письма (ответы в imap_message, текст письма в email_template) остаются на своих regex-цепочках:
+#          на документах в несколько KB без cap они быстрее (bench_html_text.py).
+
+from __future__ import annotations
+
+import re
+from html import unescape
+from functools import lru_cache
+from typing import Callable, FrozenSet, List, Optional
+
+# Содержимое всегда выкидывается (raw text: внутри тегов нет, конец ищется напрямую)
+RAW_TEXT_TAGS: FrozenSet[str] = frozenset({"script", "style", "template", "textarea"})
+
+# Элементы-обвязка страницы: выкидываются вместе с содержимым
+BOILERPLATE_TAGS: FrozenSet[str] = frozenset({"header", "footer", "nav", "aside", "form", "noscript", "svg", "iframe"})
+
+# Теги, разрывающие строку
+BLOCK_TAGS: FrozenSet[str] = frozenset(
+    {
+        "address", "article", "blockquote", "br", "dd", "div", "dl", "dt", "figcaption", "h1", "h2", "h3", "h4",
+        "h5", "h6", "hr", "li", "main", "ol", "p", "pre", "section", "table", "td", "th", "tr", "ul",
+    }
+)
+
+_ATTRS = r"((?:[^>\"']|\"[^\"]*\"|'[^']*')*)"
+# Теги, не влияющие на структуру (span, b, a без ссылки, ...), вырезаются внутри текстового сегмента одним sub
+_INLINE_TAG_RE = re.compile(r"</?[a-zA-Z](?:[^>\"']|\"[^\"]*\"|'[^']*')*>|<[!?][^>]*>")
+_NL_RE = re.compile(r"\r\n|\r|\n")
+_RAW_END_RE = {name: re.compile(rf"</{name}\s*>", re.IGNORECASE) for name in RAW_TEXT_TAGS}
+
+
+@lru_cache(maxsize=32)
+def _token_re(names: FrozenSet[str]) -> "re.Pattern[str]":
+    # Master-regex: комментарии + только структурные теги (names); в Python-цикл попадают лишь они
+    alt = "|".join(sorted((re.escape(n) for n in names), key=len, reverse=True))
+    return re.compile(
+        r"<!--.*?(?:-->|\Z)|<(/?)(" + alt + r")(?![a-zA-Z0-9:-])" + _ATTRS + ">",
+        re.IGNORECASE | re.DOTALL,
+    )
+
+
+def _skip_raw(s: str, name: str, pos: int) -> int:
+    m = _RAW_END_RE[name].search(s, pos)
+    return m.end() if m else len(s)
+
+
+def html_to_text(
+    html: str,
+    *,
+    drop_tags: FrozenSet[str] = BOILERPLATE_TAGS,
+    block_tags: FrozenSet[str] = BLOCK_TAGS,
+    body_only: bool = False,
+    dedup: bool = False,
+    max_lines: int = 0,
+    max_chars: int = 0,
+    line_filter: Optional[Callable[[str], bool]] = None,
+    line_sep: str = "\n",
+) -> str:
+    """
+    Один проход по документу. Строка = текст между block-тегами / переводами строк, пробелы схлопнуты.
+    body_only: только содержимое <body>...</body> (нет <body> -> "").
+    max_lines / max_chars: разбор останавливается, как только лимит набран (0 = без лимита).
+    line_filter(line) -> False: строка отбрасывается (до дедупа и лимитов).
+    """
+    s = html or ""
+    out: List[str] = []
+    seen: set[str] = set()
+    cur: List[str] = []
+    total = 0
+    drop_depth = 0
+    active = not body_only
+    pos = 0
+
+    def flush() -> bool:
+        nonlocal total
+        if not cur:
+            return False
+        line = " ".join("".join(cur).split())
+        cur.clear()
+        if not line:
+            return False
+        if line_filter is not None and not line_filter(line):
+            return False
+        if dedup:
+            if line in seen:
+                return False
+            seen.add(line)
+        out.append(line)
+        total += len(line) + len(line_sep)
+        return bool((max_lines and len(out) >= max_lines) or (max_chars and total >= max_chars))
+
+    def text(seg: str) -> bool:
+        if "<" in seg:
+            seg = _INLINE_TAG_RE.sub(" ", seg)
+        if "&" in seg:
+            seg = unescape(seg)
+        if "\n" not in seg and "\r" not in seg:
+            cur.append(seg)
+            return False
+        parts = _NL_RE.split(seg)
+        for part in parts[:-1]:
+            cur.append(part)
+            if flush():
+                return True
+        cur.append(parts[-1])
+        return False
+
+    names = RAW_TEXT_TAGS | drop_tags | block_tags | (frozenset({"body"}) if body_only else frozenset())
+    for m in _token_re(names).finditer(s):
+        if m.start() < pos:
+            continue  # внутри уже пропущенного raw-text блока
+        if active and not drop_depth and m.start() > pos and text(s[pos : m.start()]):
+            return line_sep.join(out)
+        pos = m.end()
+
+        name = m.group(2)
+        if name is None:
+            cur.append(" ")
+            continue
+        name = name.lower()
+        closing = bool(m.group(1))
+
+        if not closing and name in RAW_TEXT_TAGS:
+            pos = _skip_raw(s, name, pos)
+            cur.append(" ")
+            continue
+        if body_only and name == "body":
+            if closing:
+                break
+            active = True
+            continue
+        if name in drop_tags:
+            if closing:
+                drop_depth = max(0, drop_depth - 1)
+            elif not m.group(3).rstrip().endswith("/"):
+                drop_depth += 1
+            continue
+        if active and not drop_depth and flush():
+            return line_sep.join(out)
+    else:
+        if active and not drop_depth and pos < len(s) and text(s[pos:]):
+            return line_sep.join(out)
+
+    if active:
+        flush()
+    if body_only and not active:
+        return ""
+    return line_sep.join(out)
+
@@ -7,13 +7,18 @@
 # - Reads auth_type + credentials_json from DB (optional cache if cache_key provided) and validates+decrypts via engine.common.mail.types.get(fmt).
 # - LOGIN works; OAUTH types -> FAILED (not_supported) with log.
 # - Log/trace always include timestamp + server replies/diagnostics in data.
+# - uid_fetch_many(uids, items): one UID FETCH for a UID set (ranges compressed), parsed per UID into
+#   meta text (UID/FLAGS/RFC822.SIZE/BODYSTRUCTURE...) + literal sections (BODY[], BODY[HEADER.FIELDS (...)]).
+# - select() also returns uidvalidity/uidnext/highestmodseq (None if the server did not send them);
+#   enable_condstore() turns on CONDSTORE where advertised so SELECT reports HIGHESTMODSEQ.
 
 from __future__ import annotations
 
 import imaplib
+import re
 import time
 from datetime import datetime, timezone
-from typing import Any, Dict, Optional, Tuple, cast
+from typing import Any, Dict, List, Optional, Sequence, Tuple, cast
 
 from engine.common import db
 from engine.common.cache.client import memo as cache_memo
@@ -24,6 +29,12 @@ IMAP_ACTIONS = ("CONNECT", "AUTH", "SELECT", "FETCH", "LIST", "CREATE", "MOVE",
 STATUS_OK = "OK"
 STATUS_FAILED = "FAILED"
 
+_FETCH_START_RE = re.compile(rb"^\s*\d+\s+\(")
+_FETCH_LITERAL_RE = re.compile(rb"\{\d+\}\s*$")
+_FETCH_SECTION_RE = re.compile(rb"(?:BODY\[([^\]]*)\](?:<\d+>)?|(RFC822(?:\.HEADER|\.TEXT)?))\s*\{\d+\}\s*$", re.IGNORECASE)
+_FETCH_UID_RE = re.compile(rb"\bUID\s+(\d+)", re.IGNORECASE)
+_FETCH_SIZE_RE = re.compile(rb"\bRFC822\.SIZE\s+(\d+)", re.IGNORECASE)
+
 # Small TTL: changes in UI should be visible quickly.
 _DB_CACHE_TTL_SEC = 60
 _DB_CACHE_VERSION = "mailbox_creds_v1"
@@ -131,13 +142,40 @@ class IMAPConn:
             if typ != "OK":
                 self._set_log("SELECT", STATUS_FAILED, {"mailbox": mailbox, "server_reply": rep})
                 return None
-            out = {"mailbox": mailbox, "count": _parse_count(data), "server_reply": rep}
+            out = {
+                "mailbox": mailbox,
+                "count": _parse_count(data),
+                "uidvalidity": _untagged_int(self.conn_obj, "UIDVALIDITY"),
+                "uidnext": _untagged_int(self.conn_obj, "UIDNEXT"),
+                "highestmodseq": _untagged_int(self.conn_obj, "HIGHESTMODSEQ"),
+                "server_reply": rep,
+            }
             self._set_log("SELECT", STATUS_OK, out)
             return out
         except Exception as e:
             self._set_log("SELECT", STATUS_FAILED, {"mailbox": mailbox, "detail": str(e)})
             return None
 
+    def enable_condstore(self) -> bool:
+        if not self.conn_obj:
+            self._set_log("CONNECT", STATUS_FAILED, {"error": "not_connected", "op": "ENABLE_CONDSTORE"})
+            return False
+        caps = tuple(getattr(self.conn_obj, "capabilities", ()) or ())
+        if "CONDSTORE" not in caps or "ENABLE" not in caps:
+            self._set_log("CONNECT", STATUS_FAILED, {"op": "ENABLE_CONDSTORE", "error": "not_supported", "capabilities": list(caps)})
+            return False
+        try:
+            typ, data = self.conn_obj.enable("CONDSTORE")
+            rep = {"typ": typ, "data": _b2s_list(data)}
+            if typ != "OK":
+                self._set_log("CONNECT", STATUS_FAILED, {"op": "ENABLE_CONDSTORE", "server_reply": rep})
+                return False
+            self._set_log("CONNECT", STATUS_OK, {"op": "ENABLE_CONDSTORE", "server_reply": rep})
+            return True
+        except Exception as e:
+            self._set_log("CONNECT", STATUS_FAILED, {"op": "ENABLE_CONDSTORE", "detail": str(e)})
+            return False
+
     def uid_search(self, criteria: str = "ALL") -> Optional[list[str]]:
         if not self.conn_obj:
             self._set_log("FETCH", STATUS_FAILED, {"error": "not_connected", "op": "UID_SEARCH", "criteria": criteria})
@@ -175,6 +213,37 @@ class IMAPConn:
             self._set_log("FETCH", STATUS_FAILED, {"op": "UID_FETCH_RFC822", "uid": uid, "detail": str(e)})
             return None
 
+    def uid_fetch_many(self, uids: Sequence[str], items: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        One UID FETCH for many UIDs. items: e.g. "(UID BODY.PEEK[])".
+        Returns {uid: {"meta": str, "size": int|None, "sections": {"": bytes, "HEADER.FIELDS (...)": bytes}}}.
+        UIDs missing in the result (expunged meanwhile) are simply absent. Log keeps counts only (no bodies).
+        """
+        uid_list = [str(u) for u in (uids or []) if str(u).strip()]
+        if not uid_list:
+            return {}
+        uid_set = _uid_set(uid_list)
+        if not self.conn_obj:
+            self._set_log("FETCH", STATUS_FAILED, {"error": "not_connected", "op": "UID_FETCH_MANY", "count": len(uid_list)})
+            return None
+        try:
+            typ, data = self.conn_obj.uid("FETCH", uid_set, items)
+            if typ != "OK":
+                rep = {"typ": typ, "data": _b2s_list([x for x in (data or []) if isinstance(x, bytes)])}
+                self._set_log("FETCH", STATUS_FAILED, {"op": "UID_FETCH_MANY", "items": items, "count": len(uid_list), "server_reply": rep})
+                return None
+            out = _parse_fetch_items(data)
+            nbytes = sum(len(b) for v in out.values() for b in v["sections"].values())
+            self._set_log(
+                "FETCH",
+                STATUS_OK,
+                {"op": "UID_FETCH_MANY", "items": items, "count": len(uid_list), "returned": len(out), "bytes": nbytes},
+            )
+            return out
+        except Exception as e:
+            self._set_log("FETCH", STATUS_FAILED, {"op": "UID_FETCH_MANY", "items": items, "count": len(uid_list), "detail": str(e)})
+            return None
+
     def uid_store_flags(self, uid: str, flags: str, mode: str = "+") -> Optional[Dict[str, Any]]:
         if not self.conn_obj:
             self._set_log("FETCH", STATUS_FAILED, {"error": "not_connected", "op": "UID_STORE_FLAGS", "uid": uid})
@@ -314,6 +383,7 @@ class IMAPConn:
             _imap_load_from_db_uncached,
             ttl=_DB_CACHE_TTL_SEC,
             version=_DB_CACHE_VERSION,
+            l1=True,
         )
 
     # -------------------------
@@ -429,6 +499,17 @@ def _extract_first_bytes(data: Any) -> Optional[bytes]:
     return None
 
 
+def _untagged_int(c: imaplib.IMAP4, name: str) -> Optional[int]:
+    # select() flushes untagged_responses first, so what is there belongs to this SELECT
+    vals = (getattr(c, "untagged_responses", None) or {}).get(name) or []
+    for raw in reversed(vals):
+        s = raw.decode("ascii", "replace") if isinstance(raw, (bytes, bytearray)) else str(raw or "")
+        s = s.strip().split(" ")[0] if s.strip() else ""
+        if s.isdigit():
+            return int(s)
+    return None
+
+
 def _parse_count(data: Any) -> Optional[int]:
     if not data or not isinstance(data, list) or not data[0]:
         return None
@@ -439,3 +520,62 @@ def _parse_count(data: Any) -> Optional[int]:
         return int(s) if s.isdigit() else None
     except Exception:
         return None
+
+
+def _uid_set(uids: Sequence[str]) -> str:
+    # "5,7,8,9,12" -> "5,7:9,12"
+    nums = sorted({int(u) for u in uids if str(u).strip().isdigit()})
+    parts: List[str] = []
+    i = 0
+    while i < len(nums):
+        j = i
+        while j + 1 < len(nums) and nums[j + 1] == nums[j] + 1:
+            j += 1
+        parts.append(str(nums[i]) if i == j else f"{nums[i]}:{nums[j]}")
+        i = j + 1
+    return ",".join(parts)
+
+
+def _parse_fetch_items(data: Any) -> Dict[str, Dict[str, Any]]:
+    """
+    imaplib FETCH data -> per-UID items. A message starts with "<seq> (" (tuple head or bytes line);
+    literals follow heads ending with {n}; continuation lines (" ...)" / ")") belong to the current message.
+    """
+    msgs: List[Tuple[List[bytes], Dict[str, bytes]]] = []
+    cur: Optional[Tuple[List[bytes], Dict[str, bytes]]] = None
+
+    for part in data if isinstance(data, list) else []:
+        if isinstance(part, tuple) and len(part) >= 2:
+            head = bytes(part[0] or b"")
+            lit = part[1]
+            if cur is None or _FETCH_START_RE.match(head):
+                cur = ([], {})
+                msgs.append(cur)
+            cur[0].append(_FETCH_LITERAL_RE.sub(b"", head))
+            m = _FETCH_SECTION_RE.search(head)
+            if m and isinstance(lit, (bytes, bytearray)):
+                name = m.group(1) if m.group(1) is not None else m.group(2)
+                key = name.decode("ascii", "replace").upper()
+                if key == "RFC822":
+                    key = ""
+                cur[1][key] = bytes(lit)
+        elif isinstance(part, (bytes, bytearray)):
+            line = bytes(part)
+            if cur is None or _FETCH_START_RE.match(line):
+                cur = ([], {})
+                msgs.append(cur)
+            cur[0].append(line)
+
+    out: Dict[str, Dict[str, Any]] = {}
+    for heads, sections in msgs:
+        meta = b" ".join(heads)
+        m_uid = _FETCH_UID_RE.search(meta)
+        if not m_uid:
+            continue
+        m_size = _FETCH_SIZE_RE.search(meta)
+        out[m_uid.group(1).decode("ascii")] = {
+            "meta": meta.decode("utf-8", errors="replace"),
+            "size": int(m_size.group(1)) if m_size else None,
+            "sections": sections,
+        }
+    return out
@@ -1,9 +1,14 @@
 # FILE: engine/common/mail/send.py
 # PATH: engine/common/mail/send.py
-# DATE: 2026-04-14
+# DATE: 2026-10-16
 # SUMMARY:
 # - send_one is the single sender orchestrator: render/template, smrel, SMTP send, sending_log write, status accounting
 # - no campaign/contact lookup queries inside; caller passes full campaign/contact payload
+# - campaign["ready_template"] (SendTemplate) is rendered per recipient without regex passes
+# - optional smtp_session (SMTPSession of the same mailbox) reuses an open SMTP connection across calls
+# - optional log_writer (SendingLogWriter): block ids, row reserved before SMTP, outcomes flushed in bulk
+# - an exception after the reservation releases it (mail not accepted) or records SEND (accepted) — never left open
+# - smtp 451 per-recipient counter: atomic CLIENT.incr (no GET + SET race)
 
 from __future__ import annotations
 
@@ -14,12 +19,17 @@ from typing import Any, Dict, List, Optional
 
 from engine.common import db
 from engine.common.cache.client import CLIENT
-from engine.common.email_template import DEFAULT_VARS, build_send_bodies, build_send_vars_from_contact
+from engine.common.email_template import (
+    DEFAULT_VARS,
+    SendTemplate,
+    build_send_vars_from_contact,
+    compile_send_template,
+)
 from engine.common.mail.logs import log_mail_event
-from engine.common.mail.smtp import SMTPConn
+from engine.common.mail.sending_log import SendingLogWriter, sending_log_seq_name
+from engine.common.mail.smtp import STATUS_OK as SMTP_STATUS_OK, SMTPConn, SMTPSession
 from engine.common.utils import safe_dict
 
-_SENDING_LOG_SEQ_NAME: Optional[str] = None
 _SMTP_451_STATE_TTL_SEC = 7 * 24 * 60 * 60
 _SMTP_451_MAX_FAILS_PER_EMAIL = 3
 _SMTP_451_EMAIL_WRONG_REASON = "451 TMP"
@@ -45,36 +55,10 @@ def _inject_hidden_mailer_table(body_html: str, mailer_id: int) -> str:
     return html[:pos] + marker + html[pos:]
 
 
-def _sending_log_seq_name() -> str:
-    global _SENDING_LOG_SEQ_NAME
-    if _SENDING_LOG_SEQ_NAME:
-        return _SENDING_LOG_SEQ_NAME
-
-    row = db.fetch_one(
-        """
-        SELECT substring(
-            c.column_default
-            FROM $$nextval\\('([^']+)'::regclass\\)$$
-        )
-        FROM information_schema.columns c
-        WHERE c.table_schema = 'public'
-          AND c.table_name = 'sending_log'
-          AND c.column_name = 'id'
-        LIMIT 1
-        """,
-        [],
-    )
-    if not row or not row[0]:
-        raise RuntimeError("SENDING_LOG_SEQUENCE_NOT_FOUND")
-
-    _SENDING_LOG_SEQ_NAME = str(row[0])
-    return _SENDING_LOG_SEQ_NAME
-
-
 def _next_sending_log_id() -> int:
     row = db.fetch_one(
         "SELECT nextval(%s::regclass)",
-        [str(_sending_log_seq_name())],
+        [str(sending_log_seq_name())],
     )
     if not row or row[0] is None:
         raise RuntimeError("SENDING_LOG_NEXTVAL_FAILED")
@@ -102,7 +86,7 @@ def _insert_sending_log_row(
                 data,
                 processed_at
             )
-            VALUES (
+            SELECT
                 %s,
                 %s,
                 %s,
@@ -110,7 +94,7 @@ def _insert_sending_log_row(
                 %s,
                 %s::jsonb,
                 CASE WHEN %s THEN now() ELSE NULL END
-            )
+            WHERE NOT EXISTS (SELECT 1 FROM public.sending_log x WHERE x.id = %s)
             ON CONFLICT DO NOTHING
             RETURNING campaign_id, processed
         ),
@@ -134,6 +118,7 @@ def _insert_sending_log_row(
             str(status),
             json.dumps(payload, ensure_ascii=False),
             bool(processed),
+            int(log_id),
         ),
     )
 
@@ -166,26 +151,12 @@ def _smtp_451_count_key(aggr_contact_id: Optional[int], email: str) -> Optional[
     return None
 
 
-def _smtp_451_get_count(aggr_contact_id: Optional[int], email: str) -> int:
-    key = _smtp_451_count_key(aggr_contact_id, email)
-    if not key:
-        return 0
-    raw = CLIENT.get(key, ttl_sec=1)
-    if raw is None:
-        return 0
-    try:
-        return max(0, int(bytes(raw).decode("utf-8", errors="replace").strip() or "0"))
-    except Exception:
-        return 0
-
-
 def _smtp_451_inc_count(aggr_contact_id: Optional[int], email: str) -> int:
+    # атомарный INCR + TTL: параллельные отправки на тот же адрес не теряют инкременты; Redis недоступен -> 0
     key = _smtp_451_count_key(aggr_contact_id, email)
     if not key:
         return 0
-    value = _smtp_451_get_count(aggr_contact_id, email) + 1
-    CLIENT.set(key, str(value).encode("utf-8"), ttl_sec=_SMTP_451_STATE_TTL_SEC)
-    return value
+    return int(CLIENT.incr(key, 1, ttl_sec=_SMTP_451_STATE_TTL_SEC) or 0)
 
 
 def _smtp_451_clear_count(aggr_contact_id: Optional[int], email: str) -> None:
@@ -209,6 +180,93 @@ def _mark_aggr_email_wrong(aggr_contact_id: Optional[int], reason: str) -> None:
     )
 
 
+def _log_next_id(log_writer: Optional[SendingLogWriter]) -> int:
+    if log_writer is not None:
+        return log_writer.next_id()
+    return _next_sending_log_id()
+
+
+def _log_row(log_writer: Optional[SendingLogWriter], **row: Any) -> None:
+    if log_writer is not None:
+        log_writer.record(**row)
+        return
+    _insert_sending_log_row(**row)
+
+
+def _log_mark_email_wrong(log_writer: Optional[SendingLogWriter], aggr_contact_id: Optional[int], reason: str) -> None:
+    if log_writer is not None:
+        log_writer.mark_email_wrong(aggr_contact_id, str(reason or "").strip() or _SMTP_451_EMAIL_WRONG_REASON)
+        return
+    _mark_aggr_email_wrong(aggr_contact_id, reason)
+
+
+def _send_accepted(smtp: SMTPConn) -> bool:
+    last = next((item for item in reversed(smtp.trace or []) if item.get("action") == "SEND"), None)
+    return isinstance(last, dict) and last.get("status") == SMTP_STATUS_OK
+
+
+def _record_send_failure(
+    log_writer: Optional[SendingLogWriter],
+    *,
+    log_id: int,
+    campaign_id: int,
+    aggr_contact_cb_id: int,
+    mailbox_id: int,
+    aggr_contact_id: Optional[int],
+    to_email: str,
+    code: Optional[int],
+    trace: List[Dict[str, Any]],
+    payload: Dict[str, Any],
+    record_sent: bool,
+) -> bool:
+    if code is not None and 400 <= int(code) <= 499:
+        log_mail_event(
+            mailbox_id=mailbox_id,
+            action="SMTP_SEND_CHECK",
+            status="FAIL_TMP",
+            payload_json={"code": int(code), "smtp_trace": trace},
+        )
+        if int(code) == 451 and record_sent:
+            fail_count = _smtp_451_inc_count(aggr_contact_id, to_email)
+            if fail_count >= _SMTP_451_MAX_FAILS_PER_EMAIL:
+                _log_mark_email_wrong(log_writer, aggr_contact_id, _SMTP_451_EMAIL_WRONG_REASON)
+                _smtp_451_clear_count(aggr_contact_id, to_email)
+                _log_row(
+                    log_writer,
+                    log_id=log_id,
+                    campaign_id=campaign_id,
+                    aggr_contact_cb_id=aggr_contact_cb_id,
+                    status="BAD_ADDRESS",
+                    payload={
+                        "reason": "SMTP_451_LIMIT_REACHED",
+                        "aggr_contact_id": int(aggr_contact_id or _BAD_ID_SENTINEL),
+                        **payload,
+                    },
+                )
+        if record_sent and log_writer is not None:
+            # no outcome row for a temporary failure: drop the reservation, contact stays pending
+            log_writer.release(log_id)
+        return False
+
+    status = _status_from_smtp_code(code)
+    if status == "BAD_ADDRESS" and record_sent:
+        _log_mark_email_wrong(
+            log_writer,
+            aggr_contact_id,
+            f"smtp_{int(code)}" if code is not None else "smtp_bad_address",
+        )
+    if record_sent:
+        _log_row(
+            log_writer,
+            log_id=log_id,
+            campaign_id=campaign_id,
+            aggr_contact_cb_id=aggr_contact_cb_id,
+            status=status,
+            payload=payload,
+        )
+    return False
+
+
 def send_one(
     *,
     campaign: Dict[str, Any],
@@ -217,6 +275,8 @@ def send_one(
     sending_list_id: Optional[int] = None,
     to_email_override: Optional[str] = None,
     record_sent: bool = True,
+    smtp_session: Optional[SMTPSession] = None,
+    log_writer: Optional[SendingLogWriter] = None,
 ) -> bool:
     campaign_obj = safe_dict(campaign)
     campaign_id = _as_pos_int(campaign_obj.get("id"))
@@ -267,8 +327,9 @@ def send_one(
                 bad_campaign_reason = "SUBJECTS_EMPTY"
 
         if bad_campaign_reason:
-            log_id = _next_sending_log_id()
-            _insert_sending_log_row(
+            log_id = _log_next_id(log_writer)
+            _log_row(
+                log_writer,
                 log_id=int(log_id),
                 campaign_id=int(campaign_id or _BAD_ID_SENTINEL),
                 aggr_contact_cb_id=int(aggr_contact_cb_id_int or _BAD_ID_SENTINEL),
@@ -286,8 +347,9 @@ def send_one(
         to_email = str(to_email_override or "").strip() or str(contact_obj.get("email") or "").strip()
         if not to_email:
             aggr_contact_id = _as_pos_int(contact_obj.get("aggr_contact_id"))
-            log_id = _next_sending_log_id()
-            _insert_sending_log_row(
+            log_id = _log_next_id(log_writer)
+            _log_row(
+                log_writer,
                 log_id=int(log_id),
                 campaign_id=int(campaign_id),
                 aggr_contact_cb_id=int(aggr_contact_cb_id_int),
@@ -302,7 +364,7 @@ def send_one(
             )
             return False
 
-        log_id = _next_sending_log_id()
+        log_id = _log_next_id(log_writer)
         utm = f"smrel={int(log_id)}"
 
     if contact_obj:
@@ -312,7 +374,10 @@ def send_one(
         vars_map["UTM"] = utm
     vars_map["company_email"] = to_email
 
-    body_html, body_text = build_send_bodies(html_tpl, vars_map, utm)
+    send_tpl = campaign_obj.get("ready_template")
+    if not isinstance(send_tpl, SendTemplate) or send_tpl.source != html_tpl:
+        send_tpl = compile_send_template(html_tpl)
+    body_html, body_text = send_tpl.render(vars_map, utm)
 
     headers: Dict[str, str] = {}
     for k, v in (safe_dict(letter_headers)).items():
@@ -335,7 +400,8 @@ def send_one(
     }
 
     if record_sent and (is_blocked or is_wrong_email):
-        _insert_sending_log_row(
+        _log_row(
+            log_writer,
             log_id=int(log_id),
             campaign_id=int(campaign_id),
             aggr_contact_cb_id=int(aggr_contact_cb_id_int),
@@ -348,14 +414,41 @@ def send_one(
         )
         return False
 
-    smtp = SMTPConn(int(mailbox_id))
-    ok = smtp.send_mail(
-        to_email,
-        subj,
-        body_text=body_text,
-        body_html=body_html,
-        headers=headers,
-    )
+    if record_sent and log_writer is not None:
+        log_writer.reserve(
+            log_id=int(log_id),
+            campaign_id=int(campaign_id),
+            aggr_contact_cb_id=int(aggr_contact_cb_id_int),
+        )
+
+    smtp: Optional[SMTPConn] = None
+    try:
+        if smtp_session is not None and int(smtp_session.mailbox_id) == int(mailbox_id):
+            smtp = smtp_session
+        else:
+            smtp = SMTPConn(int(mailbox_id))
+        ok = smtp.send_mail(
+            to_email,
+            subj,
+            body_text=body_text,
+            body_html=body_html,
+            headers=headers,
+        )
+    except Exception:
+        # the reservation must not outlive the call: recover_reserved() would turn it into SEND_UNCONFIRMED
+        if record_sent and log_writer is not None:
+            if smtp is not None and _send_accepted(smtp):
+                _log_row(
+                    log_writer,
+                    log_id=int(log_id),
+                    campaign_id=int(campaign_id),
+                    aggr_contact_cb_id=int(aggr_contact_cb_id_int),
+                    status="SEND",
+                    payload={**payload_base, "smtp_trace": list(smtp.trace or [])},
+                )
+            else:
+                log_writer.release(int(log_id))
+        raise
 
     trace = list(smtp.trace or [])
     code = smtp.last_send_code(to_email)
@@ -365,51 +458,34 @@ def send_one(
     payload["smtp_code"] = code
 
     if ok:
-        _smtp_451_clear_count(aggr_contact_id, to_email)
         if record_sent:
-            _insert_sending_log_row(
+            _log_row(
+                log_writer,
                 log_id=int(log_id),
                 campaign_id=int(campaign_id),
                 aggr_contact_cb_id=int(aggr_contact_cb_id_int),
                 status="SEND",
                 payload=payload,
             )
+        _smtp_451_clear_count(aggr_contact_id, to_email)
         return True
 
-    if code is not None and 400 <= int(code) <= 499:
-        log_mail_event(
-            mailbox_id=int(mailbox_id),
-            action="SMTP_SEND_CHECK",
-            status="FAIL_TMP",
-            payload_json={"code": int(code), "smtp_trace": trace},
-        )
-        if int(code) == 451 and bool(record_sent):
-            fail_count = _smtp_451_inc_count(aggr_contact_id, to_email)
-            if fail_count >= _SMTP_451_MAX_FAILS_PER_EMAIL:
-                _mark_aggr_email_wrong(aggr_contact_id, _SMTP_451_EMAIL_WRONG_REASON)
-                _smtp_451_clear_count(aggr_contact_id, to_email)
-                _insert_sending_log_row(
-                    log_id=int(log_id),
-                    campaign_id=int(campaign_id),
-                    aggr_contact_cb_id=int(aggr_contact_cb_id_int),
-                    status="BAD_ADDRESS",
-                    payload={
-                        "reason": "SMTP_451_LIMIT_REACHED",
-                        "aggr_contact_id": int(aggr_contact_id or _BAD_ID_SENTINEL),
-                        **payload,
-                    },
-                )
-        return False
-
-    status = _status_from_smtp_code(code)
-    if status == "BAD_ADDRESS" and bool(record_sent):
-        _mark_aggr_email_wrong(aggr_contact_id, f"smtp_{int(code)}" if code is not None else "smtp_bad_address")
-    if record_sent:
-        _insert_sending_log_row(
+    try:
+        return _record_send_failure(
+            log_writer,
             log_id=int(log_id),
             campaign_id=int(campaign_id),
             aggr_contact_cb_id=int(aggr_contact_cb_id_int),
-            status=status,
+            mailbox_id=int(mailbox_id),
+            aggr_contact_id=aggr_contact_id,
+            to_email=to_email,
+            code=code,
+            trace=trace,
             payload=payload,
+            record_sent=bool(record_sent),
         )
-    return False
+    except Exception:
+        # the mail was not accepted: a failed outcome write leaves the contact pending, not unconfirmed
+        if record_sent and log_writer is not None:
+            log_writer.release(int(log_id))
+        raise
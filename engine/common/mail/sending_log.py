@@ -0,0 +1,333 @@
+# FILE: engine/common/mail/sending_log.py
+# PATH: engine/common/mail/sending_log.py
+# DATE: 2026-10-16
+# SUMMARY:
+# - sending_log id allocation (sequence name lookup, nextval blocks via generate_series)
+# - SendingLogWriter: write-behind writer for one sender process
+#   * reserve(): row with status=SENDING is inserted BEFORE SMTP (sync) -> contact is excluded by the
+#     candidate anti-join, so a crash between SMTP and flush can never cause a double send
+#   * record()/release()/mark_email_wrong(): buffered; one flush = one statement
+#     (multi-row insert + bulk confirm/delete + one sent_num update per campaign + wrong_email marks)
+#   * flush bound: flush_rows buffered outcomes or flush_sec seconds, whichever comes first
+#   * recover_reserved(): SENDING rows left by a killed process -> SEND_UNCONFIRMED (never re-sent)
+# - inserts skip existing ids via NOT EXISTS (partitioned sending_log: PK is (id, created_at))
+
+from __future__ import annotations
+
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+from engine.common import db
+
+STATUS_RESERVED = "SENDING"
+STATUS_UNCONFIRMED = "SEND_UNCONFIRMED"
+
+ID_BLOCK_SIZE = 100
+FLUSH_ROWS = 50
+FLUSH_SEC = 5.0
+
+_SENDING_LOG_SEQ_NAME: Optional[str] = None
+
+
+def sending_log_seq_name() -> str:
+    global _SENDING_LOG_SEQ_NAME
+    if _SENDING_LOG_SEQ_NAME:
+        return _SENDING_LOG_SEQ_NAME
+
+    row = db.fetch_one(
+        """
+        SELECT substring(
+            c.column_default
+            FROM $$nextval\\('([^']+)'::regclass\\)$$
+        )
+        FROM information_schema.columns c
+        WHERE c.table_schema = 'public'
+          AND c.table_name = 'sending_log'
+          AND c.column_name = 'id'
+        LIMIT 1
+        """,
+        [],
+    )
+    if not row or not row[0]:
+        raise RuntimeError("SENDING_LOG_SEQUENCE_NOT_FOUND")
+
+    _SENDING_LOG_SEQ_NAME = str(row[0])
+    return _SENDING_LOG_SEQ_NAME
+
+
+def next_sending_log_ids(count: int) -> List[int]:
+    rows = db.fetch_all(
+        "SELECT nextval(%s::regclass) FROM generate_series(1, %s)",
+        [str(sending_log_seq_name()), max(1, int(count))],
+    )
+    out = [int(r[0]) for r in rows if r and r[0] is not None]
+    if not out:
+        raise RuntimeError("SENDING_LOG_NEXTVAL_FAILED")
+    return out
+
+
+def recover_reserved(campaign_ids: List[int]) -> int:
+    """
+    Reservations without an outcome (process killed between SMTP and flush).
+    Whether the mail left is unknown -> keep the row (no resend), mark it SEND_UNCONFIRMED.
+    Call only when no other process sends for these campaigns.
+    """
+    ids = [int(x) for x in (campaign_ids or []) if int(x) > 0]
+    if not ids:
+        return 0
+    row = db.fetch_one(
+        """
+        WITH upd AS (
+            UPDATE public.sending_log
+            SET status = %s
+            WHERE campaign_id = ANY(%s)
+              AND status = %s
+              AND processed = false
+            RETURNING id
+        )
+        SELECT COUNT(*)::int FROM upd
+        """,
+        [STATUS_UNCONFIRMED, ids, STATUS_RESERVED],
+    )
+    return int(row[0] or 0) if row else 0
+
+
+_FLUSH_SQL = """
+WITH ins AS (
+    INSERT INTO public.sending_log (
+        id,
+        campaign_id,
+        aggr_contact_cb_id,
+        processed,
+        status,
+        data,
+        processed_at
+    )
+    SELECT
+        v.id,
+        v.campaign_id,
+        v.aggr_contact_cb_id,
+        v.processed,
+        v.status,
+        v.data::jsonb,
+        CASE WHEN v.processed THEN now() ELSE NULL END
+    FROM unnest(%s::bigint[], %s::bigint[], %s::bigint[], %s::bool[], %s::text[], %s::text[])
+        AS v(id, campaign_id, aggr_contact_cb_id, processed, status, data)
+    -- partitioned sending_log has PK (id, created_at): ON CONFLICT alone does not see a reserved id
+    WHERE NOT EXISTS (SELECT 1 FROM public.sending_log x WHERE x.id = v.id)
+    ON CONFLICT DO NOTHING
+    RETURNING campaign_id, processed
+),
+conf AS (
+    UPDATE public.sending_log lg
+    SET status = v.status,
+        data = v.data::jsonb,
+        processed = true,
+        processed_at = now()
+    FROM unnest(%s::bigint[], %s::text[], %s::text[]) AS v(id, status, data)
+    WHERE lg.id = v.id
+      AND lg.status = %s
+    RETURNING lg.campaign_id
+),
+rel AS (
+    DELETE FROM public.sending_log lg
+    WHERE lg.id = ANY(%s::bigint[])
+      AND lg.status = %s
+    RETURNING lg.id
+),
+cnt AS (
+    SELECT x.campaign_id, COUNT(*)::int AS n
+    FROM (
+        SELECT campaign_id FROM ins WHERE processed = true
+        UNION ALL
+        SELECT campaign_id FROM conf
+    ) x
+    GROUP BY x.campaign_id
+),
+upd AS (
+    UPDATE public.campaigns_campaigns c
+    SET sent_num = COALESCE(c.sent_num, 0) + cnt.n,
+        updated_at = now()
+    FROM cnt
+    WHERE c.id = cnt.campaign_id
+    RETURNING c.id
+),
+wrong AS (
+    UPDATE public.aggr_contacts_cb ac
+    SET wrong_email = true,
+        wrong_email_reason = v.reason,
+        updated_at = now()
+    FROM unnest(%s::bigint[], %s::text[]) AS v(id, reason)
+    WHERE ac.id = v.id
+    RETURNING ac.id
+)
+SELECT
+    (SELECT COUNT(*)::int FROM ins),
+    (SELECT COUNT(*)::int FROM conf),
+    (SELECT COUNT(*)::int FROM rel),
+    (SELECT COUNT(*)::int FROM wrong)
+"""
+
+
+class SendingLogWriter:
+    def __init__(
+        self,
+        *,
+        id_block: int = ID_BLOCK_SIZE,
+        flush_rows: int = FLUSH_ROWS,
+        flush_sec: float = FLUSH_SEC,
+    ) -> None:
+        self.id_block = max(1, int(id_block))
+        self.flush_rows = max(1, int(flush_rows))
+        self.flush_sec = max(0.0, float(flush_sec))
+
+        self._ids: List[int] = []
+        self._reserved: set[int] = set()
+        self._inserts: List[tuple] = []
+        self._confirms: List[tuple] = []
+        self._releases: List[int] = []
+        self._wrong: Dict[int, str] = {}
+        self._oldest_at: Optional[float] = None
+
+        self.counters: Dict[str, Any] = {
+            "id_blocks": 0,
+            "reserved": 0,
+            "flushes": 0,
+            "flush_sec_total": 0.0,
+            "inserted": 0,
+            "confirmed": 0,
+            "released": 0,
+            "wrong_marked": 0,
+        }
+
+    # -------------------------
+    # Public API
+    # -------------------------
+
+    def next_id(self) -> int:
+        if not self._ids:
+            self._ids = next_sending_log_ids(self.id_block)
+            self._ids.reverse()
+            self.counters["id_blocks"] += 1
+        return self._ids.pop()
+
+    def reserve(self, *, log_id: int, campaign_id: int, aggr_contact_cb_id: int) -> None:
+        db.execute(
+            """
+            INSERT INTO public.sending_log (
+                id,
+                campaign_id,
+                aggr_contact_cb_id,
+                processed,
+                status,
+                data
+            )
+            VALUES (%s, %s, %s, false, %s, '{}'::jsonb)
+            """,
+            (int(log_id), int(campaign_id), int(aggr_contact_cb_id), STATUS_RESERVED),
+        )
+        self._reserved.add(int(log_id))
+        self.counters["reserved"] += 1
+
+    def record(
+        self,
+        *,
+        log_id: int,
+        campaign_id: int,
+        aggr_contact_cb_id: int,
+        status: str,
+        payload: Dict[str, Any],
+        processed: bool = True,
+    ) -> None:
+        data = json.dumps(payload, ensure_ascii=False)
+        if int(log_id) in self._reserved:
+            self._reserved.discard(int(log_id))
+            self._confirms.append((int(log_id), str(status), data))
+        else:
+            self._inserts.append(
+                (int(log_id), int(campaign_id), int(aggr_contact_cb_id), bool(processed), str(status), data)
+            )
+        self._queued()
+
+    def release(self, log_id: int) -> None:
+        if int(log_id) not in self._reserved:
+            return
+        self._reserved.discard(int(log_id))
+        self._releases.append(int(log_id))
+        self._queued()
+
+    def mark_email_wrong(self, aggr_contact_id: Optional[int], reason: str) -> None:
+        if aggr_contact_id is None:
+            return
+        self._wrong[int(aggr_contact_id)] = str(reason)
+        self._queued()
+
+    def pending_count(self) -> int:
+        return len(self._inserts) + len(self._confirms) + len(self._releases) + len(self._wrong)
+
+    def flush_due(self) -> bool:
+        if not self.pending_count():
+            return False
+        if self.pending_count() >= self.flush_rows:
+            return bool(self.flush())
+        if self._oldest_at is not None and time.monotonic() - self._oldest_at >= self.flush_sec:
+            return bool(self.flush())
+        return False
+
+    def flush(self) -> int:
+        if not self.pending_count():
+            return 0
+
+        inserts, confirms, releases, wrong = self._inserts, self._confirms, self._releases, self._wrong
+        t0 = time.monotonic()
+        row = db.fetch_one(
+            _FLUSH_SQL,
+            (
+                [r[0] for r in inserts],
+                [r[1] for r in inserts],
+                [r[2] for r in inserts],
+                [r[3] for r in inserts],
+                [r[4] for r in inserts],
+                [r[5] for r in inserts],
+                [r[0] for r in confirms],
+                [r[1] for r in confirms],
+                [r[2] for r in confirms],
+                STATUS_RESERVED,
+                list(releases),
+                STATUS_RESERVED,
+                list(wrong.keys()),
+                list(wrong.values()),
+            ),
+        )
+        # fetch_one commits on exit; only now the buffer is dropped (failed flush keeps it for retry)
+        n = self.pending_count()
+        self._inserts, self._confirms, self._releases, self._wrong = [], [], [], {}
+        self._oldest_at = None
+
+        self.counters["flushes"] += 1
+        self.counters["flush_sec_total"] += time.monotonic() - t0
+        if row:
+            self.counters["inserted"] += int(row[0] or 0)
+            self.counters["confirmed"] += int(row[1] or 0)
+            self.counters["released"] += int(row[2] or 0)
+            self.counters["wrong_marked"] += int(row[3] or 0)
+        return n
+
+    def close(self) -> None:
+        self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        c = dict(self.counters)
+        c["pending"] = self.pending_count()
+        c["reserved_open"] = len(self._reserved)
+        c["ids_left"] = len(self._ids)
+        return c
+
+    # -------------------------
+    # Internal
+    # -------------------------
+
+    def _queued(self) -> None:
+        if self._oldest_at is None:
+            self._oldest_at = time.monotonic()
@@ -5,6 +5,8 @@
 # - Единый полный file-log всех SMTP действий (CONNECT/AUTH/SEND/DISCONNECT) в logs/smtp.log (JSONL), best-effort.
 # - Исправлено: SMTP-ошибки с кодом, приходящие через исключения (SMTPRecipientsRefused/SMTPDataError/SMTPSenderRefused/SMTPResponseException),
 #   теперь нормализуются в data.refused{rcpt:{code,resp}} чтобы send_one() корректно классифицировал 4xx/5xx.
+# - SMTPSession: долгоживущее соединение для sender-процесса (RSET между письмами, NOOP после простоя,
+#   reconnect после 421/timeout, recycle по числу писем/возрасту), счётчики handshake/писем на соединение.
 
 from __future__ import annotations
 
@@ -29,6 +31,11 @@ STATUS_FAILED = "FAILED"
 _DB_CACHE_TTL_SEC = 60
 _DB_CACHE_VERSION = "mailbox_creds_v2"
 
+SESSION_MAX_MESSAGES = 100
+SESSION_MAX_AGE_SEC = 300.0
+SESSION_NOOP_IDLE_SEC = 20.0
+_SESSION_DROP_CODES = (421,)
+
 _PROJECT_ROOT = Path(__file__).resolve().parents[3]
 _LOG_DIR = _PROJECT_ROOT / "logs"
 _SMTP_LOG_FILE = _LOG_DIR / "smtp.log"
@@ -328,6 +335,7 @@ class SMTPConn:
             _smtp_load_from_db_uncached,
             ttl=_DB_CACHE_TTL_SEC,
             version=_DB_CACHE_VERSION,
+            l1=True,
         )
 
     # -------------------------
@@ -473,6 +481,188 @@ class SMTPConn:
             _smtp_file_log(rec)
 
 
+class SMTPSession(SMTPConn):
+    """
+    Долгоживущее SMTP-соединение одного mailbox (для sender-процесса).
+    - send_mail() не делает QUIT: соединение переиспользуется, между письмами RSET;
+    - после простоя > noop_idle_sec — NOOP, мёртвое соединение переоткрывается ДО отправки;
+    - 421 / обрыв / timeout во время отправки -> соединение сбрасывается, следующее письмо переподключится;
+    - recycle после max_messages писем или max_age_sec секунд жизни соединения;
+    - self.trace содержит только записи последнего send_mail() (как у SMTPConn).
+    """
+
+    def __init__(
+        self,
+        mailbox_id: int,
+        cache_key: Optional[str] = None,
+        *,
+        max_messages: int = SESSION_MAX_MESSAGES,
+        max_age_sec: float = SESSION_MAX_AGE_SEC,
+        noop_idle_sec: float = SESSION_NOOP_IDLE_SEC,
+    ) -> None:
+        super().__init__(mailbox_id, cache_key)
+        self.max_messages = max(1, int(max_messages))
+        self.max_age_sec = max(1.0, float(max_age_sec))
+        self.noop_idle_sec = max(0.0, float(noop_idle_sec))
+
+        self.connected_at: float = 0.0
+        self.last_used_at: float = 0.0
+        self.conn_messages: int = 0
+        self._trace_flushed: int = 0
+
+        self.counters: Dict[str, Any] = {
+            "handshakes": 0,
+            "handshake_failed": 0,
+            "handshake_sec_total": 0.0,
+            "handshake_sec_last": 0.0,
+            "messages": 0,
+            "conns_closed": 0,
+            "conn_messages_closed_total": 0,
+            "recycles": 0,
+            "reconnects": 0,
+        }
+
+    # -------------------------
+    # Public API
+    # -------------------------
+
+    def send_mail(
+        self,
+        to_email: str,
+        subject: str,
+        *,
+        body_text: str = "",
+        body_html: str = "",
+        headers: Optional[Dict[str, str]] = None,
+    ) -> bool:
+        self.trace = []
+        self.log = {}
+        self._trace_flushed = 0
+        try:
+            if not self._ensure_conn():
+                return False
+
+            ok = self._send_mail(
+                to_email,
+                subject,
+                body_text=body_text,
+                body_html=body_html,
+                headers=headers,
+            )
+            self.conn_messages += 1
+            self.counters["messages"] += 1
+            self.last_used_at = time.monotonic()
+
+            if not ok and self._last_send_lost_conn(to_email):
+                self.counters["reconnects"] += 1
+                self._drop_conn("send_lost_conn")
+            return ok
+        finally:
+            self._flush_trace()
+
+    def shutdown(self) -> None:
+        self.trace = []
+        self._trace_flushed = 0
+        if self.conn_obj is not None:
+            self._drop_conn("shutdown")
+        self._flush_trace()
+
+    def stats(self) -> Dict[str, Any]:
+        c = dict(self.counters)
+        closed = int(c["conns_closed"])
+        hs = int(c["handshakes"])
+        c["handshake_sec_avg"] = (float(c["handshake_sec_total"]) / hs) if hs else 0.0
+        c["messages_per_conn_avg"] = (float(c["conn_messages_closed_total"]) / closed) if closed else float(self.conn_messages)
+        c["conn_messages"] = int(self.conn_messages)
+        c["conn_age_sec"] = (time.monotonic() - self.connected_at) if self.conn_obj is not None else 0.0
+        return c
+
+    # -------------------------
+    # Internal: session lifecycle
+    # -------------------------
+
+    def _ensure_conn(self) -> bool:
+        if self.conn_obj is not None:
+            now = time.monotonic()
+            if self.conn_messages >= self.max_messages or now - self.connected_at >= self.max_age_sec:
+                self.counters["recycles"] += 1
+                self._drop_conn("recycle")
+            elif not self._probe_conn(idle_sec=now - self.last_used_at):
+                self.counters["reconnects"] += 1
+                self._drop_conn("probe_failed")
+
+        if self.conn_obj is not None:
+            return True
+
+        t0 = time.monotonic()
+        ok = self.conn()
+        dt = time.monotonic() - t0
+        self.counters["handshake_sec_last"] = dt
+        if not ok:
+            self.counters["handshake_failed"] += 1
+            return False
+
+        self.counters["handshakes"] += 1
+        self.counters["handshake_sec_total"] += dt
+        self.connected_at = time.monotonic()
+        self.last_used_at = self.connected_at
+        self.conn_messages = 0
+        return True
+
+    def _probe_conn(self, *, idle_sec: float) -> bool:
+        c = self.conn_obj
+        if c is None:
+            return False
+        try:
+            if idle_sec >= self.noop_idle_sec:
+                code, _msg = c.noop()
+                if int(code) != 250:
+                    return False
+            code, _msg = c.rset()
+            return int(code) == 250
+        except Exception:
+            return False
+
+    def _last_send_lost_conn(self, to_email: str) -> bool:
+        if self.conn_obj is None:
+            return True
+        code = self.last_send_code(to_email)
+        if code is not None and int(code) in _SESSION_DROP_CODES:
+            return True
+        data = (self.log or {}).get("data")
+        if isinstance(data, dict) and data.get("error") == "send_failed":
+            # обрыв/timeout/SSL: состояние соединения неизвестно — не переиспользуем
+            return True
+        return False
+
+    def _drop_conn(self, reason: str) -> None:
+        c = self.conn_obj
+        self.conn_obj = None
+        self.counters["conns_closed"] += 1
+        self.counters["conn_messages_closed_total"] += int(self.conn_messages)
+        self.conn_messages = 0
+        if c is None:
+            return
+        try:
+            code, msg = c.quit()
+            self._set_log(
+                "DISCONNECT",
+                STATUS_OK,
+                {"reason": reason, "server_reply": {"quit": {"code": code, "msg": _b2s(msg)}}},
+            )
+        except Exception as e:
+            try:
+                c.close()
+            except Exception:
+                pass
+            self._set_log("DISCONNECT", STATUS_OK, {"reason": reason, "note": "closed_without_quit", "detail": str(e)})
+
+    def _flush_trace(self) -> None:
+        for rec in self.trace[self._trace_flushed :]:
+            _smtp_file_log(rec)
+        self._trace_flushed = len(self.trace)
+
+
 def _b2s(x: Any) -> str:
     if x is None:
         return ""
@@ -0,0 +1,433 @@
+# FILE: engine/common/partitions.py  (новое — 2026-10-16)
+# PURPOSE: Помесячные RANGE-партиции для append-only sending_log (created_at) и mailbox_stats (time).
+#          - ensure_future(): партиции на PREMAKE_MONTHS вперёд; DEFAULT — только mailbox_stats (время из лога бывает любым),
+#            sending_log (created_at = now()) без DEFAULT;
+#          - ensure_indexes(): индексы на родителе (новые партиции получают их сами):
+#              BRIN по времени; btree covering под анти-join sender-а / parent_send / pending
+#              (campaign_id, aggr_contact_cb_id) INCLUDE (id, status, processed, processed_at, created_at) — index-only;
+#              (letter_id) INCLUDE (time) под join-ы mailbox_stats -> sending_log; lookup по id — PK (id, created_at);
+#          - archive_expired(): партиции старше retention -> freeze, отдельный DETACH (CONCURRENTLY без DEFAULT-партиции,
+#            иначе обычный с lock_timeout 500ms), затем COPY (text) отсоединённой таблицы в .tsv.gz + manifest
+#            (rows, sha256), сверка числа строк и DROP. Кампании, потерявшие сырые строки,
+#            замораживаются в campaign_counters по источнику (только счётчики, которые питает таблица).
+#            Retention — только явно (PARTITION_RETENTION_DAYS_*), по умолчанию выключен для обеих таблиц:
+#            панель читает сырые mailbox_stats (списки визитов), архив их укорачивает.
+#            sending_log архивируется только если все кампании партиции archived.
+#          Таблица, ещё не переведённая на партиции (engine.common.partitions_migrate), пропускается.
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from engine.common import campaign_counters, db
+
+SCHEMA = "public"
+PREMAKE_MONTHS = 3
+ARCHIVE_DIR = os.environ.get("PARTITION_ARCHIVE_DIR", "/serenity-logs/archive")
+DETACH_LOCK_TIMEOUT = "500ms"  # обычный DETACH (есть DEFAULT): потолок очереди вставок/чтений за родителем
+
+
+def _env_days(name: str, default: Optional[int]) -> Optional[int]:
+    raw = (os.environ.get(name) or "").strip()
+    if not raw:
+        return default
+    return int(raw) if raw.isdigit() and int(raw) > 0 else None
+
+
+@dataclass(frozen=True)
+class PartitionSpec:
+    table: str
+    key: str                           # колонка времени (ключ партиционирования)
+    retention_days: Optional[int]      # None — не архивировать
+    indexes: Tuple[Tuple[str, str], ...]  # (имя, "USING ... (...)" без ON)
+    pk: Tuple[str, ...] = ("id",)      # + key -> PRIMARY KEY на партиционированной таблице
+    archive_guard: str = ""            # SQL: есть строка -> партицию архивировать нельзя ({part} — имя партиции)
+    campaigns_sql: str = ""            # SQL: DISTINCT campaign_id строк партиции ({part})
+    with_default: bool = True          # DEFAULT-партиция (запрещает DETACH CONCURRENTLY)
+
+
+SPECS: Dict[str, PartitionSpec] = {
+    "sending_log": PartitionSpec(
+        table="sending_log",
+        key="created_at",
+        retention_days=_env_days("PARTITION_RETENTION_DAYS_SENDING_LOG", None),
+        indexes=(
+            ("sending_log_created_brin", "USING brin (created_at)"),
+            (
+                "sending_log_campaign_contact_cov",
+                "USING btree (campaign_id, aggr_contact_cb_id) INCLUDE (id, status, processed, processed_at, created_at)",
+            ),
+        ),
+        archive_guard="""
+            SELECT 1
+            FROM {part} lg
+            JOIN public.campaigns_campaigns c ON c.id = lg.campaign_id
+            WHERE COALESCE(c.archived, false) = false
+            LIMIT 1
+        """,
+        campaigns_sql="SELECT DISTINCT campaign_id FROM {part} WHERE campaign_id IS NOT NULL",
+        # created_at = now() на вставке -> всегда в заранее созданном месяце; без DEFAULT архив идёт через CONCURRENTLY
+        with_default=False,
+    ),
+    "mailbox_stats": PartitionSpec(
+        table="mailbox_stats",
+        key="time",
+        retention_days=_env_days("PARTITION_RETENTION_DAYS_MAILBOX_STATS", None),
+        indexes=(
+            ("mailbox_stats_time_brin", "USING brin (time)"),
+            ("mailbox_stats_letter_cov", "USING btree (letter_id) INCLUDE (time)"),
+        ),
+        campaigns_sql="""
+            SELECT DISTINCT lg.campaign_id
+            FROM {part} ms
+            JOIN public.sending_log lg ON lg.id = ms.letter_id
+            WHERE lg.campaign_id IS NOT NULL
+        """,
+    ),
+}
+
+
+# -------------------- naming / bounds --------------------
+
+
+def month_start(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+
+def add_months(d: date, n: int) -> date:
+    m = d.month - 1 + int(n)
+    return date(d.year + m // 12, m % 12 + 1, 1)
+
+
+def utc_start(d: date) -> datetime:
+    return datetime(d.year, d.month, d.day, tzinfo=timezone.utc)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month.year:04d}{month.month:02d}"
+
+
+def default_name(table: str) -> str:
+    return f"{table}_pdefault"
+
+
+def bounds_sql(month: date) -> str:
+    # границы в UTC явно: иначе timestamptz-литерал читается в TimeZone сессии создавшего процесса
+    return f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{add_months(month, 1).isoformat()} 00:00:00+00')"
+
+
+def create_partition_sql(spec: PartitionSpec, month: date, schema: str = SCHEMA, *, name: str = "",
+                         parent: str = "") -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {schema}.{name or partition_name(spec.table, month)} "
+        f"PARTITION OF {schema}.{parent or spec.table} {bounds_sql(month)}"
+    )
+
+
+def create_default_sql(spec: PartitionSpec, schema: str = SCHEMA) -> str:
+    return f"CREATE TABLE IF NOT EXISTS {schema}.{default_name(spec.table)} PARTITION OF {schema}.{spec.table} DEFAULT"
+
+
+def index_sql(spec: PartitionSpec, schema: str = SCHEMA) -> List[str]:
+    return [f"CREATE INDEX IF NOT EXISTS {name} ON {schema}.{spec.table} {body}" for name, body in spec.indexes]
+
+
+# -------------------- catalog --------------------
+
+
+def is_partitioned(cur: Any, table: str, schema: str = SCHEMA) -> bool:
+    cur.execute(
+        """
+        SELECT c.relkind = 'p'
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s AND c.relname = %s
+        """,
+        [schema, table],
+    )
+    row = cur.fetchone()
+    return bool(row and row[0])
+
+
+def _bound_date(text: str) -> date:
+    dt = datetime.fromisoformat(text.strip())
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc)
+    return dt.date()
+
+
+def list_partitions(cur: Any, table: str, schema: str = SCHEMA) -> List[Tuple[str, Optional[date], Optional[date]]]:
+    """[(имя, from, to)] по возрастанию; DEFAULT -> (имя, None, None) в конце."""
+    cur.execute(
+        """
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        JOIN pg_namespace n ON n.oid = p.relnamespace
+        WHERE n.nspname = %s AND p.relname = %s
+        """,
+        [schema, table],
+    )
+    out: List[Tuple[str, Optional[date], Optional[date]]] = []
+    tail: List[Tuple[str, Optional[date], Optional[date]]] = []
+    for name, bound in cur.fetchall() or []:
+        b = str(bound or "")
+        if b.strip().upper() == "DEFAULT":
+            tail.append((str(name), None, None))
+            continue
+        # FOR VALUES FROM ('2026-10-01 02:00:00+02') TO ('2026-11-01 01:00:00+01') — в TimeZone сессии
+        try:
+            lo = _bound_date(b.split("FROM ('", 1)[1].split("'", 1)[0])
+            hi = _bound_date(b.split("TO ('", 1)[1].split("'", 1)[0])
+            out.append((str(name), lo, hi))
+        except Exception:
+            tail.append((str(name), None, None))
+    out.sort(key=lambda x: x[1] or date.min)
+    return out + tail
+
+
+# -------------------- maintenance --------------------
+
+
+def ensure_future(cur: Any, spec: PartitionSpec, *, months: int = PREMAKE_MONTHS, schema: str = SCHEMA) -> List[str]:
+    """Партиции с текущего месяца на months вперёд (+ DEFAULT, если with_default). -> созданные/заметки."""
+    notes: List[str] = []
+    existing = {name for name, _lo, _hi in list_partitions(cur, spec.table, schema)}
+    if spec.with_default:
+        cur.execute(create_default_sql(spec, schema))
+    has_default = spec.with_default or default_name(spec.table) in existing
+    this_month = month_start(datetime.now(timezone.utc).date())
+    for i in range(0, int(months) + 1):
+        m = add_months(this_month, i)
+        name = partition_name(spec.table, m)
+        if name in existing:
+            continue
+        if has_default:
+            cur.execute(
+                f"SELECT 1 FROM {schema}.{default_name(spec.table)} WHERE {spec.key} >= %s AND {spec.key} < %s LIMIT 1",
+                [utc_start(m), utc_start(add_months(m, 1))],
+            )
+        if has_default and cur.fetchone():
+            # CREATE PARTITION упадёт, пока такие строки лежат в DEFAULT — разбирать руками
+            notes.append(f"{name}: default partition has rows in range, not created")
+            continue
+        cur.execute(create_partition_sql(spec, m, schema))
+        notes.append(f"{name}: created")
+    return notes
+
+
+def ensure_indexes(cur: Any, spec: PartitionSpec, schema: str = SCHEMA) -> None:
+    for sql in index_sql(spec, schema):
+        cur.execute(sql)
+
+
+def _archive_paths(spec: PartitionSpec, part: str) -> Tuple[str, str]:
+    base = os.path.join(ARCHIVE_DIR, spec.table, part)
+    return base + ".tsv.gz", base + ".json"
+
+
+def _copy_out(cur: Any, schema: str, part: str, path: str) -> Tuple[int, str]:
+    # COPY text: переводы строк внутри значений экранированы -> строк файла = строк таблицы
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    h = hashlib.sha256()
+    rows = 0
+    with gzip.open(tmp, "wb", compresslevel=6) as gz:
+        with cur.copy(f"COPY {schema}.{part} TO STDOUT") as copy:
+            for chunk in copy:
+                data = bytes(chunk)
+                rows += data.count(b"\n")
+                h.update(data)
+                gz.write(data)
+    with open(tmp, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return rows, h.hexdigest()
+
+
+def _campaign_ids(cur: Any, spec: PartitionSpec, part: str, schema: str) -> List[int]:
+    if not spec.campaigns_sql:
+        return []
+    cur.execute(spec.campaigns_sql.format(part=f"{schema}.{part}"))
+    return [int(r[0]) for r in cur.fetchall() or []]
+
+
+def _has_default(cur: Any, spec: PartitionSpec, schema: str) -> bool:
+    return any(lo is None for _name, lo, _hi in list_partitions(cur, spec.table, schema))
+
+
+def _detach_pending(cur: Any, spec: PartitionSpec, part: str, schema: str) -> bool:
+    # прерванный DETACH ... CONCURRENTLY оставляет партицию в состоянии pending -> FINALIZE
+    cur.execute(
+        """
+        SELECT i.inhdetachpending
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s AND c.relname = %s
+        """,
+        [schema, part],
+    )
+    row = cur.fetchone()
+    return bool(row and row[0])
+
+
+def detach_partition(conn: Any, spec: PartitionSpec, part: str, schema: str = SCHEMA) -> str:
+    """
+    Отдельный шаг без COPY. Без DEFAULT-партиции — DETACH CONCURRENTLY (autocommit, родитель не блокируется).
+    С DEFAULT (CONCURRENTLY запрещён) — обычный DETACH: ACCESS EXCLUSIVE на родителе на миллисекунды,
+    ожидание блокировки ограничено DETACH_LOCK_TIMEOUT (вставки/чтения стоят в очереди не дольше), не успели — next run.
+    -> "concurrently" | "locked"
+    """
+    parent = f"{schema}.{spec.table}"
+    with conn.cursor() as cur:
+        pending = _detach_pending(cur, spec, part, schema)
+        has_default = _has_default(cur, spec, schema)
+    conn.commit()
+    if pending or not has_default:
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                mode = "FINALIZE" if pending else "CONCURRENTLY"
+                cur.execute(f"ALTER TABLE {parent} DETACH PARTITION {schema}.{part} {mode}")
+        finally:
+            conn.autocommit = False
+        return "concurrently"
+    with conn.cursor() as cur:
+        cur.execute(f"SET LOCAL lock_timeout = '{DETACH_LOCK_TIMEOUT}'")
+        cur.execute(f"ALTER TABLE {parent} DETACH PARTITION {schema}.{part}")
+    conn.commit()
+    return "locked"
+
+
+def _archive_detached(conn: Any, spec: PartitionSpec, part: str, schema: str = SCHEMA) -> Dict[str, Any]:
+    """Отсоединённая таблица (писателей нет): COPY в файл, сверка, freeze, manifest, DROP — одна транзакция."""
+    data_path, manifest_path = _archive_paths(spec, part)
+    month = date(int(part[-6:-2]), int(part[-2:]), 1)
+    with conn.cursor() as cur:
+        cur.execute(f"LOCK TABLE {schema}.{part} IN ACCESS EXCLUSIVE MODE")
+        cur.execute(f"SELECT COUNT(*) FROM {schema}.{part}")
+        expected = int((cur.fetchone() or [0])[0] or 0)
+        rows, sha = _copy_out(cur, schema, part, data_path)
+        if rows != expected:
+            conn.rollback()
+            return {"partition": part, "mode": "count_mismatch", "expected": expected, "copied": rows}
+
+        campaign_ids = _campaign_ids(cur, spec, part, schema)
+        campaign_counters.freeze(campaign_ids, spec.table, cur=cur)
+
+        with open(manifest_path, "w") as f:
+            json.dump(
+                {
+                    "table": spec.table,
+                    "partition": part,
+                    "from": month.isoformat(),
+                    "to": add_months(month, 1).isoformat(),
+                    "rows": rows,
+                    "sha256": sha,
+                    "format": "COPY text, gzip",
+                    "archived_at": datetime.now(timezone.utc).isoformat(),
+                    "campaign_ids": campaign_ids,
+                },
+                f,
+                ensure_ascii=False,
+            )
+        cur.execute(f"DROP TABLE {schema}.{part}")
+    conn.commit()
+    return {"partition": part, "mode": "archived", "rows": rows, "file": data_path}
+
+
+def archive_partition(conn: Any, spec: PartitionSpec, part: str, schema: str = SCHEMA) -> Dict[str, Any]:
+    """
+    1) guard + freeze кампаний (до того, как строки пропадут из родителя: verify не «чинит» счётчики вниз);
+    2) detach_partition() — отдельный шаг, без удержания блокировок на время COPY;
+    3) _archive_detached(): COPY уже отсоединённой таблицы + DROP.
+    Упали между шагами — отсоединённая таблица подхватывается следующим запуском (detached_leftovers).
+    """
+    with conn.cursor() as cur:
+        if spec.archive_guard:
+            cur.execute(spec.archive_guard.format(part=f"{schema}.{part}"))
+            if cur.fetchone():
+                conn.rollback()
+                return {"partition": part, "mode": "guarded"}
+        campaign_counters.freeze(_campaign_ids(cur, spec, part, schema), spec.table, cur=cur)
+    conn.commit()
+
+    detach_mode = detach_partition(conn, spec, part, schema)
+    res = _archive_detached(conn, spec, part, schema)
+    res["detach"] = detach_mode
+    return res
+
+
+def detached_leftovers(cur: Any, spec: PartitionSpec, schema: str = SCHEMA) -> List[str]:
+    """{table}_pYYYYMM, уже не партиции (упали после detach) — ждут COPY + DROP."""
+    cur.execute(
+        """
+        SELECT c.relname
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s
+          AND c.relkind = 'r'
+          AND c.relname ~ ('^' || %s || '_p[0-9]{6}$')
+          AND NOT c.relispartition
+        ORDER BY 1
+        """,
+        [schema, spec.table],
+    )
+    return [str(r[0]) for r in cur.fetchall() or []]
+
+
+def archive_expired(conn: Any, spec: PartitionSpec, schema: str = SCHEMA) -> List[Dict[str, Any]]:
+    if not spec.retention_days:
+        return []
+    cutoff = datetime.now(timezone.utc).date().toordinal() - int(spec.retention_days)
+    out: List[Dict[str, Any]] = []
+    with conn.cursor() as cur:
+        leftovers = detached_leftovers(cur, spec, schema)
+        parts = list_partitions(cur, spec.table, schema)
+    conn.commit()
+    for name in leftovers:
+        try:
+            out.append(_archive_detached(conn, spec, name, schema))
+        except Exception as e:
+            conn.rollback()
+            out.append({"partition": name, "mode": "error", "error": f"{type(e).__name__}:{e}"})
+    for name, lo, hi in parts:
+        if lo is None or hi is None or hi.toordinal() > cutoff:
+            continue
+        try:
+            out.append(archive_partition(conn, spec, name, schema))
+        except Exception as e:
+            conn.rollback()
+            conn.autocommit = False
+            out.append({"partition": name, "mode": "error", "error": f"{type(e).__name__}:{e}"})
+    return out
+
+
+def run_maintenance_once() -> Dict[str, Any]:
+    """Worker-задача: партиции вперёд + индексы + архив просроченных, по всем уже партиционированным таблицам."""
+    summary: Dict[str, Any] = {"mode": "ok"}
+    with db.connection() as conn:
+        for table, spec in SPECS.items():
+            with conn.cursor() as cur:
+                if not is_partitioned(cur, table):
+                    conn.commit()
+                    summary[table] = "not_partitioned"
+                    continue
+                notes = ensure_future(cur, spec)
+                ensure_indexes(cur, spec)
+            conn.commit()
+            archived = archive_expired(conn, spec)
+            summary[table] = {
+                "created": [n for n in notes if n.endswith("created")],
+                "notes": [n for n in notes if not n.endswith("created")],
+                "archived": archived,
+            }
+    return summary
@@ -0,0 +1,204 @@
+# FILE: engine/common/partitions_explain.py  (новое — 2026-10-16)
+# PURPOSE: Регрессионная проверка планов ключевых запросов по sending_log / mailbox_stats (EXPLAIN FORMAT JSON, без ANALYZE).
+#          python -m engine.common.partitions_explain [--campaign-id N] [--min-rows 100000]  -> exit 1 при регрессии.
+#          - анти-join sender-а, parent_send, последние строки кампании, lookup по id:
+#            ни одного Seq Scan по sending_log* (на таблицах меньше --min-rows планировщик вправе читать целиком — пропуск);
+#          - выборки по окну времени: отсечение партиций, читается не больше max_parts партиций.
+#          Формы запросов повторяют core_send/sender.py и web/panel/views.py — при изменении запросов обновлять здесь.
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from engine.common import db
+from engine.common import partitions as pt
+
+
+@dataclass(frozen=True)
+class PlanCheck:
+    name: str
+    sql: str
+    params: Tuple[str, ...]           # имена из контекста: campaign_id, letter_id, since, until
+    no_seq_scan: Tuple[str, ...] = ()  # таблицы (с партициями), где Seq Scan = регрессия
+    max_parts: Optional[Dict[str, int]] = None  # таблица -> максимум читаемых партиций (только партиционированные)
+
+
+CHECKS: Tuple[PlanCheck, ...] = (
+    PlanCheck(
+        name="sender_antijoin",
+        sql="""
+        SELECT sl.aggr_contact_cb_id
+        FROM public.sending_lists sl
+        JOIN public.campaigns_campaigns c ON c.sending_list_id = sl.task_id AND c.id = %s
+        LEFT JOIN public.sending_log lg
+          ON lg.campaign_id = c.id
+         AND lg.aggr_contact_cb_id = sl.aggr_contact_cb_id
+        WHERE COALESCE(sl.removed, false) = false
+          AND lg.id IS NULL
+        ORDER BY sl.rate ASC NULLS LAST, sl.aggr_contact_cb_id ASC
+        LIMIT 200
+        """,
+        params=("campaign_id",),
+        no_seq_scan=("sending_log",),
+    ),
+    PlanCheck(
+        name="parent_send",
+        sql="""
+        SELECT lg.aggr_contact_cb_id, MAX(COALESCE(lg.processed_at, lg.created_at))
+        FROM public.sending_log lg
+        WHERE lg.campaign_id = %s AND lg.processed = true AND lg.status = 'SEND'
+        GROUP BY lg.aggr_contact_cb_id
+        """,
+        params=("campaign_id",),
+        no_seq_scan=("sending_log",),
+    ),
+    PlanCheck(
+        name="recent_rows_by_campaign",
+        sql="""
+        SELECT id FROM (
+            SELECT lg.id, ROW_NUMBER() OVER (
+                PARTITION BY lg.campaign_id ORDER BY COALESCE(lg.processed_at, lg.created_at) DESC, lg.id DESC
+            ) AS rn
+            FROM public.sending_log lg
+            WHERE lg.campaign_id = ANY(ARRAY[%s]::bigint[])
+        ) x
+        WHERE rn <= 3
+        """,
+        params=("campaign_id",),
+        no_seq_scan=("sending_log",),
+    ),
+    PlanCheck(
+        name="sending_log_by_id",
+        sql="SELECT status, processed FROM public.sending_log WHERE id = %s",
+        params=("letter_id",),
+        no_seq_scan=("sending_log",),
+    ),
+    PlanCheck(
+        name="sending_log_window",
+        sql="SELECT COUNT(*) FROM public.sending_log WHERE created_at >= %s AND created_at < %s",
+        params=("since", "until"),
+        max_parts={"sending_log": 2},
+    ),
+    PlanCheck(
+        name="mailbox_stats_window",
+        sql="""
+        SELECT lg.campaign_id, COUNT(*)
+        FROM public.mailbox_stats ms
+        JOIN public.sending_log lg ON lg.id = ms.letter_id
+        WHERE ms.time >= %s AND ms.time < %s
+        GROUP BY lg.campaign_id
+        """,
+        params=("since", "until"),
+        max_parts={"mailbox_stats": 2},
+    ),
+)
+
+
+def _nodes(plan: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    yield plan
+    for sub in plan.get("Plans") or []:
+        yield from _nodes(sub)
+
+
+def _belongs(rel: str, table: str) -> bool:
+    return rel == table or rel.startswith(table + "_p")
+
+
+def evaluate(plan: Dict[str, Any], check: PlanCheck, *, seq_ok: Tuple[str, ...] = ()) -> List[str]:
+    """Проблемы плана (пусто = OK). seq_ok — таблицы, для которых Seq Scan не проверяется (малые)."""
+    problems: List[str] = []
+    scanned: Dict[str, set] = {}
+    for node in _nodes(plan):
+        rel = str(node.get("Relation Name") or "")
+        if not rel:
+            continue
+        for table in check.no_seq_scan:
+            if _belongs(rel, table) and table not in seq_ok and node.get("Node Type") == "Seq Scan":
+                problems.append(f"Seq Scan on {rel}")
+        for table in (check.max_parts or {}):
+            if _belongs(rel, table):
+                scanned.setdefault(table, set()).add(rel)
+    for table, limit in (check.max_parts or {}).items():
+        got = scanned.get(table) or set()
+        if len(got) > int(limit):
+            problems.append(f"{table}: {len(got)} partitions scanned > {limit} ({', '.join(sorted(got))})")
+    return problems
+
+
+def _context(cur: Any, campaign_id: Optional[int]) -> Dict[str, Any]:
+    if campaign_id is None:
+        cur.execute("SELECT campaign_id FROM public.sending_log WHERE campaign_id IS NOT NULL ORDER BY id DESC LIMIT 1")
+        row = cur.fetchone()
+        campaign_id = int(row[0]) if row else 0
+    cur.execute("SELECT COALESCE(MAX(id), 0) FROM public.sending_log")
+    letter_id = int((cur.fetchone() or [0])[0] or 0)
+    until = datetime.now(timezone.utc)
+    return {"campaign_id": int(campaign_id), "letter_id": letter_id, "since": until - timedelta(days=7), "until": until}
+
+
+def _small_tables(cur: Any, min_rows: int) -> Tuple[str, ...]:
+    out: List[str] = []
+    for table in pt.SPECS:
+        cur.execute(
+            """
+            SELECT COALESCE(SUM(GREATEST(c.reltuples, 0)), 0)
+            FROM pg_class c
+            WHERE c.oid = ('public.' || %s)::regclass
+               OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = ('public.' || %s)::regclass)
+            """,
+            [table, table],
+        )
+        if float((cur.fetchone() or [0])[0] or 0) < float(min_rows):
+            out.append(table)
+    return tuple(out)
+
+
+def run(campaign_id: Optional[int] = None, min_rows: int = 100_000, verbose: bool = False) -> int:
+    failed = 0
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            ctx = _context(cur, campaign_id)
+            small = _small_tables(cur, min_rows)
+            partitioned = {t for t in pt.SPECS if pt.is_partitioned(cur, t)}
+            for check in CHECKS:
+                parts_for = [t for t in (check.max_parts or {}) if t in partitioned]
+                if not check.no_seq_scan and not parts_for:
+                    print(f"[EXPLAIN] {check.name}: SKIP (not partitioned)")
+                    continue
+                cur.execute("EXPLAIN (FORMAT JSON) " + check.sql, [ctx[p] for p in check.params])
+                raw = cur.fetchone()[0]
+                doc = json.loads(raw) if isinstance(raw, str) else raw
+                plan = doc[0]["Plan"]
+                eff = PlanCheck(
+                    check.name, check.sql, check.params, check.no_seq_scan,
+                    {t: n for t, n in (check.max_parts or {}).items() if t in partitioned},
+                )
+                problems = evaluate(plan, eff, seq_ok=small)
+                if problems:
+                    failed += 1
+                    print(f"[EXPLAIN] {check.name}: FAIL — {'; '.join(problems)}")
+                    if verbose:
+                        print(json.dumps(plan, indent=2)[:4000])
+                else:
+                    note = f" (seq scans not checked: {', '.join(small)})" if small and check.no_seq_scan else ""
+                    print(f"[EXPLAIN] {check.name}: OK{note}")
+        conn.rollback()
+    return 1 if failed else 0
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--campaign-id", type=int, default=None)
+    ap.add_argument("--min-rows", type=int, default=100_000, help="меньше строк — Seq Scan допустим")
+    ap.add_argument("-v", "--verbose", action="store_true")
+    args = ap.parse_args()
+    sys.exit(run(args.campaign_id, int(args.min_rows), bool(args.verbose)))
+
+
+if __name__ == "__main__":
+    main()
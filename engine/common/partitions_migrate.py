@@ -0,0 +1,252 @@
+# FILE: engine/common/partitions_migrate.py  (новое — 2026-10-16)
+# PURPOSE: Перевод существующей sending_log / mailbox_stats на помесячные партиции (engine.common.partitions).
+#          python -m engine.common.partitions_migrate sending_log [--batch 200000] [--execute]
+#          1) проверки: таблица есть и ещё не партиционирована; внешние ключи НА неё (партиционированный PK
+#             включает ключ времени -> FK на (id) невозможен) и UNIQUE без ключа времени — без флагов стоп;
+#          2) {t}__part (LIKE ... INCLUDING DEFAULTS/CONSTRAINTS/GENERATED) PARTITION BY RANGE, партиции min..now+PREMAKE
+#             (+ DEFAULT по спеке или если есть строки с NULL во времени);
+#          3) копирование пачками по id (каждая пачка — своя транзакция, писатели не блокируются); изменения во время
+#             копирования (INSERT с заранее выделенным id, UPDATE статусов, DELETE) пишет триггер в {t}__mig_changes;
+#          4) индексы спеки на новом родителе;
+#          5) swap в одной транзакции: LOCK old EXCLUSIVE (чтение идёт), хвост + изменённые id, rename old -> {t}_unpartitioned,
+#             {t}__part -> {t}, sequence OWNED BY новая колонка, триггеры campaign_counters на новой таблице.
+#          Старая таблица остаётся ({t}_unpartitioned) — удалить руками после проверки.
+#          Без --execute — только план и проверки.
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from datetime import date, timezone
+from typing import Any, List, Optional, Tuple
+
+from engine.common import campaign_counters, db
+from engine.common import partitions as pt
+
+SCHEMA = pt.SCHEMA
+
+
+def _fetch(cur: Any, sql: str, params: Optional[list] = None) -> list:
+    cur.execute(sql, params or [])
+    return cur.fetchall() or []
+
+
+def referencing_fks(cur: Any, table: str, schema: str = SCHEMA) -> List[Tuple[str, str]]:
+    return [
+        (str(r[0]), str(r[1]))
+        for r in _fetch(
+            cur,
+            """
+            SELECT con.conname, con.conrelid::regclass::text
+            FROM pg_constraint con
+            WHERE con.contype = 'f' AND con.confrelid = (%s || '.' || %s)::regclass
+            """,
+            [schema, table],
+        )
+    ]
+
+
+def unique_without_key(cur: Any, spec: pt.PartitionSpec, schema: str = SCHEMA) -> List[Tuple[str, str]]:
+    """UNIQUE / PK-индексы без ключа партиционирования: на партиционированной таблице их не построить."""
+    out: List[Tuple[str, str]] = []
+    for name, cols, is_pk, defn in _fetch(
+        cur,
+        """
+        SELECT i.relname,
+               ARRAY(SELECT a.attname FROM unnest(x.indkey) k JOIN pg_attribute a
+                     ON a.attrelid = x.indrelid AND a.attnum = k)::text[],
+               x.indisprimary,
+               pg_get_indexdef(x.indexrelid)
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        WHERE x.indrelid = (%s || '.' || %s)::regclass AND x.indisunique
+        """,
+        [schema, spec.table],
+    ):
+        if spec.key in (cols or []):
+            continue
+        if is_pk and list(cols or []) == list(spec.pk):
+            continue  # PK (id) -> PK (id, key) на новой таблице
+        out.append((str(name), str(defn)))
+    return out
+
+
+def _seq_of(cur: Any, table: str, schema: str = SCHEMA) -> Optional[str]:
+    rows = _fetch(cur, "SELECT pg_get_serial_sequence(%s, 'id')", [f"{schema}.{table}"])
+    return str(rows[0][0]) if rows and rows[0][0] else None
+
+
+def _utc_date(ts: Any) -> Optional[date]:
+    if ts is None:
+        return None
+    if getattr(ts, "tzinfo", None) is not None:
+        ts = ts.astimezone(timezone.utc)
+    return ts.date() if hasattr(ts, "date") else ts
+
+
+def _months(lo: date, hi: date) -> List[date]:
+    out: List[date] = []
+    m = pt.month_start(lo)
+    while m <= hi:
+        out.append(m)
+        m = pt.add_months(m, 1)
+    return out
+
+
+def migrate(table: str, *, batch: int = 200_000, execute: bool = False, relax_unique: bool = False,
+            drop_fks: bool = False) -> int:
+    spec = pt.SPECS[table]
+    t, new, old = spec.table, f"{spec.table}__part", f"{spec.table}_unpartitioned"
+    chg = f"{spec.table}__mig_changes"
+
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            if pt.is_partitioned(cur, t):
+                print(f"[PART] {t}: already partitioned")
+                return 0
+            fks = referencing_fks(cur, t)
+            uniq = unique_without_key(cur, spec)
+            lo_ts, hi_ts, min_id, max_id, null_keys = _fetch(
+                cur,
+                f"SELECT min({spec.key}), max({spec.key}), min(id), max(id), COUNT(*) FILTER (WHERE {spec.key} IS NULL) "
+                f"FROM {SCHEMA}.{t}",
+            )[0]
+            seq = _seq_of(cur, t)
+        conn.commit()
+
+        today = time.gmtime()
+        lo = _utc_date(lo_ts) or date(today.tm_year, today.tm_mon, 1)
+        hi = pt.add_months(date(today.tm_year, today.tm_mon, 1), pt.PREMAKE_MONTHS)
+        if hi_ts and _utc_date(hi_ts) > hi:
+            hi = _utc_date(hi_ts)
+        months = _months(lo, hi)
+
+        print(
+            f"[PART] {t}: key={spec.key} ids={min_id}..{max_id} months={months[0]}..{months[-1]} ({len(months)}) "
+            f"seq={seq} null_keys={null_keys}"
+        )
+        for name, src in fks:
+            print(f"[PART]   FK {name} on {src} -> {t}: {'will be dropped' if drop_fks else 'BLOCKS migration (--drop-fks)'}")
+        for name, defn in uniq:
+            print(f"[PART]   {defn}: {'becomes non-unique' if relax_unique else 'BLOCKS migration (--relax-unique)'}")
+        if (fks and not drop_fks) or (uniq and not relax_unique):
+            return 2
+        if not execute:
+            print("[PART] dry run, pass --execute")
+            return 0
+
+        with conn.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {SCHEMA}.{new}")
+            cur.execute(
+                f"CREATE TABLE {SCHEMA}.{new} (LIKE {SCHEMA}.{t} INCLUDING DEFAULTS INCLUDING CONSTRAINTS "
+                f"INCLUDING GENERATED) PARTITION BY RANGE ({spec.key})"
+            )
+            cur.execute(f"ALTER TABLE {SCHEMA}.{new} ADD PRIMARY KEY ({', '.join(spec.pk + (spec.key,))})")
+            if spec.with_default or null_keys:
+                # строки с NULL во времени может принять только DEFAULT
+                cur.execute(f"CREATE TABLE {SCHEMA}.{pt.default_name(t)}__m PARTITION OF {SCHEMA}.{new} DEFAULT")
+            for m in months:
+                cur.execute(pt.create_partition_sql(spec, m, name=f"{pt.partition_name(t, m)}__m", parent=new))
+            cur.execute(f"DROP TABLE IF EXISTS {SCHEMA}.{chg}")
+            cur.execute(f"CREATE UNLOGGED TABLE {SCHEMA}.{chg} (id bigint NOT NULL)")
+            cur.execute(
+                f"""
+                CREATE OR REPLACE FUNCTION {SCHEMA}.{chg}_fn() RETURNS trigger LANGUAGE plpgsql AS $fn$
+                BEGIN
+                    INSERT INTO {SCHEMA}.{chg} (id) VALUES (CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END);
+                    RETURN NULL;
+                END
+                $fn$
+                """
+            )
+            cur.execute(
+                f"CREATE TRIGGER {chg} AFTER INSERT OR UPDATE OR DELETE ON {SCHEMA}.{t} "
+                f"FOR EACH ROW EXECUTE FUNCTION {SCHEMA}.{chg}_fn()"
+            )
+        conn.commit()
+
+        copied = 0
+        last = int(min_id or 1) - 1
+        top = int(max_id or 0)
+        t0 = time.perf_counter()
+        while last < top:
+            nxt = min(top, last + int(batch))
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"INSERT INTO {SCHEMA}.{new} SELECT * FROM {SCHEMA}.{t} WHERE id > %s AND id <= %s", [last, nxt]
+                )
+                copied += int(cur.rowcount or 0)
+            conn.commit()
+            last = nxt
+            print(f"[PART] {t}: copied {copied} rows, id<={last} ({time.perf_counter() - t0:.0f}s)")
+
+        with conn.cursor() as cur:
+            for name, body in spec.indexes:
+                cur.execute(f"CREATE INDEX IF NOT EXISTS m_{name} ON {SCHEMA}.{new} {body}")
+            for name, defn in uniq:
+                cur.execute(
+                    defn.replace("CREATE UNIQUE INDEX ", "CREATE INDEX m_", 1)
+                    .replace(f" ON {SCHEMA}.{t} ", f" ON {SCHEMA}.{new} ", 1)
+                )
+            cur.execute(f"ANALYZE {SCHEMA}.{new}")
+        conn.commit()
+
+        # swap: запись блокируется на время хвоста + rename, чтение продолжается
+        with conn.cursor() as cur:
+            cur.execute(f"LOCK TABLE {SCHEMA}.{t} IN EXCLUSIVE MODE")
+            cur.execute(f"DROP TRIGGER {chg} ON {SCHEMA}.{t}")
+            cur.execute(f"SELECT DISTINCT id FROM {SCHEMA}.{chg} WHERE id <= %s", [last])
+            changed = [int(r[0]) for r in cur.fetchall() or []]
+            if changed:
+                cur.execute(f"DELETE FROM {SCHEMA}.{new} WHERE id = ANY(%s)", [changed])
+                cur.execute(f"INSERT INTO {SCHEMA}.{new} SELECT * FROM {SCHEMA}.{t} WHERE id = ANY(%s)", [changed])
+            cur.execute(f"INSERT INTO {SCHEMA}.{new} SELECT * FROM {SCHEMA}.{t} WHERE id > %s", [last])
+            tail = int(cur.rowcount or 0)
+            cur.execute(f"DROP TABLE {SCHEMA}.{chg}")
+            cur.execute(f"DROP FUNCTION {SCHEMA}.{chg}_fn()")
+
+            for name, src in fks:
+                cur.execute(f"ALTER TABLE {src} DROP CONSTRAINT {name}")
+            cur.execute(f"ALTER TABLE {SCHEMA}.{t} RENAME TO {old}")
+            cur.execute(f"ALTER TABLE {SCHEMA}.{new} RENAME TO {t}")
+            for name, _lo, _hi in pt.list_partitions(cur, t):
+                if name.endswith("__m"):
+                    cur.execute(f"ALTER TABLE {SCHEMA}.{name} RENAME TO {name[:-3]}")
+            for idx_name in [n for n, _b in spec.indexes] + [n for n, _d in uniq]:
+                cur.execute(f"ALTER INDEX IF EXISTS {SCHEMA}.{idx_name} RENAME TO {idx_name}_unpartitioned")
+                cur.execute(f"ALTER INDEX IF EXISTS {SCHEMA}.m_{idx_name} RENAME TO {idx_name}")
+            if seq:
+                cur.execute(f"ALTER SEQUENCE {seq} OWNED BY {SCHEMA}.{t}.id")
+            # триггеры остались на старой таблице; новые ставим только сейчас — скопированные строки уже посчитаны
+            campaign_counters.install_schema(cur)
+        conn.commit()
+
+    print(
+        f"[PART] {t}: swapped, copied={copied}, tail={tail}, changed_during_copy={len(changed)}; "
+        f"old table kept as {SCHEMA}.{old}"
+    )
+    return 0
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("table", choices=sorted(pt.SPECS))
+    ap.add_argument("--batch", type=int, default=200_000)
+    ap.add_argument("--execute", action="store_true")
+    ap.add_argument("--relax-unique", action="store_true", help="UNIQUE без ключа времени -> обычный индекс")
+    ap.add_argument("--drop-fks", action="store_true", help="снять FK, ссылающиеся на таблицу")
+    args = ap.parse_args()
+    sys.exit(
+        migrate(
+            args.table,
+            batch=int(args.batch),
+            execute=bool(args.execute),
+            relax_unique=bool(args.relax_unique),
+            drop_fks=bool(args.drop_fks),
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
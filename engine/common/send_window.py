@@ -0,0 +1,342 @@
+# FILE: engine/common/send_window.py  (новое — 2026-10-16)
+# PURPOSE: Скомпилированный календарь окна отправки.
+#          JSON-окно ({"mon": [{"from": "09:00", "to": "17:00"}], ..., "hol": [...]}, время Europe/Berlin,
+#          праздник DE -> ключ "hol") разворачивается на HORIZON_DAYS вперёд в отсортированный список
+#          UTC-границ [open, close, open, close, ...] (слоты слиты) -> is_open / next_open / next_close за O(log n).
+#          Минуты по дням считаются как раньше (сумма валидных слотов, без слияния) — для интервалов status-процессора.
+#          calendar_for(): кэш в процессе по (хэш окна, сегодняшний день Berlin) — кампании с общим окном
+#          workspace / global делят один календарь; смена дня = новый ключ. Тот же dict окна (общий объект
+#          workspace / global внутри тика) узнаётся по identity без повторного json-хэша; окна не мутируются.
+#          effective_window() / load_*_window(s)() / campaign_calendars(): эффективное окно кампании
+#          (campaign -> workspace -> global, кэш в Redis — ключи сбрасывает aap_settings) — общее для status и sender.
+
+from __future__ import annotations
+
+import hashlib
+import json
+import random
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from engine.common.cache.client import CLIENT
+from engine.common.db import fetch_all, fetch_one
+from engine.common.email_template import _is_de_public_holiday
+
+TZ_BERLIN = ZoneInfo("Europe/Berlin")
+HORIZON_DAYS = 15  # сегодня + 14 дней (как lookahead в core_status)
+_DAY_KEYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+
+_CACHE: Dict[Tuple[str, date], "WindowCalendar"] = {}
+_BY_OBJ: Dict[int, Tuple[object, "WindowCalendar"]] = {}  # id(dict) -> (dict, cal): общий dict окна без повторного хэша
+_CACHE_DAY: Optional[date] = None
+_CACHE_LOCK = threading.Lock()
+_CACHE_MAX = 4096
+_WINDOW_CACHE_TTL_MIN_SEC = 8 * 60
+_WINDOW_CACHE_TTL_MAX_SEC = 12 * 60
+
+
+def parse_hhmm_to_minutes(value: str) -> Optional[int]:
+    try:
+        raw = str(value or "").strip()
+        if ":" not in raw:
+            return None
+        h, m = raw.split(":", 1)
+        hh = int(h)
+        mm = int(m)
+        if hh < 0 or hh > 23 or mm < 0 or mm > 59:
+            return None
+        return int(hh * 60 + mm)
+    except Exception:
+        return None
+
+
+def iter_slots(slots_obj: Any) -> Iterable[Tuple[str, str]]:
+    if not isinstance(slots_obj, list):
+        return []
+    out: list[Tuple[str, str]] = []
+    for item in slots_obj:
+        if isinstance(item, dict):
+            a = str(item.get("from") or "").strip()
+            b = str(item.get("to") or "").strip()
+            if a and b:
+                out.append((a, b))
+            continue
+        if isinstance(item, (list, tuple)) and len(item) == 2:
+            a = str(item[0] or "").strip()
+            b = str(item[1] or "").strip()
+            if a and b:
+                out.append((a, b))
+    return out
+
+
+def day_key_for_date(day_value: date) -> str:
+    if _is_de_public_holiday(day_value):
+        return "hol"
+    return _DAY_KEYS[day_value.weekday()]
+
+
+def _day_slots(window_obj: dict, day_value: date) -> Tuple[Tuple[int, int], ...]:
+    out: list[Tuple[int, int]] = []
+    for a_str, b_str in iter_slots(window_obj.get(day_key_for_date(day_value), [])):
+        a = parse_hhmm_to_minutes(a_str)
+        b = parse_hhmm_to_minutes(b_str)
+        if a is None or b is None or b <= a:
+            continue
+        out.append((int(a), int(b)))
+    return tuple(out)
+
+
+def _local_ts(day_value: date, minutes: int) -> float:
+    return datetime(
+        day_value.year, day_value.month, day_value.day, int(minutes) // 60, int(minutes) % 60, tzinfo=TZ_BERLIN
+    ).timestamp()
+
+
+def window_hash(window_obj: object) -> str:
+    if not isinstance(window_obj, dict) or not window_obj:
+        return ""
+    raw = json.dumps(window_obj, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class WindowCalendar:
+    """Окно, развёрнутое на [start_day, start_day + days) по Berlin; границы — UTC epoch."""
+
+    __slots__ = ("start_day", "days", "bounds", "day_slots", "open_days")
+
+    def __init__(self, window_obj: object, start_day: date, days: int = HORIZON_DAYS) -> None:
+        self.start_day = start_day
+        self.days = max(1, int(days))
+        self.day_slots: Dict[date, Tuple[Tuple[int, int], ...]] = {}
+        self.open_days: List[date] = []
+
+        spans: list[Tuple[float, float]] = []
+        if isinstance(window_obj, dict):
+            for offset in range(self.days):
+                day_value = start_day + timedelta(days=offset)
+                slots = _day_slots(window_obj, day_value)
+                if not slots:
+                    continue
+                self.day_slots[day_value] = slots
+                self.open_days.append(day_value)
+                for a, b in slots:
+                    # b = 24:00 невозможно (to <= 23:59), так что граница всегда внутри дня
+                    t0, t1 = _local_ts(day_value, a), _local_ts(day_value, b)
+                    if t1 > t0:
+                        spans.append((t0, t1))
+
+        spans.sort()
+        bounds: List[float] = []
+        for t0, t1 in spans:
+            if bounds and t0 <= bounds[-1]:
+                if t1 > bounds[-1]:
+                    bounds[-1] = t1
+                continue
+            bounds.append(t0)
+            bounds.append(t1)
+        self.bounds = bounds
+
+    # ---- точка во времени ----
+
+    def is_open(self, ts: float) -> bool:
+        return bisect_right(self.bounds, float(ts)) % 2 == 1
+
+    def next_open(self, ts: float) -> Optional[float]:
+        """ts, если окно открыто; иначе ближайшее открытие в горизонте (None — нет)."""
+        i = bisect_right(self.bounds, float(ts))
+        if i % 2 == 1:
+            return float(ts)
+        return self.bounds[i] if i < len(self.bounds) else None
+
+    def next_close(self, ts: float) -> Optional[float]:
+        """Закрытие текущего открытого интервала (None — сейчас закрыто)."""
+        i = bisect_right(self.bounds, float(ts))
+        return self.bounds[i] if i % 2 == 1 else None
+
+    # ---- дни (Berlin) ----
+
+    def minutes_on(self, day_value: date) -> int:
+        return int(sum(b - a for a, b in self.day_slots.get(day_value, ())))
+
+    def remaining_minutes(self, now_de: datetime) -> int:
+        cur = int(now_de.hour * 60 + now_de.minute)
+        total = 0
+        for a, b in self.day_slots.get(now_de.date(), ()):
+            if cur >= b:
+                continue
+            total += int(b - max(int(a), cur))
+        return int(total)
+
+    def first_open_day(self, day_from: date, day_to: date) -> Tuple[Optional[date], int]:
+        """Первый день с окном в [day_from, day_to] -> (день, минуты) | (None, 0)."""
+        i = bisect_left(self.open_days, day_from)
+        if i < len(self.open_days) and self.open_days[i] <= day_to:
+            d = self.open_days[i]
+            return (d, self.minutes_on(d))
+        return (None, 0)
+
+    def open_days_between(self, day_from: date, day_to: date) -> List[Tuple[date, int]]:
+        i = bisect_left(self.open_days, day_from)
+        j = bisect_right(self.open_days, day_to)
+        return [(d, self.minutes_on(d)) for d in self.open_days[i:j]]
+
+
+def calendar_for(window_obj: object, *, today: Optional[date] = None) -> WindowCalendar:
+    global _CACHE_DAY
+    day = today or datetime.now(tz=TZ_BERLIN).date()
+    hit = _BY_OBJ.get(id(window_obj))
+    if hit is not None and hit[0] is window_obj and hit[1].start_day == day:
+        return hit[1]
+    key = (window_hash(window_obj), day)
+    cal = _CACHE.get(key)
+    if cal is None:
+        cal = WindowCalendar(window_obj if key[0] else {}, day)
+    with _CACHE_LOCK:
+        if _CACHE_DAY != day or len(_CACHE) >= _CACHE_MAX:
+            _CACHE.clear()
+            _BY_OBJ.clear()
+            _CACHE_DAY = day
+        if len(_BY_OBJ) >= _CACHE_MAX:
+            _BY_OBJ.clear()
+        _CACHE[key] = cal
+        _BY_OBJ[id(window_obj)] = (window_obj, cal)
+    return cal
+
+
+# -------------------- effective window: campaign -> workspace -> global --------------------
+
+
+def _ws_window_cache_key(workspace_id: str) -> str:
+    return f"core_status:campaign:window:ws:{str(workspace_id)}"
+
+
+def _global_window_cache_key() -> str:
+    return "core_status:campaign:window:global"
+
+
+def _window_cache_get(key: str) -> Optional[dict[str, Any]]:
+    raw = CLIENT.get(str(key), ttl_sec=_WINDOW_CACHE_TTL_MIN_SEC, l1=True)
+    if raw is None:
+        return None
+    try:
+        parsed = json.loads(bytes(raw).decode("utf-8", errors="replace"))
+    except Exception:
+        return None
+    return parsed if isinstance(parsed, dict) else None
+
+
+def _window_cache_set(key: str, payload: dict[str, Any]) -> None:
+    try:
+        CLIENT.set(
+            str(key),
+            json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+            ttl_sec=random.randint(_WINDOW_CACHE_TTL_MIN_SEC, _WINDOW_CACHE_TTL_MAX_SEC),
+        )
+    except Exception:
+        pass
+
+
+def _window_is_nonempty(window_obj: object) -> bool:
+    if not isinstance(window_obj, dict):
+        return False
+    for value in window_obj.values():
+        if isinstance(value, list) and len(value) > 0:
+            return True
+    return False
+
+
+def effective_window(campaign_window: object, workspace_window: object, global_window: object) -> dict[str, Any]:
+    if _window_is_nonempty(campaign_window):
+        return campaign_window if isinstance(campaign_window, dict) else {}
+    if _window_is_nonempty(workspace_window):
+        return workspace_window if isinstance(workspace_window, dict) else {}
+    if _window_is_nonempty(global_window):
+        return global_window if isinstance(global_window, dict) else {}
+    return {}
+
+
+def load_global_window() -> dict[str, Any]:
+    cache_key = _global_window_cache_key()
+    cached = _window_cache_get(cache_key)
+    if cached is not None:
+        return cached
+
+    row = fetch_one(
+        """
+        SELECT global_global_window
+        FROM public.aap_settings_global_sending_settings
+        WHERE singleton_key = 1
+        LIMIT 1
+        """,
+        [],
+    )
+    value = row[0] if row and isinstance(row[0], dict) else {}
+    payload = value if isinstance(value, dict) else {}
+    _window_cache_set(cache_key, payload)
+    return payload
+
+
+def load_workspace_windows(workspace_ids: Iterable[str]) -> dict[str, dict[str, Any]]:
+    ws_ids = sorted({str(x) for x in workspace_ids if str(x or "").strip()})
+    out: dict[str, dict[str, Any]] = {}
+    missing: list[str] = []
+
+    for ws_id in ws_ids:
+        cached = _window_cache_get(_ws_window_cache_key(ws_id))
+        if cached is None:
+            missing.append(ws_id)
+            continue
+        out[ws_id] = cached
+
+    if missing:
+        rows = fetch_all(
+            """
+            SELECT workspace_id::text, value_json
+            FROM public.aap_settings_sending_settings
+            WHERE workspace_id::text = ANY(%s)
+            """,
+            [missing],
+        )
+        fetched_ids: set[str] = set()
+        for ws_id, value_json in rows:
+            ws_key = str(ws_id or "").strip()
+            if not ws_key:
+                continue
+            payload = value_json if isinstance(value_json, dict) else {}
+            out[ws_key] = payload
+            _window_cache_set(_ws_window_cache_key(ws_key), payload)
+            fetched_ids.add(ws_key)
+
+        for ws_id in missing:
+            if ws_id in fetched_ids:
+                continue
+            out[ws_id] = {}
+            _window_cache_set(_ws_window_cache_key(ws_id), {})
+
+    return out
+
+
+def campaign_calendars(campaign_ids: Iterable[int]) -> dict[int, WindowCalendar]:
+    """{campaign_id: календарь эффективного окна (campaign -> workspace -> global)} для sender-а."""
+    ids = sorted({int(x) for x in campaign_ids if int(x) > 0})
+    if not ids:
+        return {}
+    rows = fetch_all(
+        """
+        SELECT c.id::bigint, c.workspace_id::text, c.window
+        FROM public.campaigns_campaigns c
+        WHERE c.id = ANY(%s)
+        """,
+        [ids],
+    )
+    ws_windows = load_workspace_windows(str(row[1] or "").strip() for row in rows)
+    global_window = load_global_window()
+    out: dict[int, WindowCalendar] = {}
+    for campaign_id, workspace_id, campaign_window in rows:
+        camp_window = campaign_window if isinstance(campaign_window, dict) else {}
+        ws_window = ws_windows.get(str(workspace_id or "").strip(), {})
+        out[int(campaign_id)] = calendar_for(effective_window(camp_window, ws_window, global_window))
+    return out
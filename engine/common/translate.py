@@ -1,5 +1,5 @@
 # FILE: engine/common/translate.py
-# DATE: 2026-04-12
+# DATE: 2026-10-16
 # PURPOSE: Global translation helpers for prompts/text: get_prompt and translate_text.
 
 from __future__ import annotations
@@ -26,6 +26,7 @@ TRANSLATION_VERIFY_SYSTEM = (
 TRANSLATION_CACHE_VERSION = "translation.checked.v1"
 MIN_TRANSLATION_CACHE_DAYS = 7
 MAX_TRANSLATION_CACHE_DAYS = 21
+TRANSLATION_L1_TTL_SEC = 60 * 60  # ключ = hash(model, instructions, input) -> значение не меняется, держим в L1 долго
 
 LANG_MAP = {
     "en": "English",
@@ -75,7 +76,7 @@ def _translation_cache_key(*, model: str, instructions: str, input_text: str) ->
 
 
 def _translation_cache_get(key: str) -> str | None:
-    payload = CLIENT.get(key, ttl_sec=DEFAULT_TTL_SEC)
+    payload = CLIENT.get(key, ttl_sec=DEFAULT_TTL_SEC, l1=True, l1_ttl=TRANSLATION_L1_TTL_SEC)
     if payload is None:
         return None
     try:
@@ -1,24 +1,40 @@
-# FILE: engine/common/worker.py  (обновлено — 2025-12-19)
+# FILE: engine/common/worker.py  (обновлено — 2026-10-16)
 # Смысл: тикер-планировщик задач. Фикс: больше не плодим зомби — всегда делаем proc.join() для завершившихся/убитых задач,
 # и аккуратно закрываем Queue (close/join_thread).
+# CHANGE: resident-режим (опционально, per-task): задача живёт в долгоживущем дочернем процессе и получает "run" по Pipe,
+#         вместо Process+Queue на каждый запуск. Таймаут = kill + respawn на следующем запуске; singleton/heavy — как раньше.
+#         Статистика по задачам: p50/p95 длительности, лаг очереди (старт - due), overrun (длительность > every_sec).
+# CHANGE: event-driven цикл вместо тиков: heap по _next_run_at + multiprocessing.connection.wait на sentinel-ах
+#         процессов (и Pipe resident-ов) -> старт ровно в due, разбор завершения/таймаута сразу, в простое не крутимся.
+#         tick_sec теперь: шаг разгона копий non-singleton задачи и пауза после исключения цикла.
 
 from __future__ import annotations
 
+import heapq
 import json
 import os
 import signal
 import sys
 import time
 import traceback
-from dataclasses import dataclass
+from collections import deque
+from dataclasses import dataclass, field
 from datetime import datetime
-from multiprocessing import Process, Queue
-from typing import Any, Callable, Dict, Optional
+from multiprocessing import Pipe, Process, Queue
+from multiprocessing.connection import Connection, wait
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
 from zoneinfo import ZoneInfo
 
 
 _TZ_BERLIN = ZoneInfo("Europe/Berlin")
 
+# resident: после стольких запусков дочерний процесс пересоздаётся (утечки памяти / разросшиеся module-кэши)
+RESIDENT_MAX_RUNS = 500
+RESIDENT_STOP_WAIT_SEC = 2.0
+
+STATS_WINDOW = 200  # последние N запусков для p50/p95
+STATS_LOG_EVERY_SEC = 300.0
+
 
 def _now_ts() -> float:
     return time.time()
@@ -40,6 +56,15 @@ def _safe_json(obj: Any, max_len: int = 4000) -> str:
     return s
 
 
+def _pct(values: List[float], q: float) -> float:
+    # nearest-rank
+    if not values:
+        return 0.0
+    xs = sorted(values)
+    idx = min(len(xs) - 1, max(0, int(round(q * (len(xs) - 1)))))
+    return float(xs[idx])
+
+
 @dataclass
 class TaskSpec:
     name: str
@@ -50,16 +75,58 @@ class TaskSpec:
     heavy: bool = False
     priority: int = 50  # меньше = раньше
     jitter_sec: int = 0  # +-рандом не делаем специально (без random), но поле оставлено
+    resident: bool = False  # только для singleton; иначе fork-per-run
+
+
+@dataclass
+class ResidentChild:
+    proc: Process
+    conn: Connection  # parent end
+    spawned_at: float
+    runs: int = 0
+    pid: int = 0
 
 
 @dataclass
 class RunningTask:
     spec: TaskSpec
     proc: Process
-    q: Queue
+    q: Optional[Queue]  # None в resident-режиме (результат идёт по Pipe)
     started_at: float
     deadline_at: Optional[float]
     pid: int = 0
+    resident: Optional[ResidentChild] = None
+
+
+@dataclass
+class TaskStats:
+    runs: int = 0
+    ok: int = 0
+    failed: int = 0
+    empty: int = 0
+    timeouts: int = 0
+    overruns: int = 0
+    spawns: int = 0
+    durations_ms: Deque[float] = field(default_factory=lambda: deque(maxlen=STATS_WINDOW))
+    lags_ms: Deque[float] = field(default_factory=lambda: deque(maxlen=STATS_WINDOW))
+
+    def summary(self) -> Dict[str, Any]:
+        d = list(self.durations_ms)
+        lg = list(self.lags_ms)
+        return {
+            "runs": self.runs,
+            "ok": self.ok,
+            "failed": self.failed,
+            "empty": self.empty,
+            "timeouts": self.timeouts,
+            "overruns": self.overruns,
+            "spawns": self.spawns,
+            "duration_p50_ms": int(_pct(d, 0.50)),
+            "duration_p95_ms": int(_pct(d, 0.95)),
+            "lag_p50_ms": int(_pct(lg, 0.50)),
+            "lag_p95_ms": int(_pct(lg, 0.95)),
+            "lag_max_ms": int(max(lg)) if lg else 0,
+        }
 
 
 class Worker:
@@ -70,19 +137,34 @@ class Worker:
         tick_sec: float = 0.5,
         log_path: Optional[str] = None,
         name: str = "worker",
+        resident: bool = False,
     ):
         self.max_parallel = int(max_parallel)
         self.tick_sec = float(tick_sec)
         self.log_path = log_path
         self.name = name
+        self.resident = bool(resident)  # дефолт для register(resident=None)
 
         self._specs: Dict[str, TaskSpec] = {}
         self._next_run_at: Dict[str, float] = {}
+        # (due_at, priority, name, ver): ленивое удаление — запись с устаревшим ver игнорируется
+        self._heap: List[Tuple[float, int, str, int]] = []
+        self._heap_ver: Dict[str, int] = {}
+        self._ready: Dict[str, TaskSpec] = {}  # due, ждут слота (parallel / heavy / singleton)
         self._running: Dict[str, RunningTask] = {}  # by task name (singleton)
         self._stop = False
 
         self._heavy_running_name: Optional[str] = None  # task name
 
+        self._residents: Dict[str, ResidentChild] = {}  # by task name
+        self._stats: Dict[str, TaskStats] = {}
+        self._stats_logged_at = _now_ts()
+
+        # self-pipe: сигнал/stop() будит wait() сразу
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+
         # чтобы корректно останавливаться
         signal.signal(signal.SIGTERM, self._handle_stop)
         signal.signal(signal.SIGINT, self._handle_stop)
@@ -99,6 +181,7 @@ class Worker:
         singleton: bool = True,
         heavy: bool = False,
         priority: int = 50,
+        resident: Optional[bool] = None,
     ) -> None:
         if not name or not isinstance(name, str):
             raise ValueError("name must be non-empty str")
@@ -115,9 +198,11 @@ class Worker:
             singleton=bool(singleton),
             heavy=bool(heavy),
             priority=int(priority),
+            resident=bool(self.resident if resident is None else resident) and bool(singleton),
         )
         self._specs[name] = spec
-        self._next_run_at[name] = _now_ts()  # можно стартовать сразу
+        self._set_next_run(name, _now_ts())  # можно стартовать сразу
+        self._stats[name] = TaskStats()
 
         self._log(
             "registered",
@@ -128,6 +213,7 @@ class Worker:
                 "singleton": spec.singleton,
                 "heavy": spec.heavy,
                 "priority": spec.priority,
+                "resident": spec.resident,
             },
         )
 
@@ -140,6 +226,7 @@ class Worker:
         singleton: bool = True,
         heavy: bool = False,
         priority: int = 50,
+        resident: Optional[bool] = None,
     ):
         def _wrap(fn: Callable[[], Any]):
             self.register(
@@ -150,6 +237,7 @@ class Worker:
                 singleton=singleton,
                 heavy=heavy,
                 priority=priority,
+                resident=resident,
             )
             return fn
 
@@ -157,6 +245,10 @@ class Worker:
 
     def stop(self) -> None:
         self._stop = True
+        self._wake()
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: st.summary() for name, st in self._stats.items()}
 
     def run_forever(self) -> None:
         self._log("start", {"worker": self.name, "pid": os.getpid(), "tasks": len(self._specs)})
@@ -165,16 +257,81 @@ class Worker:
                 self._collect_finished()
                 self._kill_timeouts()
                 self._schedule_starts()
+                self._log_stats_due()
+                self._wait_events(self._next_wake_at())
             except Exception:
                 # тикер не умирает никогда
                 self._log("ticker_exception", {"traceback": traceback.format_exc()})
-            time.sleep(self.tick_sec)
+                time.sleep(self.tick_sec)
+        self._stop_residents()
+        self._log("stats", {"tasks": self.stats()})
         self._log("stop", {"worker": self.name})
 
     # -------------------- internals --------------------
 
     def _handle_stop(self, *_args):
         self._stop = True
+        self._wake()
+
+    def _wake(self) -> None:
+        try:
+            os.write(self._wake_w, b"x")
+        except OSError:
+            pass  # pipe полон -> wait() и так проснётся
+
+    def _set_next_run(self, name: str, ts: float) -> None:
+        self._next_run_at[name] = ts
+        self._ready.pop(name, None)
+        self._recheck_at(name, ts)
+
+    def _recheck_at(self, name: str, ts: float) -> None:
+        ver = self._heap_ver.get(name, 0) + 1
+        self._heap_ver[name] = ver
+        heapq.heappush(self._heap, (ts, self._specs[name].priority, name, ver))
+
+    def _heap_top(self) -> Optional[Tuple[float, int, str, int]]:
+        while self._heap:
+            top = self._heap[0]
+            if self._heap_ver.get(top[2]) == top[3]:
+                return top
+            heapq.heappop(self._heap)
+        return None
+
+    def _promote_due(self, now: float) -> None:
+        while True:
+            top = self._heap_top()
+            if top is None or top[0] > now:
+                return
+            heapq.heappop(self._heap)
+            self._ready[top[2]] = self._specs[top[2]]
+
+    def _next_wake_at(self) -> Optional[float]:
+        # ready-задачи, ждущие слота, будит завершение running (sentinel), отдельный таймер не нужен
+        cands: List[float] = [self._stats_logged_at + STATS_LOG_EVERY_SEC]
+        top = self._heap_top()
+        if top is not None:
+            cands.append(top[0])
+        for rt in self._running.values():
+            if rt.deadline_at is not None:
+                cands.append(rt.deadline_at)
+        return min(cands)
+
+    def _wait_events(self, wake_at: Optional[float]) -> None:
+        objs: List[Any] = [self._wake_r]
+        for rt in self._running.values():
+            objs.append(rt.proc.sentinel)
+            if rt.resident is not None:
+                objs.append(rt.resident.conn)
+        timeout = None if wake_at is None else max(0.0, wake_at - _now_ts())
+        if self._stop:
+            return
+        ready = wait(objs, timeout=timeout)
+        if self._wake_r in ready:
+            try:
+                while os.read(self._wake_r, 4096):
+                    pass
+            except (BlockingIOError, OSError):
+                pass
 
     def _can_start_anything(self) -> bool:
         # heavy running => не стартуем ничего нового
@@ -184,27 +341,22 @@ class Worker:
         return len(self._running)
 
     def _due_specs(self) -> list[TaskSpec]:
-        now = _now_ts()
-        specs: list[TaskSpec] = []
-        for name, spec in self._specs.items():
-            if self._next_run_at.get(name, 0) <= now:
-                specs.append(spec)
+        self._promote_due(_now_ts())
         # приоритет: меньше раньше, потом по имени (стабильно)
-        specs.sort(key=lambda s: (s.priority, s.name))
-        return specs
+        return sorted(self._ready.values(), key=lambda s: (s.priority, s.name))
 
     def _schedule_starts(self) -> None:
         if not self._specs:
             return
 
-        # лимит параллельности
-        if self._running_count() >= self.max_parallel:
-            return
-
         due = self._due_specs()
         if not due:
             return
 
+        # лимит параллельности
+        if self._running_count() >= self.max_parallel:
+            return
+
         for spec in due:
             # heavy блокирует старты
             if not self._can_start_anything():
@@ -218,7 +370,7 @@ class Worker:
             if spec.heavy:
                 if self._running_count() >= self.max_parallel:
                     return
-                started = self._start_task(spec)
+                started = self._start_and_unready(spec)
                 if started:
                     self._heavy_running_name = spec.name
                 return  # heavy стартанул => больше ничего не стартуем
@@ -226,9 +378,20 @@ class Worker:
             # обычные: стартуем пока есть место
             if self._running_count() >= self.max_parallel:
                 return
-            self._start_task(spec)
+            self._start_and_unready(spec)
+
+    def _start_and_unready(self, spec: TaskSpec) -> bool:
+        self._ready.pop(spec.name, None)
+        started = self._start_task(spec)
+        if started and not spec.singleton:
+            # non-singleton остаётся due до завершения копии: следующая копия — не раньше чем через tick_sec (как при тиках)
+            self._recheck_at(spec.name, _now_ts() + self.tick_sec)
+        return started
 
     def _start_task(self, spec: TaskSpec) -> bool:
+        if spec.resident:
+            return self._start_resident_run(spec)
+
         q: Queue = Queue(maxsize=1)
         started_at = _now_ts()
         deadline_at = (started_at + spec.timeout_sec) if spec.timeout_sec else None
@@ -242,7 +405,7 @@ class Worker:
             proc.start()
         except Exception:
             self._log("start_failed", {"task": spec.name, "error": traceback.format_exc()})
-            self._next_run_at[spec.name] = started_at + spec.every_sec
+            self._set_next_run(spec.name, started_at + spec.every_sec)
             return False
 
         rt = RunningTask(
@@ -259,35 +422,191 @@ class Worker:
             # если singleton=False — уникализируем ключ по pid
             self._running[f"{spec.name}#{rt.pid}"] = rt
 
+        self._stats[spec.name].spawns += 1
+        self._note_started(spec, started_at)
         self._log("started", {"task": spec.name, "pid": rt.pid, "heavy": spec.heavy, "timeout_sec": spec.timeout_sec})
         return True
 
+    def _start_resident_run(self, spec: TaskSpec) -> bool:
+        started_at = _now_ts()
+        try:
+            child = self._ensure_resident(spec)
+            child.conn.send("run")
+        except Exception:
+            self._log("start_failed", {"task": spec.name, "resident": True, "error": traceback.format_exc()})
+            self._drop_resident(spec.name)
+            self._set_next_run(spec.name, started_at + spec.every_sec)
+            return False
+
+        child.runs += 1
+        self._running[spec.name] = RunningTask(
+            spec=spec,
+            proc=child.proc,
+            q=None,
+            started_at=started_at,
+            deadline_at=(started_at + spec.timeout_sec) if spec.timeout_sec else None,
+            pid=child.pid,
+            resident=child,
+        )
+        self._note_started(spec, started_at)
+        self._log(
+            "started",
+            {
+                "task": spec.name,
+                "pid": child.pid,
+                "heavy": spec.heavy,
+                "timeout_sec": spec.timeout_sec,
+                "resident": True,
+                "resident_run": child.runs,
+            },
+        )
+        return True
+
+    def _ensure_resident(self, spec: TaskSpec) -> ResidentChild:
+        child = self._residents.get(spec.name)
+        if child is not None and child.proc.is_alive() and child.runs < RESIDENT_MAX_RUNS:
+            return child
+        if child is not None:
+            self._drop_resident(spec.name)
+
+        parent_conn, child_conn = Pipe(duplex=True)
+        proc = Process(
+            target=_resident_entry,
+            args=(spec.name, spec.fn, child_conn, os.getpid()),
+            daemon=True,
+        )
+        try:
+            proc.start()
+        finally:
+            # у родителя остаётся только свой конец: EOF в ребёнке = родителя нет
+            child_conn.close()
+
+        child = ResidentChild(proc=proc, conn=parent_conn, spawned_at=_now_ts(), pid=proc.pid or 0)
+        self._residents[spec.name] = child
+        self._stats[spec.name].spawns += 1
+        self._log("resident_spawned", {"task": spec.name, "pid": child.pid})
+        return child
+
+    def _drop_resident(self, name: str) -> None:
+        child = self._residents.pop(name, None)
+        if child is None:
+            return
+        try:
+            child.conn.send("stop")
+        except Exception:
+            pass
+        try:
+            child.conn.close()
+        except Exception:
+            pass
+        self._reap(child.proc, RESIDENT_STOP_WAIT_SEC)
+
+    def _stop_residents(self) -> None:
+        for name in list(self._residents.keys()):
+            self._drop_resident(name)
+
+    def _reap(self, proc: Process, wait_sec: float) -> None:
+        # join -> terminate -> kill; всегда с join(), чтобы не оставлять zombie
+        try:
+            proc.join(timeout=wait_sec)
+        except Exception:
+            pass
+        if proc.is_alive():
+            try:
+                proc.terminate()
+            except Exception:
+                pass
+            try:
+                proc.join(timeout=wait_sec)
+            except Exception:
+                pass
+        if proc.is_alive():
+            try:
+                proc.kill()
+            except Exception:
+                pass
+            try:
+                proc.join(timeout=0.2)
+            except Exception:
+                pass
+
+    def _read_result(self, rt: RunningTask) -> tuple[bool, Any]:
+        """(finished, result). Resident: готов ответ в Pipe или процесс умер. Fork-per-run: процесс завершился."""
+        if rt.resident is not None:
+            try:
+                if rt.resident.conn.poll():
+                    return True, rt.resident.conn.recv()
+            except EOFError:
+                # ребёнок умер (таймаут-kill / краш) без ответа -> как пустой выход в fork-per-run
+                self._drop_resident(rt.spec.name)
+                return True, None
+            except Exception:
+                # Pipe сломан (ребёнок умер на середине записи) -> респаун на следующем запуске
+                self._drop_resident(rt.spec.name)
+                return True, {"ok": False, "error": "result_read_failed"}
+            if rt.proc.is_alive():
+                return False, None
+            return True, None
+
+        if rt.proc.is_alive():
+            return False, None
+        result: Any = None
+        try:
+            if not rt.q.empty():
+                result = rt.q.get_nowait()
+        except Exception:
+            result = {"ok": False, "error": "result_read_failed"}
+        return True, result
+
+    def _note_started(self, spec: TaskSpec, started_at: float) -> None:
+        st = self._stats[spec.name]
+        due_at = self._next_run_at.get(spec.name, started_at)
+        st.lags_ms.append(max(0.0, (started_at - due_at) * 1000.0))
+
+    def _note_finished(self, spec: TaskSpec, duration_sec: float, outcome: str) -> None:
+        st = self._stats[spec.name]
+        st.runs += 1
+        st.durations_ms.append(duration_sec * 1000.0)
+        if duration_sec > spec.every_sec:
+            st.overruns += 1
+        if outcome == "ok":
+            st.ok += 1
+        elif outcome == "exception":
+            st.failed += 1
+        elif outcome == "ended_empty":
+            st.empty += 1
+
+    def _log_stats_due(self) -> None:
+        now = _now_ts()
+        if now - self._stats_logged_at < STATS_LOG_EVERY_SEC:
+            return
+        self._stats_logged_at = now
+        self._log("stats", {"tasks": self.stats()})
+
     def _collect_finished(self) -> None:
         finished_keys: list[str] = []
 
         for key, rt in list(self._running.items()):
-            if rt.proc.is_alive():
+            # попытка забрать результат (если есть)
+            finished, result = self._read_result(rt)
+            if not finished:
                 continue
 
             # ВАЖНО: забрать exit-status у завершившегося процесса, иначе он останется zombie (<defunct>)
-            try:
-                rt.proc.join(timeout=0)
-            except Exception:
-                pass
+            if not rt.proc.is_alive():
+                try:
+                    rt.proc.join(timeout=0)
+                except Exception:
+                    pass
+                if rt.resident is not None and self._residents.get(rt.spec.name) is rt.resident:
+                    # resident умер (таймаут-kill / краш) -> следующий запуск поднимет новый
+                    self._drop_resident(rt.spec.name)
 
             end_at = _now_ts()
             duration_ms = int((end_at - rt.started_at) * 1000)
 
             payload: Dict[str, Any] = {"task": rt.spec.name, "pid": rt.pid, "duration_ms": duration_ms}
 
-            # попытка забрать результат (если есть)
-            result: Any = None
-            try:
-                if not rt.q.empty():
-                    result = rt.q.get_nowait()
-            except Exception:
-                result = {"ok": False, "error": "result_read_failed"}
-
             if isinstance(result, dict) and result.get("ok") is True:
                 payload["event"] = "ok"
                 if "result" in result:
@@ -302,18 +621,21 @@ class Worker:
                 payload["event"] = "ended_empty"
                 self._log("ended_empty", payload)
 
+            self._note_finished(rt.spec, end_at - rt.started_at, payload["event"])
+
             # аккуратно прибираем очередь (ресурсы/потоки)
-            try:
-                rt.q.close()
-            except Exception:
-                pass
-            try:
-                rt.q.join_thread()
-            except Exception:
-                pass
+            if rt.q is not None:
+                try:
+                    rt.q.close()
+                except Exception:
+                    pass
+                try:
+                    rt.q.join_thread()
+                except Exception:
+                    pass
 
             # планируем следующий запуск
-            self._next_run_at[rt.spec.name] = end_at + rt.spec.every_sec
+            self._set_next_run(rt.spec.name, end_at + rt.spec.every_sec)
 
             # heavy завершился — снимаем блокировку стартов
             if self._heavy_running_name == rt.spec.name:
@@ -334,7 +656,11 @@ class Worker:
             if now <= rt.deadline_at:
                 continue
 
-            self._log("timeout", {"task": rt.spec.name, "pid": rt.pid, "timeout_sec": rt.spec.timeout_sec})
+            self._log(
+                "timeout",
+                {"task": rt.spec.name, "pid": rt.pid, "timeout_sec": rt.spec.timeout_sec, "resident": rt.resident is not None},
+            )
+            self._stats[rt.spec.name].timeouts += 1
 
             # terminate -> wait -> kill
             try:
@@ -359,7 +685,11 @@ class Worker:
                 pass
 
             # следующий запуск: "сейчас + every_sec"
-            self._next_run_at[rt.spec.name] = _now_ts() + rt.spec.every_sec
+            self._set_next_run(rt.spec.name, _now_ts() + rt.spec.every_sec)
+
+            # не добили (процесс не умер) -> повтор не раньше чем через 2с, без холостого цикла
+            if rt.proc.is_alive():
+                rt.deadline_at = _now_ts() + 2.0
 
     def _log(self, event: str, data: Dict[str, Any]) -> None:
         rec = {
@@ -408,3 +738,48 @@ def _child_entry(task_name: str, fn: Callable[[], Any], q: Queue) -> None:
             sys.exit(1)
         except Exception:
             os._exit(1)
+
+
+def _resident_entry(task_name: str, fn: Callable[[], Any], conn: Connection, parent_pid: int) -> None:
+    """
+    Resident-процесс: ждёт "run" по Pipe, вызывает fn(), отправляет результат; живёт между запусками.
+    Исключение fn() не убивает процесс (отчёт как в fork-per-run). EOF / "stop" / смерть родителя -> выход.
+    """
+    # SIGTERM родителя (таймаут) должен реально останавливать; Ctrl-C обрабатывает родитель
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    while True:
+        try:
+            # EOF может не прийти, если копия родительского конца унаследована соседним resident-ом
+            if not conn.poll(1.0):
+                if os.getppid() != parent_pid:
+                    break
+                continue
+            cmd = conn.recv()
+        except (EOFError, OSError):
+            break
+        if cmd != "run":
+            break
+
+        try:
+            res = fn()
+            payload: Dict[str, Any] = {"ok": True}
+            if res is not None:
+                payload["result"] = res
+        except Exception as e:
+            payload = {"ok": False, "error": str(e), "traceback": traceback.format_exc()}
+
+        try:
+            conn.send(payload)
+        except Exception:
+            # результат не сериализуется -> хотя бы статус
+            try:
+                conn.send({"ok": bool(payload.get("ok")), "error": "result_send_failed"})
+            except Exception:
+                break
+
+    try:
+        conn.close()
+    except Exception:
+        pass
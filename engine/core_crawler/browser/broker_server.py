@@ -1,6 +1,7 @@
 # FILE: engine/core_crawler/browser/broker_server.py
-# DATE: 2026-03-27
+# DATE: 2026-10-16
 # PURPOSE: Local unix-socket browser broker process for core_crawler fetch requests.
+# CHANGE: slot round-robin position is an atomic CLIENT.incr counter (one round trip, no GET + SET).
 
 from __future__ import annotations
 
@@ -168,7 +169,15 @@ def _rr_key(site: str) -> str:
     site_name = str(site or "").strip()
     if not site_name:
         raise ValueError("rr key requires site")
-    return f"core_crawler:slot_rr:{site_name}"
+    # v2: счётчик INCR (ASCII int); v1 хранил pickle {"pos": N}
+    return f"core_crawler:slot_rr:v2:{site_name}"
+
+
+def _rr_take(site: str, count: int) -> int:
+    # атомарно сдвигает round-robin на count -> позиция до сдвига (Redis недоступен -> 0)
+    n = max(1, int(count))
+    end = CLIENT.incr(_rr_key(site), n, ttl_sec=STATE_TTL_SEC)
+    return max(0, int(end) - n) if end is not None else 0
 
 
 def _route_plan_key() -> str:
@@ -437,15 +446,11 @@ def _activate_11880_windows(site: str, available: list[str]) -> list[str]:
                 and float((state.get(name) or {}).get("cool_until") or 0.0) <= now
             ]
             if eligible_names:
-                rr_state = _cache_get_obj(_rr_key(site)) or {"pos": 0}
-                rr_pos = int(rr_state.get("pos") or 0)
+                advance = min(len(eligible_names), target_count - len(engaged_names))
+                rr_pos = _rr_take(site, advance)
                 start_idx = rr_pos % len(eligible_names)
                 rotated_names = eligible_names[start_idx:] + eligible_names[:start_idx]
-                advanced = 0
-                for name in rotated_names:
-                    if len(engaged_names) >= target_count:
-                        break
-                    advanced += 1
+                for name in rotated_names[:advance]:
                     state[name] = {
                         "active_until": 0.0,
                         "cool_until": 0.0,
@@ -453,7 +458,6 @@ def _activate_11880_windows(site: str, available: list[str]) -> list[str]:
                     }
                     engaged_names.append(name)
                     engaged_set.add(name)
-                _cache_set_obj(_rr_key(site), {"pos": rr_pos + max(1, advanced)})
         _cache_set_obj(_window_key(site), state)
         return [name for name in available if name in engaged_set]
     finally:
@@ -549,10 +553,8 @@ def _activate_fixed_slots(
                 current_priority = len([name for name in current[:target_count] if name in preferred])
                 if current_priority >= desired_priority:
                     return current[:target_count]
-    rr_state = _cache_get_obj(_rr_key(site)) or {"pos": 0}
-    rr_pos = int(rr_state.get("pos") or 0)
+    rr_pos = _rr_take(site, target_count)
     selected = _select_slots(available, rr_pos)
-    _cache_set_obj(_rr_key(site), {"pos": rr_pos + max(1, target_count)})
     until = now + random.uniform(CRAWLER_SLOT_HOLD_MIN_SEC, CRAWLER_SLOT_HOLD_MAX_SEC)
     _cache_set_obj(_schedule_key(site), {"names": list(selected), "until": until})
     return list(selected)
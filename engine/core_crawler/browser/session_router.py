@@ -1,6 +1,7 @@
 # FILE: engine/core_crawler/browser/session_router.py
-# DATE: 2026-03-27
+# DATE: 2026-10-16
 # PURPOSE: Shared browser fetch router with in-process slot/session state and concurrent pages per logical session.
+# CHANGE: per-slot dispatch pacing is one atomic CLIENT.pace reservation (was gate lock + GET + SET).
 
 from __future__ import annotations
 
@@ -52,7 +53,6 @@ ROUTER_BOOT_ID = uuid4().hex
 QUARANTINE_BACKOFF_TTL_SEC = 7 * 24 * 60 * 60
 WAIT_TIMEOUT_SEC = 30.0
 RUNTIME_IDLE_REAP_SEC = 90.0
-SESSION_GATE_TTL_SEC = 5.0
 SESSION_GATE_WAIT_SEC = 5.0
 HTTP_CHROMIUM_LOG_FILE = "http_chromium.log"
 HTTP_LIGHT_LOG_FILE = "http_light.log"
@@ -441,21 +441,14 @@ class BrowserSessionRouter:
             raise ValueError("window lock key requires site")
         return f"core_crawler:slot_window_lock:{site_name}"
 
-    @staticmethod
-    def _dispatch_gate_key(site: str, slot_name: str, slot_idx: int) -> str:
-        site_name = str(site or "").strip()
-        tunnel_name = str(slot_name or "").strip()
-        if not site_name or not tunnel_name:
-            raise ValueError("dispatch gate key requires site and slot_name")
-        return f"core_crawler:browser_dispatch_gate:{site_name}:{tunnel_name}:{int(slot_idx)}"
-
     @staticmethod
     def _dispatch_state_key(site: str, slot_name: str, slot_idx: int) -> str:
         site_name = str(site or "").strip()
         tunnel_name = str(slot_name or "").strip()
         if not site_name or not tunnel_name:
             raise ValueError("dispatch state key requires site and slot_name")
-        return f"core_crawler:browser_dispatch_state:{site_name}:{tunnel_name}:{int(slot_idx)}"
+        # v2: ASCII ms-timestamp следующего старта (CLIENT.pace); v1 хранил pickle {"next_start_ts": ...}
+        return f"core_crawler:browser_dispatch_state:v2:{site_name}:{tunnel_name}:{int(slot_idx)}"
 
     @staticmethod
     def _slot_profile_key(site: str, slot_name: str) -> str:
@@ -1017,36 +1010,24 @@ class BrowserSessionRouter:
         return profile
 
     def _wait_for_dispatch_slot(self, cfg: SiteSessionConfig, session: BrowserSession) -> None:
+        # Один EVAL резервирует старт слота: start = max(now, next_start); next_start = start + pause.
+        # Параллельные запросы на тот же слот получают следующие по очереди старты без lock + GET + SET.
         slot_name = str(session.tunnel.get("name") or "").strip()
         slot_idx = int(session.slot_idx)
-        gate_key = self._dispatch_gate_key(cfg.site, slot_name, slot_idx)
         state_key = self._dispatch_state_key(cfg.site, slot_name, slot_idx)
-        owner = f"dispatch:{cfg.site}:{slot_name}:{slot_idx}:{uuid4().hex}"
         gate_wait_sec = max(float(SESSION_GATE_WAIT_SEC), float(cfg.pause_max_sec) + 1.0)
-        gate_token = self._lock_until(gate_key, SESSION_GATE_TTL_SEC, owner, gate_wait_sec)
-        if not gate_token:
+        pause_sec = max(0.0, random.uniform(float(cfg.pause_min_sec), float(cfg.pause_max_sec)))
+        wait_for = CLIENT.pace(
+            state_key,
+            interval_sec=pause_sec,
+            max_wait_sec=gate_wait_sec,
+            ttl_sec=max(60.0, float(cfg.pause_max_sec) * 10.0),
+        )
+        if wait_for is None or wait_for < 0:
             raise RuntimeError(f"DISPATCH GATE BUSY {cfg.site} {slot_name}:{slot_idx}")
-        try:
-            raw_state = self._cache_get_obj(state_key)
-            next_start_ts = 0.0
-            if isinstance(raw_state, dict):
-                try:
-                    next_start_ts = float(raw_state.get("next_start_ts") or 0.0)
-                except Exception:
-                    next_start_ts = 0.0
-            wait_for = float(next_start_ts) - float(time.time())
-            if wait_for > 0:
-                time.sleep(wait_for)
-            pause_sec = random.uniform(float(cfg.pause_min_sec), float(cfg.pause_max_sec))
-            reserved_until = float(time.time()) + max(0.0, float(pause_sec))
-            self._cache_set_obj(
-                state_key,
-                {"next_start_ts": reserved_until},
-                ttl_sec=max(60, int(max(float(cfg.pause_max_sec) * 10.0, 60.0))),
-            )
-            session.next_dispatch_ts = reserved_until
-        finally:
-            self._release_lock(gate_key, gate_token)
+        if wait_for > 0:
+            time.sleep(wait_for)
+        session.next_dispatch_ts = float(time.time()) + pause_sec
 
     def reset_slot_session(self, site: str, slot_name: str, slot_idx: int = 0) -> None:
         return
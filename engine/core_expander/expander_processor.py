@@ -15,6 +15,7 @@ def main() -> None:
         name="core_expander_processor",
         tick_sec=2,
         max_parallel=1,
+        resident=True,
     )
 
     worker.register(
@@ -2,6 +2,15 @@
 # DATE: 2026-04-20
 # PURPOSE: Scan recent IMAP mailboxes for Serenity-related letters, move outloop to SerenityMailer,
 #          and avoid re-reading already processed UIDs via Redis cache.
+# CHANGE: per UID chunk — 1) done-markers via one get_many, 2) one UID FETCH of selected headers +
+#         BODYSTRUCTURE (PEEK) to drop messages that cannot be ours, 3) full bodies (BODY.PEEK[]) in
+#         count/size-bounded batches only for candidates. IMAP_BOUNCE_HEADER_FILTER=0 -> full bodies for all.
+# CHANGE: per-(mailbox, folder) high-water mark in cache (UIDVALIDITY, last UID, HIGHESTMODSEQ):
+#         unchanged folder -> no SEARCH at all; otherwise UID last+1:* only; UIDVALIDITY change / no state ->
+#         full SINCE-window scan. The mark never passes a UID whose fetch failed, so done-keys only cover retries.
+# CHANGE: mailboxes are scanned concurrently (thread pool) with a global and a per-IMAP-host limit,
+#         a per-mailbox deadline (checked between folders/UID chunks, progress kept via the high-water mark)
+#         and a run budget; slow / cut-off mailboxes are reported separately in the summary.
 
 from __future__ import annotations
 
@@ -9,6 +18,9 @@ import hashlib
 import json
 import os
 import re
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from datetime import datetime, timedelta, timezone
 from typing import Any, Dict, Iterable, Iterator, Optional
 
@@ -17,11 +29,22 @@ from engine.common.cache.client import CLIENT
 from engine.common.gpt import GPTClient
 from engine.common.mail.imap import IMAPConn
 from engine.common.translate import get_prompt
-from engine.core_imap.imap_message import process_imap_message
+from engine.core_imap.imap_message import CANDIDATE_HEADER_FIELDS, is_candidate_headers, process_imap_message
 
 SERENITY_FOLDER = "SerenityMailer"
 DEFAULT_WINDOW_DAYS = 7
 DEFAULT_UID_BATCH_SIZE = 200
+HWM_TTL_SEC = 30 * 24 * 60 * 60
+DEFAULT_CONCURRENCY = 4
+DEFAULT_PER_HOST_CONCURRENCY = 2
+DEFAULT_MAILBOX_DEADLINE_SEC = 240
+DEFAULT_RUN_BUDGET_SEC = 780  # < IMAP_BOUNCE_TIMEOUT_SEC (900) of the worker task
+DEFAULT_SLOW_MAILBOX_SEC = 60
+BODY_BATCH_SIZE = 25
+BODY_BATCH_MAX_BYTES = 8 * 1024 * 1024
+
+_HEADER_FETCH_ITEMS = f"(UID RFC822.SIZE BODYSTRUCTURE BODY.PEEK[HEADER.FIELDS ({' '.join(CANDIDATE_HEADER_FIELDS)})])"
+_BODY_FETCH_ITEMS = "(UID BODY.PEEK[])"
 
 
 def _window_days() -> int:
@@ -38,12 +61,25 @@ def _uid_batch_size() -> int:
     return DEFAULT_UID_BATCH_SIZE
 
 
+def _env_pos_int(name: str, default: int) -> int:
+    raw = (os.environ.get(name) or "").strip()
+    if raw.isdigit() and int(raw) > 0:
+        return int(raw)
+    return default
+
+
+def _header_filter_enabled() -> bool:
+    raw = (os.environ.get("IMAP_BOUNCE_HEADER_FILTER") or "").strip().lower()
+    return raw not in ("0", "false", "no", "off")
+
+
 def _imap_since(days_back: int) -> str:
     dt = datetime.now(timezone.utc) - timedelta(days=int(days_back))
     return dt.strftime("%d-%b-%Y")
 
 
-def _recent_mailbox_ids(days_back: int) -> list[int]:
+def _recent_mailboxes(days_back: int) -> list[tuple[int, str]]:
+    # (mailbox_id, imap host) — host only for the per-host concurrency limit
     rows = db.fetch_all(
         """
         WITH recent_campaigns AS (
@@ -52,7 +88,7 @@ def _recent_mailbox_ids(days_back: int) -> list[int]:
             WHERE campaign_id IS NOT NULL
               AND created_at >= now() - (%s::int * interval '1 day')
         )
-        SELECT DISTINCT c.mailbox_id
+        SELECT DISTINCT c.mailbox_id, lower(COALESCE(im.credentials_json->>'host', ''))
         FROM recent_campaigns rc
         JOIN public.campaigns_campaigns c
           ON c.id = rc.campaign_id
@@ -63,7 +99,7 @@ def _recent_mailbox_ids(days_back: int) -> list[int]:
         """,
         [int(days_back)],
     )
-    return [int(r[0]) for r in rows if r and r[0] is not None]
+    return [(int(r[0]), str(r[1] or "")) for r in rows if r and r[0] is not None]
 
 
 def _parse_list_row(row: str) -> tuple[str, str]:
@@ -322,12 +358,29 @@ def _done_cache_key(mailbox_id: int, folder: str, uid: str) -> str:
     return f"imap:bounce:done:v1:{int(mailbox_id)}:{_folder_hash(folder)}:{str(uid)}"
 
 
-def _is_done(mailbox_id: int, folder: str, uid: str, ttl_sec: int) -> bool:
+def _hwm_cache_key(mailbox_id: int, folder: str) -> str:
+    return f"imap:bounce:hwm:v1:{int(mailbox_id)}:{_folder_hash(folder)}"
+
+
+def _load_hwm(mailbox_id: int, folder: str) -> Optional[Dict[str, Any]]:
     try:
-        payload = CLIENT.get(_done_cache_key(mailbox_id, folder, uid), ttl_sec=ttl_sec)
-        return payload is not None
+        raw = CLIENT.get(_hwm_cache_key(mailbox_id, folder), ttl_sec=HWM_TTL_SEC)
     except Exception:
-        return False
+        return None
+    if raw is None:
+        return None
+    obj = _safe_json_load(raw.decode("utf-8", errors="replace"))
+    if not obj or not isinstance(obj.get("uidvalidity"), int) or not isinstance(obj.get("last_uid"), int):
+        return None
+    return obj
+
+
+def _save_hwm(mailbox_id: int, folder: str, *, uidvalidity: int, last_uid: int, modseq: Optional[int]) -> None:
+    payload = json.dumps({"uidvalidity": int(uidvalidity), "last_uid": int(last_uid), "modseq": modseq})
+    try:
+        CLIENT.set(_hwm_cache_key(mailbox_id, folder), payload.encode("utf-8"), ttl_sec=HWM_TTL_SEC)
+    except Exception:
+        return
 
 
 def _mark_done(mailbox_id: int, folder: str, uid: str, ttl_sec: int) -> None:
@@ -337,16 +390,274 @@ def _mark_done(mailbox_id: int, folder: str, uid: str, ttl_sec: int) -> None:
         return
 
 
-def _process_mailbox(mailbox_id: int, days_back: int) -> Dict[str, Any]:
+def _not_done(mailbox_id: int, folder: str, uids: list[str], ttl_sec: int) -> list[str]:
+    try:
+        vals = CLIENT.get_many([_done_cache_key(mailbox_id, folder, uid) for uid in uids], ttl_sec=ttl_sec)
+    except Exception:
+        return list(uids)
+    return [uid for uid, v in zip(uids, vals) if v is None]
+
+
+def _mark_done_many(mailbox_id: int, folder: str, uids: list[str], ttl_sec: int) -> None:
+    if not uids:
+        return
+    try:
+        CLIENT.set_many([(_done_cache_key(mailbox_id, folder, uid), b"1") for uid in uids], ttl_sec=ttl_sec)
+    except Exception:
+        return
+
+
+def _body_batches(uids: list[str], sizes: Dict[str, Optional[int]]) -> Iterator[list[str]]:
+    batch: list[str] = []
+    batch_bytes = 0
+    for uid in uids:
+        size = int(sizes.get(uid) or 0)
+        if batch and (len(batch) >= BODY_BATCH_SIZE or batch_bytes + size > BODY_BATCH_MAX_BYTES):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(uid)
+        batch_bytes += size
+    if batch:
+        yield batch
+
+
+def _split_candidates(
+    conn: IMAPConn, uids: list[str], out: Dict[str, Any]
+) -> tuple[list[str], list[str], Dict[str, Optional[int]]]:
+    """(candidates, not_ours, sizes). Header fetch failure -> all are candidates (old full-fetch path)."""
+    if not _header_filter_enabled():
+        return list(uids), [], {}
+    heads = conn.uid_fetch_many(uids, _HEADER_FETCH_ITEMS)
+    out["fetch_calls"] += 1
+    if heads is None:
+        out["errors"].append({"error": "header_fetch_failed", "count": len(uids)})
+        return list(uids), [], {}
+
+    candidates: list[str] = []
+    not_ours: list[str] = []
+    sizes: Dict[str, Optional[int]] = {}
+    for uid in uids:
+        item = heads.get(uid)
+        if item is None:
+            # нет в ответе (удалено между SEARCH и FETCH / кривой ответ) -> решит полный fetch
+            candidates.append(uid)
+            continue
+        sections = item.get("sections") or {}
+        header_bytes = next((v for k, v in sections.items() if k.startswith("HEADER")), b"")
+        out["fetch_bytes"] += len(header_bytes)
+        sizes[uid] = item.get("size")
+        if is_candidate_headers(header_bytes, str(item.get("meta") or "")):
+            candidates.append(uid)
+        else:
+            not_ours.append(uid)
+    return candidates, not_ours, sizes
+
+
+def _fetch_bodies(conn: IMAPConn, uids: list[str], out: Dict[str, Any]) -> Dict[str, bytes]:
+    got = conn.uid_fetch_many(uids, _BODY_FETCH_ITEMS)
+    out["fetch_calls"] += 1
+    bodies: Dict[str, bytes] = {}
+    if got is not None:
+        for uid, item in got.items():
+            raw = (item.get("sections") or {}).get("")
+            if raw is not None:
+                bodies[uid] = raw
+    # batch не удался / часть не пришла -> по одному, как раньше
+    for uid in uids:
+        if uid in bodies:
+            continue
+        raw_msg = conn.uid_fetch_rfc822(uid)
+        out["fetch_calls"] += 1
+        if raw_msg is not None:
+            bodies[uid] = raw_msg
+    for raw in bodies.values():
+        out["fetch_bytes"] += len(raw)
+    return bodies
+
+
+def _folder_uids(
+    conn: IMAPConn,
+    mailbox_id: int,
+    folder: str,
+    sel: Dict[str, Any],
+    days_back: int,
+    out: Dict[str, Any],
+) -> Optional[list[str]]:
+    """UIDs to look at in this folder (None = search failed). Fast paths use the stored high-water mark."""
+    state = _load_hwm(mailbox_id, folder)
+    uidvalidity = sel.get("uidvalidity")
+    uidnext = sel.get("uidnext")
+    modseq = sel.get("highestmodseq")
+
+    if state is not None and uidvalidity is not None and state["uidvalidity"] == uidvalidity:
+        last_uid = int(state["last_uid"])
+        if (uidnext is not None and uidnext - 1 <= last_uid) or (
+            modseq is not None and state.get("modseq") == modseq
+        ):
+            out["unchanged_folders"] += 1
+            return []
+        out["incremental_folders"] += 1
+        uids = conn.uid_search(f"UID {last_uid + 1}:*")
+        if uids is None:
+            return None
+        # "UID n:*" всегда возвращает последнее письмо, даже если его UID < n
+        return [u for u in uids if u.isdigit() and int(u) > last_uid]
+
+    out["full_scan_folders"] += 1
+    if state is not None and uidvalidity is not None:
+        out["uidvalidity_reset"] += 1
+    return conn.uid_search(f"SINCE {_imap_since(days_back)}")
+
+
+def _advance_hwm(
+    mailbox_id: int,
+    folder: str,
+    sel: Dict[str, Any],
+    uids: list[str],
+    failed_uids: list[str],
+) -> None:
+    uidvalidity = sel.get("uidvalidity")
+    if uidvalidity is None:
+        return  # без UIDVALIDITY инкрементально нельзя -> каждый раз окно
+
+    state = _load_hwm(mailbox_id, folder)
+    prev_last = int(state["last_uid"]) if state is not None and state["uidvalidity"] == uidvalidity else 0
+
+    uidnext = sel.get("uidnext")
+    top = int(uidnext) - 1 if uidnext is not None else max([int(u) for u in uids if u.isdigit()], default=0)
+    if failed_uids:
+        top = min(top, min(int(u) for u in failed_uids) - 1)
+    last_uid = max(prev_last, top)
+    if last_uid <= 0 and state is None:
+        return
+
+    # modseq фиксируем только когда прошли всё: иначе "не изменилось" спрятало бы ретраи
+    modseq = sel.get("highestmodseq") if not failed_uids else None
+    _save_hwm(mailbox_id, folder, uidvalidity=int(uidvalidity), last_uid=last_uid, modseq=modseq)
+
+
+def _scan_folder(
+    conn: IMAPConn,
+    mailbox_id: int,
+    folder: str,
+    days_back: int,
+    move_targets: list[str],
+    ttl_sec: int,
+    out: Dict[str, Any],
+    deadline: Optional[float] = None,
+) -> None:
+    sel = conn.select(folder, readonly=False)
+    if sel is None:
+        out["errors"].append({"folder": folder, "error": "select_failed"})
+        return
+
+    uids = _folder_uids(conn, mailbox_id, folder, sel, days_back, out)
+    if uids is None:
+        out["errors"].append({"folder": folder, "error": "search_failed"})
+        return
+
+    failed_uids: list[str] = []
+    for uid_batch in _chunks(uids, _uid_batch_size()):
+        if deadline is not None and time.monotonic() >= deadline:
+            # остаток — в следующий прогон: high-water mark не пройдёт дальше первого непрочитанного UID
+            out["deadline_hit"] = True
+            failed_uids.append(uid_batch[0])
+            break
+
+        # 1) done-markers: one MGET per chunk
+        pending = _not_done(mailbox_id, folder, uid_batch, ttl_sec)
+        out["cached_skip"] += len(uid_batch) - len(pending)
+        if not pending:
+            continue
+
+        # 2) headers + BODYSTRUCTURE: one UID FETCH per chunk
+        candidates, not_ours, sizes = _split_candidates(conn, pending, out)
+        out["seen"] += len(not_ours)
+        out["header_skip"] += len(not_ours)
+        _mark_done_many(mailbox_id, folder, not_ours, ttl_sec)
+
+        # 3) full bodies only for candidates, batched by count/size
+        for body_batch in _body_batches(candidates, sizes):
+            bodies = _fetch_bodies(conn, body_batch, out)
+            for uid in body_batch:
+                raw_msg = bodies.get(uid)
+                if raw_msg is None:
+                    out["errors"].append({"folder": folder, "uid": uid, "error": "fetch_failed"})
+                    failed_uids.append(uid)
+                    continue
+                out["seen"] += 1
+                out["body_fetched"] += 1
+                _handle_message(conn, mailbox_id, folder, uid, raw_msg, move_targets, ttl_sec, out)
+
+    _advance_hwm(mailbox_id, folder, sel, uids, failed_uids)
+
+
+def _handle_message(
+    conn: IMAPConn,
+    mailbox_id: int,
+    folder: str,
+    uid: str,
+    raw_msg: bytes,
+    move_targets: list[str],
+    ttl_sec: int,
+    out: Dict[str, Any],
+) -> None:
+    res = process_imap_message(mailbox_id, folder, uid, raw_msg)
+
+    if res.get("is_ours"):
+        out["ours"] += 1
+    if str(res.get("kind") or "").startswith("OUTLOOP_"):
+        out["outloop"] += 1
+
+    if res.get("move_to_serenity"):
+        moved_ok = False
+        if move_targets:
+            for target_folder in move_targets:
+                if str(target_folder).strip().lower() == str(folder).strip().lower():
+                    continue
+                moved = conn.uid_move(uid, str(target_folder))
+                if moved is not None:
+                    out["moved"] += 1
+                    moved_ok = True
+                    break
+        if not moved_ok:
+            out["errors"].append(
+                {
+                    "folder": folder,
+                    "uid": uid,
+                    "error": "move_failed",
+                    "kind": res.get("kind"),
+                    "move_targets": move_targets,
+                }
+            )
+
+    if res.get("updated_bad_address"):
+        out["blocked"] += 1
+
+    if res.get("cache_done", True):
+        _mark_done(mailbox_id, folder, uid, ttl_sec)
+
+
+def _process_mailbox(mailbox_id: int, days_back: int, deadline: Optional[float] = None) -> Dict[str, Any]:
     conn = IMAPConn(mailbox_id, cache_key=f"imap-bounce:{mailbox_id}")
     ttl_sec = int(days_back) * 86400
     out: Dict[str, Any] = {
         "mailbox_id": int(mailbox_id),
+        "deadline_hit": False,
+        "folders_done": 0,
         "serenity_folder": "",
         "move_targets": [],
         "folders": 0,
         "seen": 0,
         "cached_skip": 0,
+        "header_skip": 0,
+        "body_fetched": 0,
+        "fetch_calls": 0,
+        "fetch_bytes": 0,
+        "unchanged_folders": 0,
+        "incremental_folders": 0,
+        "full_scan_folders": 0,
+        "uidvalidity_reset": 0,
         "moved": 0,
         "ours": 0,
         "outloop": 0,
@@ -359,6 +670,7 @@ def _process_mailbox(mailbox_id: int, days_back: int) -> Dict[str, Any]:
         return out
 
     try:
+        conn.enable_condstore()
         folder_rows = conn.list_mailboxes() or []
         serenity_folder_name = _ensure_serenity_folder(conn, folder_rows)
         if serenity_folder_name:
@@ -398,61 +710,12 @@ def _process_mailbox(mailbox_id: int, days_back: int) -> Dict[str, Any]:
         out["folders"] = len(folders)
 
         for folder in folders:
-            sel = conn.select(folder, readonly=False)
-            if sel is None:
-                out["errors"].append({"folder": folder, "error": "select_failed"})
-                continue
-
-            uids = conn.uid_search(f"SINCE {_imap_since(days_back)}") or []
-            if not uids:
-                continue
-
-            for uid_batch in _chunks(uids, _uid_batch_size()):
-                for uid in uid_batch:
-                    if _is_done(mailbox_id, folder, uid, ttl_sec):
-                        out["cached_skip"] += 1
-                        continue
-
-                    raw_msg = conn.uid_fetch_rfc822(uid)
-                    if raw_msg is None:
-                        out["errors"].append({"folder": folder, "uid": uid, "error": "fetch_failed"})
-                        continue
-
-                    out["seen"] += 1
-                    res = process_imap_message(mailbox_id, folder, uid, raw_msg)
-
-                    if res.get("is_ours"):
-                        out["ours"] += 1
-                    if str(res.get("kind") or "").startswith("OUTLOOP_"):
-                        out["outloop"] += 1
-
-                    if res.get("move_to_serenity"):
-                        moved_ok = False
-                        if move_targets:
-                            for target_folder in move_targets:
-                                if str(target_folder).strip().lower() == str(folder).strip().lower():
-                                    continue
-                                moved = conn.uid_move(uid, str(target_folder))
-                                if moved is not None:
-                                    out["moved"] += 1
-                                    moved_ok = True
-                                    break
-                        if not moved_ok:
-                            out["errors"].append(
-                                {
-                                    "folder": folder,
-                                    "uid": uid,
-                                    "error": "move_failed",
-                                    "kind": res.get("kind"),
-                                    "move_targets": move_targets,
-                                }
-                            )
-
-                    if res.get("updated_bad_address"):
-                        out["blocked"] += 1
-
-                    if res.get("cache_done", True):
-                        _mark_done(mailbox_id, folder, uid, ttl_sec)
+            if deadline is not None and time.monotonic() >= deadline:
+                out["deadline_hit"] = True
+            if out["deadline_hit"]:
+                break
+            _scan_folder(conn, mailbox_id, folder, days_back, move_targets, ttl_sec, out, deadline)
+            out["folders_done"] += 1
     finally:
         try:
             conn.close()
@@ -462,30 +725,111 @@ def _process_mailbox(mailbox_id: int, days_back: int) -> Dict[str, Any]:
     return out
 
 
+_SUM_KEYS = (
+    "seen",
+    "cached_skip",
+    "header_skip",
+    "body_fetched",
+    "fetch_calls",
+    "fetch_bytes",
+    "unchanged_folders",
+    "incremental_folders",
+    "full_scan_folders",
+    "moved",
+    "ours",
+    "outloop",
+    "blocked",
+)
+
+
+def _process_mailbox_safe(mailbox_id: int, host: str, days_back: int, deadline: float) -> Dict[str, Any]:
+    t0 = time.monotonic()
+    try:
+        one = _process_mailbox(mailbox_id, days_back, deadline)
+    except Exception as e:
+        # один ящик не роняет прогон остальных
+        one = {"mailbox_id": int(mailbox_id), "errors": [{"error": f"scan_failed:{type(e).__name__}:{e}"}]}
+    one["host"] = host
+    one["elapsed_sec"] = round(time.monotonic() - t0, 2)
+    return one
+
+
+def _scan_mailboxes(mailboxes: list[tuple[int, str]], days_back: int) -> tuple[list[Dict[str, Any]], list[int]]:
+    """
+    Dispatcher: a mailbox is submitted only when a global slot AND a slot for its host are free,
+    so threads never sit blocked on a busy host. Returns (results, mailbox_ids not started within the run budget).
+    """
+    concurrency = _env_pos_int("IMAP_BOUNCE_CONCURRENCY", DEFAULT_CONCURRENCY)
+    per_host = _env_pos_int("IMAP_BOUNCE_PER_HOST_CONCURRENCY", DEFAULT_PER_HOST_CONCURRENCY)
+    mailbox_sec = _env_pos_int("IMAP_BOUNCE_MAILBOX_DEADLINE_SEC", DEFAULT_MAILBOX_DEADLINE_SEC)
+    run_deadline = time.monotonic() + _env_pos_int("IMAP_BOUNCE_RUN_BUDGET_SEC", DEFAULT_RUN_BUDGET_SEC)
+
+    pending = deque(mailboxes)
+    running: Dict[Future, str] = {}
+    host_running: Dict[str, int] = {}
+    results: list[Dict[str, Any]] = []
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="imap-bounce") as pool:
+        while pending or running:
+            if time.monotonic() < run_deadline:
+                for _ in range(len(pending)):
+                    if len(running) >= concurrency:
+                        break
+                    mailbox_id, host = pending.popleft()
+                    if host_running.get(host, 0) >= per_host:
+                        pending.append((mailbox_id, host))
+                        continue
+                    deadline = min(time.monotonic() + mailbox_sec, run_deadline)
+                    fut = pool.submit(_process_mailbox_safe, mailbox_id, host, days_back, deadline)
+                    running[fut] = host
+                    host_running[host] = host_running.get(host, 0) + 1
+            elif not running:
+                break
+
+            if not running:
+                continue
+            done, _ = wait(list(running.keys()), return_when=FIRST_COMPLETED)
+            for fut in done:
+                host = running.pop(fut)
+                host_running[host] = max(0, host_running.get(host, 0) - 1)
+                results.append(fut.result())
+
+    return results, [int(mailbox_id) for mailbox_id, _host in pending]
+
+
 def task_imap_bounce_scan_once() -> Dict[str, Any]:
     days_back = _window_days()
-    mailbox_ids = _recent_mailbox_ids(days_back)
+    mailboxes = _recent_mailboxes(days_back)
     result: Dict[str, Any] = {
         "window_days": days_back,
         "uid_batch_size": _uid_batch_size(),
-        "mailboxes_total": len(mailbox_ids),
+        "mailboxes_total": len(mailboxes),
         "mailboxes": [],
-        "seen": 0,
-        "cached_skip": 0,
-        "moved": 0,
-        "ours": 0,
-        "outloop": 0,
-        "blocked": 0,
+        "slow_mailboxes": [],
+        "not_started": [],
+        **{k: 0 for k in _SUM_KEYS},
     }
-    for mailbox_id in mailbox_ids:
-        one = _process_mailbox(mailbox_id, days_back)
+    t0 = time.monotonic()
+    scanned, not_started = _scan_mailboxes(mailboxes, days_back)
+    result["elapsed_sec"] = round(time.monotonic() - t0, 2)
+    result["not_started"] = not_started
+
+    slow_sec = _env_pos_int("IMAP_BOUNCE_SLOW_MAILBOX_SEC", DEFAULT_SLOW_MAILBOX_SEC)
+    for one in sorted(scanned, key=lambda x: int(x.get("mailbox_id", 0))):
         result["mailboxes"].append(one)
-        result["seen"] += int(one.get("seen", 0))
-        result["cached_skip"] += int(one.get("cached_skip", 0))
-        result["moved"] += int(one.get("moved", 0))
-        result["ours"] += int(one.get("ours", 0))
-        result["outloop"] += int(one.get("outloop", 0))
-        result["blocked"] += int(one.get("blocked", 0))
+        for k in _SUM_KEYS:
+            result[k] += int(one.get(k, 0))
+        if one.get("deadline_hit") or float(one.get("elapsed_sec", 0)) >= slow_sec:
+            result["slow_mailboxes"].append(
+                {
+                    "mailbox_id": one.get("mailbox_id"),
+                    "host": one.get("host"),
+                    "elapsed_sec": one.get("elapsed_sec"),
+                    "deadline_hit": bool(one.get("deadline_hit")),
+                    "folders_done": one.get("folders_done"),
+                    "folders": one.get("folders"),
+                }
+            )
     return result
 
 
@@ -2,6 +2,8 @@
 # DATE: 2026-04-20
 # PURPOSE: Parse one IMAP message, keep only Serenity mails, handle outloop DB updates,
 #          and classify non-outloop replies into replay_log.
+# CHANGE: is_candidate_headers(): header/BODYSTRUCTURE pre-filter for the bulk scan — only replies,
+#         auto-replies, bounces and marked letters need the full body (the marker sits in the HTML body).
 
 from __future__ import annotations
 
@@ -27,6 +29,12 @@ _BOUNCE_MARKER_RE = re.compile(
     r"(mailer-daemon|postmaster|delivery status notification|mail delivery subsystem|undeliverable|delivery failure)",
     re.IGNORECASE,
 )
+_REPLY_SUBJECT_RE = re.compile(
+    r"^\s*(re|aw|antw|sv|vs|wg|fw|fwd|tr|rif|r)\s*(\[\d+\])?\s*:"
+    r"|automatic reply|auto.?reply|autoreply|out of office|abwesen|returned mail|undelivered|nicht zustellbar",
+    re.IGNORECASE,
+)
+_DSN_STRUCTURE_RE = re.compile(r'"(delivery-status|rfc822|rfc822-headers|global-delivery-status|report)"', re.IGNORECASE)
 _HTML_SCRIPT_STYLE_RE = re.compile(r"<(script|style)\b[^>]*>.*?</\1>", re.IGNORECASE | re.DOTALL)
 _HTML_TAG_RE = re.compile(r"<[^>]+>")
 _WS_RE = re.compile(r"[ \t\r\f\v]+")
@@ -37,6 +45,21 @@ _STATUS_ANGRY_CONTACT = "ANGRY_CONTACT"
 _STATUS_ANSWER = "ANSWER"
 _WRONG_EMAIL_REASON = "RETURNED MAIL"
 _YES_TOKENS = {"yes", "да"}
+
+# Fields for BODY.PEEK[HEADER.FIELDS (...)] in the bulk pre-filter.
+CANDIDATE_HEADER_FIELDS = (
+    "From",
+    "Subject",
+    "Return-Path",
+    "In-Reply-To",
+    "References",
+    "Auto-Submitted",
+    "X-Autoreply",
+    "X-Autorespond",
+    "Precedence",
+    "X-Mailer-App",
+    "X-Mailer-Id",
+)
 _NO_TOKENS = {"no", "нет"}
 
 
@@ -53,6 +76,42 @@ def _extract_sending_log_id_if_ours(raw_msg: bytes) -> Optional[int]:
     return sending_log_id if sending_log_id > 0 else None
 
 
+def is_candidate_headers(headers: bytes, bodystructure: str) -> bool:
+    """
+    True -> the message may be ours (needs full body + process_imap_message).
+    False -> certainly SKIP_NOT_OURS: not a reply/auto-reply/bounce and no marker in headers.
+    """
+    raw = bytes(headers or b"")
+    if _MAILER_APP_BYTES_RE.search(raw) or _MAILER_ID_BYTES_RE.search(raw):
+        return True
+    if _DSN_STRUCTURE_RE.search(bodystructure or ""):
+        return True
+
+    try:
+        hdr = BytesParser(policy=policy.compat32).parsebytes(raw, headersonly=True)
+    except Exception:
+        return True
+
+    if (hdr.get("In-Reply-To") or "").strip() or (hdr.get("References") or "").strip():
+        return True
+    if (hdr.get("X-Autoreply") or "").strip() or (hdr.get("X-Autorespond") or "").strip():
+        return True
+    auto = (hdr.get("Auto-Submitted") or "").strip().lower()
+    if auto and auto != "no":
+        return True
+    if (hdr.get("Precedence") or "").strip().lower() == "auto_reply":
+        return True
+    if (hdr.get("Return-Path") or "").strip() == "<>":
+        return True
+
+    from_subject = f"{hdr.get('From') or ''}\n{hdr.get('Subject') or ''}"
+    if _BOUNCE_MARKER_RE.search(from_subject):
+        return True
+    if _REPLY_SUBJECT_RE.search(str(hdr.get("Subject") or "")):
+        return True
+    return False
+
+
 def _parse_message(raw_msg: bytes) -> Optional[Message]:
     try:
         return BytesParser(policy=policy.default).parsebytes(raw_msg)
@@ -1,23 +1,29 @@
 # FILE: engine/core_rate/rate_sending_lists.py
-# DATE: 2026-04-05
+# DATE: 2026-10-16
 # PURPOSE: Fill public.sending_lists.rate for one random active task.
+# Website stage (_enrich_websites): concurrent fetch with per-host limit + total deadline, cleaned page text
+# cached per URL, nano summary started as soon as its page arrives (summary deadline for the stage),
+# one bulk UPDATE of aggr_contacts_cb for the whole batch.
+# Page text: shared single-pass engine.common.html_text extractor (body only, boilerplate dropped, capped early).
+# Small-batch gate: atomic CLIENT.incr on the ready key (first worker to see a small batch sets the wait key).
 
 from __future__ import annotations
 
 import json
 import random
-import re
+import threading
 import time
-from html import unescape
-from typing import Any, Dict, List
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeout
+from typing import Any, Callable, Dict, List, Optional
 from urllib.error import HTTPError, URLError
+from urllib.parse import urlsplit
 from urllib.request import Request, urlopen
 
-from psycopg.types.json import Json
-
 from engine.common.cache.client import CLIENT
 from engine.common.db import get_connection
 from engine.common.gpt import GPTClient
+from engine.common.html_text import html_to_text
 from engine.common.logs import log
 from engine.common.translate import get_prompt, translate_text
 from engine.common.utils import h64_text, parse_json_object, parse_json_response
@@ -28,8 +34,15 @@ from engine.core_status.is_active import (
 )
 
 WEBSITE_HTTP_TIMEOUT_SEC = 4
-WEBSITE_CONTACT_BUDGET_SEC = 12
+WEBSITE_STAGE_DEADLINE_SEC = 30
+WEBSITE_FETCH_WORKERS = 16
+WEBSITE_FETCH_PER_HOST = 2
+WEBSITE_SUMMARY_WORKERS = 8
+WEBSITE_SUMMARY_DEADLINE_SEC = 60
+WEBSITE_TEXT_CACHE_TTL_SEC = 7 * 24 * 60 * 60
+WEBSITE_EMPTY_CACHE_TTL_SEC = 6 * 60 * 60
 MAX_PAGE_TEXT_LEN = 8000
+MAX_PAGE_BYTES = 2 * 1024 * 1024
 MAX_WEBSITE_INPUT_LEN = 12000
 MAX_MEANINGFUL_BLOCKS = 30
 MIN_WORK_BATCH_SIZE = 15
@@ -46,6 +59,7 @@ NOISY_LINE_MARKERS = (
     "newsletter",
     "kontakt",
 )
+WEBSITE_BLOCK_TAGS = frozenset({"main", "article", "section", "p", "li", "h1", "h2", "h3", "h4"})
 
 
 def _small_batch_wait_key(task_id: int) -> str:
@@ -56,17 +70,22 @@ def _small_batch_ready_key(task_id: int) -> str:
     return f"core_rate:contacts:small_batch:ready:{int(task_id)}"
 
 
-def _small_batch_is_waiting(task_id: int) -> bool:
-    return CLIENT.get(_small_batch_wait_key(int(task_id)), ttl_sec=1) is not None
-
-
-def _small_batch_is_ready(task_id: int) -> bool:
-    return CLIENT.get(_small_batch_ready_key(int(task_id)), ttl_sec=1) is not None
-
-
-def _small_batch_mark_first_seen(task_id: int) -> None:
-    CLIENT.set(_small_batch_wait_key(int(task_id)), b"1", ttl_sec=int(SMALL_BATCH_WAIT_TTL_SEC))
-    CLIENT.set(_small_batch_ready_key(int(task_id)), b"1", ttl_sec=int(SMALL_BATCH_READY_TTL_SEC))
+def _small_batch_check(task_id: int) -> str:
+    """
+    Маленький батч: первый увидевший (INCR ready == 1, атомарно) ставит wait и ждёт;
+    пока wait жив — ждут все; потом батч берётся. -> "wait_first" | "wait" | "go" (Redis недоступен -> "go").
+    """
+    seen = CLIENT.incr(
+        _small_batch_ready_key(int(task_id)), 1, ttl_sec=int(SMALL_BATCH_READY_TTL_SEC), refresh_ttl=False
+    )
+    if seen is None:
+        return "go"
+    if seen == 1:
+        CLIENT.set(_small_batch_wait_key(int(task_id)), b"1", ttl_sec=int(SMALL_BATCH_WAIT_TTL_SEC))
+        return "wait_first"
+    if CLIENT.get(_small_batch_wait_key(int(task_id)), ttl_sec=1) is not None:
+        return "wait"
+    return "go"
 
 
 def _small_batch_clear_state(task_id: int) -> None:
@@ -110,7 +129,7 @@ def _fetch_text_from_url(url: str) -> str:
             },
         )
         with urlopen(request, timeout=WEBSITE_HTTP_TIMEOUT_SEC) as resp:
-            body = resp.read()
+            body = resp.read(MAX_PAGE_BYTES)
     except (HTTPError, URLError, TimeoutError, ValueError):
         return ""
     except Exception:
@@ -121,44 +140,16 @@ def _fetch_text_from_url(url: str) -> str:
     except Exception:
         return ""
 
-    body_match = re.search(r"(?is)<body[^>]*>(.*?)</body>", html)
-    if not body_match:
-        return ""
-    html = body_match.group(1)
-
-    html = re.sub(r"(?is)<(header|footer|nav|aside|form|noscript|svg)[^>]*>.*?</\\1>", " ", html)
-    html = re.sub(r"(?is)<script[^>]*>.*?</script>", " ", html)
-    html = re.sub(r"(?is)<style[^>]*>.*?</style>", " ", html)
-    html = re.sub(r"(?is)<!--.*?-->", " ", html)
-    html = re.sub(r"(?is)</?(main|article|section|p|li|h1|h2|h3|h4)[^>]*>", "\n", html)
-    html = re.sub(r"(?is)<[^>]+>", " ", html)
-    html = unescape(html)
-    html = re.sub(r"\r", "\n", html)
-    html = re.sub(r"[ \t]+", " ", html)
-    html = re.sub(r"\n\s*\n+", "\n\n", html)
-    raw_lines = [line.strip() for line in html.splitlines()]
-    lines: List[str] = []
-    seen_lines: set[str] = set()
-
-    for raw_line in raw_lines:
-        line = re.sub(r"\s+", " ", raw_line).strip()
-        if not line:
-            continue
-        line_l = line.lower()
-        if any(marker in line_l for marker in NOISY_LINE_MARKERS) and len(line) <= 160:
-            continue
-        if sum(1 for ch in line if ch in "|>•") >= 3:
-            continue
-        if len(line.split()) <= 2 and len(line) <= 24:
-            continue
-        if line in seen_lines:
-            continue
-        seen_lines.add(line)
-        lines.append(line)
-        if len(lines) >= MAX_MEANINGFUL_BLOCKS:
-            break
-
-    text = "\n\n".join(lines).strip()
+    text = html_to_text(
+        html,
+        block_tags=WEBSITE_BLOCK_TAGS,
+        body_only=True,
+        dedup=True,
+        max_lines=MAX_MEANINGFUL_BLOCKS,
+        max_chars=MAX_PAGE_TEXT_LEN,
+        line_filter=_is_meaningful_line,
+        line_sep="\n\n",
+    ).strip()
     if not text:
         return ""
 
@@ -167,6 +158,203 @@ def _fetch_text_from_url(url: str) -> str:
     return text
 
 
+def _is_meaningful_line(line: str) -> bool:
+    line_l = line.lower()
+    if len(line) <= 160 and any(marker in line_l for marker in NOISY_LINE_MARKERS):
+        return False
+    if sum(1 for ch in line if ch in "|>•") >= 3:
+        return False
+    if len(line) <= 24 and len(line.split()) <= 2:
+        return False
+    return True
+
+
+def _website_text_cache_key(url: str) -> str:
+    return f"core_rate:website_text:v1:{h64_text(str(url or '').strip())}"
+
+
+def _fetch_pages(
+    urls: List[str],
+    deadline: float,
+    on_page: Optional[Callable[[str, str], None]] = None,
+) -> Dict[str, str]:
+    """
+    Cleaned page text per URL: cache first, then concurrent fetch (global + per-host limit).
+    URL не успевший до deadline в ответ не попадает (и не кэшируется).
+    on_page(url, text) — сразу по мере готовности страницы (кэш или fetch), в потоке вызывающего.
+    """
+    out: Dict[str, str] = {}
+    uniq = list(dict.fromkeys(u for u in urls if u))
+    if not uniq:
+        return out
+
+    cached = CLIENT.get_many([_website_text_cache_key(u) for u in uniq], ttl_sec=WEBSITE_TEXT_CACHE_TTL_SEC)
+    missing: List[str] = []
+    for url, raw in zip(uniq, cached):
+        if raw is None:
+            missing.append(url)
+        else:
+            out[url] = raw.decode("utf-8", errors="ignore")
+            if on_page is not None:
+                on_page(url, out[url])
+    if not missing:
+        return out
+
+    host_slots: Dict[str, threading.BoundedSemaphore] = {}
+    for url in missing:
+        host = (urlsplit(url).hostname or "").lower()
+        host_slots.setdefault(host, threading.BoundedSemaphore(WEBSITE_FETCH_PER_HOST))
+
+    def _fetch(url: str) -> Optional[str]:
+        slot = host_slots[(urlsplit(url).hostname or "").lower()]
+        if not slot.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            return None
+        try:
+            if time.monotonic() >= deadline:
+                return None
+            return _fetch_text_from_url(url)
+        finally:
+            slot.release()
+
+    ex = ThreadPoolExecutor(max_workers=min(WEBSITE_FETCH_WORKERS, len(missing)))
+    futs = {ex.submit(_fetch, url): url for url in missing}
+    fetched_ok: List[tuple[str, bytes]] = []
+    fetched_empty: List[tuple[str, bytes]] = []
+    try:
+        for fut in as_completed(futs, timeout=max(0.0, deadline - time.monotonic())):
+            url = futs[fut]
+            try:
+                text = fut.result()
+            except Exception:
+                text = None
+            if text is None:
+                continue
+            out[url] = text
+            if on_page is not None:
+                on_page(url, text)
+            (fetched_ok if text else fetched_empty).append((_website_text_cache_key(url), text.encode("utf-8")))
+    except FuturesTimeout:
+        pass
+    finally:
+        # незавершённые fetch-и добегут сами (urlopen timeout), ждать их не нужно
+        ex.shutdown(wait=False, cancel_futures=True)
+
+    if fetched_ok:
+        CLIENT.set_many(fetched_ok, ttl_sec=WEBSITE_TEXT_CACHE_TTL_SEC)
+    if fetched_empty:
+        CLIENT.set_many(fetched_empty, ttl_sec=WEBSITE_EMPTY_CACHE_TTL_SEC)
+    return out
+
+
+def _summarise_website(user_id: int, website_input: str) -> Any:
+    return GPTClient().ask(
+        model="nano",
+        service_tier="flex",
+        user_id=str(user_id),
+        instructions=get_prompt("process_website"),
+        input=website_input,
+        use_local_cache=False,
+        web_search=False,
+    )
+
+
+def _enrich_websites(contacts: List[tuple[int, Dict[str, Any]]], *, user_id: int) -> Dict[str, Any]:
+    """
+    Website stage for not yet website_processed contacts:
+    concurrent fetch (cached per URL); each page goes to a nano summary as soon as it arrives -> rows for one bulk UPDATE.
+    updates: (contact_id, company_data, website_processed); deferred contacts (page or summary deadline) are not touched
+    and are returned in deferred_ids -> caller leaves them unrated until a later run has their page.
+    """
+    started = time.monotonic()
+    deadline = started + WEBSITE_STAGE_DEADLINE_SEC
+    summary_deadline = started + WEBSITE_SUMMARY_DEADLINE_SEC
+    stage: Dict[str, Any] = {
+        "updates": [],
+        "processed_cnt": 0,
+        "described_cnt": 0,
+        "deferred_cnt": 0,
+        "deferred_ids": set(),
+        "gpt_not_ok": "",
+        "gpt_not_ok_contact_id": 0,
+        "duration_ms": 0,
+    }
+    if not contacts:
+        return stage
+
+    urls: Dict[int, str] = {}
+    for contact_id, company_data in contacts:
+        norm = parse_json_object(company_data.get("norm"), field_name="company_data.norm")
+        description = str(norm.get("description") or "").strip()
+        website_urls = _uniq_text_list(norm.get("websites"))
+        if len(description) < 100 and website_urls:
+            urls[contact_id] = website_urls[0]
+
+    contacts_by_url: Dict[str, List[int]] = {}
+    for contact_id, url in urls.items():
+        contacts_by_url.setdefault(url, []).append(contact_id)
+
+    summaries: Dict[int, str] = {}
+    gpt_failed: set[int] = set()
+    futs: Dict[Any, int] = {}
+    ex = ThreadPoolExecutor(max_workers=max(1, min(WEBSITE_SUMMARY_WORKERS, len(urls))))
+
+    def _on_page(url: str, text: str) -> None:
+        website_input = (text or "").strip()[:MAX_WEBSITE_INPUT_LEN]
+        if not website_input:
+            return
+        for cid in contacts_by_url.get(url, []):
+            futs[ex.submit(_summarise_website, user_id, website_input)] = cid
+
+    try:
+        pages = _fetch_pages(list(urls.values()), deadline, on_page=_on_page)
+        deferred: set[int] = {cid for cid, url in urls.items() if url not in pages}
+        pending = set(futs.values())
+        try:
+            for fut in as_completed(futs, timeout=max(0.0, summary_deadline - time.monotonic())):
+                contact_id = futs[fut]
+                pending.discard(contact_id)
+                try:
+                    resp = fut.result()
+                except Exception:
+                    gpt_failed.add(contact_id)
+                    continue
+                gpt_status = str(resp.status or "").strip()
+                if gpt_status.upper() != "OK":
+                    # как раньше: не-OK от GPT -> contact не трогаем, весь run уходит в паузу
+                    deferred.add(contact_id)
+                    if not stage["gpt_not_ok"]:
+                        stage["gpt_not_ok"] = gpt_status or "-"
+                        stage["gpt_not_ok_contact_id"] = int(contact_id)
+                    continue
+                summaries[contact_id] = str(resp.content or "").strip()
+        except FuturesTimeout:
+            # summary не успел к дедлайну стадии -> контакт ждёт следующего run (страница уже в кэше)
+            deferred |= pending
+    finally:
+        ex.shutdown(wait=False, cancel_futures=True)
+
+    for contact_id, company_data in contacts:
+        if contact_id in deferred:
+            stage["deferred_cnt"] += 1
+            stage["deferred_ids"].add(int(contact_id))
+            continue
+        norm = parse_json_object(company_data.get("norm"), field_name="company_data.norm")
+        description_web = summaries.get(contact_id, "")
+        if description_web:
+            norm["description_web"] = description_web
+            stage["described_cnt"] += 1
+        else:
+            norm.pop("description_web", None)
+        company_data["norm"] = norm
+        processed = contact_id not in gpt_failed
+        if processed:
+            stage["processed_cnt"] += 1
+        stage["updates"].append((int(contact_id), company_data, processed))
+
+    stage["duration_ms"] = int((time.monotonic() - started) * 1000)
+    return stage
+
+
 def _build_contact_text(company_data: Dict[str, Any]) -> str:
     norm = parse_json_object(company_data.get("norm"), field_name="company_data.norm")
     cards = parse_json_object(company_data.get("cards"), field_name="company_data.cards")
@@ -260,6 +448,7 @@ def run_once() -> Dict[str, Any]:
         "picked_cnt": 0,
         "website_processed_cnt": 0,
         "website_description_cnt": 0,
+        "website_deferred_cnt": 0,
         "items_cnt": 0,
         "written_cnt": 0,
         "status": "noop",
@@ -380,15 +569,13 @@ def run_once() -> Dict[str, Any]:
                 return result
 
             if len(rows) < MIN_WORK_BATCH_SIZE:
-                small_batch_ready = _small_batch_is_ready(int(task_id))
-                small_batch_waiting = _small_batch_is_waiting(int(task_id))
-                if not small_batch_ready:
-                    _small_batch_mark_first_seen(int(task_id))
+                small_batch = _small_batch_check(int(task_id))
+                if small_batch == "wait_first":
                     result["status"] = "small_batch_wait_first"
                     result["small_batch_wait_sec"] = int(SMALL_BATCH_WAIT_TTL_SEC)
                     conn.rollback()
                     return result
-                if small_batch_waiting:
+                if small_batch == "wait":
                     result["status"] = "small_batch_wait"
                     conn.rollback()
                     return result
@@ -396,111 +583,69 @@ def run_once() -> Dict[str, Any]:
             else:
                 _small_batch_clear_state(int(task_id))
 
-            items: List[Dict[str, Any]] = []
-
+            parsed_rows: List[tuple[int, Dict[str, Any], bool]] = []
             for contact_id_raw, company_data_raw, website_processed_raw in rows:
-                contact_id = int(contact_id_raw)
                 company_data = parse_json_object(company_data_raw, field_name="aggr_contacts_cb.company_data")
-                website_processed = bool(website_processed_raw)
-
-                if not website_processed:
-                    norm = parse_json_object(company_data.get("norm"), field_name="company_data.norm")
-                    description = str(norm.get("description") or "").strip()
-                    website_urls = _uniq_text_list(norm.get("websites"))
-                    website_text_parts: List[str] = []
-                    if len(description) < 100:
-                        website_started_at = time.monotonic()
-
-                        for website_url in website_urls[:1]:
-                            if (time.monotonic() - website_started_at) >= WEBSITE_CONTACT_BUDGET_SEC:
-                                break
-
-                            main_page_text = _fetch_text_from_url(website_url)
-                            if main_page_text:
-                                website_text_parts.append(main_page_text)
-
-                    description_web = ""
-                    website_gpt_exception = False
-                    website_input = "\n\n".join(part for part in website_text_parts if part.strip()).strip()
-                    if website_input:
-                        if len(website_input) > MAX_WEBSITE_INPUT_LEN:
-                            website_input = website_input[:MAX_WEBSITE_INPUT_LEN]
-                        try:
-                            website_resp = GPTClient().ask(
-                                model="nano",
-                                service_tier="flex",
-                                user_id=str(user_id),
-                                instructions=get_prompt("process_website"),
-                                input=website_input,
-                                use_local_cache=False,
-                                web_search=False,
-                            )
-                            if str(website_resp.status or "").strip().upper() != "OK":
-                                wait_sec = random.randint(40, 60)
-                                result["status"] = "gpt_not_ok_website"
-                                _log_event(
-                                    {
-                                        "event": "rate_contacts",
-                                        "mode": "gpt_not_ok_website",
-                                        "task_id": int(task_id),
-                                        "task_type": task_type,
-                                        "contact_id": int(contact_id),
-                                        "gpt_status": str(website_resp.status or "").strip(),
-                                        "wait_sec": int(wait_sec),
-                                    }
-                                )
-                                time.sleep(float(wait_sec))
-                                return result
-                            description_web = str(website_resp.content or "").strip()
-                        except Exception:
-                            website_gpt_exception = True
-
-                    if description_web:
-                        norm["description_web"] = description_web
-                        result["website_description_cnt"] = int(result["website_description_cnt"]) + 1
-                    else:
-                        norm.pop("description_web", None)
-
-                    company_data["norm"] = norm
-                    if website_gpt_exception:
-                        cur.execute(
-                            """
-                            UPDATE public.aggr_contacts_cb
-                            SET company_data = %s,
-                                website_processed = false,
-                                updated_at = now()
-                            WHERE id = %s
-                            """,
-                            (Json(company_data), int(contact_id)),
-                        )
-                    else:
-                        cur.execute(
-                            """
-                            UPDATE public.aggr_contacts_cb
-                            SET company_data = %s,
-                                website_processed = true,
-                                updated_at = now()
-                            WHERE id = %s
-                            """,
-                            (Json(company_data), int(contact_id)),
-                        )
-                    conn.commit()
-                    if not website_gpt_exception:
-                        website_processed = True
-                        result["website_processed_cnt"] = int(result["website_processed_cnt"]) + 1
-
-                items.append(
+                parsed_rows.append((int(contact_id_raw), company_data, bool(website_processed_raw)))
+            conn.commit()  # не держать транзакцию открытой на время website stage
+
+            pending = [(contact_id, company_data) for contact_id, company_data, done in parsed_rows if not done]
+            stage = _enrich_websites(pending, user_id=int(user_id))
+            result["website_processed_cnt"] = int(stage["processed_cnt"])
+            result["website_description_cnt"] = int(stage["described_cnt"])
+            result["website_deferred_cnt"] = int(stage["deferred_cnt"])
+            result["website_stage_ms"] = int(stage["duration_ms"])
+
+            if stage["updates"]:
+                cur.execute(
+                    """
+                    UPDATE public.aggr_contacts_cb ac
+                    SET company_data = v.company_data::jsonb,
+                        website_processed = v.website_processed,
+                        updated_at = now()
+                    FROM unnest(%s::bigint[], %s::text[], %s::bool[]) AS v(id, company_data, website_processed)
+                    WHERE ac.id = v.id
+                    """,
+                    (
+                        [u[0] for u in stage["updates"]],
+                        [json.dumps(u[1], ensure_ascii=False) for u in stage["updates"]],
+                        [bool(u[2]) for u in stage["updates"]],
+                    ),
+                )
+                conn.commit()
+
+            if stage["gpt_not_ok"]:
+                wait_sec = random.randint(40, 60)
+                result["status"] = "gpt_not_ok_website"
+                _log_event(
                     {
-                        "id": int(contact_id),
-                        "text": _build_contact_text(company_data),
+                        "event": "rate_contacts",
+                        "mode": "gpt_not_ok_website",
+                        "task_id": int(task_id),
+                        "task_type": task_type,
+                        "contact_id": int(stage["gpt_not_ok_contact_id"]),
+                        "gpt_status": str(stage["gpt_not_ok"]),
+                        "wait_sec": int(wait_sec),
                     }
                 )
+                time.sleep(float(wait_sec))
+                return result
+
+            # deferred (website deadline) -> без оценки: sl.rate остаётся NULL, контакт вернётся в следующем run
+            items: List[Dict[str, Any]] = [
+                {
+                    "id": int(contact_id),
+                    "text": _build_contact_text(company_data),
+                }
+                for contact_id, company_data, _ in parsed_rows
+                if int(contact_id) not in stage["deferred_ids"]
+            ]
 
             conn.commit()
 
         result["items_cnt"] = len(items)
         if not items:
-            result["status"] = "no_items"
+            result["status"] = "website_deferred" if stage["deferred_ids"] else "no_items"
             return result
 
         instructions = _build_rating_instructions(task_type, source_product, source_company, source_geo)
@@ -1,11 +1,17 @@
 # FILE: engine/core_rate_cities_expand_pairs/cities_rate_processor.py
-# DATE: 2026-04-05
+# DATE: 2026-10-16
 # PURPOSE: Dedicated worker for city rating tasks only.
+#          RATE_CITIES_MODE=queue -> batches go through the gpt_jobs queue (enqueue + concurrent dispatch)
+#          instead of one synchronous GPT call per run.
+
+import os
 
 from engine.common.worker import Worker
 from engine.core_rate_cities_expand_pairs import rate_cities
 
 RATE_TIMEOUT_SEC = 900
+ENQUEUE_EVERY_SEC = 30
+DISPATCH_EVERY_SEC = 5
 
 
 def main() -> None:
@@ -15,15 +21,35 @@ def main() -> None:
         max_parallel=10,
     )
 
-    w.register(
-        name="rate_cities_once",
-        fn=rate_cities.run_once,
-        every_sec=1,
-        timeout_sec=RATE_TIMEOUT_SEC,
-        singleton=False,
-        heavy=False,
-        priority=10,
-    )
+    if (os.environ.get("RATE_CITIES_MODE") or "").strip().lower() == "queue":
+        w.register(
+            name="rate_cities_enqueue",
+            fn=rate_cities.enqueue_once,
+            every_sec=ENQUEUE_EVERY_SEC,
+            timeout_sec=RATE_TIMEOUT_SEC,
+            singleton=True,
+            heavy=False,
+            priority=20,
+        )
+        w.register(
+            name="rate_cities_dispatch",
+            fn=rate_cities.dispatch_queue_once,
+            every_sec=DISPATCH_EVERY_SEC,
+            timeout_sec=RATE_TIMEOUT_SEC,
+            singleton=True,
+            heavy=False,
+            priority=10,
+        )
+    else:
+        w.register(
+            name="rate_cities_once",
+            fn=rate_cities.run_once,
+            every_sec=1,
+            timeout_sec=RATE_TIMEOUT_SEC,
+            singleton=False,
+            heavy=False,
+            priority=10,
+        )
 
     w.run_forever()
 
@@ -1,7 +1,9 @@
 # FILE: engine/core_rate_cities_expand_pairs/rate_cities.py
-# DATE: 2026-03-25
+# DATE: 2026-10-16
 # PURPOSE: Standalone city-rating task for the new flow. Picks one task with unrated cities,
 # rates up to 50 cities via GPT, stores rates/hash in DB, and returns the batch result.
+# Queue mode: enqueue_once() puts one batch per task (up to QUEUE_TASKS_PER_PASS tasks) into gpt_jobs,
+# dispatch_queue_once() runs them concurrently, _on_rated() validates/saves each result as it arrives.
 
 from __future__ import annotations
 
@@ -11,9 +13,10 @@ import random
 import time
 from typing import Any, Dict, List, Optional, Tuple
 
+from engine.common import gpt_jobs
 from engine.common.cache.client import CLIENT
 from engine.common.db import get_connection
-from engine.common.gpt import GPTClient
+from engine.common.gpt import GPTClient, GptResponse
 from engine.common.logs import log
 from engine.common.translate import get_prompt, translate_text
 from engine.common.utils import h64_text, parse_json_response
@@ -26,6 +29,9 @@ TASK_LOCK_TTL_SEC = 300
 TASK_PICK_LIMIT = 200
 LOG_FILE = "rate_cities.log"
 LOG_FOLDER = "processing"
+WORKLOAD = "rate_cities"
+QUEUE_TASKS_PER_PASS = 200
+DISPATCH_JOBS_PER_PASS = 40  # flex-вызов до ~1 мин; 40 job-ов / 8 потоков укладываются в RATE_TIMEOUT_SEC
 
 
 def _task_lock_key(task_id: int) -> str:
@@ -145,6 +151,7 @@ def _load_candidates(task_id: int, limit: int) -> Tuple[List[Dict[str, Any]], in
               ON cs.id = tcr.city_id
             WHERE tcr.task_id = %s
               AND tcr.rate IS NULL
+            ORDER BY tcr.city_id
             LIMIT %s
             """,
             (int(task_id), int(limit)),
@@ -385,6 +392,94 @@ def run_once() -> Dict[str, Any]:
                 pass
 
 
+def _job_key(task_id: int, hash_task: int, candidates: List[Dict[str, Any]]) -> str:
+    # тот же task + те же города -> тот же key: пока job открыт, повторный enqueue его не дублирует
+    ids = ",".join(str(int(c["id"])) for c in candidates)
+    return f"{int(task_id)}:{int(hash_task)}:{h64_text(ids)}"
+
+
+def enqueue_once() -> Dict[str, Any]:
+    task_ids, pick_task_ids_ms = _pick_task_ids(QUEUE_TASKS_PER_PASS)
+    jobs: List[gpt_jobs.GptJob] = []
+    for task_id in task_ids:
+        task, _ = _load_task(int(task_id))
+        if not task or int(task.get("unrated_cnt") or 0) <= 0:
+            continue
+        candidates, _ = _load_candidates(int(task_id), BATCH_SIZE)
+        if not candidates:
+            continue
+        hash_task = _build_task_hash(
+            str(task["source_product"]),
+            str(task["source_company"]),
+            str(task["source_geo"]),
+        )
+        jobs.append(
+            gpt_jobs.GptJob(
+                key=_job_key(int(task_id), hash_task, candidates),
+                instructions=_build_instructions(
+                    str(task["task_type"]),
+                    str(task["source_product"]),
+                    str(task["source_company"]),
+                    str(task["source_geo"]),
+                ),
+                input=json.dumps({"items_to_rate": candidates}, ensure_ascii=False, separators=(",", ":")),
+                model=MODEL,
+                service_tier=SERVICE_TIER,
+                user_id=str(task["user_id"]),
+                use_gpt_cache=True,
+                meta={
+                    "task_id": int(task_id),
+                    "task_type": str(task["task_type"]),
+                    "hash_task": int(hash_task),
+                    "candidates": [{"id": int(c["id"]), "name": str(c["name"])} for c in candidates],
+                },
+            )
+        )
+
+    queued = GPTClient().submit_many(workload=WORKLOAD, jobs=jobs) if jobs else 0
+    result = {
+        "mode": "enqueue",
+        "tasks_seen": len(task_ids),
+        "jobs_built": len(jobs),
+        "jobs_queued": int(queued),
+        "pick_task_ids_ms": int(pick_task_ids_ms),
+    }
+    _log_event({"event": "rate_cities", **result})
+    return result
+
+
+def _on_rated(job: gpt_jobs.GptJobRow, response: GptResponse) -> None:
+    meta = job.meta or {}
+    candidates = list(meta.get("candidates") or [])
+    data = parse_json_response(response.content or "")
+    rated_items = data.get("rated_items") if isinstance(data, dict) else None
+    items = _validate_ranked_items(candidates, rated_items if isinstance(rated_items, list) else None)
+    saved_count, save_rated_items_ms = _save_rated_items(int(meta["task_id"]), items, int(meta["hash_task"]))
+    _log_event(
+        {
+            "event": "rate_cities",
+            "mode": "ok" if items else "empty",
+            "job_id": int(job.id),
+            "task_id": int(meta["task_id"]),
+            "task_type": str(meta.get("task_type") or ""),
+            "batch_size": len(candidates),
+            "saved_count": int(saved_count),
+            "hash_task": int(meta["hash_task"]),
+            "raw_count": len(rated_items) if isinstance(rated_items, list) else 0,
+            "save_rated_items_ms": int(save_rated_items_ms),
+        }
+    )
+
+
+gpt_jobs.register_handler(WORKLOAD, _on_rated)
+
+
+def dispatch_queue_once() -> Dict[str, Any]:
+    result = gpt_jobs.dispatch_once([WORKLOAD], limit=DISPATCH_JOBS_PER_PASS)
+    _log_event({"event": "rate_cities", "mode": "dispatch", **result})
+    return result
+
+
 def main() -> None:
     print(json.dumps(run_once(), ensure_ascii=False, indent=2))
 
@@ -1,6 +1,8 @@
 # FILE: engine/core_send/sender.py
-# DATE: 2026-04-14
+# DATE: 2026-10-16
 # PURPOSE: Sender based on campaigns.active + campaigns.sending_interval and sending_lists/sending_log.
+# CHANGE: active campaigns are also gated by their compiled send-window calendar (closes on time, waits for next opening).
+# CHANGE: prefetched candidates are re-checked (blocked / wrong_email / removed) right before they are handed out.
 
 from __future__ import annotations
 
@@ -9,15 +11,24 @@ import random
 import signal
 import time
 from collections import deque
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from multiprocessing import Pipe, Process
 from typing import Any, Dict, List, Optional, Tuple
 
 from engine.common.db import fetch_all
+from engine.common.email_template import SendTemplate, compile_send_template
 from engine.common.mail.send import send_one
+from engine.common.mail.sending_log import SendingLogWriter, recover_reserved
+from engine.common.mail.smtp import SMTPSession
+from engine.common.send_window import WindowCalendar, campaign_calendars
 from engine.common.utils import safe_dict
 
 _SEND_FAIL_SLEEP_SEC = 1.0
+_META_REFRESH_SEC = 15.0
+_PENDING_RECOUNT_SEC = 300.0
+_CANDIDATE_BATCH_SIZE = 200
+_CANDIDATE_MAX_AGE_SEC = 120.0
+_CANDIDATE_RECHECK_CHUNK = 32
 
 
 @dataclass
@@ -48,11 +59,43 @@ class SendCandidate:
     norm: Dict[str, Any]
 
 
+@dataclass
+class CandidateCursor:
+    campaign_id: int
+    queue: deque = field(default_factory=deque)
+    pending: int = 0
+    filled_at: float = 0.0
+
+    def next(self) -> Optional[SendCandidate]:
+        now = _now_ts()
+        if self.queue and now - self.filled_at > _CANDIDATE_MAX_AGE_SEC:
+            self.queue.clear()
+        while True:
+            if not self.queue:
+                self.queue.extend(_candidate_batch_for_campaign(int(self.campaign_id), limit=_CANDIDATE_BATCH_SIZE))
+                self.filled_at = now
+                if not self.queue:
+                    self.pending = 0
+                    return None
+            # blocked / wrong_email / removed могли появиться после выборки (IMAP bounce/reply, панель):
+            # перед отправкой голова очереди перепроверяется одним запросом, выбывшие отбрасываются
+            head = [self.queue.popleft() for _ in range(min(_CANDIDATE_RECHECK_CHUNK, len(self.queue)))]
+            ok_ids = _still_sendable_ids(int(self.campaign_id), [c.aggr_contact_cb_id for c in head])
+            head = [c for c in head if int(c.aggr_contact_cb_id) in ok_ids]
+            if head:
+                self.queue.extendleft(reversed(head[1:]))
+                return head[0]
+
+    def consumed(self) -> None:
+        self.pending = max(0, int(self.pending) - 1)
+
+
 @dataclass(frozen=True)
 class CampaignLetterPayload:
     ready_html: str
     subjects: List[str]
     headers: Dict[str, str]
+    template: SendTemplate
 
 
 def _now_ts() -> float:
@@ -69,6 +112,16 @@ def _fmt_wait_sec(ts: float, now: float) -> str:
         return "?"
 
 
+def _smtp_session_brief(smtp_session: Optional[SMTPSession]) -> str:
+    if smtp_session is None:
+        return ""
+    st = smtp_session.stats()
+    return (
+        f" smtp_hs={int(st['handshakes'])} smtp_hs_avg={float(st['handshake_sec_avg']):.2f}s"
+        f" smtp_conn_msgs={int(st['conn_messages'])} smtp_msgs_per_conn={float(st['messages_per_conn_avg']):.1f}"
+    )
+
+
 def _pick_weighted_campaign(candidates: List[Tuple[int, int]]) -> Optional[int]:
     total = sum(max(0, int(weight)) for _, weight in candidates)
     if total <= 0:
@@ -235,14 +288,41 @@ def _candidate_batch_for_campaign(campaign_id: int, *, limit: int = 200) -> List
     return out
 
 
-def _pick_send_candidate(candidates: List[Tuple[int, int]]) -> Optional[SendCandidate]:
+def _still_sendable_ids(campaign_id: int, aggr_contact_cb_ids: List[int]) -> set[int]:
+    ids = [int(x) for x in aggr_contact_cb_ids if int(x) > 0]
+    if not ids:
+        return set()
+    rows = fetch_all(
+        """
+        SELECT sl.aggr_contact_cb_id
+        FROM public.campaigns_campaigns c
+        JOIN public.sending_lists sl
+          ON sl.task_id = c.sending_list_id
+         AND sl.aggr_contact_cb_id = ANY(%s)
+        JOIN public.aggr_contacts_cb ac
+          ON ac.id = sl.aggr_contact_cb_id
+        WHERE c.id = %s
+          AND COALESCE(sl.removed, false) = false
+          AND COALESCE(ac.blocked, false) = false
+          AND COALESCE(ac.wrong_email, false) = false
+        """,
+        [ids, int(campaign_id)],
+    )
+    return {int(r[0]) for r in rows or []}
+
+
+def _pick_send_candidate(
+    candidates: List[Tuple[int, int]],
+    cursors: Dict[int, CandidateCursor],
+) -> Optional[SendCandidate]:
     pool = [(int(cid), int(weight)) for cid, weight in candidates if int(weight) > 0]
     while pool:
         chosen_campaign_id = _pick_weighted_campaign(pool)
         if chosen_campaign_id is None:
             return None
-        batch = _candidate_batch_for_campaign(int(chosen_campaign_id))
-        for candidate in batch:
+        cursor = cursors.get(int(chosen_campaign_id))
+        candidate = cursor.next() if cursor is not None else None
+        if candidate is not None:
             return candidate
         pool = [(cid, weight) for cid, weight in pool if int(cid) != int(chosen_campaign_id)]
     return None
@@ -276,7 +356,12 @@ def _campaign_letter_payloads(campaign_ids: List[int]) -> Dict[int, CampaignLett
                 if kk and vv:
                     hdrs[kk] = vv
         if html_tpl and subject_pool:
-            out[int(cid)] = CampaignLetterPayload(ready_html=html_tpl, subjects=subject_pool, headers=hdrs)
+            out[int(cid)] = CampaignLetterPayload(
+                ready_html=html_tpl,
+                subjects=subject_pool,
+                headers=hdrs,
+                template=compile_send_template(html_tpl),
+            )
     return out
 
 
@@ -338,8 +423,13 @@ def _sender_process_main(mailbox_id: int, campaign_ids: List[int], child_conn) -
     signal.signal(signal.SIGINT, _sigterm)
 
     death_at = _now_ts() + random.uniform(25 * 60, 45 * 60)
+    smtp_session = SMTPSession(int(mailbox_id))
+    log_writer = SendingLogWriter()
 
     try:
+        recovered = recover_reserved([int(x) for x in (campaign_ids or [])])
+        if recovered:
+            hb(next_wake_at=_now_ts() + 0.1, state="RECOVERED", reason=f"unconfirmed_reservations={recovered}")
         _sender_loop(
             mailbox_id=int(mailbox_id),
             campaign_ids=[int(x) for x in (campaign_ids or [])],
@@ -347,11 +437,21 @@ def _sender_process_main(mailbox_id: int, campaign_ids: List[int], child_conn) -
             dead=dead,
             stop_flag=_stop,
             death_at_ts=death_at,
+            smtp_session=smtp_session,
+            log_writer=log_writer,
         )
     except Exception as e:
         dead(f"EXCEPTION:{type(e).__name__}:{e}")
         raise
     finally:
+        try:
+            log_writer.close()
+        except Exception:
+            pass
+        try:
+            smtp_session.shutdown()
+        except Exception:
+            pass
         try:
             child_conn.close()
         except Exception:
@@ -366,6 +466,8 @@ def _sender_loop(
     dead,
     stop_flag: Dict[str, bool],
     death_at_ts: float,
+    smtp_session: Optional[SMTPSession] = None,
+    log_writer: Optional[SendingLogWriter] = None,
 ) -> None:
     camp_ids = [int(x) for x in campaign_ids if int(x) > 0]
     if not camp_ids:
@@ -377,6 +479,13 @@ def _sender_loop(
         return
 
     next_send_at: Dict[int, float] = {}
+    cursors: Dict[int, CandidateCursor] = {}
+    active_intervals: Dict[int, int] = {}
+    active_ids: List[int] = []
+    letter_payloads: Dict[int, CampaignLetterPayload] = {}
+    calendars: Dict[int, WindowCalendar] = {}
+    meta_refresh_at = 0.0
+    pending_recount_at = 0.0
     hb(next_wake_at=_now_ts() + 0.1, state="START", reason=f"campaigns={len(camp_ids)}")
 
     while True:
@@ -386,34 +495,62 @@ def _sender_loop(
         if _now_ts() >= death_at_ts:
             dead("DEATH_AT")
             return
+        if log_writer is not None:
+            log_writer.flush_due()
 
-        active_intervals = _active_campaign_intervals(int(mailbox_id), camp_ids)
-        active_ids = sorted(active_intervals.keys())
-
-        for cid in list(next_send_at.keys()):
-            if cid not in active_intervals:
-                next_send_at.pop(cid, None)
+        # intervals/letters: refresh by timer; a changed active set forces a pending recount
+        now_ts = _now_ts()
+        if now_ts >= meta_refresh_at:
+            active_intervals = _active_campaign_intervals(int(mailbox_id), camp_ids)
+            prev_active_ids = active_ids
+            active_ids = sorted(active_intervals.keys())
+            letter_payloads = _campaign_letter_payloads(active_ids) if active_ids else {}
+            calendars = campaign_calendars(active_ids) if active_ids else {}
+            meta_refresh_at = _now_ts() + _META_REFRESH_SEC
+            if active_ids != prev_active_ids:
+                pending_recount_at = 0.0
+
+            for cid in list(next_send_at.keys()):
+                if cid not in active_intervals:
+                    next_send_at.pop(cid, None)
+            for cid in list(cursors.keys()):
+                if cid not in active_intervals:
+                    cursors.pop(cid, None)
 
         now_ts = _now_ts()
         for cid in active_ids:
             next_send_at.setdefault(int(cid), float(now_ts))
+            cursors.setdefault(int(cid), CandidateCursor(campaign_id=int(cid)))
 
         if not active_ids:
             sleep_sec = 5.0
+            meta_refresh_at = 0.0
             hb(next_wake_at=_now_ts() + sleep_sec, state="NO_ACTIVE_CAMPAIGNS", reason="sleep=5s")
             time.sleep(sleep_sec)
             continue
 
-        letter_payloads = _campaign_letter_payloads(active_ids)
-        pending = _pending_by_campaign(active_ids)
+        # pending: full recount by timer, decremented locally per attempt in between
+        if _now_ts() >= pending_recount_at:
+            pending = _pending_by_campaign(active_ids)
+            for cid in active_ids:
+                cursors[int(cid)].pending = int(pending.get(int(cid), 0))
+            pending_recount_at = _now_ts() + _PENDING_RECOUNT_SEC
+
         ready_candidates: List[Tuple[int, int]] = []
         nearest_next_ts: Optional[float] = None
 
         now_ts = _now_ts()
         for cid in active_ids:
-            pending_cnt = int(pending.get(int(cid), 0))
+            pending_cnt = int(cursors[int(cid)].pending)
             if pending_cnt <= 0:
                 continue
+            # campaigns.active отстаёт от окна на цикл status-процессора; календарь закрывает точно по времени
+            calendar = calendars.get(int(cid))
+            if calendar is not None and not calendar.is_open(now_ts):
+                open_ts = calendar.next_open(now_ts)
+                if open_ts is not None:
+                    nearest_next_ts = open_ts if nearest_next_ts is None else min(nearest_next_ts, open_ts)
+                continue
             due_ts = float(next_send_at.get(int(cid), now_ts))
             if due_ts <= now_ts:
                 ready_candidates.append((int(cid), int(pending_cnt)))
@@ -423,6 +560,7 @@ def _sender_loop(
         if not ready_candidates:
             if nearest_next_ts is None:
                 sleep_sec = 5.0
+                pending_recount_at = min(pending_recount_at, _now_ts() + _META_REFRESH_SEC)
             else:
                 sleep_sec = max(0.5, min(5.0, float(nearest_next_ts - now_ts)))
             hb(
@@ -433,7 +571,7 @@ def _sender_loop(
             time.sleep(sleep_sec)
             continue
 
-        candidate = _pick_send_candidate(ready_candidates)
+        candidate = _pick_send_candidate(ready_candidates, cursors)
         if candidate is None:
             sleep_sec = _SEND_FAIL_SLEEP_SEC
             hb(
@@ -483,6 +621,7 @@ def _sender_loop(
                 "id": int(candidate.campaign_id),
                 "mailbox_id": int(mailbox_id),
                 "ready_content": letter_payload.ready_html,
+                "ready_template": letter_payload.template,
                 "subjects": letter_payload.subjects,
                 "headers": letter_payload.headers,
             }
@@ -492,9 +631,12 @@ def _sender_loop(
                     contact=contact,
                     aggr_contact_cb_id=int(candidate.aggr_contact_cb_id),
                     record_sent=True,
+                    smtp_session=smtp_session,
+                    log_writer=log_writer,
                 )
             )
         except Exception as e:
+            cursors[int(candidate.campaign_id)].consumed()
             next_send_at[int(candidate.campaign_id)] = _now_ts() + 30.0
             sleep_sec = _SEND_FAIL_SLEEP_SEC
             hb(
@@ -506,12 +648,16 @@ def _sender_loop(
             time.sleep(sleep_sec)
             continue
 
+        cursors[int(candidate.campaign_id)].consumed()
         next_send_at[int(candidate.campaign_id)] = _now_ts() + float(interval_sec if sent else max(interval_sec, 1.0))
         hb(
             next_wake_at=next_send_at[int(candidate.campaign_id)],
             state="SCHEDULED_NEXT",
             campaign_id=candidate.campaign_id,
-            reason=f"sent={str(bool(sent)).lower()} next_in={(interval_sec if sent else max(interval_sec, 1.0)):.2f}s",
+            reason=(
+                f"sent={str(bool(sent)).lower()} next_in={(interval_sec if sent else max(interval_sec, 1.0)):.2f}s"
+                f"{_smtp_session_brief(smtp_session)}"
+            ),
         )
 
 
@@ -0,0 +1,200 @@
+# FILE: engine/core_stats/bench_ingest.py  (новое — 2026-10-16)
+# PURPOSE: Replay-бенч загрузки smrel.log: прежний stat_processor (INSERT VALUES по 500 строк, соединение на пачку)
+#          против engine.core_stats.ingest (COPY + checkpoint в одной транзакции, дедуп, почасовые счётчики).
+#          Синтетический лог на --lines строк (по умолчанию 10M), доля --dup-share повторов (префетч / повторные открытия).
+#          Посередине лог ротируется (rename -> smrel.log.1 + новый smrel.log), checkpoint стоит внутри старого файла.
+#          Всё в отдельной схеме (--schema, по умолчанию bench_ingest; public не трогается). --no-db — только parse+dedup.
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Tuple
+
+from engine.core_stats import ingest as ig
+
+
+def _write_log(path: str, start_line: int, n: int, letters: int, dup_share: float, seed: int) -> None:
+    rnd = random.Random(seed + start_line)
+    t0 = datetime(2026, 9, 1, tzinfo=timezone.utc) + timedelta(seconds=start_line)
+    recent: List[int] = []
+    with open(path, "wb", buffering=1 << 20) as f:
+        for i in range(n):
+            ts = t0 + timedelta(seconds=i)
+            if recent and rnd.random() < dup_share:
+                letter = recent[rnd.randrange(len(recent))]  # тот же letter в пределах окна
+            else:
+                letter = rnd.randint(1, letters)
+                recent.append(letter)
+                if len(recent) > 256:
+                    recent.pop(0)
+            f.write(f"{ts.strftime('%Y-%m-%dT%H:%M:%SZ')}\t{letter}\n".encode("ascii"))
+
+
+def _parse_dedup_only(paths: List[str]) -> Tuple[int, int, float]:
+    dd = ig.Deduper()
+    lines = dups = 0
+    t0 = time.perf_counter()
+    for p in paths:
+        st = os.stat(p)
+        plan = ig.ReadPlan(p, int(st.st_ino), int(st.st_dev), 0, final=True)
+        for line, _pos in ig.iter_lines(plan, 1 << 62):
+            parsed = ig.parse_line(line)
+            if parsed is None:
+                continue
+            lines += 1
+            key = dd.key(*parsed)
+            if key in dd:
+                dups += 1
+            else:
+                dd.add_many((key,))
+    return lines, dups, time.perf_counter() - t0
+
+
+def _schema_sql(s: str, campaigns: int, letters: int) -> str:
+    return f"""
+    DROP SCHEMA IF EXISTS {s} CASCADE;
+    CREATE SCHEMA {s};
+    CREATE TABLE {s}.sending_log (id bigint PRIMARY KEY, campaign_id bigint NOT NULL);
+    INSERT INTO {s}.sending_log (id, campaign_id) SELECT g, 1 + g % {int(campaigns)} FROM generate_series(1, {int(letters)}) g;
+    CREATE TABLE {s}.mailbox_stats (id bigserial PRIMARY KEY, letter_id bigint NOT NULL, time timestamptz NOT NULL);
+    """
+
+
+def _legacy_replay(path: str, s: str, max_lines: int) -> Tuple[int, float]:
+    # stat_processor до 2026-10-16: INSERT ... VALUES (%s,%s) x500 через db.execute (новое соединение на пачку при DB_POOL=0)
+    from engine.common.db import execute
+
+    batch: List[Tuple[int, datetime]] = []
+    n = 0
+    t0 = time.perf_counter()
+
+    def flush() -> None:
+        params: list = []
+        for letter_id, ts in batch:
+            params.extend([letter_id, ts])
+        execute(
+            f"INSERT INTO {s}.mailbox_stats (letter_id, time) VALUES {','.join(['(%s,%s)'] * len(batch))}", params
+        )
+        batch.clear()
+
+    with open(path, "rb") as f:
+        for line in f:
+            parsed = ig.parse_line(line)
+            if not parsed:
+                continue
+            batch.append(parsed)
+            n += 1
+            if len(batch) >= 500:
+                flush()
+            if n >= max_lines:
+                break
+    if batch:
+        flush()
+    return n, time.perf_counter() - t0
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--lines", type=int, default=10_000_000)
+    ap.add_argument("--letters", type=int, default=2_000_000)
+    ap.add_argument("--campaigns", type=int, default=500)
+    ap.add_argument("--dup-share", type=float, default=0.3)
+    ap.add_argument("--legacy-lines", type=int, default=500_000, help="прежний путь — на префиксе, экстраполяция")
+    ap.add_argument("--max-bytes", type=int, default=ig.MAX_BYTES_PER_RUN)
+    ap.add_argument("--schema", default="bench_ingest")
+    ap.add_argument("--dir", default="")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--no-db", action="store_true")
+    ap.add_argument("--keep", action="store_true")
+    args = ap.parse_args()
+
+    work = args.dir or tempfile.mkdtemp(prefix="bench_ingest_")
+    log = os.path.join(work, "smrel.log")
+    half = int(args.lines) // 2
+
+    t0 = time.perf_counter()
+    _write_log(log + ".gen1", 0, half, int(args.letters), float(args.dup_share), int(args.seed))
+    _write_log(log + ".gen2", half, int(args.lines) - half, int(args.letters), float(args.dup_share), int(args.seed))
+    size = os.path.getsize(log + ".gen1") + os.path.getsize(log + ".gen2")
+    print(f"log: {args.lines} lines, {size / 1e6:.0f}MB in {time.perf_counter() - t0:.1f}s ({work})")
+
+    lines, dups, dt = _parse_dedup_only([log + ".gen1", log + ".gen2"])
+    print(f"parse+dedup only: {lines} lines, dups={dups} ({dups / max(lines, 1):.1%}) in {dt:.1f}s = {lines / dt:,.0f} lines/s")
+
+    if args.no_db:
+        if not args.keep:
+            for p in (log + ".gen1", log + ".gen2"):
+                os.remove(p)
+        return
+
+    from engine.common import db
+
+    s = str(args.schema)
+    db.execute(_schema_sql(s, int(args.campaigns), int(args.letters)))
+    db.execute(ig.schema_sql(s))
+
+    n_legacy, dt_legacy = _legacy_replay(log + ".gen1", s, int(args.legacy_lines))
+    rate_legacy = n_legacy / max(dt_legacy, 1e-9)
+    print(
+        f"legacy INSERT x500: {n_legacy} lines in {dt_legacy:.1f}s = {rate_legacy:,.0f} lines/s "
+        f"(10M ≈ {int(args.lines) / rate_legacy / 60:.1f} min)"
+    )
+    db.execute(f"TRUNCATE {s}.mailbox_stats; TRUNCATE {s}.stat_ingest_state; TRUNCATE {s}.campaign_stats_hourly")
+
+    # первая половина пишется в smrel.log; после первого прохода — ротация
+    os.rename(log + ".gen1", log)
+    dd = ig.Deduper()
+    runs = 0
+    rotated = False
+    t0 = time.perf_counter()
+    while True:
+        res = ig.ingest(log, source="bench", max_bytes=int(args.max_bytes), dedup=dd, schema=s)
+        runs += 1
+        for note in res.get("notes") or []:
+            print(f"  run#{runs}: {note}")
+        if not rotated:
+            os.rename(log, log + ".1")
+            os.rename(log + ".gen2", log)
+            rotated = True
+            continue
+        if not res.get("lines"):
+            break
+    dt_new = time.perf_counter() - t0
+
+    row = db.fetch_one(
+        f"""
+        SELECT
+            (SELECT COUNT(*) FROM {s}.mailbox_stats),
+            (SELECT COALESCE(SUM(opens), 0) FROM {s}.campaign_stats_hourly),
+            (SELECT COALESCE(SUM(dup_events), 0) FROM {s}.campaign_stats_hourly),
+            (SELECT lines_total FROM {s}.stat_ingest_state WHERE source = 'bench'),
+            (SELECT file_offset FROM {s}.stat_ingest_state WHERE source = 'bench')
+        """
+    )
+    ms_rows, opens, dup_events, lines_total, offset = [int(x or 0) for x in row]
+    print(
+        f"ingest COPY: {lines_total} lines in {dt_new:.1f}s over {runs} runs = {lines_total / dt_new:,.0f} lines/s "
+        f"(x{(lines_total / dt_new) / max(rate_legacy, 1e-9):.1f} vs legacy)"
+    )
+    ok = ms_rows == opens and ms_rows + dup_events == lines_total == int(args.lines) and offset == os.path.getsize(log)
+    print(
+        f"check: mailbox_stats={ms_rows} hourly_opens={opens} dups={dup_events} lines={lines_total} "
+        f"offset={offset} -> {'OK' if ok else 'MISMATCH'}"
+    )
+
+    if not args.keep:
+        db.execute(f"DROP SCHEMA {s} CASCADE")
+        for p in (log, log + ".1"):
+            try:
+                os.remove(p)
+            except OSError:
+                pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+# FILE: engine/core_stats/ingest.py  (новое — 2026-10-16)
+# PURPOSE: Загрузка лога открытий (smrel.log: "<iso ts>\t<letter_id>") в mailbox_stats.
+#          - COPY FROM STDIN во временную stage-таблицу, затем одним statement-ом в mailbox_stats
+#            + почасовые счётчики кампаний + checkpoint (inode, offset) — всё в одной транзакции:
+#            падение = откат целиком, повтор с того же места, без дублей и потерь.
+#          - checkpoint в БД (public.stat_ingest_state), а не в файле; только полные строки (хвост без \n ждёт).
+#          - ротация: inode сменился -> дочитать старый файл (smrel.log.1, найден по inode) с offset, потом новый с 0;
+#            тот же inode, но размер < offset (copytruncate) -> с 0.
+#          - дедуп (letter_id, окно DEDUP_WINDOW_SEC): префетч image-proxy и повторные открытия в окне -> одна строка.
+#            Ограниченный набор ключей в памяти (FIFO), пополняется только после commit; на холодном старте
+#            прогревается из mailbox_stats за последнее окно.
+#          - public.campaign_stats_hourly: opens (после дедупа) и dup_events (отброшенные) по кампании/часу.
+# CHANGE: (2026-10-16) DDL из ensure_schema() перенесён в миграцию aap_campaigns/0007_stat_ingest.
+
+from __future__ import annotations
+
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from engine.common import db
+
+SCHEMA = "public"
+DEDUP_WINDOW_SEC = 30 * 60
+DEDUP_MAX_KEYS = 1_000_000
+READ_CHUNK_BYTES = 1 << 20
+MAX_BYTES_PER_RUN = 32 << 20
+ROTATED_SUFFIXES = (".1", ".0", "-old")
+
+# Схема ставится миграцией web/panel aap_campaigns 0007_stat_ingest (шаг деплоя), не из процессов воркеров
+def schema_sql(schema: str = SCHEMA) -> str:
+    return f"""
+CREATE TABLE IF NOT EXISTS {schema}.stat_ingest_state (
+    source text PRIMARY KEY,
+    inode bigint NOT NULL,
+    dev bigint NOT NULL,
+    file_offset bigint NOT NULL,
+    last_event_at timestamptz,
+    lines_total bigint NOT NULL DEFAULT 0,
+    rows_total bigint NOT NULL DEFAULT 0,
+    dups_total bigint NOT NULL DEFAULT 0,
+    bad_total bigint NOT NULL DEFAULT 0,
+    updated_at timestamptz NOT NULL DEFAULT now()
+);
+CREATE TABLE IF NOT EXISTS {schema}.campaign_stats_hourly (
+    campaign_id bigint NOT NULL,
+    hour timestamptz NOT NULL,
+    opens bigint NOT NULL DEFAULT 0,
+    dup_events bigint NOT NULL DEFAULT 0,
+    updated_at timestamptz NOT NULL DEFAULT now(),
+    PRIMARY KEY (campaign_id, hour)
+);
+"""
+
+
+# -------------------- parse / dedup --------------------
+
+
+def parse_line(line: bytes) -> Optional[Tuple[int, datetime]]:
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        ts_raw, smrel = line.split(b"\t", 1)
+        letter_id = int(smrel)
+        ts = datetime.fromisoformat(ts_raw.decode("ascii").replace("Z", "+00:00"))
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        return letter_id, ts
+    except Exception:
+        return None
+
+
+class Deduper:
+    """Ключи (letter_id, окно) в порядке поступления; сверх max_keys вытесняются самые старые."""
+
+    def __init__(self, window_sec: int = DEDUP_WINDOW_SEC, max_keys: int = DEDUP_MAX_KEYS) -> None:
+        self.window_sec = max(1, int(window_sec))
+        self.max_keys = max(1, int(max_keys))
+        self._keys: "OrderedDict[Tuple[int, int], None]" = OrderedDict()
+        self.warm = False
+
+    def key(self, letter_id: int, ts: datetime) -> Tuple[int, int]:
+        return (int(letter_id), int(ts.timestamp()) // self.window_sec)
+
+    def __contains__(self, key: Tuple[int, int]) -> bool:
+        return key in self._keys
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add_many(self, keys: Iterable[Tuple[int, int]]) -> None:
+        d = self._keys
+        for k in keys:
+            d[k] = None
+        while len(d) > self.max_keys:
+            d.popitem(last=False)
+
+
+_DEDUP: Dict[str, Deduper] = {}
+
+
+def deduper_for(source: str) -> Deduper:
+    # процесс resident (Worker) -> набор живёт между запусками
+    d = _DEDUP.get(source)
+    if d is None:
+        d = Deduper()
+        _DEDUP[source] = d
+    return d
+
+
+# -------------------- checkpoint / rotation --------------------
+
+
+@dataclass
+class Checkpoint:
+    inode: int
+    dev: int
+    offset: int
+    last_event_at: Optional[datetime]
+
+
+@dataclass
+class ReadPlan:
+    path: str
+    inode: int
+    dev: int
+    offset: int
+    final: bool  # файл больше не пишется (ротирован) -> хвост без \n тоже строка
+
+
+def _find_rotated(path: str, inode: int, dev: int) -> Optional[str]:
+    for suffix in ROTATED_SUFFIXES:
+        cand = path + suffix
+        try:
+            st = os.stat(cand)
+        except OSError:
+            continue
+        if int(st.st_ino) == int(inode) and int(st.st_dev) == int(dev):
+            return cand
+    return None
+
+
+def plan_reads(path: str, cp: Optional[Checkpoint]) -> Tuple[List[ReadPlan], List[str]]:
+    """-> (что читать по порядку, заметки). Без checkpoint — текущий файл с 0."""
+    notes: List[str] = []
+    try:
+        st = os.stat(path)
+    except OSError:
+        st = None
+
+    plans: List[ReadPlan] = []
+    if cp is not None and (st is None or int(st.st_ino) != cp.inode or int(st.st_dev) != cp.dev):
+        old = _find_rotated(path, cp.inode, cp.dev)
+        if old is not None:
+            plans.append(ReadPlan(old, cp.inode, cp.dev, cp.offset, final=True))
+            notes.append(f"rotated: drain {os.path.basename(old)} from {cp.offset}")
+        else:
+            notes.append(f"rotated: old inode {cp.inode} not found, tail after offset {cp.offset} lost")
+        if st is not None:
+            plans.append(ReadPlan(path, int(st.st_ino), int(st.st_dev), 0, final=False))
+        return plans, notes
+
+    if st is None:
+        return plans, notes
+    offset = cp.offset if cp is not None else 0
+    if int(st.st_size) < offset:
+        notes.append(f"truncated: size {st.st_size} < offset {offset}, restart at 0")
+        offset = 0
+    plans.append(ReadPlan(path, int(st.st_ino), int(st.st_dev), offset, final=False))
+    return plans, notes
+
+
+def iter_lines(plan: ReadPlan, max_bytes: int) -> Iterator[Tuple[bytes, int]]:
+    """(строка, offset после неё) — только полные строки; max_bytes — мягкий лимит на запуск."""
+    with open(plan.path, "rb") as f:
+        st = os.fstat(f.fileno())
+        if int(st.st_ino) != plan.inode:
+            return  # подменили между stat и open — следующий запуск перепланирует
+        f.seek(plan.offset)
+        pos = plan.offset
+        rest = b""
+        read = 0
+        while read < max_bytes:
+            chunk = f.read(READ_CHUNK_BYTES)
+            if not chunk:
+                break
+            read += len(chunk)
+            buf = rest + chunk
+            start = 0
+            while True:
+                nl = buf.find(b"\n", start)
+                if nl < 0:
+                    break
+                pos += nl + 1 - start
+                yield buf[start:nl], pos
+                start = nl + 1
+            rest = buf[start:]
+        if plan.final and rest and read < max_bytes:
+            yield rest, pos + len(rest)
+
+
+# -------------------- write --------------------
+
+
+def _load_checkpoint(cur: Any, source: str, schema: str) -> Optional[Checkpoint]:
+    cur.execute(
+        f"""
+        SELECT inode, dev, file_offset, last_event_at
+        FROM {schema}.stat_ingest_state
+        WHERE source = %s
+        FOR UPDATE
+        """,
+        [source],
+    )
+    row = cur.fetchone()
+    if not row:
+        return None
+    return Checkpoint(int(row[0]), int(row[1]), int(row[2]), row[3])
+
+
+def _warm_dedup(cur: Any, dedup: Deduper, cp: Optional[Checkpoint], schema: str) -> None:
+    if cp is None or cp.last_event_at is None:
+        dedup.warm = True
+        return
+    since = cp.last_event_at - timedelta(seconds=dedup.window_sec)
+    cur.execute(f"SELECT letter_id, time FROM {schema}.mailbox_stats WHERE time >= %s", [since])
+    dedup.add_many(dedup.key(int(r[0]), r[1]) for r in cur.fetchall() or [] if r[0] is not None and r[1] is not None)
+    dedup.warm = True
+
+
+def _stage(cur: Any) -> None:
+    cur.execute(
+        """
+        CREATE TEMP TABLE IF NOT EXISTS stat_ingest_stage (
+            letter_id bigint NOT NULL,
+            time timestamptz NOT NULL,
+            dup boolean NOT NULL
+        ) ON COMMIT DELETE ROWS
+        """
+    )
+    cur.execute("TRUNCATE stat_ingest_stage")
+
+
+def _apply_stage(cur: Any, schema: str) -> int:
+    cur.execute(
+        f"""
+        INSERT INTO {schema}.mailbox_stats (letter_id, time)
+        SELECT letter_id, time FROM stat_ingest_stage WHERE NOT dup
+        """
+    )
+    rows = int(cur.rowcount or 0)
+    cur.execute(
+        f"""
+        INSERT INTO {schema}.campaign_stats_hourly AS h (campaign_id, hour, opens, dup_events)
+        SELECT
+            lg.campaign_id::bigint,
+            date_trunc('hour', s.time),
+            COUNT(*) FILTER (WHERE NOT s.dup),
+            COUNT(*) FILTER (WHERE s.dup)
+        FROM stat_ingest_stage s
+        JOIN {schema}.sending_log lg ON lg.id = s.letter_id
+        WHERE lg.campaign_id IS NOT NULL
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+        ON CONFLICT (campaign_id, hour) DO UPDATE
+        SET opens = h.opens + EXCLUDED.opens,
+            dup_events = h.dup_events + EXCLUDED.dup_events,
+            updated_at = now()
+        """
+    )
+    return rows
+
+
+def _save_checkpoint(cur: Any, source: str, cp: Checkpoint, counts: Dict[str, int], schema: str) -> None:
+    cur.execute(
+        f"""
+        INSERT INTO {schema}.stat_ingest_state AS s
+            (source, inode, dev, file_offset, last_event_at, lines_total, rows_total, dups_total, bad_total)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (source) DO UPDATE
+        SET inode = EXCLUDED.inode,
+            dev = EXCLUDED.dev,
+            file_offset = EXCLUDED.file_offset,
+            last_event_at = GREATEST(s.last_event_at, EXCLUDED.last_event_at),
+            lines_total = s.lines_total + EXCLUDED.lines_total,
+            rows_total = s.rows_total + EXCLUDED.rows_total,
+            dups_total = s.dups_total + EXCLUDED.dups_total,
+            bad_total = s.bad_total + EXCLUDED.bad_total,
+            updated_at = now()
+        """,
+        [
+            source,
+            cp.inode,
+            cp.dev,
+            cp.offset,
+            cp.last_event_at,
+            counts["lines"],
+            counts["rows"],
+            counts["dups"],
+            counts["bad"],
+        ],
+    )
+
+
+def ingest(
+    path: str,
+    *,
+    source: str = "smrel",
+    initial_offset: Optional[int] = None,
+    max_bytes: int = MAX_BYTES_PER_RUN,
+    dedup: Optional[Deduper] = None,
+    schema: str = SCHEMA,
+) -> Dict[str, Any]:
+    """
+    Один проход: всё новое в лог-файле(ах) до max_bytes -> mailbox_stats, одна транзакция.
+    initial_offset — только при первом запуске (нет checkpoint): перенос старого offset-файла, тот же inode.
+    """
+    dd = dedup if dedup is not None else deduper_for(source)
+    counts = {"lines": 0, "rows": 0, "dups": 0, "bad": 0}
+    notes: List[str] = []
+
+    with db.connection() as conn:
+        with conn.cursor() as cur:
+            cp = _load_checkpoint(cur, source, schema)
+            if cp is None and initial_offset:
+                try:
+                    st = os.stat(path)
+                    cp = Checkpoint(int(st.st_ino), int(st.st_dev), int(initial_offset), None)
+                    notes.append(f"migrated offset file: {initial_offset}")
+                except OSError:
+                    pass
+            if not dd.warm:
+                _warm_dedup(cur, dd, cp, schema)
+
+            plans, plan_notes = plan_reads(path, cp)
+            notes.extend(plan_notes)
+            if not plans:
+                conn.rollback()
+                return {"mode": "no_file", "notes": notes, **counts}
+
+            _stage(cur)
+            fresh: Dict[Tuple[int, int], None] = {}
+            last_event_at = cp.last_event_at if cp is not None else None
+            end = cp
+            budget = int(max_bytes)
+
+            with cur.copy("COPY stat_ingest_stage (letter_id, time, dup) FROM STDIN") as copy:
+                for plan in plans:
+                    end = Checkpoint(plan.inode, plan.dev, plan.offset, last_event_at)
+                    consumed = 0
+                    for line, pos in iter_lines(plan, budget):
+                        consumed = pos - plan.offset
+                        end.offset = pos
+                        counts["lines"] += 1
+                        parsed = parse_line(line)
+                        if parsed is None:
+                            if line.strip():
+                                counts["bad"] += 1
+                            continue
+                        letter_id, ts = parsed
+                        key = dd.key(letter_id, ts)
+                        dup = key in dd or key in fresh
+                        if dup:
+                            counts["dups"] += 1
+                        else:
+                            fresh[key] = None
+                        copy.write_row((letter_id, ts, dup))
+                        if last_event_at is None or ts > last_event_at:
+                            last_event_at = ts
+                    end.last_event_at = last_event_at
+                    budget -= consumed
+                    if budget <= 0 or (plan.final and end.offset < _size(plan.path)):
+                        break  # лимит запуска: следующий раз продолжим с этого файла / offset
+
+            counts["rows"] = _apply_stage(cur, schema) if counts["lines"] else 0
+            if end is not None:
+                _save_checkpoint(cur, source, end, counts, schema)
+        conn.commit()
+
+    dd.add_many(fresh.keys())
+    return {
+        "mode": "ok",
+        "inode": end.inode if end is not None else None,
+        "offset": end.offset if end is not None else None,
+        "dedup_keys": len(dd),
+        "notes": notes,
+        **counts,
+    }
+
+
+def _size(path: str) -> int:
+    try:
+        return int(os.stat(path).st_size)
+    except OSError:
+        return 0
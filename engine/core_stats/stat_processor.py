@@ -1,23 +1,24 @@
 # FILE: engine/core_stats/stat_processor.py
 # PATH: engine/core_stats/stat_processor.py
-# DATE: 2026-01-31
+# DATE: 2026-10-16
 # SUMMARY:
 # - Parse smrel.log from serenity-logs volume
-# - Batch insert into mailbox_stats(letter_id, time)
-# - Append-only processing with file offset
+# - Ingest via engine.core_stats.ingest: COPY + mailbox_stats + hourly counters + checkpoint in one transaction
+# - Checkpoint (inode, offset) in stat_ingest_state; survives logrotate (rename and copytruncate)
+# - Dedup (letter_id, 30 min window) in a bounded in-memory set -> resident worker process
+# - Old .smrel.offset file is read once to seed the first checkpoint
 # - Run via engine.common.worker.Worker (run_forever)
 
 from __future__ import annotations
 
 import os
-from datetime import datetime
 
-from engine.common.db import execute
 from engine.common.worker import Worker
+from engine.core_stats import ingest
 
 LOG_PATH = "/serenity-logs/smrel/smrel.log"
 OFFSET_PATH = "/serenity-logs/smrel/.smrel.offset"
-BATCH_SIZE = 500
+SOURCE = "smrel"
 
 
 def _load_offset() -> int:
@@ -28,81 +29,21 @@ def _load_offset() -> int:
         return 0
 
 
-def _save_offset(offset: int) -> None:
-    os.makedirs(os.path.dirname(OFFSET_PATH), exist_ok=True)
-    with open(OFFSET_PATH, "w") as f:
-        f.write(str(offset))
-
-
-def _parse_line(line: str):
-    line = line.strip()
-    if not line:
-        return None
-
-    try:
-        ts_raw, smrel = line.split("\t", 1)
-        letter_id = int(smrel)
-        ts = datetime.fromisoformat(ts_raw.replace("Z", "+00:00"))
-        return letter_id, ts
-    except Exception:
-        return None
-
-
-def _flush_batch(batch) -> int:
-    if not batch:
-        return 0
-
-    values_sql = ",".join(["(%s,%s)"] * len(batch))
-    params = []
-    for letter_id, ts in batch:
-        params.extend([letter_id, ts])
-
-    execute(
-        f"""
-        INSERT INTO mailbox_stats (letter_id, time)
-        VALUES {values_sql}
-        """,
-        params,
-    )
-    return len(batch)
-
-
 def process_once() -> int:
-    if not os.path.exists(LOG_PATH):
+    if not os.path.exists(LOG_PATH) and not any(os.path.exists(LOG_PATH + s) for s in ingest.ROTATED_SUFFIXES):
         print("[STAT] log file not found")
         return 0
 
-    offset = _load_offset()
-    processed = 0
-    batch = []
-
-    with open(LOG_PATH, "r") as f:
-        f.seek(offset)
-
-        for line in f:
-            parsed = _parse_line(line)
-            if not parsed:
-                continue
-
-            batch.append(parsed)
-
-            if len(batch) >= BATCH_SIZE:
-                n = _flush_batch(batch)
-                processed += n
-                print(f"[STAT] inserted batch: {n}")
-                batch.clear()
-
-        if batch:
-            n = _flush_batch(batch)
-            processed += n
-            print(f"[STAT] inserted batch: {n}")
-            batch.clear()
-
-        new_offset = f.tell()
-        _save_offset(new_offset)
+    res = ingest.ingest(LOG_PATH, source=SOURCE, initial_offset=_load_offset())
+    for note in res.get("notes") or []:
+        print(f"[STAT] {note}")
 
-    if processed:
-        print(f"[STAT] done, rows={processed}, offset={new_offset}")
+    processed = int(res.get("rows") or 0)
+    if res.get("lines"):
+        print(
+            f"[STAT] done, rows={processed}, dups={res.get('dups')}, bad={res.get('bad')}, "
+            f"offset={res.get('offset')}, inode={res.get('inode')}, dedup_keys={res.get('dedup_keys')}"
+        )
     else:
         print("[STAT] nothing new")
 
@@ -112,7 +53,7 @@ def process_once() -> int:
 def main() -> None:
     print("[STAT] worker started")
 
-    w = Worker(name="stat_processor", tick_sec=0.5)
+    w = Worker(name="stat_processor", tick_sec=0.5, resident=True)
 
     w.register(
         "process_smrel_log",
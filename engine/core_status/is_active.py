@@ -1,6 +1,7 @@
 # FILE: engine/core_status/is_active.py
-# DATE: 2026-04-06
+# DATE: 2026-10-16
 # PURPOSE: Helper functions for audience task active evaluation.
+# CHANGE: cache writes/invalidations feed core_status task_dirty (dirty ids + recheck_at at cache expiry).
 
 from __future__ import annotations
 
@@ -10,6 +11,7 @@ from typing import Any
 
 from engine.common.cache.client import CLIENT
 from engine.common.db import fetch_all, fetch_one
+from engine.core_status import task_dirty
 
 
 LIMIT_TEST_CONTACTS_RATED = 60
@@ -130,11 +132,15 @@ def _set_cached_bool(cache_key: str, value: bool, ttl_sec: int) -> None:
 
 
 def _set_test_more_needed(task_id: int, value: bool) -> None:
-    _set_cached_bool(_test_more_needed_cache_key(int(task_id)), bool(value), _test_more_needed_cache_ttl_sec())
+    ttl_sec = _test_more_needed_cache_ttl_sec()
+    _set_cached_bool(_test_more_needed_cache_key(int(task_id)), bool(value), ttl_sec)
+    task_dirty.schedule_recheck(int(task_id), ttl_sec)
 
 
 def _set_full_more_needed(task_id: int, value: bool) -> None:
-    _set_cached_bool(_full_more_needed_cache_key(int(task_id)), bool(value), _full_more_needed_cache_ttl_sec())
+    ttl_sec = _full_more_needed_cache_ttl_sec()
+    _set_cached_bool(_full_more_needed_cache_key(int(task_id)), bool(value), ttl_sec)
+    task_dirty.schedule_recheck(int(task_id), ttl_sec)
 
 
 def _load_full_state_payload(task_id: int) -> dict[str, Any]:
@@ -179,6 +185,7 @@ def clear_is_more_needed_state_cache(task_id: int) -> None:
 
 def clear_is_more_needed_full_cache(task_id: int) -> None:
     CLIENT.delete_many([_full_more_needed_cache_key(int(task_id))])
+    task_dirty.mark_dirty([int(task_id)])
 
 
 def invalidate_is_more_needed_cache(task_id: int) -> None:
@@ -188,6 +195,7 @@ def invalidate_is_more_needed_cache(task_id: int) -> None:
             _full_more_needed_cache_key(int(task_id)),
         ]
     )
+    task_dirty.mark_dirty([int(task_id)])
 
 
 def start_full_continue_window(task_id: int) -> None:
@@ -383,6 +391,8 @@ def is_more_needed(task_id: int, update: bool = False) -> bool:
             needed = False
 
         _set_test_more_needed(int(task_id_i), bool(needed))
+        if bool(force_update):
+            task_dirty.mark_dirty([int(task_id_i)])
         return bool(needed)
 
     if access_type in {"full", "super", "custom"}:
@@ -392,6 +402,8 @@ def is_more_needed(task_id: int, update: bool = False) -> bool:
                 return bool(cached)
         needed = bool(_compute_full_more_needed(int(task_id_i), int(rate_limit)))
         _set_full_more_needed(int(task_id_i), bool(needed))
+        if bool(force_update):
+            task_dirty.mark_dirty([int(task_id_i)])
         return bool(needed)
 
     if access_type == "stat_only":
@@ -0,0 +1,61 @@
+# FILE: engine/core_status/maintenance_processor.py
+# DATE: 2026-10-16
+# PURPOSE: Dedicated worker for long status-side maintenance: campaign_counters verify / sent recount,
+#          hourly partition maintenance for sending_log / mailbox_stats (premake months, indexes, archive expired).
+#          Kept out of core_status_processor: its max_parallel=1 slot serves the 2s dirty / 10s campaign status
+#          cycles, a 15-60 min run there would leave ready/active and campaign status stale for its whole duration.
+
+from engine.common import partitions
+from engine.common.worker import Worker
+from engine.core_status import status
+
+CAMPAIGN_SENT_RECOUNT_EVERY_SEC = 60 * 60
+CAMPAIGN_SENT_RECOUNT_TIMEOUT_SEC = 15 * 60
+COUNTERS_FULL_VERIFY_EVERY_SEC = 24 * 60 * 60
+COUNTERS_FULL_VERIFY_TIMEOUT_SEC = 60 * 60
+PARTITIONS_EVERY_SEC = 60 * 60
+PARTITIONS_TIMEOUT_SEC = 30 * 60
+
+
+def main() -> None:
+    w = Worker(
+        name="core_status_maintenance_processor",
+        tick_sec=5,
+        max_parallel=1,
+    )
+
+    w.register(
+        name="campaign_sent_recount_run_once",
+        fn=status.run_campaign_sent_recount_once,
+        every_sec=CAMPAIGN_SENT_RECOUNT_EVERY_SEC,
+        timeout_sec=CAMPAIGN_SENT_RECOUNT_TIMEOUT_SEC,
+        singleton=True,
+        heavy=False,
+        priority=20,
+    )
+
+    w.register(
+        name="campaign_counters_full_verify_run_once",
+        fn=status.run_campaign_counters_full_verify_once,
+        every_sec=COUNTERS_FULL_VERIFY_EVERY_SEC,
+        timeout_sec=COUNTERS_FULL_VERIFY_TIMEOUT_SEC,
+        singleton=True,
+        heavy=True,
+        priority=25,
+    )
+
+    w.register(
+        name="partitions_maintenance_run_once",
+        fn=partitions.run_maintenance_once,
+        every_sec=PARTITIONS_EVERY_SEC,
+        timeout_sec=PARTITIONS_TIMEOUT_SEC,
+        singleton=True,
+        heavy=True,
+        priority=30,
+    )
+
+    w.run_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,10 @@
 # FILE: engine/core_status/status.py
-# DATE: 2026-04-05
+# DATE: 2026-10-16
 # PURPOSE: Temporary status helpers and audience task active recalculation.
+# CHANGE: campaign sent recount reads campaign_counters (verify_and_repair first) instead of GROUP BY over sending_log.
+# CHANGE: run_dirty_once — ready/active only for task_dirty ids (dirty / recheck_at due); full runs = safety sweep.
+# CHANGE: campaign window checks go through send_window.calendar_for (compiled per window hash, shared by campaigns).
+# CHANGE: effective window loading (campaign -> workspace -> global) + campaign_calendars moved to engine.common.send_window.
 
 from __future__ import annotations
 
@@ -8,39 +12,33 @@ import json
 import math
 import random
 from datetime import date, datetime, timedelta
-from typing import Any, Dict, Iterable, Optional, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 from zoneinfo import ZoneInfo
 
+from engine.common import campaign_counters
 from engine.common.cache.client import CLIENT
 from engine.common.db import get_connection
 from engine.common.db import fetch_all
-from engine.common.db import fetch_one
-from engine.common.email_template import _is_de_public_holiday
+from engine.common.send_window import calendar_for, effective_window, load_global_window, load_workspace_windows
+from engine.core_status import task_dirty
 from engine.core_status.is_active import clear_is_more_needed_full_cache, is_more_needed
 
 _TZ_BERLIN = ZoneInfo("Europe/Berlin")
 _CACHE_TTL_MIN_SEC = 8 * 60
 _CACHE_TTL_MAX_SEC = 12 * 60
+_WINDOW_LOOKAHEAD_DAYS = 14
 
 
 def _cache_ttl_sec() -> int:
     return int(random.randint(_CACHE_TTL_MIN_SEC, _CACHE_TTL_MAX_SEC))
 
 
-def _ws_window_cache_key(workspace_id: str) -> str:
-    return f"core_status:campaign:window:ws:{str(workspace_id)}"
-
-
-def _global_window_cache_key() -> str:
-    return "core_status:campaign:window:global"
-
-
 def _mailbox_limits_cache_key(mailbox_id: int) -> str:
     return f"core_status:campaign:limits:mailbox:{int(mailbox_id)}"
 
 
 def _cache_get_dict(key: str) -> Optional[dict[str, Any]]:
-    raw = CLIENT.get(str(key), ttl_sec=1)
+    raw = CLIENT.get(str(key), ttl_sec=_CACHE_TTL_MIN_SEC, l1=True)
     if raw is None:
         return None
     try:
@@ -61,205 +59,6 @@ def _cache_set_dict(key: str, payload: dict[str, Any]) -> None:
         pass
 
 
-def _parse_hhmm_to_minutes(value: str) -> Optional[int]:
-    try:
-        raw = str(value or "").strip()
-        if ":" not in raw:
-            return None
-        h, m = raw.split(":", 1)
-        hh = int(h)
-        mm = int(m)
-        if hh < 0 or hh > 23 or mm < 0 or mm > 59:
-            return None
-        return int(hh * 60 + mm)
-    except Exception:
-        return None
-
-
-def _iter_slots(slots_obj: Any) -> Iterable[Tuple[str, str]]:
-    if not isinstance(slots_obj, list):
-        return []
-    out: list[Tuple[str, str]] = []
-    for item in slots_obj:
-        if isinstance(item, dict):
-            a = str(item.get("from") or "").strip()
-            b = str(item.get("to") or "").strip()
-            if a and b:
-                out.append((a, b))
-            continue
-        if isinstance(item, (list, tuple)) and len(item) == 2:
-            a = str(item[0] or "").strip()
-            b = str(item[1] or "").strip()
-            if a and b:
-                out.append((a, b))
-    return out
-
-
-def _window_is_nonempty(window_obj: object) -> bool:
-    if not isinstance(window_obj, dict):
-        return False
-    for value in window_obj.values():
-        if isinstance(value, list) and len(value) > 0:
-            return True
-    return False
-
-
-def _day_key_for_date(day_value: date) -> str:
-    if _is_de_public_holiday(day_value):
-        return "hol"
-    wd = day_value.weekday()
-    return ("mon", "tue", "wed", "thu", "fri", "sat", "sun")[wd]
-
-
-def _sum_window_minutes_for_date(window_obj: object, day_value: date) -> int:
-    if not isinstance(window_obj, dict):
-        return 0
-    key = _day_key_for_date(day_value)
-    total = 0
-    for a_str, b_str in _iter_slots(window_obj.get(key, [])):
-        a = _parse_hhmm_to_minutes(a_str)
-        b = _parse_hhmm_to_minutes(b_str)
-        if a is None or b is None:
-            continue
-        if b <= a:
-            continue
-        total += int(b - a)
-    return int(total)
-
-
-def _is_now_in_send_window(now_de: datetime, window_obj: object) -> bool:
-    if not isinstance(window_obj, dict):
-        return False
-    key = _day_key_for_date(now_de.date())
-    cur = int(now_de.hour * 60 + now_de.minute)
-    for a_str, b_str in _iter_slots(window_obj.get(key, [])):
-        a = _parse_hhmm_to_minutes(a_str)
-        b = _parse_hhmm_to_minutes(b_str)
-        if a is None or b is None:
-            continue
-        if b <= a:
-            continue
-        if a <= cur < b:
-            return True
-    return False
-
-
-def _pick_window_day(now_de: datetime, window_obj: object, lookahead_days: int = 14) -> Tuple[Optional[date], int]:
-    today_minutes = _sum_window_minutes_for_date(window_obj, now_de.date())
-    if today_minutes > 0:
-        return (now_de.date(), int(today_minutes))
-
-    for offset in range(1, int(lookahead_days) + 1):
-        day_value = now_de.date() + timedelta(days=int(offset))
-        day_minutes = _sum_window_minutes_for_date(window_obj, day_value)
-        if day_minutes > 0:
-            return (day_value, int(day_minutes))
-    return (None, 0)
-
-
-def _remaining_window_minutes_today(now_de: datetime, window_obj: object) -> int:
-    if not isinstance(window_obj, dict):
-        return 0
-    key = _day_key_for_date(now_de.date())
-    cur = int(now_de.hour * 60 + now_de.minute)
-    total = 0
-    for a_str, b_str in _iter_slots(window_obj.get(key, [])):
-        a = _parse_hhmm_to_minutes(a_str)
-        b = _parse_hhmm_to_minutes(b_str)
-        if a is None or b is None:
-            continue
-        if b <= a:
-            continue
-        if cur >= b:
-            continue
-        start = max(int(a), cur)
-        if b > start:
-            total += int(b - start)
-    return int(total)
-
-
-def _first_future_window_day(now_de: datetime, window_obj: object, lookahead_days: int = 14) -> Tuple[Optional[date], int]:
-    if not isinstance(window_obj, dict):
-        return (None, 0)
-    for offset in range(1, int(lookahead_days) + 1):
-        day_value = now_de.date() + timedelta(days=int(offset))
-        day_minutes = _sum_window_minutes_for_date(window_obj, day_value)
-        if day_minutes > 0:
-            return (day_value, int(day_minutes))
-    return (None, 0)
-
-
-def _effective_window(campaign_window: object, workspace_window: object, global_window: object) -> dict[str, Any]:
-    if _window_is_nonempty(campaign_window):
-        return campaign_window if isinstance(campaign_window, dict) else {}
-    if _window_is_nonempty(workspace_window):
-        return workspace_window if isinstance(workspace_window, dict) else {}
-    if _window_is_nonempty(global_window):
-        return global_window if isinstance(global_window, dict) else {}
-    return {}
-
-
-def _load_global_window() -> dict[str, Any]:
-    cache_key = _global_window_cache_key()
-    cached = _cache_get_dict(cache_key)
-    if cached is not None:
-        return cached
-
-    row = fetch_one(
-        """
-        SELECT global_global_window
-        FROM public.aap_settings_global_sending_settings
-        WHERE singleton_key = 1
-        LIMIT 1
-        """,
-        [],
-    )
-    value = row[0] if row and isinstance(row[0], dict) else {}
-    payload = value if isinstance(value, dict) else {}
-    _cache_set_dict(cache_key, payload)
-    return payload
-
-
-def _load_workspace_windows(workspace_ids: Iterable[str]) -> dict[str, dict[str, Any]]:
-    ws_ids = sorted({str(x) for x in workspace_ids if str(x or "").strip()})
-    out: dict[str, dict[str, Any]] = {}
-    missing: list[str] = []
-
-    for ws_id in ws_ids:
-        cached = _cache_get_dict(_ws_window_cache_key(ws_id))
-        if cached is None:
-            missing.append(ws_id)
-            continue
-        out[ws_id] = cached
-
-    if missing:
-        rows = fetch_all(
-            """
-            SELECT workspace_id::text, value_json
-            FROM public.aap_settings_sending_settings
-            WHERE workspace_id::text = ANY(%s)
-            """,
-            [missing],
-        )
-        fetched_ids: set[str] = set()
-        for ws_id, value_json in rows:
-            ws_key = str(ws_id or "").strip()
-            if not ws_key:
-                continue
-            payload = value_json if isinstance(value_json, dict) else {}
-            out[ws_key] = payload
-            _cache_set_dict(_ws_window_cache_key(ws_key), payload)
-            fetched_ids.add(ws_key)
-
-        for ws_id in missing:
-            if ws_id in fetched_ids:
-                continue
-            out[ws_id] = {}
-            _cache_set_dict(_ws_window_cache_key(ws_id), {})
-
-    return out
-
-
 def _load_mailbox_limits(mailbox_ids: Iterable[int]) -> dict[int, tuple[int, int]]:
     ids = sorted({int(x) for x in mailbox_ids if int(x) > 0})
     out: dict[int, tuple[int, int]] = {}
@@ -313,122 +112,163 @@ def is_active(task: dict[str, object]) -> bool:
     return True
 
 
-def run_ready_once() -> dict[str, int | str]:
-    with get_connection() as conn, conn.cursor() as cur:
-        cur.execute(
-            """
-            WITH task_scan AS (
-                SELECT t.id::bigint AS task_id
-                FROM public.aap_audience_audiencetask t
-                WHERE COALESCE(t.archived, false) = false
-            ),
-            task_state AS (
-                SELECT ts.task_id
-                FROM task_scan ts
-                WHERE EXISTS (
-                    SELECT 1
-                    FROM public.task_cb_ratings tcr
-                    WHERE tcr.task_id = ts.task_id
-                      AND tcr.rate > 0
-                )
-            ),
-            upd AS (
-                UPDATE public.aap_audience_audiencetask t
-                SET ready = CASE
-                                WHEN ts.task_id IS NOT NULL THEN true
-                                ELSE false
-                            END,
-                    updated_at = now()
-                FROM task_scan s
-                LEFT JOIN task_state ts
-                  ON ts.task_id = s.task_id
-                WHERE t.id = s.task_id
-                  AND t.ready IS DISTINCT FROM CASE
-                                                   WHEN ts.task_id IS NOT NULL THEN true
-                                                   ELSE false
-                                               END
-                RETURNING t.id
+def _recalc_ready(cur: Any, task_ids: Optional[List[int]]) -> Tuple[int, int, int]:
+    # task_ids=None — все задачи
+    cur.execute(
+        """
+        WITH task_scan AS (
+            SELECT t.id::bigint AS task_id
+            FROM public.aap_audience_audiencetask t
+            WHERE COALESCE(t.archived, false) = false
+              AND (%s::bigint[] IS NULL OR t.id = ANY(%s::bigint[]))
+        ),
+        task_state AS (
+            SELECT ts.task_id
+            FROM task_scan ts
+            WHERE EXISTS (
+                SELECT 1
+                FROM public.task_cb_ratings tcr
+                WHERE tcr.task_id = ts.task_id
+                  AND tcr.rate > 0
             )
-            SELECT
-                (SELECT COUNT(*)::int FROM task_scan) AS scanned_cnt,
-                (SELECT COUNT(*)::int FROM task_state) AS matched_cnt,
-                (SELECT COUNT(*)::int FROM upd) AS updated_cnt
-            """
+        ),
+        upd AS (
+            UPDATE public.aap_audience_audiencetask t
+            SET ready = CASE
+                            WHEN ts.task_id IS NOT NULL THEN true
+                            ELSE false
+                        END,
+                updated_at = now()
+            FROM task_scan s
+            LEFT JOIN task_state ts
+              ON ts.task_id = s.task_id
+            WHERE t.id = s.task_id
+              AND t.ready IS DISTINCT FROM CASE
+                                               WHEN ts.task_id IS NOT NULL THEN true
+                                               ELSE false
+                                           END
+            RETURNING t.id
         )
-        row = cur.fetchone() or [0, 0, 0]
+        SELECT
+            (SELECT COUNT(*)::int FROM task_scan) AS scanned_cnt,
+            (SELECT COUNT(*)::int FROM task_state) AS matched_cnt,
+            (SELECT COUNT(*)::int FROM upd) AS updated_cnt
+        """,
+        [task_ids, task_ids],
+    )
+    row = cur.fetchone() or [0, 0, 0]
+    return (int(row[0] or 0), int(row[1] or 0), int(row[2] or 0))
+
+
+def _recalc_active(cur: Any, task_ids: Optional[List[int]]) -> Tuple[int, int, int]:
+    # task_ids=None — все задачи; -> (scanned, updated, active_true)
+    cur.execute(
+        """
+        SELECT *
+        FROM public.aap_audience_audiencetask t
+        WHERE (%s::bigint[] IS NULL OR t.id = ANY(%s::bigint[]))
+        ORDER BY t.id ASC
+        """,
+        [task_ids, task_ids],
+    )
+    rows = cur.fetchall() or []
+    if not rows:
+        return (0, 0, 0)
+
+    columns = [str(desc[0]) for desc in (cur.description or [])]
+    next_states: list[tuple[int, bool]] = []
+    for row in rows:
+        task = {column: row[idx] for idx, column in enumerate(columns)}
+        next_states.append((int(task["id"]), bool(is_active(task))))
+
+    ids = [task_id for task_id, _is_active in next_states]
+    active_values = [is_active_value for _task_id, is_active_value in next_states]
+
+    cur.execute(
+        """
+        WITH data(task_id, active_value) AS (
+            SELECT * FROM unnest(%s::bigint[], %s::boolean[])
+        ),
+        upd AS (
+            UPDATE public.aap_audience_audiencetask t
+            SET active = data.active_value,
+                updated_at = now()
+            FROM data
+            WHERE t.id = data.task_id
+              AND t.active IS DISTINCT FROM data.active_value
+            RETURNING t.id, t.active
+        )
+        SELECT COUNT(*)::int AS updated_cnt
+        FROM upd
+        """,
+        [ids, active_values],
+    )
+    updated_cnt = int((cur.fetchone() or [0])[0] or 0)
+    active_true_cnt = sum(1 for _task_id, is_active_value in next_states if is_active_value)
+    return (len(next_states), updated_cnt, int(active_true_cnt))
+
+
+def run_ready_once() -> dict[str, int | str]:
+    with get_connection() as conn, conn.cursor() as cur:
+        scanned_cnt, matched_cnt, updated_cnt = _recalc_ready(cur, None)
         conn.commit()
 
     return {
         "mode": "ok",
-        "scanned_cnt": int(row[0] or 0),
-        "matched_cnt": int(row[1] or 0),
-        "updated_cnt": int(row[2] or 0),
+        "scanned_cnt": int(scanned_cnt),
+        "matched_cnt": int(matched_cnt),
+        "updated_cnt": int(updated_cnt),
     }
 
 
 def run_active_once() -> dict[str, int | str]:
+    # Полный проход (страховка): ловит то, что не дошло до task_dirty (писатели в обход триггеров, старт без очереди).
     with get_connection() as conn, conn.cursor() as cur:
-        cur.execute(
-            """
-            SELECT *
-            FROM public.aap_audience_audiencetask t
-            ORDER BY t.id ASC
-            """
-        )
-        rows = cur.fetchall() or []
-        if not rows:
-            return {
-                "mode": "ok",
-                "scanned_cnt": 0,
-                "updated_cnt": 0,
-                "active_true_cnt": 0,
-                "active_false_cnt": 0,
-            }
+        scanned_cnt, updated_cnt, active_true_cnt = _recalc_active(cur, None)
+        conn.commit()
+    pruned_cnt = task_dirty.prune()
 
-        columns = [str(desc[0]) for desc in (cur.description or [])]
-        next_states: list[tuple[int, bool]] = []
-        for row in rows:
-            task = {column: row[idx] for idx, column in enumerate(columns)}
-            next_states.append((int(task["id"]), bool(is_active(task))))
+    return {
+        "mode": "ok",
+        "scanned_cnt": int(scanned_cnt),
+        "updated_cnt": int(updated_cnt),
+        "active_true_cnt": int(active_true_cnt),
+        "active_false_cnt": int(scanned_cnt - active_true_cnt),
+        "dirty_pruned_cnt": int(pruned_cnt),
+    }
 
-        task_ids = [task_id for task_id, _is_active in next_states]
-        active_values = [is_active_value for _task_id, is_active_value in next_states]
 
-        cur.execute(
-            """
-            WITH data(task_id, active_value) AS (
-                SELECT * FROM unnest(%s::bigint[], %s::boolean[])
-            ),
-            upd AS (
-                UPDATE public.aap_audience_audiencetask t
-                SET active = data.active_value,
-                    updated_at = now()
-                FROM data
-                WHERE t.id = data.task_id
-                  AND t.active IS DISTINCT FROM data.active_value
-                RETURNING t.id, t.active
-            )
-            SELECT COUNT(*)::int AS updated_cnt
-            FROM upd
-            """,
-            [task_ids, active_values],
-        )
-        updated_cnt = int((cur.fetchone() or [0])[0] or 0)
+def run_dirty_once() -> dict[str, int | str]:
+    # Только изменившиеся (dirty) задачи и задачи с наступившим recheck_at (истёк кэш is_more_needed).
+    # claim коммитится отдельно (is_more_needed сам пишет recheck_at в ту же таблицу); упавший цикл добирает полный проход.
+    task_ids = task_dirty.claim_due()
+    if not task_ids:
+        return {"mode": "idle", "claimed_cnt": 0}
+
+    with get_connection() as conn, conn.cursor() as cur:
+        _ready_scanned, _ready_matched, ready_updated_cnt = _recalc_ready(cur, task_ids)
+        # коммит до active: триггер UPDATE OF ready держит строки core_status_task_due, а is_more_needed пишет
+        # recheck_at в них же с другого соединения пула -> иначе ждёт сам себя до таймаута задачи
+        conn.commit()
+        scanned_cnt, updated_cnt, active_true_cnt = _recalc_active(cur, task_ids)
         conn.commit()
 
-    active_true_cnt = sum(1 for _task_id, is_active_value in next_states if is_active_value)
-    active_false_cnt = len(next_states) - active_true_cnt
     return {
         "mode": "ok",
-        "scanned_cnt": int(len(next_states)),
+        "claimed_cnt": int(len(task_ids)),
+        "ready_updated_cnt": int(ready_updated_cnt),
+        "scanned_cnt": int(scanned_cnt),
         "updated_cnt": int(updated_cnt),
         "active_true_cnt": int(active_true_cnt),
-        "active_false_cnt": int(active_false_cnt),
+        "active_false_cnt": int(scanned_cnt - active_true_cnt),
     }
 
 
 def run_campaign_status_once() -> dict[str, int | str]:
     now_de = datetime.now(tz=ZoneInfo("UTC")).astimezone(_TZ_BERLIN)
+    now_ts = now_de.timestamp()
+    today = now_de.date()
+    last_day = today + timedelta(days=_WINDOW_LOOKAHEAD_DAYS)
 
     rows = fetch_all(
         """
@@ -455,9 +295,9 @@ def run_campaign_status_once() -> dict[str, int | str]:
         }
 
     pool_rows = [row for row in rows if (not bool(row[4]))]
-    ws_windows = _load_workspace_windows(str(row[1] or "").strip() for row in pool_rows)
+    ws_windows = load_workspace_windows(str(row[1] or "").strip() for row in pool_rows)
     mailbox_limits = _load_mailbox_limits(int(row[2]) for row in pool_rows if row[2] is not None)
-    global_window = _load_global_window()
+    global_window = load_global_window()
 
     campaign_rows: list[dict[str, Any]] = []
 
@@ -474,23 +314,20 @@ def run_campaign_status_once() -> dict[str, int | str]:
         is_pool_eligible = not bool(archived)
         is_active_eligible = bool(user_active) and (not bool(archived))
         ws_window = ws_windows.get(ws_id, {}) if is_pool_eligible else {}
-        effective_window = _effective_window(camp_window, ws_window, global_window) if is_pool_eligible else {}
+        eff_window = effective_window(camp_window, ws_window, global_window) if is_pool_eligible else {}
 
-        is_active_now = bool(is_active_eligible) and _is_now_in_send_window(now_de, effective_window)
+        cal = calendar_for(eff_window, today=today)
+        is_active_now = bool(is_active_eligible) and cal.is_open(now_ts)
 
-        today_minutes = _sum_window_minutes_for_date(effective_window, now_de.date())
-        interval_day, interval_day_minutes = _pick_window_day(now_de, effective_window)
-        remaining_today_minutes = _remaining_window_minutes_today(now_de, effective_window)
-        future_day, future_minutes = _first_future_window_day(now_de, effective_window)
+        today_minutes = cal.minutes_on(today)
+        interval_day, interval_day_minutes = cal.first_open_day(today, last_day)
+        remaining_today_minutes = cal.remaining_minutes(now_de)
+        future_day, future_minutes = cal.first_open_day(today + timedelta(days=1), last_day)
 
         # Aggregate by mailbox+day across all pool campaigns that have a window on that day.
-        # Horizon matches window day-picking helpers: today + next 14 days.
+        # Horizon matches window day-picking: today + next 14 days.
         if is_pool_eligible:
-            for offset in range(0, 15):
-                day_value = now_de.date() + timedelta(days=int(offset))
-                minutes_value = _sum_window_minutes_for_date(effective_window, day_value)
-                if int(minutes_value) <= 0:
-                    continue
+            for day_value, minutes_value in cal.open_days_between(today, last_day):
                 key = (int(mid), day_value)
                 mailbox_day_total_minutes[key] = int(mailbox_day_total_minutes.get(key, 0)) + int(minutes_value)
                 mailbox_day_campaign_count[key] = int(mailbox_day_campaign_count.get(key, 0)) + 1
@@ -644,25 +481,34 @@ def run_campaign_status_once() -> dict[str, int | str]:
     }
 
 
+COUNTERS_RECENT_WITHIN_SEC = 3 * 60 * 60  # окно "недавно активных" для часовой сверки (с запасом на пропуск запуска)
+
+
+def run_campaign_counters_full_verify_once() -> dict[str, int | str]:
+    # Полная сверка rollup-а со всеми сырыми таблицами (раз в сутки): GROUP BY по sending_log / mailbox_stats / replay_log.
+    rep = campaign_counters.verify_and_repair()
+    return {
+        "mode": "ok",
+        "counters_checked_cnt": int(rep.get("checked") or 0),
+        "counters_drift_cnt": int(rep.get("drift_cnt") or 0),
+        "counters_repaired_cnt": int(rep.get("repaired_cnt") or 0),
+    }
+
+
 def run_campaign_sent_recount_once() -> dict[str, int | str]:
+    # Сверка rollup-а campaign_counters только по недавно активным кампаниям (+ пересчёт расхождений),
+    # затем sent_num <- campaign_counters.processed (без GROUP BY по всему sending_log).
+    rep = campaign_counters.verify_recent(COUNTERS_RECENT_WITHIN_SEC)
     with get_connection() as conn, conn.cursor() as cur:
         cur.execute(
             """
-            WITH sent AS (
-                SELECT
-                    sl.campaign_id::bigint AS campaign_id,
-                    COUNT(sl.id)::int AS sent_cnt
-                FROM public.sending_log sl
-                WHERE COALESCE(sl.processed, false) = true
-                GROUP BY sl.campaign_id
-            ),
-            calc AS (
+            WITH calc AS (
                 SELECT
                     c.id::bigint AS campaign_id,
-                    COALESCE(s.sent_cnt, 0)::int AS sent_value
+                    COALESCE(cc.processed, 0)::int AS sent_value
                 FROM public.campaigns_campaigns c
-                LEFT JOIN sent s
-                  ON s.campaign_id = c.id
+                LEFT JOIN public.campaign_counters cc
+                  ON cc.campaign_id = c.id
             ),
             upd AS (
                 UPDATE public.campaigns_campaigns c
@@ -691,4 +537,6 @@ def run_campaign_sent_recount_once() -> dict[str, int | str]:
         "scanned_cnt": int(row[0] or 0),
         "updated_cnt": int(row[1] or 0),
         "sent_nonzero_cnt": int(row[2] or 0),
+        "counters_drift_cnt": int(rep.get("drift_cnt") or 0),
+        "counters_repaired_cnt": int(rep.get("repaired_cnt") or 0),
     }
@@ -1,12 +1,15 @@
 # FILE: engine/core_status/status_processor.py
-# DATE: 2026-04-05
+# DATE: 2026-10-16
 # PURPOSE: Dedicated worker for status-based audience task ready recalculation.
+# CHANGE: dirty_run_once every 2s (task_dirty ids only); full ready/active sweeps every 10 min as safety net.
+# CHANGE: campaign_sent_recount / campaign_counters verify moved to maintenance_processor (long runs starved this slot).
 
 from engine.common.worker import Worker
 from engine.core_status import status
 
 TASK_TIMEOUT_SEC = 120
-CAMPAIGN_SENT_RECOUNT_EVERY_SEC = 60 * 60
+DIRTY_EVERY_SEC = 2
+FULL_SWEEP_EVERY_SEC = 10 * 60
 
 
 def main() -> None:
@@ -14,12 +17,23 @@ def main() -> None:
         name="core_status_processor",
         tick_sec=1,
         max_parallel=1,
+        resident=True,
+    )
+
+    w.register(
+        name="dirty_run_once",
+        fn=status.run_dirty_once,
+        every_sec=DIRTY_EVERY_SEC,
+        timeout_sec=TASK_TIMEOUT_SEC,
+        singleton=True,
+        heavy=False,
+        priority=3,
     )
 
     w.register(
         name="ready_run_once",
         fn=status.run_ready_once,
-        every_sec=2,
+        every_sec=FULL_SWEEP_EVERY_SEC,
         timeout_sec=TASK_TIMEOUT_SEC,
         singleton=True,
         heavy=False,
@@ -29,7 +43,7 @@ def main() -> None:
     w.register(
         name="active_run_once",
         fn=status.run_active_once,
-        every_sec=2,
+        every_sec=FULL_SWEEP_EVERY_SEC,
         timeout_sec=TASK_TIMEOUT_SEC,
         singleton=True,
         heavy=False,
@@ -46,16 +60,6 @@ def main() -> None:
         priority=15,
     )
 
-    w.register(
-        name="campaign_sent_recount_run_once",
-        fn=status.run_campaign_sent_recount_once,
-        every_sec=CAMPAIGN_SENT_RECOUNT_EVERY_SEC,
-        timeout_sec=TASK_TIMEOUT_SEC,
-        singleton=True,
-        heavy=False,
-        priority=20,
-    )
-
     w.run_forever()
 
 
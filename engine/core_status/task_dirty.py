@@ -0,0 +1,200 @@
+# FILE: engine/core_status/task_dirty.py  (новое — 2026-10-16)
+# PURPOSE: Очередь «грязных» audience-задач для инкрементального пересчёта ready/active.
+#          public.core_status_task_due: dirty (входные данные изменились) + recheck_at (индекс next-change-at).
+#          dirty ставят триггеры в транзакции писателя:
+#            - aap_audience_audiencetask: INSERT / UPDATE OF ready, archived, user_active, rate_limit, workspace_id;
+#            - task_cb_ratings: statement-level (transition tables), строки с изменившимся rate -> их task_id;
+#          и python-писатели кэша is_more_needed (engine/core_status/is_active.py: invalidate/clear/update=True).
+#          recheck_at: единственный переход по времени у активности задачи — истечение кэша is_more_needed
+#          (1–3 ч, случайный TTL); ставится при записи кэша = момент, когда ответ может поменяться.
+#          claim_due(): UPDATE ... FOR UPDATE SKIP LOCKED -> id задач для пересчёта; цена ~ число изменений.
+# CHANGE: (2026-10-16) DDL из ensure_schema() перенесён в миграцию aap_audience/0012_core_status_task_due.
+
+from __future__ import annotations
+
+from typing import Iterable, List
+
+from engine.common import db
+
+SCHEMA = "public"
+CLAIM_LIMIT = 2000
+
+# Схема ставится миграцией web/panel aap_audience 0012_core_status_task_due (шаг деплоя), не из процессов воркеров
+SCHEMA_SQL = f"""
+CREATE TABLE IF NOT EXISTS {SCHEMA}.core_status_task_due (
+    task_id bigint PRIMARY KEY,
+    dirty boolean NOT NULL DEFAULT false,
+    recheck_at timestamptz,
+    updated_at timestamptz NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS core_status_task_due_dirty_idx
+    ON {SCHEMA}.core_status_task_due (task_id) WHERE dirty;
+CREATE INDEX IF NOT EXISTS core_status_task_due_recheck_idx
+    ON {SCHEMA}.core_status_task_due (recheck_at) WHERE recheck_at IS NOT NULL;
+
+CREATE OR REPLACE FUNCTION {SCHEMA}.core_status_mark_dirty(ids bigint[]) RETURNS void LANGUAGE sql AS $fn$
+    INSERT INTO {SCHEMA}.core_status_task_due AS t (task_id, dirty)
+    SELECT DISTINCT x, true FROM unnest(ids) AS x WHERE x IS NOT NULL ORDER BY 1
+    ON CONFLICT (task_id) DO UPDATE SET dirty = true, updated_at = now()
+    WHERE NOT t.dirty;
+$fn$;
+
+CREATE OR REPLACE FUNCTION {SCHEMA}.core_status_task_dirty_row() RETURNS trigger LANGUAGE plpgsql AS $fn$
+BEGIN
+    PERFORM {SCHEMA}.core_status_mark_dirty(ARRAY[NEW.id::bigint]);
+    RETURN NULL;
+END
+$fn$;
+
+CREATE OR REPLACE FUNCTION {SCHEMA}.core_status_rating_dirty_ins() RETURNS trigger LANGUAGE plpgsql AS $fn$
+BEGIN
+    PERFORM {SCHEMA}.core_status_mark_dirty(ARRAY(SELECT DISTINCT n.task_id::bigint FROM new_rows n));
+    RETURN NULL;
+END
+$fn$;
+
+CREATE OR REPLACE FUNCTION {SCHEMA}.core_status_rating_dirty_upd() RETURNS trigger LANGUAGE plpgsql AS $fn$
+BEGIN
+    PERFORM {SCHEMA}.core_status_mark_dirty(ARRAY(
+        SELECT n.task_id::bigint FROM new_rows n
+        LEFT JOIN old_rows o ON o.task_id = n.task_id AND o.cb_id = n.cb_id
+        WHERE o.task_id IS NULL OR o.rate IS DISTINCT FROM n.rate
+        UNION
+        SELECT o.task_id::bigint FROM old_rows o
+        LEFT JOIN new_rows n ON n.task_id = o.task_id AND n.cb_id = o.cb_id
+        WHERE n.task_id IS NULL
+    ));
+    RETURN NULL;
+END
+$fn$;
+
+CREATE OR REPLACE FUNCTION {SCHEMA}.core_status_rating_dirty_del() RETURNS trigger LANGUAGE plpgsql AS $fn$
+BEGIN
+    PERFORM {SCHEMA}.core_status_mark_dirty(ARRAY(SELECT DISTINCT o.task_id::bigint FROM old_rows o));
+    RETURN NULL;
+END
+$fn$;
+
+DO $do$
+BEGIN
+    IF to_regclass('{SCHEMA}.aap_audience_audiencetask') IS NOT NULL AND NOT EXISTS (
+        SELECT 1 FROM pg_trigger
+        WHERE tgname = 'core_status_task_dirty_ins' AND tgrelid = '{SCHEMA}.aap_audience_audiencetask'::regclass
+    ) THEN
+        CREATE TRIGGER core_status_task_dirty_ins AFTER INSERT ON {SCHEMA}.aap_audience_audiencetask
+            FOR EACH ROW EXECUTE FUNCTION {SCHEMA}.core_status_task_dirty_row();
+    END IF;
+    IF to_regclass('{SCHEMA}.aap_audience_audiencetask') IS NOT NULL AND NOT EXISTS (
+        SELECT 1 FROM pg_trigger
+        WHERE tgname = 'core_status_task_dirty_upd' AND tgrelid = '{SCHEMA}.aap_audience_audiencetask'::regclass
+    ) THEN
+        -- active / updated_at (пишет сам status-процессор) сюда не входят -> без самоподпитки
+        CREATE TRIGGER core_status_task_dirty_upd
+            AFTER UPDATE OF ready, archived, user_active, rate_limit, workspace_id
+            ON {SCHEMA}.aap_audience_audiencetask
+            FOR EACH ROW
+            WHEN (
+                OLD.ready IS DISTINCT FROM NEW.ready
+                OR OLD.archived IS DISTINCT FROM NEW.archived
+                OR OLD.user_active IS DISTINCT FROM NEW.user_active
+                OR OLD.rate_limit IS DISTINCT FROM NEW.rate_limit
+                OR OLD.workspace_id IS DISTINCT FROM NEW.workspace_id
+            )
+            EXECUTE FUNCTION {SCHEMA}.core_status_task_dirty_row();
+    END IF;
+    IF to_regclass('{SCHEMA}.task_cb_ratings') IS NOT NULL AND NOT EXISTS (
+        SELECT 1 FROM pg_trigger
+        WHERE tgname = 'core_status_rating_dirty_ins' AND tgrelid = '{SCHEMA}.task_cb_ratings'::regclass
+    ) THEN
+        CREATE TRIGGER core_status_rating_dirty_ins AFTER INSERT ON {SCHEMA}.task_cb_ratings
+            REFERENCING NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION {SCHEMA}.core_status_rating_dirty_ins();
+        CREATE TRIGGER core_status_rating_dirty_upd AFTER UPDATE ON {SCHEMA}.task_cb_ratings
+            REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION {SCHEMA}.core_status_rating_dirty_upd();
+        CREATE TRIGGER core_status_rating_dirty_del AFTER DELETE ON {SCHEMA}.task_cb_ratings
+            REFERENCING OLD TABLE AS old_rows
+            FOR EACH STATEMENT EXECUTE FUNCTION {SCHEMA}.core_status_rating_dirty_del();
+    END IF;
+END
+$do$;
+"""
+
+
+def _ids(task_ids: Iterable[int]) -> List[int]:
+    return sorted({int(x) for x in (task_ids or []) if x is not None and int(x) > 0})
+
+
+def mark_dirty(task_ids: Iterable[int]) -> None:
+    """Задачи пересчитаются в ближайшем цикле status_processor."""
+    ids = _ids(task_ids)
+    if not ids:
+        return
+    db.execute(f"SELECT {SCHEMA}.core_status_mark_dirty(%s::bigint[])", [ids])
+
+
+def schedule_recheck(task_id: int, delay_sec: float) -> None:
+    """Ответ задачи может поменяться через delay_sec (истечение кэша). Более ранний recheck_at не сдвигается."""
+    tid = int(task_id)
+    if tid <= 0:
+        return
+    db.execute(
+        f"""
+        INSERT INTO {SCHEMA}.core_status_task_due AS t (task_id, recheck_at)
+        VALUES (%s, now() + make_interval(secs => %s))
+        ON CONFLICT (task_id) DO UPDATE
+        SET recheck_at = CASE
+                             WHEN t.recheck_at IS NULL OR t.recheck_at <= now() THEN EXCLUDED.recheck_at
+                             ELSE LEAST(t.recheck_at, EXCLUDED.recheck_at)
+                         END,
+            updated_at = now()
+        """,
+        [tid, max(0.0, float(delay_sec))],
+    )
+
+
+def claim_due(limit: int = CLAIM_LIMIT) -> List[int]:
+    """Забрать dirty / просроченные recheck задачи: dirty -> false, наступивший recheck_at -> NULL."""
+    rows = db.fetch_all(
+        f"""
+        WITH due AS (
+            SELECT task_id
+            FROM (
+                SELECT task_id FROM {SCHEMA}.core_status_task_due WHERE dirty
+                UNION
+                SELECT task_id FROM {SCHEMA}.core_status_task_due WHERE recheck_at <= now()
+            ) s
+            ORDER BY task_id
+            LIMIT %s
+        ),
+        locked AS (
+            SELECT t.task_id
+            FROM {SCHEMA}.core_status_task_due t
+            JOIN due ON due.task_id = t.task_id
+            ORDER BY t.task_id
+            FOR UPDATE OF t SKIP LOCKED
+        )
+        UPDATE {SCHEMA}.core_status_task_due t
+        SET dirty = false,
+            recheck_at = CASE WHEN t.recheck_at <= now() THEN NULL ELSE t.recheck_at END,
+            updated_at = now()
+        FROM locked
+        WHERE t.task_id = locked.task_id
+        RETURNING t.task_id
+        """,
+        [max(1, int(limit))],
+    )
+    return sorted(int(r[0]) for r in rows or [])
+
+
+def prune() -> int:
+    """Удалить отработанные строки (не dirty, без recheck) и строки удалённых задач."""
+    rows = db.fetch_all(
+        f"""
+        DELETE FROM {SCHEMA}.core_status_task_due t
+        WHERE (NOT t.dirty AND t.recheck_at IS NULL)
+           OR NOT EXISTS (SELECT 1 FROM {SCHEMA}.aap_audience_audiencetask a WHERE a.id = t.task_id)
+        RETURNING t.task_id
+        """
+    )
+    return len(rows or [])
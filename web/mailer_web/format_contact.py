@@ -206,6 +206,7 @@ def get_city_title(plz_id: Any, request: HttpRequest, land: bool = False, plz: b
             _load_vocabulary,
             ttl=7 * 24 * 60 * 60,
             version="format_contact:city_titles:v1",
+            l1=True,
         )
         request._format_contact_city_titles_cache = vocabulary
 
@@ -248,6 +249,7 @@ def get_city_title(plz_id: Any, request: HttpRequest, land: bool = False, plz: b
             _load_vocabulary,
             ttl=7 * 24 * 60 * 60,
             version="format_contact:city_titles:v1",
+            l1=True,
             update=True,
         )
 
@@ -281,6 +283,7 @@ def get_city_title_by_city_id(city_id: Any, request: HttpRequest, land: bool = F
             _load_vocabulary,
             ttl=7 * 24 * 60 * 60,
             version="format_contact:city_titles_by_id:v1",
+            l1=True,
         )
         request._format_contact_city_titles_by_id_cache = vocabulary
 
@@ -317,6 +320,7 @@ def get_city_title_by_city_id(city_id: Any, request: HttpRequest, land: bool = F
             _load_vocabulary,
             ttl=7 * 24 * 60 * 60,
             version="format_contact:city_titles_by_id:v1",
+            l1=True,
             update=True,
         )
 
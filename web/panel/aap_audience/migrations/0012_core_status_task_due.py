@@ -0,0 +1,24 @@
+# Generated by hand on 2026-10-16
+# core_status_task_due queue + dirty triggers (engine.core_status.task_dirty) — installed on deploy by
+# `manage.py migrate` instead of lazily from worker processes. Triggers on engine tables that do not exist yet
+# (fresh / test DB) are skipped by the to_regclass guards inside the SQL.
+
+from django.db import migrations
+
+
+def forward(apps, schema_editor):
+    from engine.core_status import task_dirty
+
+    with schema_editor.connection.cursor() as cur:
+        cur.execute(task_dirty.SCHEMA_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("aap_audience", "0011_remove_audiencetask_collected_and_more"),
+    ]
+
+    operations = [
+        migrations.RunPython(forward, reverse_code=migrations.RunPython.noop),
+    ]
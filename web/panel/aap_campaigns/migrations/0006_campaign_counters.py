@@ -0,0 +1,45 @@
+# Generated by hand on 2026-10-16
+# campaign_counters rollup (engine.common.campaign_counters): tables, triggers and backfill
+# must exist before the panel reads them -> run as part of `manage.py migrate` on deploy.
+# Non-atomic: triggers go in one short transaction (SHARE ROW EXCLUSIVE on the hot tables only for the DDL),
+# then every campaign is rebuilt in its own transaction, so senders are never blocked for the whole backfill.
+
+from django.db import migrations, transaction
+
+
+def forward(apps, schema_editor):
+    from engine.common import campaign_counters
+
+    conn = schema_editor.connection
+    with transaction.atomic(using=conn.alias), conn.cursor() as cur:
+        campaign_counters.install_schema(cur)
+
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT to_regclass('public.sending_log') IS NOT NULL
+               AND to_regclass('public.mailbox_stats') IS NOT NULL
+               AND to_regclass('public.replay_log') IS NOT NULL
+            """
+        )
+        if not cur.fetchone()[0]:
+            # engine tables not created yet (fresh / test DB): nothing to backfill
+            return
+        campaign_ids = campaign_counters.backfill_ids(cur)
+
+    for campaign_id in campaign_ids:
+        with transaction.atomic(using=conn.alias), conn.cursor() as cur:
+            campaign_counters.backfill_one(cur, campaign_id)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ("aap_campaigns", "0005_campaign_send_state_fields"),
+    ]
+
+    operations = [
+        migrations.RunPython(forward, reverse_code=migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by hand on 2026-10-16
+# stat_ingest_state / campaign_stats_hourly (engine.core_stats.ingest) — installed on deploy by
+# `manage.py migrate` instead of lazily from the stats worker.
+
+from django.db import migrations
+
+
+def forward(apps, schema_editor):
+    from engine.core_stats import ingest
+
+    with schema_editor.connection.cursor() as cur:
+        cur.execute(ingest.schema_sql())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("aap_campaigns", "0006_campaign_counters"),
+    ]
+
+    operations = [
+        migrations.RunPython(forward, reverse_code=migrations.RunPython.noop),
+    ]
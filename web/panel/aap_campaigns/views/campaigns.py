@@ -1,9 +1,9 @@
 # FILE: web/panel/aap_campaigns/views/campaigns.py
 # PATH: web/panel/aap_campaigns/views/campaigns.py
-# DATE: 2026-02-03
+# DATE: 2026-10-16
 # SUMMARY (patch):
 # - fix: keep POSTed form values when mailing list is taken (dedup error), so form doesn't reset
-# - stats in bottom table: total/sent/left for each campaign (total=active sending_lists rows; sent=all sending_log rows with status=SEND; left=max(0,total-sent))
+# - stats in bottom table: total/sent/left for each campaign (total=active sending_lists rows; sent=campaign_counters.sent, i.e. sending_log rows with status=SEND; left=max(0,total-sent))
 # - POST action send_test: only when letter exists; sends test with to_email_override + record_sent=False
 # - do NOT touch existing window logic/helpers (kept local); reuse shared _is_de_public_holiday() helper
 
@@ -520,15 +520,13 @@ def _stats_by_campaign_ids(campaign_ids: list[int]) -> dict[int, tuple[int, int,
     GROUP BY c.id
     """
 
-    # --- sent: sending_log rows per campaign ---
+    # --- sent: campaign_counters rollup (status=SEND) ---
     sql_sent = """
     SELECT
         campaign_id,
-        COUNT(id) AS sent_cnt
-    FROM public.sending_log
-    WHERE status = 'SEND'
-      AND campaign_id = ANY(%s)
-    GROUP BY campaign_id
+        sent AS sent_cnt
+    FROM public.campaign_counters
+    WHERE campaign_id = ANY(%s)
     """
 
     totals: dict[int, int] = {}
@@ -0,0 +1,23 @@
+# Generated by hand on 2026-10-16
+# public.gpt_jobs — offline GPT request queue (engine.common.gpt_jobs). The schema lives with the engine module,
+# installed here on deploy instead of from worker processes at runtime.
+
+from django.db import migrations
+
+
+def forward(apps, schema_editor):
+    from engine.common import gpt_jobs
+
+    with schema_editor.connection.cursor() as cur:
+        cur.execute(gpt_jobs.SCHEMA_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("panel", "0002_globaltemplate_buttons"),
+    ]
+
+    operations = [
+        migrations.RunPython(forward, reverse_code=migrations.RunPython.noop),
+    ]
@@ -1,6 +1,7 @@
 # FILE: web/panel/views.py
-# DATE: 2026-03-08
+# DATE: 2026-10-16
 # PURPOSE: panel main views: overview + stats + switch-user.
+# CHANGE: sent / unique views / per-page totals read the campaign_counters rollup instead of COUNT over sending_log.
 
 from __future__ import annotations
 
@@ -127,11 +128,9 @@ def _sent_counts_by_campaign_ids(campaign_ids):
     with connection.cursor() as cur:
         cur.execute(
             """
-            SELECT campaign_id, COUNT(id) AS sent_cnt
-            FROM public.sending_log
+            SELECT campaign_id, sent
+            FROM public.campaign_counters
             WHERE campaign_id = ANY(%s)
-              AND status = 'SEND'
-            GROUP BY campaign_id
             """,
             [ids],
         )
@@ -148,12 +147,9 @@ def _views_counts_by_campaign_ids(campaign_ids):
     with connection.cursor() as cur:
         cur.execute(
             """
-            SELECT lg.campaign_id, COUNT(DISTINCT lg.aggr_contact_cb_id) AS views_cnt
-            FROM public.mailbox_stats ms
-            JOIN public.sending_log lg
-              ON lg.id = ms.letter_id
-            WHERE lg.campaign_id = ANY(%s)
-            GROUP BY lg.campaign_id
+            SELECT campaign_id, viewed_unique
+            FROM public.campaign_counters
+            WHERE campaign_id = ANY(%s)
             """,
             [ids],
         )
@@ -271,25 +267,11 @@ def _stats_site_click_rows_page(ws_id, *, limit: int = 100, page: int = 1):
     with connection.cursor() as cur:
         cur.execute(
             """
-            SELECT COUNT(*)::int
-            FROM (
-              SELECT
-                c.id,
-                lg.aggr_contact_cb_id,
-                COALESCE(NULLIF(trim(ac.company_name), ''), NULLIF(trim(ac.email), ''), '—')
-              FROM public.mailbox_stats ms
-              JOIN public.sending_log lg
-                ON lg.id = ms.letter_id
-              JOIN public.campaigns_campaigns c
-                ON c.id = lg.campaign_id
-               AND c.workspace_id = %s::uuid
-              LEFT JOIN public.aggr_contacts_cb ac
-                ON ac.id = lg.aggr_contact_cb_id
-              GROUP BY
-                c.id,
-                lg.aggr_contact_cb_id,
-                COALESCE(NULLIF(trim(ac.company_name), ''), NULLIF(trim(ac.email), ''), '—')
-            ) q
+            SELECT COALESCE(SUM(cc.viewed_unique), 0)::int
+            FROM public.campaign_counters cc
+            JOIN public.campaigns_campaigns c
+              ON c.id = cc.campaign_id
+             AND c.workspace_id = %s::uuid
             """,
             [ws_id],
         )
@@ -455,10 +437,10 @@ def _stats_sending_rows_page(ws_id, *, limit: int = 100, page: int = 1):
     with connection.cursor() as cur:
         cur.execute(
             """
-            SELECT COUNT(*)::int
-            FROM public.sending_log lg
+            SELECT COALESCE(SUM(cc.total_logged), 0)::int
+            FROM public.campaign_counters cc
             JOIN public.campaigns_campaigns c
-              ON c.id = lg.campaign_id
+              ON c.id = cc.campaign_id
              AND c.workspace_id = %s::uuid
             """,
             [ws_id],
@@ -563,10 +545,10 @@ def _stats_sending_rows_for_campaign_page(ws_id, campaign_id: int, *, limit: int
     with connection.cursor() as cur:
         cur.execute(
             """
-            SELECT COUNT(*)::int
-            FROM public.sending_log lg
+            SELECT COALESCE(SUM(cc.total_logged), 0)::int
+            FROM public.campaign_counters cc
             JOIN public.campaigns_campaigns c
-              ON c.id = lg.campaign_id
+              ON c.id = cc.campaign_id
              AND c.workspace_id = %s::uuid
              AND c.id = %s
             """,
@@ -1457,10 +1439,8 @@ def _stats_stub_view(request, *, section: str):
         with connection.cursor() as cur:
             cur.execute(
                 """
-                SELECT
-                  COUNT(*)::int AS total_cnt,
-                  COUNT(*) FILTER (WHERE UPPER(COALESCE(status, '')) = 'SEND')::int AS ok_cnt
-                FROM public.sending_log
+                SELECT total_logged, sent
+                FROM public.campaign_counters
                 WHERE campaign_id = %s
                 """,
                 [int(selected_campaign_id)],